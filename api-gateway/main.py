@@ -1,7 +1,13 @@
 from fastapi import FastAPI, APIRouter, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import requests
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from collections import OrderedDict
+import httpx
 import os
+import time
+
+from services.tokens import AUTH_REQUERIDA, TokenInvalido, extraer_bearer, obtener_verificador
 
 # Define la instancia de la aplicación FastAPI.
 app = FastAPI(title="API Gateway Taller Microservicios")
@@ -29,38 +35,204 @@ SERVICES = {
     "service3": os.getenv("NAME3_SERVICE_URL", "http://127.0.0.1:8003"),
 }
 
-# TODO: Implementa una ruta genérica para redirigir peticiones GET.
-@router.get("/{service_name}/{path:path}")
-async def forward_get(service_name: str, path: str, request: Request):
-    if service_name not in SERVICES:
-        raise HTTPException(status_code=404, detail=f"Service '{service_name}' not found.")
-    
-    service_url = f"{SERVICES[service_name]}/{path}"
-    
-    try:
-        response = requests.get(service_url, params=request.query_params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error forwarding request to {service_name}: {e}")
-
-# TODO: Implementa una ruta genérica para redirigir peticiones POST.
-@router.post("/{service_name}/{path:path}")
-async def forward_post(service_name: str, path: str, request: Request):
+# Configuración de los pools de conexiones hacia los microservicios.
+# Cada servicio tiene su propio cliente con conexiones keep-alive reutilizables.
+POOL_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("GATEWAY_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("GATEWAY_KEEPALIVE_EXPIRY", "30"))
+TIMEOUT_CONNECT = float(os.getenv("GATEWAY_CONNECT_TIMEOUT", "5"))
+TIMEOUT_READ = float(os.getenv("GATEWAY_READ_TIMEOUT", "30"))
+
+# Cabeceras hop-by-hop que no deben reenviarse entre conexiones (RFC 7230).
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host",
+}
+
+# Caché opcional de respuestas GET con TTL corto (desactivada con 0, por defecto).
+# Solo se guardan respuestas 200 de las rutas listadas, por prefijo "servicio/ruta".
+CACHE_TTL = float(os.getenv("GATEWAY_CACHE_TTL", "0"))
+CACHE_MAX_ENTRIES = int(os.getenv("GATEWAY_CACHE_MAX_ENTRIES", "1000"))
+CACHE_PATHS = tuple(
+    p.strip() for p in os.getenv(
+        "GATEWAY_CACHE_PATHS", "service1/health-data/,service2/historial/"
+    ).split(",") if p.strip()
+)
+
+# Métodos cuyo cuerpo se reenvía al microservicio.
+METHODS_WITH_BODY = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Clientes HTTP asíncronos compartidos, uno por servicio (se crean al iniciar).
+clients: dict[str, httpx.AsyncClient] = {}
+
+
+def build_client(base_url: str) -> httpx.AsyncClient:
+    """Crea un cliente asíncrono con pool keep-alive para un microservicio."""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        limits=httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(TIMEOUT_READ, connect=TIMEOUT_CONNECT),
+    )
+
+
+def filter_headers(headers) -> dict:
+    """Elimina las cabeceras hop-by-hop antes de reenviar."""
+    return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+
+def etag_matches(if_none_match, etag) -> bool:
+    """Comparación débil de If-None-Match contra un ETag."""
+    if not if_none_match or not etag:
+        return False
+    candidates = {e.strip().removeprefix("W/") for e in if_none_match.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+class ResponseCache:
+    """LRU de respuestas GET con TTL, compartida por todas las peticiones.
+
+    La clave es servicio + ruta + query ordenada. Sirve cuerpos ya
+    serializados sin tocar al microservicio mientras no expiren; si la
+    respuesta guardada tiene ETag y el cliente envía el mismo en
+    If-None-Match, se responde 304 directamente.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()  # key -> (expires, status, headers, body)
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "not_modified": 0, "evictions": 0}
+
+    @staticmethod
+    def key(service_name: str, path: str, request: Request):
+        return (service_name, path, tuple(sorted(request.query_params.multi_items())))
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry
+
+    def put(self, key, status_code: int, headers: dict, body: bytes):
+        self.entries[key] = (time.monotonic() + self.ttl, status_code, headers, body)
+        self.entries.move_to_end(key)
+        self.stats["stores"] += 1
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "ttl_seconds": self.ttl,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache(CACHE_TTL, CACHE_MAX_ENTRIES)
+
+
+def is_cacheable(service_name: str, path: str, request: Request) -> bool:
+    """GET sin credenciales sobre una ruta configurada (caché compartida)."""
+    if CACHE_TTL <= 0 or request.method != "GET" or "authorization" in request.headers:
+        return False
+    return f"{service_name}/{path}".startswith(CACHE_PATHS)
+
+
+def cached_response(entry, request: Request) -> Response:
+    _, status_code, headers, body = entry
+    if etag_matches(request.headers.get("if-none-match"), headers.get("etag")):
+        response_cache.stats["not_modified"] += 1
+        return Response(status_code=304, headers={k: v for k, v in headers.items()
+                                                  if k in ("etag", "cache-control")})
+    return Response(content=body, status_code=status_code, headers=headers)
+
+
+@app.on_event("startup")
+async def open_clients():
+    for name, url in SERVICES.items():
+        clients[name] = build_client(url)
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    for client in clients.values():
+        await client.aclose()
+    clients.clear()
+
+
+# Ruta genérica que redirige GET, POST, PUT, PATCH y DELETE al microservicio.
+# El cuerpo de la petición y el de la respuesta se transmiten en streaming,
+# sin decodificar ni volver a codificar el JSON.
+@router.api_route("/{service_name}/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def forward(service_name: str, path: str, request: Request):
     if service_name not in SERVICES:
         raise HTTPException(status_code=404, detail=f"Service '{service_name}' not found.")
-    
-    service_url = f"{SERVICES[service_name]}/{path}"
-    
+
+    # Con AUTH_REQUERIDA el token se verifica aquí, localmente (claves JWKS en
+    # memoria y revocación en Redis); el servicio de autenticación queda abierto.
+    if AUTH_REQUERIDA and service_name != "auth":
+        token = extraer_bearer(request.headers.get("authorization"))
+        try:
+            await obtener_verificador().verificar(token or "")
+        except TokenInvalido as e:
+            raise HTTPException(status_code=401, detail=f"Invalid token: {e}",
+                                headers={"WWW-Authenticate": "Bearer"})
+
+    cacheable = is_cacheable(service_name, path, request)
+    headers = filter_headers(request.headers)
+    if cacheable:
+        cache_key = response_cache.key(service_name, path, request)
+        entry = response_cache.get(cache_key)
+        if entry is not None:
+            return cached_response(entry, request)
+        # Se pide la respuesta completa para poder guardarla; el 304 al
+        # cliente lo decide el gateway con el ETag guardado.
+        headers = {k: v for k, v in headers.items() if k.lower() != "if-none-match"}
+
+    client = clients[service_name]
+    upstream_request = client.build_request(
+        request.method,
+        f"/{path}",
+        params=request.query_params,
+        headers=headers,
+        content=request.stream() if request.method in METHODS_WITH_BODY else None,
+    )
+
     try:
-        # Pasa los datos JSON del cuerpo de la petición.
-        response = requests.post(service_url, json=await request.json())
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(status_code=500, detail=f"Error forwarding request to {service_name}: {e}")
+        upstream = await client.send(upstream_request, stream=True)
+    except httpx.TimeoutException as e:
+        raise HTTPException(status_code=504, detail=f"Timeout forwarding request to {service_name}: {e}")
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=502, detail=f"Error forwarding request to {service_name}: {e}")
+
+    cache_control = upstream.headers.get("cache-control", "").lower()
+    if cacheable and upstream.status_code == 200 and "no-store" not in cache_control and "private" not in cache_control:
+        try:
+            body = b"".join([chunk async for chunk in upstream.aiter_raw()])
+        finally:
+            await upstream.aclose()
+        entry = (0, upstream.status_code, {k.lower(): v for k, v in filter_headers(upstream.headers).items()}, body)
+        response_cache.put(cache_key, *entry[1:])
+        return cached_response(entry, request)
 
-# TODO: Agrega más rutas para otros métodos HTTP (PUT, DELETE, etc.).
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        headers=filter_headers(upstream.headers),
+        background=BackgroundTask(upstream.aclose),
+    )
 
 # Incluye el router en la aplicación principal.
 app.include_router(router)
@@ -69,3 +241,9 @@ app.include_router(router)
 @app.get("/health")
 def health_check():
     return {"status": "ok", "message": "API Gateway is running."}
+
+
+# Métricas de la caché de respuestas (aciertos, fallos, 304 servidos).
+@app.get("/cache/metrics")
+def cache_metrics():
+    return response_cache.metrics()
@@ -0,0 +1,107 @@
+"""
+Benchmark de carga del API Gateway contra microservicios simulados locales.
+
+Levanta un servicio "stub" que responde con una latencia fija (simula la
+consulta a MongoDB) y el gateway apuntando a él, y mide peticiones/s y
+latencias con distintos niveles de concurrencia. Con el reenvío asíncrono
+las peticiones concurrentes se solapan y el throughput crece con la
+concurrencia hasta el límite del pool.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/bench_gateway.py --peticiones 2000 --latencia 0.02
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+PUERTO_STUB = 18101
+PUERTO_GATEWAY = 18100
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def crear_stub(latencia):
+    stub = FastAPI()
+
+    @stub.get("/health-data/{cedula}")
+    async def signos(cedula: str):
+        await asyncio.sleep(latencia)
+        return {"paciente": {"cedula": cedula}, "signos_vitales": [{"ritmo_cardiaco": 80}]}
+
+    return stub
+
+
+def cargar_gateway():
+    """Importa api-gateway/main.py apuntando service1 al stub"""
+    os.environ["NAME1_SERVICE_URL"] = f"http://127.0.0.1:{PUERTO_STUB}"
+    os.environ.setdefault("AUTH_REQUERIDA", "false")  # mide el reenvío, no la verificación
+    sys.path.insert(0, str(RAIZ))  # El gateway importa services.tokens
+    spec = importlib.util.spec_from_file_location("gateway_main", RAIZ / "api-gateway" / "main.py")
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo.app
+
+
+def levantar(app, puerto):
+    servidor = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=puerto, log_level="warning"))
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.05)
+    return servidor
+
+
+async def medir(concurrencia, total):
+    url = f"http://127.0.0.1:{PUERTO_GATEWAY}/api/v1/service1/health-data/123456789"
+    latencias = []
+    errores = 0
+    pendientes = iter(range(total))
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+
+    async with httpx.AsyncClient(limits=limites, timeout=30) as cliente:
+        async def trabajador():
+            nonlocal errores
+            for _ in pendientes:
+                inicio = time.perf_counter()
+                r = await cliente.get(url)
+                latencias.append(time.perf_counter() - inicio)
+                if r.status_code != 200:
+                    errores += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+        duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "rps": total / duracion,
+        "p50": statistics.median(latencias) * 1000,
+        "p99": latencias[int(len(latencias) * 0.99) - 1] * 1000,
+        "errores": errores,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--latencia", type=float, default=0.02, help="Latencia simulada del stub (s)")
+    parser.add_argument("--concurrencias", default="1,10,50,100")
+    args = parser.parse_args()
+
+    levantar(crear_stub(args.latencia), PUERTO_STUB)
+    levantar(cargar_gateway(), PUERTO_GATEWAY)
+
+    print(f"🧪 Gateway → stub con {args.latencia * 1000:.0f} ms de latencia, {args.peticiones} peticiones por nivel\n")
+    print(f"{'Concurrencia':>12}{'Req/s':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'Errores':>9}")
+    for concurrencia in (int(c) for c in args.concurrencias.split(",")):
+        r = asyncio.run(medir(concurrencia, args.peticiones))
+        print(f"{concurrencia:>12}{r['rps']:>10.0f}{r['p50']:>10.1f}{r['p99']:>10.1f}{r['errores']:>9}")
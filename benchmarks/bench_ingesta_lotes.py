@@ -0,0 +1,81 @@
+"""
+Benchmark de ingesta de signos vitales en Service1.
+
+Compara el camino actual (un POST /health-data/{cedula} por lectura) con el
+endpoint de lotes POST /health-data/lote.
+
+Ejecutar con Service1 activo:
+    python benchmarks/bench_ingesta_lotes.py --lecturas 2000 --tam-lote 500
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime
+
+import requests
+
+SERVICE1_URL = "http://127.0.0.1:8001"
+
+CEDULAS_BENCH = [f"9{n:08d}" for n in range(20)]
+
+
+def registrar_pacientes(sesion, url):
+    """Registra (o actualiza) los pacientes usados por el benchmark"""
+    for i, cedula in enumerate(CEDULAS_BENCH):
+        sesion.post(
+            f"{url}/pacientes",
+            params={"cedula": cedula, "nombre": "Bench", "apellido": f"Paciente{i}"},
+            timeout=5
+        ).raise_for_status()
+
+
+def lectura_aleatoria(cedula):
+    return {
+        "cedula": cedula,
+        "ritmo_cardiaco": random.randint(60, 120),
+        "temperatura": round(random.uniform(36, 39), 1),
+        "presion": f"{random.randint(100, 130)}/{random.randint(70, 90)}",
+        "oxigeno": random.randint(90, 100),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def medir_por_lectura(sesion, url, total):
+    inicio = time.perf_counter()
+    for i in range(total):
+        cedula = CEDULAS_BENCH[i % len(CEDULAS_BENCH)]
+        sesion.post(f"{url}/health-data/{cedula}", timeout=10).raise_for_status()
+    return time.perf_counter() - inicio
+
+
+def medir_por_lotes(sesion, url, total, tam_lote):
+    lecturas = [lectura_aleatoria(CEDULAS_BENCH[i % len(CEDULAS_BENCH)]) for i in range(total)]
+    inicio = time.perf_counter()
+    for i in range(0, total, tam_lote):
+        r = sesion.post(f"{url}/health-data/lote", json={"lecturas": lecturas[i:i + tam_lote]}, timeout=60)
+        r.raise_for_status()
+        if r.json()["rechazadas"]:
+            print(f"⚠️ Lote {i // tam_lote}: {r.json()['rechazadas']} lecturas rechazadas")
+    return time.perf_counter() - inicio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=SERVICE1_URL)
+    parser.add_argument("--lecturas", type=int, default=2000)
+    parser.add_argument("--tam-lote", type=int, default=500)
+    args = parser.parse_args()
+
+    sesion = requests.Session()
+    registrar_pacientes(sesion, args.url)
+
+    print(f"🩺 Ingestando {args.lecturas} lecturas por cada camino...\n")
+
+    t_individual = medir_por_lectura(sesion, args.url, args.lecturas)
+    t_lotes = medir_por_lotes(sesion, args.url, args.lecturas, args.tam_lote)
+
+    print(f"{'Camino':<28}{'Tiempo (s)':>12}{'Lecturas/s':>14}")
+    print(f"{'POST por lectura':<28}{t_individual:>12.2f}{args.lecturas / t_individual:>14.0f}")
+    print(f"{'POST /lote (' + str(args.tam_lote) + ')':<28}{t_lotes:>12.2f}{args.lecturas / t_lotes:>14.0f}")
+    print(f"\n🚀 Aceleración: x{t_individual / t_lotes:.1f}")
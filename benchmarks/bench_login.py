@@ -0,0 +1,137 @@
+"""
+Latencia del dashboard durante una ráfaga de inicios de sesión.
+
+Levanta un servidor HTTP con hilos (como Flask en desarrollo) con dos rutas:
+/login verifica una contraseña con el hash de Werkzeug y /dashboard arma una
+respuesta JSON liviana. Mientras `--tormenta` hilos hacen login sin pausa,
+un cliente mide la latencia de /dashboard. Se compara la verificación en el
+hilo de la petición ("inline") contra el pool de `services.contrasenas`,
+que reserva núcleos para el resto de peticiones y rechaza lo que no cabe en
+su cola.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/bench_login.py --tormenta 32 --segundos 5
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services import contrasenas  # noqa: E402
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+
+PUERTO = 18110
+PASSWORD = "paciente123"
+HISTORIAL = [{"timestamp": "2025-01-01 00:00:00", "datos": {"ritmo_cardiaco": 80, "temperatura": 36.6}}] * 20
+
+
+def crear_servidor(hash_guardado, modo):
+    class Manejador(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def responder(self, estado, cuerpo):
+            datos = json.dumps(cuerpo).encode()
+            self.send_response(estado)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            if self.path == "/dashboard":
+                self.responder(200, {"historial": HISTORIAL})
+            elif self.path == "/login":
+                try:
+                    if modo == "inline":
+                        valido = check_password_hash(hash_guardado, PASSWORD)
+                    else:
+                        valido = contrasenas.verificar(hash_guardado, PASSWORD)
+                    self.responder(200 if valido else 401, {"success": valido})
+                except contrasenas.ServicioSaturado:
+                    self.responder(503, {"success": False})
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", PUERTO), Manejador)
+    servidor.daemon_threads = True
+    servidor.request_queue_size = 1024
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def get(ruta):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{PUERTO}{ruta}", timeout=60) as r:
+            r.read()
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def medir_dashboard(segundos):
+    latencias = []
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        get("/dashboard")
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        time.sleep(0.02)
+    latencias.sort()
+    return statistics.median(latencias), latencias[int(len(latencias) * 0.99) - 1]
+
+
+def escenario(hash_guardado, modo, tormenta, segundos):
+    servidor = crear_servidor(hash_guardado, modo)
+    detener = threading.Event()
+    logins = {"ok": 0, "rechazados": 0}
+
+    def atacante():
+        while not detener.is_set():
+            estado = get("/login")
+            logins["ok" if estado == 200 else "rechazados"] += 1
+
+    hilos = [threading.Thread(target=atacante, daemon=True) for _ in range(tormenta)]
+    for hilo in hilos:
+        hilo.start()
+    time.sleep(0.5)  # que la ráfaga esté en marcha
+    p50, p99 = medir_dashboard(segundos)
+    detener.set()
+    for hilo in hilos:
+        hilo.join()
+    servidor.shutdown()
+    servidor.server_close()
+    return p50, p99, logins["ok"] / segundos, logins["rechazados"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tormenta", type=int, default=32, help="Hilos haciendo login sin pausa")
+    parser.add_argument("--segundos", type=float, default=5)
+    args = parser.parse_args()
+
+    hash_guardado = generate_password_hash(PASSWORD, method=contrasenas.HASH_METODO)
+    contrasenas.iniciar()
+
+    print(f"🧪 {contrasenas.HASH_METODO}, pool de {contrasenas.HASH_WORKERS} procesos, "
+          f"cola de {contrasenas.HASH_MAX_PENDIENTES}, {args.tormenta} hilos de login\n")
+    print(f"{'Escenario':<22}{'p50 (ms)':>10}{'p99 (ms)':>10}{'Logins/s':>10}{'Rechazados':>12}")
+
+    servidor = crear_servidor(hash_guardado, "inline")
+    p50, p99 = medir_dashboard(args.segundos / 2)
+    servidor.shutdown()
+    servidor.server_close()
+    print(f"{'Sin ráfaga':<22}{p50:>10.1f}{p99:>10.1f}{'-':>10}{'-':>12}")
+
+    for modo, nombre in (("inline", "Ráfaga, hash inline"), ("pool", "Ráfaga, pool acotado")):
+        p50, p99, tasa, rechazados = escenario(hash_guardado, modo, args.tormenta, args.segundos)
+        print(f"{nombre:<22}{p50:>10.1f}{p99:>10.1f}{tasa:>10.1f}{rechazados:>12}")
+
+    contrasenas.cerrar()
@@ -0,0 +1,91 @@
+"""
+Benchmark del motor de reglas de Service2.
+
+Compara el análisis anterior (un if/elif por diccionario) con la evaluación
+vectorizada de MotorReglas sobre el mismo lote de lecturas.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/bench_reglas.py --lecturas 100000
+"""
+
+import argparse
+import random
+import time
+from pathlib import Path
+import sys
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.service2.reglas import MotorReglas
+
+
+def analisis_por_diccionario(data):
+    """Versión original de analyze() en services/service2/main.py"""
+    bpm = data.get("ritmo_cardiaco", 0)
+    temp = data.get("temperatura", 0)
+    oxigeno = data.get("oxigeno", 100)
+    alertas = []
+
+    if bpm > 100:
+        alertas.append("⚠️ Ritmo cardíaco alto (posible taquicardia)")
+    elif bpm < 60:
+        alertas.append("⚠️ Ritmo cardíaco bajo (posible bradicardia)")
+
+    if temp > 38:
+        alertas.append("🌡️ Fiebre detectada")
+    elif temp < 36:
+        alertas.append("❄️ Hipotermia detectada")
+
+    if oxigeno < 95:
+        alertas.append("🫁 Saturación de oxígeno baja")
+
+    return alertas if alertas else ["✅ Todo en rangos normales"]
+
+
+def generar_lecturas(total, pacientes=500):
+    return [
+        {
+            "cedula": str(100000 + i % pacientes),
+            "ritmo_cardiaco": random.randint(55, 125),
+            "temperatura": round(random.uniform(35.5, 39.5), 1),
+            "presion": f"{random.randint(95, 150)}/{random.randint(60, 95)}",
+            "oxigeno": random.randint(88, 100),
+        }
+        for i in range(total)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lecturas", type=int, default=100_000)
+    args = parser.parse_args()
+
+    lecturas = generar_lecturas(args.lecturas)
+    motor = MotorReglas.desde_archivo()
+
+    inicio = time.perf_counter()
+    for lectura in lecturas:
+        analisis_por_diccionario(lectura)
+    t_bucle = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    columnas = motor.columnas(lecturas)
+    t_columnas = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    mascara = motor.evaluar(columnas)
+    t_evaluar = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    motor.alertas(mascara)
+    t_mensajes = time.perf_counter() - inicio
+
+    print(f"🧪 {args.lecturas} lecturas, {len(motor.reglas)} reglas en el motor (5 en el bucle original)\n")
+    print(f"{'Etapa':<36}{'Tiempo (ms)':>12}")
+    print(f"{'Bucle if/elif por diccionario':<36}{t_bucle * 1000:>12.1f}")
+    print(f"{'Motor: dicts → columnas':<36}{t_columnas * 1000:>12.1f}")
+    print(f"{'Motor: evaluación vectorizada':<36}{t_evaluar * 1000:>12.1f}")
+    print(f"{'Motor: máscara → mensajes':<36}{t_mensajes * 1000:>12.1f}")
+    total_motor = t_columnas + t_evaluar + t_mensajes
+    print(f"\n🚀 Evaluación sobre columnas: x{t_bucle / t_evaluar:.0f} más rápida que el bucle")
+    print(f"   Camino completo desde dicts: x{t_bucle / total_motor:.1f}")
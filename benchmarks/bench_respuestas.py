@@ -0,0 +1,111 @@
+"""
+Llamadas al modelo de Pulsito con y sin plantillas y caché de respuestas.
+
+Simula `--usuarios` chats que, en cada ronda, pulsan los botones del menú o
+hacen preguntas frecuentes sobre `--pacientes` pacientes, en `--oleadas`
+grupos simultáneos.
+Cada ronda llega una lectura nueva por paciente (invalida la caché). El
+modelo es falso: espera `--latencia-modelo` segundos y cuenta las llamadas.
+
+Ejecutar desde la raíz del proyecto (con las dependencias de my_agent):
+    python benchmarks/bench_respuestas.py --usuarios 200 --rondas 5
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from my_agent.respuestas import (  # noqa: E402
+    BOTON_HISTORIAL, BOTON_SIGNOS, CacheRespuestas, huella_signos, plantilla_historial, plantilla_signos
+)
+
+PREGUNTAS = [
+    "¿Está bien mi presión arterial?",
+    "¿Está bien mi presión arterial",
+    "¿Cómo está mi ritmo cardíaco?",
+    "¿Tengo fiebre?",
+]
+MENSAJES = [BOTON_SIGNOS] * 4 + [BOTON_HISTORIAL] * 2 + PREGUNTAS
+
+
+def lectura(cedula, ronda, rng):
+    return {
+        "cedula": cedula,
+        "paciente": {"nombre": f"Paciente {cedula}"},
+        "timestamp": f"2025-01-01 00:{ronda:02d}:00",
+        "datos": {"ritmo_cardiaco": rng.randint(60, 110), "temperatura": 36.8, "presion": "120/80", "oxigeno": 97},
+        "alertas": [],
+    }
+
+
+async def escenario(optimizado, args):
+    rng = random.Random(args.semilla)
+    llamadas = 0
+
+    async def modelo_falso(user_id, texto):
+        nonlocal llamadas
+        llamadas += 1
+        await asyncio.sleep(args.latencia_modelo)
+        return f"Respuesta a: {texto[-40:]}"
+
+    cache = CacheRespuestas(modelo_falso)
+    latencias = []
+
+    async def atender(usuario, cedula, mensaje, health_data):
+        inicio = time.perf_counter()
+        if optimizado and mensaje == BOTON_SIGNOS:
+            plantilla_signos(health_data, cedula)
+        elif optimizado and mensaje == BOTON_HISTORIAL:
+            plantilla_historial({"historial": [health_data]}, cedula)
+        else:
+            clave = CacheRespuestas.clave(cedula, mensaje, huella_signos(health_data)) if optimizado else None
+            await cache.responder(clave, str(usuario), mensaje)
+        latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    for ronda in range(args.rondas):
+        lecturas = {f"{p:08d}": lectura(f"{p:08d}", ronda, rng) for p in range(args.pacientes)}
+        cedulas = list(lecturas)
+        # Los usuarios llegan en oleadas: dentro de una se unen las llamadas,
+        # entre oleadas se reutiliza la caché
+        por_oleada = max(1, args.usuarios // args.oleadas)
+        for primero in range(0, args.usuarios, por_oleada):
+            await asyncio.gather(*(
+                atender(u, cedula, rng.choice(MENSAJES), lecturas[cedula])
+                for u in range(primero, min(args.usuarios, primero + por_oleada))
+                for cedula in [rng.choice(cedulas)]
+            ))
+    duracion = time.perf_counter() - inicio
+
+    return {
+        "llamadas": llamadas,
+        "mensajes": len(latencias),
+        "duracion": duracion,
+        "p50": statistics.median(latencias) * 1000,
+        "contadores": cache.contadores,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--pacientes", type=int, default=20)
+    parser.add_argument("--rondas", type=int, default=5)
+    parser.add_argument("--oleadas", type=int, default=4, help="Grupos de usuarios por ronda")
+    parser.add_argument("--latencia-modelo", type=float, default=0.5)
+    parser.add_argument("--semilla", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"🧪 {args.usuarios} usuarios, {args.pacientes} pacientes, {args.rondas} rondas, "
+          f"modelo falso de {args.latencia_modelo * 1000:.0f} ms\n")
+    print(f"{'Escenario':<22}{'Mensajes':>10}{'Llamadas':>10}{'p50 (ms)':>10}{'Unidas':>8}{'Aciertos':>10}")
+    for nombre, optimizado in (("Siempre el modelo", False), ("Plantillas + caché", True)):
+        r = asyncio.run(escenario(optimizado, args))
+        print(f"{nombre:<22}{r['mensajes']:>10}{r['llamadas']:>10}{r['p50']:>10.0f}"
+              f"{r['contadores']['unidas']:>8}{r['contadores']['aciertos']:>10}")
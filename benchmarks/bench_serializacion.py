@@ -0,0 +1,72 @@
+"""
+Microbenchmarks de serialización de respuestas con documentos de MongoDB.
+
+Compara el camino anterior (serialize_mongo + jsonable_encoder + json.dumps,
+lo que hace la JSONResponse por defecto de FastAPI) con dumps_mongo, que
+serializa ObjectId y datetime directamente a bytes con orjson.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/bench_serializacion.py
+"""
+
+import json
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from services.utils import dumps_mongo, serialize_mongo
+
+
+def signo_vital(cedula, t):
+    return {
+        "_id": ObjectId(),
+        "cedula": cedula,
+        "nombre": "Juan Pérez",
+        "ritmo_cardiaco": random.randint(60, 120),
+        "temperatura": round(random.uniform(36, 39), 1),
+        "presion": f"{random.randint(100, 130)}/{random.randint(70, 90)}",
+        "oxigeno": random.randint(90, 100),
+        "timestamp": t,
+    }
+
+
+def paciente(i):
+    return {
+        "_id": ObjectId(),
+        "cedula": str(100000000 + i),
+        "nombre": "Paciente",
+        "apellido": f"Prueba {i}",
+        "edad": random.randint(18, 90),
+        "fecha_registro": datetime(2025, 1, 1) + timedelta(minutes=i),
+    }
+
+
+def cargas():
+    ahora = datetime.now()
+    historial = [signo_vital("123456789", ahora - timedelta(seconds=10 * i)) for i in range(50)]
+    return {
+        "historial (50 lecturas)": {"paciente": {"cedula": "123456789"}, "signos_vitales": historial},
+        "listado (1000 pacientes)": {"pacientes": [paciente(i) for i in range(1000)], "siguiente": None},
+        "lote (10000 lecturas)": [signo_vital(str(i % 100), ahora) for i in range(10_000)],
+    }
+
+
+def camino_anterior(contenido):
+    # serialize_mongo + lo que hace JSONResponse de FastAPI con el resultado
+    return json.dumps(jsonable_encoder(serialize_mongo(contenido)), ensure_ascii=False).encode("utf-8")
+
+
+if __name__ == "__main__":
+    print(f"{'Carga':<28}{'Anterior (ms)':>15}{'dumps_mongo (ms)':>18}{'Mejora':>9}")
+    for nombre, contenido in cargas().items():
+        repeticiones = 20
+        t_anterior = timeit.timeit(lambda: camino_anterior(contenido), number=repeticiones) / repeticiones
+        t_nuevo = timeit.timeit(lambda: dumps_mongo(contenido), number=repeticiones) / repeticiones
+        print(f"{nombre:<28}{t_anterior * 1000:>15.2f}{t_nuevo * 1000:>18.2f}{t_anterior / t_nuevo:>8.1f}x")
@@ -0,0 +1,70 @@
+"""
+Benchmark de concurrencia de Service1: camino asíncrono (Motor) vs. síncrono.
+
+Lanza peticiones GET /health-data/{cedula} con 50, 200 y 1000 clientes
+concurrentes y reporta peticiones/s y latencias p50/p99 por cada instancia.
+
+Para comparar con el camino síncrono anterior, levanta ambas versiones en
+puertos distintos (por ejemplo con `git worktree` del commit previo):
+    uvicorn services.service1.main:app --port 8001            # async
+    uvicorn services.service1.main:app --port 8011            # sync (worktree)
+    python benchmarks/bench_service1_async.py \\
+        --instancia async=http://127.0.0.1:8001 --instancia sync=http://127.0.0.1:8011
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def medir(url, cedula, concurrencia, total):
+    latencias = []
+    errores = 0
+    pendientes = iter(range(total))
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+        async def trabajador():
+            nonlocal errores
+            for _ in pendientes:
+                inicio = time.perf_counter()
+                try:
+                    r = await cliente.get(f"/health-data/{cedula}", params={"limit": 10})
+                    if r.status_code != 200:
+                        errores += 1
+                except httpx.HTTPError:
+                    errores += 1
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+        duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "rps": total / duracion,
+        "p50": statistics.median(latencias) * 1000,
+        "p99": latencias[max(int(len(latencias) * 0.99) - 1, 0)] * 1000,
+        "errores": errores,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instancia", action="append", default=[],
+                        help="nombre=url de una instancia de Service1 (repetible)")
+    parser.add_argument("--cedula", default="123456789")
+    parser.add_argument("--peticiones", type=int, default=5000)
+    parser.add_argument("--concurrencias", default="50,200,1000")
+    args = parser.parse_args()
+
+    instancias = [i.split("=", 1) for i in args.instancia] or [["async", "http://127.0.0.1:8001"]]
+
+    print(f"{'Instancia':<10}{'Clientes':>10}{'Req/s':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'Errores':>9}")
+    for nombre, url in instancias:
+        for concurrencia in (int(c) for c in args.concurrencias.split(",")):
+            r = asyncio.run(medir(url, args.cedula, concurrencia, args.peticiones))
+            print(f"{nombre:<10}{concurrencia:>10}{r['rps']:>10.0f}{r['p50']:>10.1f}{r['p99']:>10.1f}{r['errores']:>9}")
@@ -0,0 +1,135 @@
+"""
+Throughput del bot de Telegram con cientos de chats simultáneos.
+
+Una fuente falsa de updates entrega `--mensajes` mensajes por cada uno de
+`--chats` usuarios (intercalados, como llegarían por polling) al handler
+real `recibir_cedula`, que consulta un Service2 simulado con `--latencia`
+segundos de respuesta. Compara el procesamiento por defecto de
+python-telegram-bot (un update a la vez) con `ProcesadorPorUsuario`, y
+verifica que los mensajes de cada usuario se atiendan en orden.
+
+Ejecutar desde la raíz del proyecto (con las dependencias de my_agent):
+    python benchmarks/bench_telegram_bot.py --chats 500 --mensajes 2 --latencia 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import uvicorn
+from fastapi import FastAPI
+
+PUERTO_STUB = 18120
+os.environ["SERVICE2_URL"] = f"http://127.0.0.1:{PUERTO_STUB}"
+os.environ.setdefault("TELEGRAM_TOKEN", "bench")
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from telegram.ext import SimpleUpdateProcessor  # noqa: E402
+from my_agent import telegram_bot  # noqa: E402
+from my_agent.procesador_updates import ProcesadorPorUsuario  # noqa: E402
+
+
+def crear_stub(latencia):
+    stub = FastAPI()
+
+    @stub.get("/analyze/{cedula}")
+    async def analizar(cedula: str):
+        await asyncio.sleep(latencia)
+        return {"paciente": {"cedula": cedula, "nombre": "Paciente Bench"},
+                "datos": {"ritmo_cardiaco": 80, "temperatura": 36.8, "presion": "120/80", "oxigeno": 98},
+                "alertas": []}
+
+    return stub
+
+
+def levantar(app, puerto):
+    servidor = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=puerto, log_level="warning"))
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.05)
+    return servidor
+
+
+class MensajeFalso:
+    def __init__(self, texto):
+        self.text = texto
+        self.respuestas = []
+
+    async def reply_text(self, texto, **kwargs):
+        self.respuestas.append(texto)
+
+
+def update_falso(usuario, secuencia):
+    cedula = f"{10000000 + usuario}"
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=usuario),
+        effective_chat=SimpleNamespace(id=usuario),
+        message=MensajeFalso(f"La cédula es {cedula}"),
+        secuencia=secuencia,
+    )
+
+
+def fuente_updates(chats, mensajes):
+    """Mensajes intercalados: el n-ésimo de cada chat antes del (n+1)-ésimo de cualquiera"""
+    for secuencia in range(mensajes):
+        for usuario in range(chats):
+            yield update_falso(usuario, secuencia)
+
+
+async def escenario(procesador, chats, mensajes):
+    await telegram_bot.iniciar_servicios()
+    orden = {}
+    latencias = []
+
+    async def manejar(update, recibido):
+        orden.setdefault(update.effective_user.id, []).append(update.secuencia)
+        await telegram_bot.recibir_cedula(update, None)
+        latencias.append(time.perf_counter() - recibido)
+
+    inicio = time.perf_counter()
+    # Igual que Application: una tarea por update, creadas en orden de llegada
+    tareas = [
+        asyncio.create_task(procesador.process_update(update, manejar(update, time.perf_counter())))
+        for update in fuente_updates(chats, mensajes)
+    ]
+    await asyncio.gather(*tareas)
+    duracion = time.perf_counter() - inicio
+    await telegram_bot.cerrar_servicios()
+
+    en_orden = all(secuencias == sorted(secuencias) for secuencias in orden.values())
+    latencias.sort()
+    return {
+        "updates_s": len(latencias) / duracion,
+        "p50": statistics.median(latencias) * 1000,
+        "p99": latencias[int(len(latencias) * 0.99) - 1] * 1000,
+        "en_orden": en_orden,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--mensajes", type=int, default=2, help="Mensajes por chat")
+    parser.add_argument("--latencia", type=float, default=0.02, help="Latencia simulada de Service2 (s)")
+    parser.add_argument("--concurrencia", type=int, default=telegram_bot.BOT_CONCURRENCIA)
+    args = parser.parse_args()
+
+    levantar(crear_stub(args.latencia), PUERTO_STUB)
+    # Sin caché de consultas: cada update llega hasta el Service2 simulado
+    telegram_bot.servicios.ttl = 0
+
+    print(f"🧪 {args.chats} chats × {args.mensajes} mensajes, Service2 con {args.latencia * 1000:.0f} ms\n")
+    print(f"{'Procesador':<28}{'Updates/s':>10}{'p50 (ms)':>11}{'p99 (ms)':>11}{'En orden':>10}")
+    escenarios = [
+        ("Un update a la vez", SimpleUpdateProcessor(1)),
+        (f"Por usuario ({args.concurrencia})", ProcesadorPorUsuario(args.concurrencia)),
+    ]
+    for nombre, procesador in escenarios:
+        r = asyncio.run(escenario(procesador, args.chats, args.mensajes))
+        print(f"{nombre:<28}{r['updates_s']:>10.1f}{r['p50']:>11.0f}{r['p99']:>11.0f}{'sí' if r['en_orden'] else 'NO':>10}")
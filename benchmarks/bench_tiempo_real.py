@@ -0,0 +1,157 @@
+"""
+Prueba de carga del servicio de tiempo real (SSE) en un solo nodo.
+
+Levanta services/tiempo_real en un hilo con uvicorn, abre miles de
+conexiones SSE simuladas repartidas entre varios pacientes y difunde
+análisis a una tasa fija inyectándolos directamente en el difusor (sin
+Redis). Una fracción de los suscriptores lee con retraso y con un buffer de
+recepción pequeño para que el atraso llegue a la cola del servidor y se
+note la coalescencia. Reporta latencia de entrega (publicación → recepción),
+eventos recibidos y omitidos.
+
+Cada conexión usa dos descriptores (cliente y servidor); para varios miles
+de suscriptores sube el límite antes de ejecutar:
+    ulimit -n 65536
+    python benchmarks/bench_tiempo_real.py --suscriptores 3000 --pacientes 100 --eventos 2000
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import orjson
+import uvicorn
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.append(str(RAIZ))
+os.environ.setdefault("TIEMPO_REAL_MAX_CONEXIONES", "100000")
+os.environ.setdefault("AUTH_REQUERIDA", "false")  # los suscriptores simulados no envían token
+
+from services.eventos import BusLocal  # noqa: E402
+from services.tiempo_real import main as tiempo_real  # noqa: E402
+
+# Los análisis se inyectan en el difusor; el bus en proceso evita depender de Redis
+tiempo_real.difusor.bus = BusLocal()
+
+PUERTO = 18105
+
+
+def levantar():
+    """Arranca el servicio en otro hilo y devuelve su event loop"""
+    listo = {}
+
+    @tiempo_real.app.on_event("startup")
+    async def capturar_loop():
+        listo["loop"] = asyncio.get_running_loop()
+
+    config = uvicorn.Config(tiempo_real.app, host="127.0.0.1", port=PUERTO,
+                            log_level="warning", backlog=8192)
+    servidor = uvicorn.Server(config)
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.05)
+    return listo["loop"]
+
+
+async def suscriptor(cedula, retraso, latencias, contadores, conectados):
+    """Conexión SSE mínima (HTTP/1.0, sin chunked) que mide la latencia de cada evento"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    if retraso:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", PUERTO))
+    lector, escritor = await asyncio.open_connection(sock=sock, limit=2 ** 20)
+    escritor.write(f"GET /stream/{cedula} HTTP/1.0\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await escritor.drain()
+    conectados.release()
+    try:
+        while True:
+            linea = await lector.readline()
+            if not linea:
+                return
+            if not linea.startswith(b"data: "):
+                continue
+            evento = orjson.loads(linea[6:])
+            latencias.append(time.perf_counter() - evento["enviado"])
+            contadores["recibidos"] += 1
+            contadores["omitidos"] += evento.get("omitidas", 0)
+            if retraso:
+                await asyncio.sleep(retraso)
+    finally:
+        escritor.close()
+
+
+async def ejecutar(args, loop_servidor):
+    latencias = []
+    contadores = {"recibidos": 0, "omitidos": 0}
+    conectados = asyncio.Semaphore(0)
+    cedulas = [f"{1000000 + i}" for i in range(args.pacientes)]
+    lentos = int(args.suscriptores * args.lentos)
+
+    inicio = time.perf_counter()
+    tareas = []
+    for i in range(args.suscriptores):
+        retraso = args.retraso if i < lentos else 0
+        tareas.append(asyncio.create_task(
+            suscriptor(cedulas[i % len(cedulas)], retraso, latencias, contadores, conectados)
+        ))
+        if i % 200 == 199:
+            await asyncio.sleep(0)  # no saturar el backlog de accept
+    for _ in range(args.suscriptores):
+        await conectados.acquire()
+    while tiempo_real.difusor.conexiones < args.suscriptores:
+        await asyncio.sleep(0.05)
+    print(f"🔌 {args.suscriptores} conexiones abiertas en {time.perf_counter() - inicio:.2f}s "
+          f"({lentos} lentas, {args.pacientes} pacientes)")
+
+    intervalo = 1 / args.tasa
+    inicio = time.perf_counter()
+    for n in range(args.eventos):
+        evento = {
+            "paciente": {"cedula": cedulas[n % len(cedulas)], "nombre": "Paciente Bench"},
+            "timestamp": "2025-01-01 00:00:00",
+            "datos": {"ritmo_cardiaco": 80, "temperatura": 36.6, "presion": "120/80", "oxigeno": 98},
+            "alertas": ["✅ Todo en rangos normales"],
+            "enviado": time.perf_counter(),
+        }
+        loop_servidor.call_soon_threadsafe(tiempo_real.difusor.publicar, evento, orjson.dumps(evento))
+        espera = inicio + (n + 1) * intervalo - time.perf_counter()
+        if espera > 0:
+            await asyncio.sleep(espera)
+    duracion = time.perf_counter() - inicio
+
+    await asyncio.sleep(args.drenaje)
+    for tarea in tareas:
+        tarea.cancel()
+    await asyncio.gather(*tareas, return_exceptions=True)
+
+    esperados = args.eventos * args.suscriptores // args.pacientes
+    latencias.sort()
+    print(f"📤 {args.eventos} eventos en {duracion:.2f}s ({args.eventos / duracion:.0f}/s), "
+          f"≈{esperados} entregas esperadas")
+    print(f"📥 Recibidos: {contadores['recibidos']}  ·  omitidos por coalescencia: {contadores['omitidos']}")
+    if latencias:
+        print(f"⏱️  Latencia p50 {statistics.median(latencias) * 1000:.1f} ms  ·  "
+              f"p99 {latencias[int(len(latencias) * 0.99) - 1] * 1000:.1f} ms  ·  "
+              f"máx {latencias[-1] * 1000:.1f} ms")
+    print(f"📊 Métricas del servicio: {tiempo_real.difusor.metricas()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suscriptores", type=int, default=2000)
+    parser.add_argument("--pacientes", type=int, default=100)
+    parser.add_argument("--eventos", type=int, default=2000, help="Análisis a difundir")
+    parser.add_argument("--tasa", type=float, default=500, help="Análisis por segundo")
+    parser.add_argument("--lentos", type=float, default=0.05, help="Fracción de suscriptores lentos")
+    parser.add_argument("--retraso", type=float, default=0.5, help="Pausa por evento de un suscriptor lento (s)")
+    parser.add_argument("--drenaje", type=float, default=2.0, help="Espera final para recibir pendientes (s)")
+    args = parser.parse_args()
+
+    asyncio.run(ejecutar(args, levantar()))
@@ -0,0 +1,433 @@
+"""
+Prueba de carga del camino completo gateway → Service1 → Service2.
+
+Simula los dispositivos de N pacientes: cada uno mide cada `--intervalo`
+segundos (con desfase aleatorio) y envía sus lecturas por el gateway a
+POST /api/v1/service1/health-data/lote, con valores realistas (línea base
+propia por paciente, variación lenta y una fracción de pacientes con
+taquicardia, fiebre, hipoxia o hipertensión). En paralelo, `--dashboards`
+clientes consultan el historial analizado en Service2 con If-None-Match.
+
+Los envíos siguen un calendario fijo (carga de lazo abierto): la latencia
+se mide desde la hora programada, así que si el sistema se atrasa el atraso
+aparece en los percentiles en lugar de esconderse. Al terminar se espera a
+que Service2 consuma las lecturas pendientes del bus y se mide ese tiempo.
+
+Cada corrida agrega una línea JSON a `--resultados` (configuración, commit,
+throughput, p50/p95/p99, histograma y errores por código) y se compara con
+la corrida anterior de la misma configuración.
+
+Con `--levantar` arranca una pila local desechable (mongod y redis-server
+en un directorio temporal, Service1, Service2 y el gateway con uvicorn), para
+correr regresiones sin tocar Atlas ni el Redis compartido.
+
+Ejecutar desde la raíz del proyecto:
+    python benchmarks/carga.py --levantar --pacientes 500 --intervalo 1 --duracion 60
+    python benchmarks/carga.py --levantar --pacientes 2000 --intervalo 5 --lecturas-por-envio 6
+    python benchmarks/carga.py --gateway http://127.0.0.1:8000 --pacientes 200 --etiqueta main
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+RAIZ = Path(__file__).resolve().parent.parent
+RESULTADOS = RAIZ / "benchmarks" / "resultados" / "carga.jsonl"
+
+# Límites superiores (ms) de los intervalos del histograma
+HISTOGRAMA_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf")]
+
+# Desviaciones de la línea base: (nombre, campo, valor de la línea base)
+CONDICIONES = [
+    ("taquicardia", "ritmo_cardiaco", 118),
+    ("fiebre", "temperatura", 38.7),
+    ("hipoxia", "oxigeno", 91),
+    ("hipertension", "sistolica", 152),
+]
+
+
+class Paciente:
+    """Signos vitales de un paciente: línea base propia más variación lenta (AR(1))"""
+
+    def __init__(self, cedula, rng, condicion=None):
+        self.cedula = cedula
+        self.rng = rng
+        self.base = {
+            "ritmo_cardiaco": min(105, max(50, rng.gauss(74, 9))),
+            "temperatura": rng.gauss(36.7, 0.25),
+            "oxigeno": min(99.5, rng.gauss(97.5, 1.0)),
+            "sistolica": rng.gauss(118, 12),
+        }
+        self.condicion = condicion
+        if condicion:
+            _, campo, valor = condicion
+            self.base[campo] = valor
+        # Desviación estándar de la variación entre lecturas
+        self.ruido = {"ritmo_cardiaco": 4, "temperatura": 0.1, "oxigeno": 0.7, "sistolica": 4}
+        self.desvio = {campo: 0.0 for campo in self.base}
+
+    def lectura(self, instante=None):
+        for campo, sd in self.ruido.items():
+            self.desvio[campo] = 0.8 * self.desvio[campo] + self.rng.gauss(0, sd)
+        valor = {campo: self.base[campo] + self.desvio[campo] for campo in self.base}
+        sistolica = round(valor["sistolica"])
+        diastolica = round(sistolica * 0.65 + self.rng.gauss(0, 4))
+        return {
+            "cedula": self.cedula,
+            "ritmo_cardiaco": round(valor["ritmo_cardiaco"]),
+            "temperatura": round(valor["temperatura"], 1),
+            "presion": f"{sistolica}/{diastolica}",
+            "oxigeno": min(100, round(valor["oxigeno"])),
+            "timestamp": datetime.fromtimestamp(instante or time.time()).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+class Medicion:
+    """Latencias y resultados de un tipo de operación"""
+
+    def __init__(self):
+        self.latencias = []
+        self.codigos = Counter()
+
+    def registrar(self, latencia, codigo):
+        self.latencias.append(latencia)
+        self.codigos[codigo] += 1
+
+    def resumen(self, duracion):
+        latencias = sorted(self.latencias)
+        total = len(latencias)
+        # 404 no es error: un paciente sin lecturas analizadas aún no tiene historial
+        errores = sum(n for codigo, n in self.codigos.items() if not (200 <= codigo < 400 or codigo == 404))
+
+        def percentil(p):
+            return round(latencias[min(total - 1, int(total * p))] * 1000, 2) if total else None
+
+        histograma = Counter(bisect_left(HISTOGRAMA_MS, l * 1000) for l in latencias)
+        return {
+            "total": total,
+            "por_segundo": round(total / duracion, 1),
+            "errores": errores,
+            "tasa_error": round(errores / total, 4) if total else 0.0,
+            "codigos": {str(codigo): n for codigo, n in sorted(self.codigos.items())},
+            "p50_ms": percentil(0.50),
+            "p95_ms": percentil(0.95),
+            "p99_ms": percentil(0.99),
+            "max_ms": round(latencias[-1] * 1000, 2) if total else None,
+            "histograma_ms": {
+                ("inf" if limite == float("inf") else str(limite)): histograma.get(i, 0)
+                for i, limite in enumerate(HISTOGRAMA_MS)
+            },
+        }
+
+
+async def enviar(cliente, metodo, url, medicion, programado, **kwargs):
+    """Ejecuta la petición y registra su latencia desde la hora programada"""
+    try:
+        r = await cliente.request(metodo, url, **kwargs)
+        codigo = r.status_code
+    except httpx.HTTPError:
+        r, codigo = None, 0  # 0 = error de conexión o timeout
+    medicion.registrar(time.perf_counter() - programado, codigo)
+    return r
+
+
+async def dispositivo(cliente, paciente, intervalo, fin, medicion, lecturas_por_envio):
+    """Envía lecturas del paciente según un calendario fijo hasta `fin`.
+
+    El dispositivo mide cada `intervalo` segundos y envía juntas
+    `lecturas_por_envio` mediciones, cada una con su propia hora.
+    """
+    periodo = intervalo * lecturas_por_envio
+    programado = time.perf_counter() + random.uniform(0, periodo)
+    url = "/api/v1/service1/health-data/lote"
+    while programado < fin:
+        espera = programado - time.perf_counter()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        ahora = time.time()
+        lecturas = [paciente.lectura(ahora - (lecturas_por_envio - 1 - i) * intervalo)
+                    for i in range(lecturas_por_envio)]
+        await enviar(cliente, "POST", url, medicion, programado, json={"lecturas": lecturas})
+        programado += periodo
+
+
+async def dashboard(cliente, cedulas, intervalo, fin, medicion):
+    """Consulta el historial de pacientes al azar, reutilizando su ETag"""
+    etags = {}
+    programado = time.perf_counter() + random.uniform(0, intervalo)
+    while programado < fin:
+        espera = programado - time.perf_counter()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        cedula = random.choice(cedulas)
+        cabeceras = {"If-None-Match": etags[cedula]} if cedula in etags else {}
+        r = await enviar(cliente, "GET", f"/api/v1/service2/historial/{cedula}", medicion, programado,
+                         headers=cabeceras)
+        if r is not None and r.headers.get("etag"):
+            etags[cedula] = r.headers["etag"]
+        programado += intervalo
+
+
+async def registrar_pacientes(cliente, cedulas, concurrencia=50):
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def registrar(i, cedula):
+        async with semaforo:
+            r = await cliente.post("/api/v1/service1/pacientes",
+                                   params={"cedula": cedula, "nombre": "Carga", "apellido": f"Paciente{i}"})
+            r.raise_for_status()
+
+    await asyncio.gather(*(registrar(i, cedula) for i, cedula in enumerate(cedulas)))
+
+
+async def lecturas_procesadas(cliente):
+    """(lecturas procesadas por Service2, pendientes en el bus) o None si no se sabe"""
+    try:
+        r = await cliente.get("/api/v1/service2/eventos/metricas")
+        metricas = r.json()
+    except (httpx.HTTPError, ValueError):
+        return None
+    grupos = (metricas.get("bus") or {}).get("grupos") or {}
+    pendientes = sum((g.get("lag") or 0) + (g.get("pendientes") or 0) for g in grupos.values())
+    return metricas.get("lecturas_procesadas", 0), pendientes
+
+
+async def esperar_drenado(cliente, limite):
+    """Segundos hasta que Service2 no tiene lecturas pendientes (None si no se alcanza)"""
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < limite:
+        estado = await lecturas_procesadas(cliente)
+        if estado is None:
+            return None
+        if estado[1] == 0:
+            return round(time.perf_counter() - inicio, 2)
+        await asyncio.sleep(0.5)
+    return None
+
+
+async def correr(args):
+    rng = random.Random(args.semilla)
+    cedulas = [f"8{n:08d}" for n in range(args.pacientes)]
+    pacientes = [
+        Paciente(cedula, random.Random(rng.random()),
+                 rng.choice(CONDICIONES) if rng.random() < args.anomalos else None)
+        for cedula in cedulas
+    ]
+
+    limites = httpx.Limits(max_connections=args.conexiones, max_keepalive_connections=args.conexiones)
+    async with httpx.AsyncClient(base_url=args.gateway, limits=limites, timeout=args.timeout) as cliente:
+        print(f"📝 Registrando {len(cedulas)} pacientes...")
+        await registrar_pacientes(cliente, cedulas)
+
+        escrituras, lecturas = Medicion(), Medicion()
+        antes = await lecturas_procesadas(cliente)
+        print(f"🚀 {args.pacientes} dispositivos midiendo cada {args.intervalo}s y {args.dashboards} dashboards "
+              f"durante {args.duracion}s...")
+        inicio = time.perf_counter()
+        fin = inicio + args.duracion
+        await asyncio.gather(
+            *(dispositivo(cliente, p, args.intervalo, fin, escrituras, args.lecturas_por_envio) for p in pacientes),
+            *(dashboard(cliente, cedulas, args.intervalo_dashboard, fin, lecturas) for _ in range(args.dashboards)),
+        )
+        duracion = time.perf_counter() - inicio
+
+        drenado = await esperar_drenado(cliente, args.espera_drenado)
+        despues = await lecturas_procesadas(cliente)
+
+    procesadas = despues[0] - antes[0] if antes and despues else None
+    return {
+        "escrituras": escrituras.resumen(duracion),
+        "dashboards": lecturas.resumen(duracion),
+        "service2": {
+            "lecturas_procesadas": procesadas,
+            "procesadas_por_segundo": round(procesadas / duracion, 1) if procesadas is not None else None,
+            "drenado_s": drenado,
+        },
+        "duracion_s": round(duracion, 2),
+    }
+
+
+# --- Pila local desechable ---
+
+def _esperar(url, procesos, limite=30):
+    fin = time.time() + limite
+    while time.time() < fin:
+        for proceso in procesos:
+            if proceso.poll() is not None:
+                raise RuntimeError(f"El proceso {proceso.args[0]} terminó al arrancar")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError(f"{url} no respondió en {limite}s")
+
+
+def levantar_pila_local(directorio, puerto_base=18200):
+    """Arranca mongod, redis-server, Service1, Service2 y el gateway; devuelve (url, procesos)"""
+    faltantes = [binario for binario in ("mongod", "redis-server") if shutil.which(binario) is None]
+    if faltantes:
+        raise SystemExit(f"❌ --levantar necesita {', '.join(faltantes)} en el PATH")
+
+    puerto_mongo, puerto_redis = puerto_base + 17, puerto_base + 79
+    puertos = {"service1": puerto_base + 1, "service2": puerto_base + 2, "gateway": puerto_base}
+    os.makedirs(os.path.join(directorio, "mongo"))
+    env = {
+        **os.environ,
+        "MONGO_URI": f"mongodb://127.0.0.1:{puerto_mongo}",
+        "DB_NAME": "carga",
+        "REDIS_URL": f"redis://127.0.0.1:{puerto_redis}/0",
+        "HISTORIAL_DIR": os.path.join(directorio, "historial"),
+        "NAME1_SERVICE_URL": f"http://127.0.0.1:{puertos['service1']}",
+        "NAME2_SERVICE_URL": f"http://127.0.0.1:{puertos['service2']}",
+        "PYTHONUNBUFFERED": "1",
+        # Los dispositivos simulados no inician sesión
+        "AUTH_REQUERIDA": "false",
+    }
+    bitacora = open(os.path.join(directorio, "pila.log"), "w")
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning"]
+    comandos = [
+        ["mongod", "--dbpath", os.path.join(directorio, "mongo"), "--port", str(puerto_mongo),
+         "--bind_ip", "127.0.0.1", "--quiet"],
+        ["redis-server", "--port", str(puerto_redis), "--save", "", "--appendonly", "no"],
+        uvicorn + ["services.service1.main:app", "--port", str(puertos["service1"])],
+        uvicorn + ["services.service2.main:app", "--port", str(puertos["service2"])],
+        uvicorn + ["main:app", "--app-dir", str(RAIZ / "api-gateway"), "--port", str(puertos["gateway"])],
+    ]
+
+    procesos = []
+    try:
+        for comando in comandos:
+            procesos.append(subprocess.Popen(comando, cwd=RAIZ, env=env, stdout=bitacora, stderr=subprocess.STDOUT))
+            if comando[0] == "mongod":
+                time.sleep(1)  # Los servicios se conectan a MongoDB al importarse
+        for nombre in ("service1", "service2", "gateway"):
+            _esperar(f"http://127.0.0.1:{puertos[nombre]}/", procesos)
+    except BaseException:
+        detener_pila(procesos)
+        raise
+    print(f"✅ Pila local lista (bitácora en {bitacora.name})")
+    return f"http://127.0.0.1:{puertos['gateway']}", procesos
+
+
+def detener_pila(procesos):
+    for proceso in reversed(procesos):
+        proceso.terminate()
+    for proceso in procesos:
+        try:
+            proceso.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+
+# --- Resultados ---
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def corrida_anterior(ruta, config):
+    """Última corrida guardada con la misma configuración"""
+    if not os.path.exists(ruta):
+        return None
+    anterior = None
+    with open(ruta, encoding="utf-8") as archivo:
+        for linea in archivo:
+            corrida = json.loads(linea)
+            if corrida.get("config") == config:
+                anterior = corrida
+    return anterior
+
+
+def imprimir(corrida, anterior):
+    def variacion(actual, previo):
+        if actual is None or not previo:
+            return ""
+        return f" ({(actual - previo) / previo * 100:+.0f}%)"
+
+    print(f"\n{'Operación':<12}{'Total':>8}{'Req/s':>9}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+          f"{'p99 (ms)':>10}{'Errores':>9}")
+    for nombre in ("escrituras", "dashboards"):
+        r = corrida["resultados"][nombre]
+        print(f"{nombre:<12}{r['total']:>8}{r['por_segundo']:>9.1f}{r['p50_ms'] or 0:>10.1f}"
+              f"{r['p95_ms'] or 0:>10.1f}{r['p99_ms'] or 0:>10.1f}{r['errores']:>9}")
+        if anterior:
+            previo = anterior["resultados"][nombre]
+            print(f"{'  vs ' + (anterior.get('commit') or '?'):<12}{'':>8}"
+                  f"{variacion(r['por_segundo'], previo['por_segundo']):>9}{variacion(r['p50_ms'], previo['p50_ms']):>10}"
+                  f"{variacion(r['p95_ms'], previo['p95_ms']):>10}{variacion(r['p99_ms'], previo['p99_ms']):>10}")
+
+    s2 = corrida["resultados"]["service2"]
+    print(f"\nService2: {s2['lecturas_procesadas']} lecturas procesadas "
+          f"({s2['procesadas_por_segundo']}/s), drenado en {s2['drenado_s']}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gateway", default="http://127.0.0.1:8000", help="URL del API Gateway")
+    parser.add_argument("--levantar", action="store_true", help="Arrancar una pila local desechable")
+    parser.add_argument("--pacientes", type=int, default=200, help="Dispositivos simulados")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="Segundos entre mediciones de cada dispositivo")
+    parser.add_argument("--lecturas-por-envio", type=int, default=1, help="Mediciones que el dispositivo envía juntas")
+    parser.add_argument("--dashboards", type=int, default=20, help="Clientes consultando el historial")
+    parser.add_argument("--intervalo-dashboard", type=float, default=2.0)
+    parser.add_argument("--anomalos", type=float, default=0.05, help="Fracción de pacientes con alguna condición")
+    parser.add_argument("--duracion", type=float, default=30)
+    parser.add_argument("--conexiones", type=int, default=200, help="Conexiones HTTP máximas del generador")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--espera-drenado", type=float, default=60)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--etiqueta", default="", help="Nombre libre de la corrida (rama, cambio probado)")
+    parser.add_argument("--resultados", default=str(RESULTADOS), help="Archivo JSONL donde se agregan las corridas")
+    args = parser.parse_args()
+    if args.intervalo < 1:
+        # Los timestamps tienen resolución de segundos y Service2 descarta
+        # lecturas con un timestamp que no avanza
+        parser.error("--intervalo debe ser de al menos 1 segundo; usa más --pacientes para subir la tasa")
+
+    config = {campo: getattr(args, campo) for campo in (
+        "pacientes", "intervalo", "lecturas_por_envio", "dashboards", "intervalo_dashboard",
+        "anomalos", "duracion", "semilla", "levantar"
+    )}
+
+    procesos = []
+    with tempfile.TemporaryDirectory(prefix="carga-") as directorio:
+        if args.levantar:
+            args.gateway, procesos = levantar_pila_local(directorio)
+        try:
+            resultados = asyncio.run(correr(args))
+        finally:
+            detener_pila(procesos)
+
+    corrida = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "etiqueta": args.etiqueta,
+        "config": config,
+        "resultados": resultados,
+    }
+    anterior = corrida_anterior(args.resultados, config)
+    imprimir(corrida, anterior)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.resultados)), exist_ok=True)
+    with open(args.resultados, "a", encoding="utf-8") as archivo:
+        archivo.write(json.dumps(corrida, ensure_ascii=False) + "\n")
+    print(f"📄 Resultados agregados a {args.resultados}")
@@ -1,6 +1,9 @@
 """
 Script para registrar pacientes de prueba en el sistema
-Ejecutar: python registrar_pacientes.py
+Ejecutar: python crear_pacientes.py
+
+Para cargar muchos usuarios y pacientes a la vez usa la importación masiva:
+    python -m services.importar_usuarios pacientes.csv
 """
 
 import requests
@@ -47,8 +50,6 @@ def registrar_pacientes():
             else:
                 print(f"❌ Error registrando {paciente['nombre']}: {response.text}")
             
-            time.sleep(1)
-            
         except Exception as e:
             print(f"❌ Error: {e}")
     
@@ -3,6 +3,7 @@ from functools import wraps
 import requests
 import os
 import sys
+import time
 from dotenv import load_dotenv
 
 # Agregar el directorio services al path para importar
@@ -10,6 +11,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 # Importar funciones de tu módulo de base de datos existente
 from services import data_base_mongo as db_mongo
+from services.contrasenas import IntentosExcedidos, ServicioSaturado
 
 load_dotenv()
 
@@ -17,6 +19,62 @@ app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'clave_secreta_cambiar_en_produccion')
 
 SERVICE2_URL = os.getenv('SERVICE2_URL', 'http://127.0.0.1:8002/historial')
+# Servicio de tiempo real (SSE); el navegador se conecta a él directamente
+TIEMPO_REAL_URL = os.getenv('TIEMPO_REAL_URL', 'http://127.0.0.1:8005')
+# Servicio de autenticación: si está configurado, el login obtiene de él un
+# token de acceso que se reenvía a los microservicios
+AUTH_SERVICE_URL = os.getenv('AUTH_SERVICE_URL')
+# El token se renueva en cualquier petición que llegue a menos de este tiempo
+# (s) de su vencimiento: la sesión sigue mientras el usuario esté activo
+RENOVAR_ANTES = int(os.getenv('TOKEN_RENOVAR_ANTES', '300'))
+
+
+def autenticar_con_servicio(cedula, password):
+    """Login contra el servicio de autenticación; devuelve (usuario, datos del token, error)"""
+    r = requests.post(f"{AUTH_SERVICE_URL}/login", json={"cedula": cedula, "password": password}, timeout=10)
+    if r.status_code == 200:
+        datos = r.json()
+        return datos["usuario"], datos, None
+    if r.status_code == 401:
+        return None, None, None
+    return None, None, (r.json().get("detail", "Error del servidor"), r.status_code)
+
+
+def guardar_token(datos):
+    session['token'] = datos["access_token"]
+    session['token_vence'] = time.time() + datos.get("expires_in", 0)
+
+
+def renovar_token(forzar=False):
+    """Renueva el token de la sesión si está por vencer; False si ya no es válido.
+
+    Si el servicio de autenticación no responde se sigue usando el actual.
+    """
+    if not session.get('token') or not AUTH_SERVICE_URL:
+        return True
+    if not forzar and session.get('token_vence', 0) - time.time() > RENOVAR_ANTES:
+        return True
+    try:
+        r = requests.post(f"{AUTH_SERVICE_URL}/token/renovar",
+                          headers={"Authorization": f"Bearer {session['token']}"}, timeout=5)
+    except requests.RequestException as e:
+        print(f"No se pudo renovar el token: {e}")
+        return True
+    if r.status_code == 200:
+        guardar_token(r.json())
+        return True
+    if r.status_code == 401:
+        # Token vencido, revocado o sesión demasiado larga: hay que volver a iniciar sesión
+        session.clear()
+        return False
+    print(f"No se pudo renovar el token: {r.status_code}")
+    return True
+
+
+def cabeceras_servicios():
+    """Cabecera Authorization con el token de la sesión, si hay uno"""
+    token = session.get('token')
+    return {"Authorization": f"Bearer {token}"} if token else {}
 
 # Decorador para requerir login
 def login_required(f):
@@ -69,8 +127,14 @@ def login():
         return jsonify({"success": False, "message": "Faltan datos"}), 400
     
     try:
-        # Autenticar usando la función de tu módulo
-        usuario = db_mongo.autenticar_usuario(cedula, password)
+        datos_token = None
+        if AUTH_SERVICE_URL:
+            usuario, datos_token, error = autenticar_con_servicio(cedula, password)
+            if error:
+                return jsonify({"success": False, "message": error[0]}), error[1]
+        else:
+            # Autenticar usando la función de tu módulo
+            usuario = db_mongo.autenticar_usuario(cedula, password)
         
         if usuario:
             # Crear sesión
@@ -80,6 +144,8 @@ def login():
                 'rol': usuario['rol'],
                 'especialidad': usuario.get('especialidad', '')
             }
+            if datos_token:
+                guardar_token(datos_token)
             return jsonify({
                 "success": True,
                 "rol": usuario['rol'],
@@ -87,7 +153,13 @@ def login():
             })
         
         return jsonify({"success": False, "message": "Credenciales inválidas"}), 401
-        
+
+    except IntentosExcedidos as e:
+        respuesta = jsonify({"success": False, "message": str(e)})
+        return respuesta, 429, {"Retry-After": str(int(e.espera) + 1)}
+    except ServicioSaturado:
+        respuesta = jsonify({"success": False, "message": "Servidor ocupado, intenta de nuevo en unos segundos"})
+        return respuesta, 503, {"Retry-After": "2"}
     except Exception as e:
         print(f"Error en login: {e}")
         return jsonify({"success": False, "message": "Error del servidor"}), 500
@@ -141,7 +213,14 @@ def registro():
 @app.route("/logout")
 def logout():
     """Cierra la sesión"""
+    token = session.pop('token', None)
+    session.pop('token_vence', None)
     session.pop('user', None)
+    if token and AUTH_SERVICE_URL:
+        try:
+            requests.post(f"{AUTH_SERVICE_URL}/logout", headers={"Authorization": f"Bearer {token}"}, timeout=5)
+        except requests.RequestException as e:
+            print(f"No se pudo revocar el token: {e}")
     return redirect(url_for('login_page'))
 
 # ============= DASHBOARDS =============
@@ -151,14 +230,16 @@ def logout():
 def paciente_dashboard():
     """Dashboard para pacientes"""
     user = session['user']
-    return render_template("paciente_dashboard.html", user=user)
+    return render_template("paciente_dashboard.html", user=user, tiempo_real_url=TIEMPO_REAL_URL,
+                           token=session.get('token', ''))
 
 @app.route("/medico/dashboard")
 @role_required('medico')
 def medico_dashboard():
     """Dashboard para médicos"""
     user = session['user']
-    return render_template("medico_dashboard.html", user=user)
+    return render_template("medico_dashboard.html", user=user, tiempo_real_url=TIEMPO_REAL_URL,
+                           token=session.get('token', ''))
 
 # ============= APIs =============
 
@@ -167,9 +248,16 @@ def medico_dashboard():
 def get_data(cedula):
     """Obtiene el historial de salud por cédula"""
     try:
-        response = requests.get(f"{SERVICE2_URL}/{cedula}")
+        response = requests.get(f"{SERVICE2_URL}/{cedula}", headers=cabeceras_servicios())
+        if response.status_code == 401 and renovar_token(forzar=True):
+            # Token rechazado antes de tiempo (p. ej. rotación de claves): se reintenta con uno nuevo
+            response = requests.get(f"{SERVICE2_URL}/{cedula}", headers=cabeceras_servicios())
         if response.status_code == 200:
             return jsonify(response.json())
+        elif response.status_code == 401:
+            # Token vencido o revocado: hay que volver a iniciar sesión
+            session.clear()
+            return jsonify({"error": "Sesión expirada"}), 401
         elif response.status_code == 404:
             return jsonify({"error": "No se encontró historial para esta cédula"}), 404
         else:
@@ -177,16 +265,28 @@ def get_data(cedula):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/token")
+@login_required
+def obtener_token():
+    """Token vigente de la sesión, para reconectar el canal en vivo (va en la URL)"""
+    return jsonify({"token": session.get('token', '')})
+
 @app.route("/api/pacientes")
 @role_required('medico')
 def get_pacientes():
-    """Lista todos los pacientes (solo para médicos)"""
+    """Lista los pacientes por páginas (solo para médicos)
+
+    Parámetros: `despues_de` (cédula del último paciente de la página
+    anterior) y `limite`. Devuelve {"pacientes": [...], "siguiente": cedula}.
+    """
+    despues_de = request.args.get('despues_de')
+    limite = request.args.get('limite', 50, type=int)
     try:
-        pacientes = db_mongo.obtener_pacientes()
-        return jsonify(pacientes)
+        pacientes, siguiente = db_mongo.obtener_pacientes_pagina(despues_de, limite)
+        return jsonify({"pacientes": pacientes, "siguiente": siguiente})
     except Exception as e:
         print(f"Error al obtener pacientes: {e}")
-        return jsonify([])
+        return jsonify({"pacientes": [], "siguiente": None})
 
 # ============= PÁGINAS DE ERROR =============
 
@@ -207,6 +307,12 @@ def inicializar_db():
         db_mongo.inicializar_datos_prueba()
         app.db_initialized = True
 
+@app.before_request
+def mantener_sesion():
+    """Renovación deslizante: cada petición renueva el token si está por vencer"""
+    if request.endpoint != 'static':
+        renovar_token()
+
 if __name__ == "__main__":
     print("🚀 Iniciando servidor Flask...")
     print(f"📊 Usando conexión MongoDB desde services/data_base_mongo.py")
@@ -14,6 +14,10 @@ const lastTempElement = document.getElementById('last-temp');
 
 let currentCedula = null;
 let updateInterval = null;
+let liveSource = null;
+
+// Puntos que se muestran en las gráficas (igual que /historial por defecto)
+const MAX_POINTS = 20;
 
 // Configuración de gráficas
 let bpmChart = new Chart(bpmCtx, {
@@ -100,6 +104,10 @@ async function updateCharts() {
     const res = await fetch(`/api/data/${currentCedula}`);
     
     if (!res.ok) {
+      if (res.status === 401) {
+        window.location.href = '/login';
+        return;
+      }
       if (res.status === 404) {
         showStatus('No se encontró historial para esta cédula', true);
         clearCharts();
@@ -183,22 +191,106 @@ function checkAlerts(bpm, temp) {
   }
 }
 
+// Agrega a las gráficas una lectura recibida por el canal en vivo
+function appendReading(evento) {
+  const label = evento.timestamp.split(' ')[1].substring(0, 5); // HH:MM
+  const bpm = evento.datos.ritmo_cardiaco;
+  const temp = evento.datos.temperatura;
+
+  for (const [chart, value] of [[bpmChart, bpm], [tempChart, temp]]) {
+    chart.data.labels.push(label);
+    chart.data.datasets[0].data.push(value);
+    if (chart.data.labels.length > MAX_POINTS) {
+      chart.data.labels.shift();
+      chart.data.datasets[0].data.shift();
+    }
+    chart.update();
+  }
+
+  lastBpmElement.textContent = bpm;
+  lastTempElement.textContent = temp.toFixed(1);
+  checkAlerts(bpm, temp);
+
+  if (evento.omitidas) {
+    showStatus(`Conexión lenta: se omitieron ${evento.omitidas} lecturas intermedias`);
+  }
+}
+
+function startPolling() {
+  if (!updateInterval) {
+    updateInterval = setInterval(updateCharts, 5000);
+  }
+}
+
+function stopPolling() {
+  if (updateInterval) {
+    clearInterval(updateInterval);
+    updateInterval = null;
+  }
+}
+
+function stopLiveUpdates() {
+  stopPolling();
+  if (liveSource) {
+    liveSource.close();
+    liveSource = null;
+  }
+}
+
+// Carga el historial y luego recibe cada lectura nueva por SSE desde el
+// servicio de tiempo real. Si el canal no está disponible se consulta el
+// historial cada 5 segundos hasta que el navegador logre reconectar.
+function startLiveUpdates() {
+  stopLiveUpdates();
+  updateCharts();
+
+  if (!window.EventSource || !window.LIVE_FEED_URL) {
+    startPolling();
+    return;
+  }
+
+  // EventSource no admite cabeceras: el token de acceso va en la URL
+  const query = window.LIVE_FEED_TOKEN ? `?token=${encodeURIComponent(window.LIVE_FEED_TOKEN)}` : '';
+  liveSource = new EventSource(`${window.LIVE_FEED_URL}/stream/${encodeURIComponent(currentCedula)}${query}`);
+  liveSource.addEventListener('lectura', (e) => appendReading(JSON.parse(e.data)));
+  liveSource.onopen = () => {
+    // Al (re)conectar se recupera lo que llegó mientras no había canal
+    if (updateInterval) {
+      stopPolling();
+      updateCharts();
+    }
+  };
+  liveSource.onerror = () => {
+    startPolling();
+    refreshLiveToken();
+  };
+}
+
+// El token de la URL del canal vence con la sesión renovada: si el canal
+// falla se pide el token vigente y, si cambió, se reconecta con él
+async function refreshLiveToken() {
+  if (!window.LIVE_FEED_TOKEN) return;
+  try {
+    const res = await fetch('/api/token');
+    if (!res.ok) return;
+    const { token } = await res.json();
+    if (token && token !== window.LIVE_FEED_TOKEN) {
+      window.LIVE_FEED_TOKEN = token;
+      startLiveUpdates();
+    }
+  } catch (error) {
+    console.error('No se pudo renovar el token del canal en vivo:', error);
+  }
+}
+
 // Función para iniciar el monitoreo
 function startMonitoring(cedula) {
   currentCedula = cedula;
   patientCedula.textContent = cedula;
   patientInfo.classList.remove('hidden');
-  
-  // Limpiar intervalo anterior si existe
-  if (updateInterval) {
-    clearInterval(updateInterval);
-  }
-  
-  // Primera actualización inmediata
-  updateCharts();
-  
-  // Actualizar cada 5 segundos
-  updateInterval = setInterval(updateCharts, 5000);
+
+  // Primera carga inmediata y luego actualizaciones en vivo
+  startLiveUpdates();
 }
 
 // Event listener para el botón de búsqueda
@@ -225,9 +317,7 @@ cedulaInput.addEventListener('keypress', (e) => {
   }
 });
 
-// Limpiar intervalo al cerrar la página
+// Cerrar el canal en vivo y el intervalo al cerrar la página
 window.addEventListener('beforeunload', () => {
-  if (updateInterval) {
-    clearInterval(updateInterval);
-  }
+  stopLiveUpdates();
 });
\ No newline at end of file
@@ -1,5 +1,7 @@
 from google.adk.agents.llm_agent import Agent
 
+from .health_data import HERRAMIENTAS
+
 root_agent = Agent(
     model='gemini-2.5-flash',
     name='Pulsito',
@@ -26,5 +28,11 @@ Rangos normales de referencia para adultos:
 - Frecuencia respiratoria: 12-20 respiraciones por minuto
 - Saturación de oxígeno: 95-100%
 
+Datos del paciente:
+- El paciente ya está seleccionado; consulta sus datos con las herramientas y no inventes valores
+- Usa ultima_lectura para su estado actual, historial_lecturas o alertas_recientes para lecturas previas y resumen_signos para tendencias en rangos de tiempo largos
+- Pide solo los datos que necesites para responder; si la pregunta no requiere datos del paciente, no uses herramientas
+
 Recuerda siempre indicar que tus respuestas son orientativas y no sustituyen la evaluación de un médico profesional.''',
+    tools=HERRAMIENTAS,
 )
\ No newline at end of file
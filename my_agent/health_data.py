@@ -1,16 +1,312 @@
-# my_agent/health_data.py
-import requests
+"""
+Herramientas de datos clínicos para el agente Pulsito.
 
-SERVICE2_URL = "http://127.0.0.1:8002/analyze"  # endpoint del último registro
+En lugar de pegar los signos vitales en cada mensaje, el modelo pide solo
+lo que necesita para responder:
 
-def get_latest_health_data():
+- `ultima_lectura`: último análisis (signos vitales y alertas), de Service2
+- `historial_lecturas`: últimas lecturas analizadas, de Service2
+- `resumen_signos`: mínimos, máximos y promedios por minuto/hora/día, de Service1
+- `alertas_recientes`: solo las lecturas recientes con alertas, de Service2
+
+El paciente no es un argumento: se toma del estado de la sesión de ADK
+(`cedula`), que el bot fija con la cédula elegida por el usuario, así el
+modelo no puede consultar a otros pacientes.
+
+Las consultas pasan por `ClienteServicios`: conexiones reutilizadas y una
+caché de `BOT_HERRAMIENTAS_TTL` segundos, así varias herramientas (o el bot
+y una herramienta) en el mismo turno no repiten la misma petición. Cada
+llamada a una herramienta se mide; `tiempos_herramientas()` da el resumen.
+
+Con `AUTH_REQUERIDA=true` los servicios exigen token: el bot inicia sesión
+en `AUTH_SERVICE_URL` con su propia cuenta (`BOT_CEDULA`, `BOT_PASSWORD`,
+de rol médico) y envía ese token en cada consulta, renovándolo antes de que
+venza o si un servicio lo rechaza.
+"""
+
+import asyncio
+import functools
+import os
+import statistics
+import time
+from collections import OrderedDict, defaultdict, deque
+
+import httpx
+from google.adk.tools import ToolContext
+
+SERVICE1_URL = os.getenv("SERVICE1_URL", "http://127.0.0.1:8001")
+SERVICE2_URL = os.getenv("SERVICE2_URL", "http://127.0.0.1:8002")
+BOT_HERRAMIENTAS_TTL = float(os.getenv("BOT_HERRAMIENTAS_TTL", "5"))
+BOT_HERRAMIENTAS_CACHE_MAX = int(os.getenv("BOT_HERRAMIENTAS_CACHE_MAX", "2000"))
+BOT_MAX_CONEXIONES = int(os.getenv("BOT_MAX_CONEXIONES", "100"))
+
+# Credencial de servicio del bot (sin ella las consultas van sin token)
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL")
+BOT_CEDULA = os.getenv("BOT_CEDULA")
+BOT_PASSWORD = os.getenv("BOT_PASSWORD")
+# El token se renueva este tiempo antes de vencer (s)
+MARGEN_RENOVACION = 60
+
+# Máximos que el modelo puede pedir (acotan el tamaño de las respuestas)
+MAX_LECTURAS = 20
+MAX_RESUMENES = 48
+PERIODOS = ("minuto", "hora", "dia")
+
+# Muestras de duración que se conservan por herramienta
+MUESTRAS_TIEMPO = 1000
+
+
+class ClienteServicios:
+    """Cliente HTTP compartido hacia Service1 y Service2 con caché de respuestas"""
+
+    def __init__(self, ttl=BOT_HERRAMIENTAS_TTL, max_entradas=BOT_HERRAMIENTAS_CACHE_MAX,
+                 auth_url=AUTH_SERVICE_URL, cedula=BOT_CEDULA, password=BOT_PASSWORD):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.auth_url = auth_url
+        self.credenciales = {"cedula": cedula, "password": password} if cedula and password else None
+        self._cliente = None
+        self._cache = OrderedDict()  # (url, params) -> (expira, datos)
+        self._token = None
+        self._token_vence = 0.0
+        self._lock_token = asyncio.Lock()
+        self.contadores = {"aciertos": 0, "peticiones": 0, "inicios_sesion": 0}
+
+    def iniciar(self):
+        if self._cliente is None:
+            self._cliente = httpx.AsyncClient(
+                timeout=httpx.Timeout(10, connect=5),
+                limits=httpx.Limits(max_connections=BOT_MAX_CONEXIONES,
+                                    max_keepalive_connections=BOT_MAX_CONEXIONES // 2),
+            )
+
+    async def cerrar(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+        self._cache.clear()
+        self._token = None
+
+    async def _cabeceras(self, renovar=False):
+        """Cabecera con el token de servicio del bot (vacía si no tiene credenciales)"""
+        if self.credenciales is None or not self.auth_url:
+            return {}
+        async with self._lock_token:
+            if renovar or self._token is None or time.monotonic() > self._token_vence:
+                response = await self._cliente.post(f"{self.auth_url}/login", json=self.credenciales)
+                response.raise_for_status()
+                datos = response.json()
+                self._token = datos["access_token"]
+                self._token_vence = time.monotonic() + datos.get("expires_in", 0) - MARGEN_RENOVACION
+                self.contadores["inicios_sesion"] += 1
+            return {"Authorization": f"Bearer {self._token}"}
+
+    async def obtener(self, url, params=None, timeout=httpx.USE_CLIENT_DEFAULT):
+        """JSON de un GET (None si 404); las respuestas se reutilizan durante el TTL"""
+        clave = (url, tuple(sorted((params or {}).items())))
+        entrada = self._cache.get(clave)
+        if entrada is not None:
+            if entrada[0] > time.monotonic():
+                self._cache.move_to_end(clave)
+                self.contadores["aciertos"] += 1
+                return entrada[1]
+            del self._cache[clave]
+
+        self.iniciar()
+        self.contadores["peticiones"] += 1
+        response = await self._cliente.get(url, params=params, headers=await self._cabeceras(), timeout=timeout)
+        if response.status_code == 401 and self.credenciales is not None:
+            # Token revocado o rotado antes de tiempo: se inicia sesión de nuevo una vez
+            response = await self._cliente.get(url, params=params, headers=await self._cabeceras(renovar=True),
+                                               timeout=timeout)
+        if response.status_code == 404:
+            datos = None
+        else:
+            response.raise_for_status()
+            datos = response.json()
+
+        self._cache[clave] = (time.monotonic() + self.ttl, datos)
+        while len(self._cache) > self.max_entradas:
+            self._cache.popitem(last=False)
+        return datos
+
+
+servicios = ClienteServicios()
+
+# Duraciones recientes (s) y errores por herramienta
+_duraciones = defaultdict(lambda: deque(maxlen=MUESTRAS_TIEMPO))
+_errores = defaultdict(int)
+
+
+def medir(herramienta):
+    """Registra la duración de cada llamada a la herramienta"""
+    @functools.wraps(herramienta)
+    async def envoltura(*args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = None
+        try:
+            resultado = await herramienta(*args, **kwargs)
+            return resultado
+        finally:
+            duracion = time.perf_counter() - inicio
+            _duraciones[herramienta.__name__].append(duracion)
+            if resultado is None or "error" in resultado:
+                _errores[herramienta.__name__] += 1
+            print(f"🔧 {herramienta.__name__} en {duracion * 1000:.0f} ms")
+    return envoltura
+
+
+def tiempos_herramientas():
+    """Llamadas, errores y percentiles de duración (ms) por herramienta"""
+    resumen = {}
+    for nombre, duraciones in _duraciones.items():
+        ordenadas = sorted(duraciones)
+        resumen[nombre] = {
+            "llamadas": len(ordenadas),
+            "errores": _errores[nombre],
+            "p50_ms": round(statistics.median(ordenadas) * 1000, 1),
+            "p95_ms": round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))] * 1000, 1),
+        }
+    return resumen
+
+
+def _cedula(tool_context):
+    return tool_context.state.get("cedula") if tool_context else None
+
+
+def _limite(limite):
+    """Número de lecturas pedido por el modelo, acotado (None si no es un número)"""
     try:
-        response = requests.get(SERVICE2_URL)
-        if response.status_code == 200:
-            data = response.json()
-            if "datos" in data:
-                return data["datos"]  # Retorna solo los datos de salud
-        return None
-    except Exception as e:
-        print("⚠️ Error al obtener datos de salud:", e)
+        return min(max(int(limite), 1), MAX_LECTURAS)
+    except (TypeError, ValueError):
         return None
+
+
+def _compactar(registro):
+    """Solo lo que el modelo necesita de un análisis"""
+    return {
+        "timestamp": registro.get("timestamp"),
+        "datos": registro.get("datos", {}),
+        "alertas": registro.get("alertas", []),
+    }
+
+
+async def _consultar(url, params=None):
+    try:
+        return await servicios.obtener(url, params), None
+    except httpx.TimeoutException:
+        return None, {"error": "El servicio de datos está tardando demasiado"}
+    except httpx.HTTPError as e:
+        print(f"⚠️ Error al consultar {url}: {e}")
+        return None, {"error": "No se pudieron consultar los datos del paciente"}
+
+
+@medir
+async def ultima_lectura(tool_context: ToolContext) -> dict:
+    """Obtiene la lectura más reciente de signos vitales del paciente seleccionado,
+    con las alertas detectadas (ritmo cardíaco, temperatura, presión, oxígeno).
+
+    Returns:
+        dict: nombre del paciente, fecha de la lectura, signos vitales y alertas.
+    """
+    cedula = _cedula(tool_context)
+    if not cedula:
+        return {"error": "No hay un paciente seleccionado"}
+    datos, error = await _consultar(f"{SERVICE2_URL}/analyze/{cedula}")
+    if error:
+        return error
+    if not datos or "datos" not in datos:
+        return {"error": f"No hay signos vitales registrados para la cédula {cedula}"}
+    return {"paciente": datos.get("paciente", {}).get("nombre"), **_compactar(datos)}
+
+
+@medir
+async def historial_lecturas(limite: int, tool_context: ToolContext) -> dict:
+    """Obtiene las últimas lecturas analizadas del paciente seleccionado, de la
+    más antigua a la más reciente. Útil para ver cómo han cambiado sus signos.
+
+    Args:
+        limite: número de lecturas a devolver (1 a 20).
+
+    Returns:
+        dict: total de lecturas guardadas y la lista de lecturas con sus alertas.
+    """
+    cedula = _cedula(tool_context)
+    if not cedula:
+        return {"error": "No hay un paciente seleccionado"}
+    limite = _limite(limite)
+    if limite is None:
+        return {"error": f"El límite debe ser un número entre 1 y {MAX_LECTURAS}"}
+    datos, error = await _consultar(f"{SERVICE2_URL}/historial/{cedula}", {"limit": limite})
+    if error:
+        return error
+    if not datos:
+        return {"error": f"No hay historial para la cédula {cedula}"}
+    return {
+        "total_registros": datos.get("total_registros"),
+        "lecturas": [_compactar(registro) for registro in datos.get("historial", [])],
+    }
+
+
+@medir
+async def resumen_signos(periodo: str, desde: str, hasta: str, tool_context: ToolContext) -> dict:
+    """Obtiene mínimos, máximos y promedios de ritmo cardíaco, temperatura y
+    oxígeno del paciente seleccionado, agrupados por periodo. Útil para
+    preguntas sobre tendencias o rangos de tiempo largos.
+
+    Args:
+        periodo: "minuto", "hora" o "dia".
+        desde: inicio del rango, "YYYY-MM-DD" o "YYYY-MM-DD HH:MM:SS"; vacío para no acotar.
+        hasta: fin del rango, en el mismo formato; vacío para no acotar.
+
+    Returns:
+        dict: lista de resúmenes por periodo, del más reciente al más antiguo.
+    """
+    cedula = _cedula(tool_context)
+    if not cedula:
+        return {"error": "No hay un paciente seleccionado"}
+    if periodo not in PERIODOS:
+        return {"error": f"Periodo inválido, usa uno de: {', '.join(PERIODOS)}"}
+    params = {"periodo": periodo, "limit": MAX_RESUMENES}
+    if desde:
+        params["desde"] = desde
+    if hasta:
+        params["hasta"] = hasta
+    datos, error = await _consultar(f"{SERVICE1_URL}/health-data/{cedula}/rollup", params)
+    if error:
+        return error
+    if not datos:
+        return {"error": f"Paciente con cédula {cedula} no encontrado"}
+    return {"periodo": periodo, "resumenes": datos.get("resumenes", [])}
+
+
+@medir
+async def alertas_recientes(limite: int, tool_context: ToolContext) -> dict:
+    """Obtiene las alertas del paciente seleccionado entre sus últimas lecturas
+    (solo las lecturas que tuvieron alguna alerta).
+
+    Args:
+        limite: cuántas lecturas recientes revisar (1 a 20).
+
+    Returns:
+        dict: lecturas revisadas y las que tuvieron alertas, con sus valores.
+    """
+    cedula = _cedula(tool_context)
+    if not cedula:
+        return {"error": "No hay un paciente seleccionado"}
+    limite = _limite(limite)
+    if limite is None:
+        return {"error": f"El límite debe ser un número entre 1 y {MAX_LECTURAS}"}
+    datos, error = await _consultar(f"{SERVICE2_URL}/historial/{cedula}", {"limit": limite})
+    if error:
+        return error
+    if not datos:
+        return {"error": f"No hay historial para la cédula {cedula}"}
+    registros = datos.get("historial", [])
+    return {
+        "lecturas_revisadas": len(registros),
+        "con_alertas": [_compactar(registro) for registro in registros if registro.get("alertas")],
+    }
+
+
+HERRAMIENTAS = [ultima_lectura, historial_lecturas, resumen_signos, alertas_recientes]
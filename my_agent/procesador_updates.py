@@ -0,0 +1,65 @@
+"""
+Procesador de updates de Telegram: usuarios en paralelo, cada uno en orden.
+
+python-telegram-bot procesa por defecto un update a la vez; con
+`concurrent_updates=True` los procesa todos en paralelo, lo que desordena
+los mensajes de un mismo chat (y el estado del ConversationHandler). Este
+procesador serializa los updates de cada usuario con un candado propio y
+deja que los de usuarios distintos corran a la vez, hasta
+`max_concurrent_updates` en total.
+"""
+
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+
+def clave_usuario(update):
+    """Usuario (o chat) al que pertenece el update; None si no tiene"""
+    usuario = getattr(update, "effective_user", None)
+    if usuario is not None:
+        return ("usuario", usuario.id)
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    return None
+
+
+class ProcesadorPorUsuario(BaseUpdateProcessor):
+    """Updates de distintos usuarios en paralelo; los de cada usuario, en orden de llegada"""
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._candados = {}  # clave -> [asyncio.Lock, updates en espera o en curso]
+
+    async def process_update(self, update, coroutine):
+        # El candado del usuario se toma antes que el cupo global: un usuario
+        # con muchos mensajes en cola no ocupa cupos mientras espera su turno.
+        # asyncio.Lock atiende en orden de llegada y la aplicación crea una
+        # tarea por update en el orden en que los recibe.
+        clave = clave_usuario(update)
+        if clave is None:
+            await super().process_update(update, coroutine)
+            return
+
+        entrada = self._candados.setdefault(clave, [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            async with entrada[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                del self._candados[clave]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def usuarios_activos(self):
+        return len(self._candados)
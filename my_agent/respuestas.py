@@ -0,0 +1,173 @@
+"""
+Respuestas de Pulsito sin llamar al modelo cuando no hace falta.
+
+- Los botones del menú ("📊 Ver mis signos vitales", "📋 Ver historial") se
+  responden con plantillas a partir de los datos de Service2.
+- Las demás preguntas se guardan en una caché con vencimiento, con clave
+  (cédula, pregunta normalizada, huella de la última lectura, huella de la
+  conversación previa): la misma pregunta sobre la misma lectura y con el
+  mismo contexto no vuelve a llamar al modelo, y una lectura nueva invalida
+  la respuesta. Una pregunta que depende de la conversación ("¿y ayer?")
+  solo reutiliza respuestas dadas dentro de esa misma conversación.
+- Si llegan preguntas idénticas mientras el modelo aún responde la primera,
+  todas esperan esa misma llamada.
+
+El modelo se recibe como función asíncrona `(user_id, texto, **extra) -> str`,
+así que puede reemplazarse por uno falso en pruebas y benchmarks.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+RESPUESTAS_CACHE_TTL = float(os.getenv("BOT_RESPUESTAS_TTL", "600"))
+RESPUESTAS_CACHE_MAX = int(os.getenv("BOT_RESPUESTAS_MAX", "5000"))
+
+BOTON_SIGNOS = "📊 Ver mis signos vitales"
+BOTON_HISTORIAL = "📋 Ver historial"
+
+
+def normalizar_pregunta(texto):
+    """Minúsculas, sin tildes, signos ni espacios repetidos"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", texto).split())
+
+
+def huella_signos(health_data):
+    """Identifica la lectura analizada: cambia con cualquier dato o alerta nueva"""
+    if not health_data or "datos" not in health_data:
+        return None
+    contenido = {
+        "timestamp": health_data.get("timestamp"),
+        "datos": health_data["datos"],
+        "alertas": health_data.get("alertas", []),
+    }
+    return hashlib.sha1(json.dumps(contenido, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def formatear_signos(health_data, cedula):
+    """Resumen de la última lectura del paciente"""
+    datos = health_data["datos"]
+    paciente = health_data.get("paciente", {})
+    alertas = health_data.get("alertas", [])
+    return (
+        f"📊 **Paciente:** {paciente.get('nombre', 'Desconocido')}\n"
+        f"📋 **Cédula:** {cedula}\n"
+        f"🕐 **Última lectura:** {health_data.get('timestamp', 'N/A')}\n\n"
+        f"**Signos vitales:**\n"
+        f"❤️ Ritmo cardíaco: {datos.get('ritmo_cardiaco', 'N/A')} bpm\n"
+        f"🌡️ Temperatura: {datos.get('temperatura', 'N/A')} °C\n"
+        f"💉 Presión arterial: {datos.get('presion', 'N/A')}\n"
+        f"🫁 Saturación de oxígeno: {datos.get('oxigeno', 'N/A')} %\n\n"
+        f"**Alertas:** {', '.join(alertas)}\n\n"
+    )
+
+
+def plantilla_signos(health_data, cedula):
+    """Respuesta al botón de signos vitales"""
+    texto = formatear_signos(health_data, cedula)
+    if health_data.get("alertas"):
+        texto += "⚠️ Hay valores fuera de rango; consulta con un profesional de la salud."
+    else:
+        texto += "✅ Todos los valores están dentro de los rangos normales."
+    return texto
+
+
+def plantilla_historial(historial, cedula):
+    """Respuesta al botón de historial (registros de /historial de Service2)"""
+    registros = historial.get("historial", [])
+    if not registros:
+        return f"⚠️ No hay historial para la cédula {cedula}."
+    lineas = [f"📋 Últimos {len(registros)} registros de la cédula {cedula}:\n"]
+    for registro in reversed(registros):
+        datos = registro.get("datos", {})
+        alertas = registro.get("alertas", [])
+        lineas.append(
+            f"🕐 {registro.get('timestamp', 'N/A')}: ❤️ {datos.get('ritmo_cardiaco', 'N/A')} bpm, "
+            f"🌡️ {datos.get('temperatura', 'N/A')} °C, 💉 {datos.get('presion', 'N/A')}, "
+            f"🫁 {datos.get('oxigeno', 'N/A')} %" + (f" ⚠️ {len(alertas)} alerta(s)" if alertas else "")
+        )
+    return "\n".join(lineas)
+
+
+class CacheRespuestas:
+    """Respuestas del modelo por clave, con TTL, LRU y unión de llamadas en curso"""
+
+    def __init__(self, modelo, ttl=RESPUESTAS_CACHE_TTL, max_entradas=RESPUESTAS_CACHE_MAX):
+        self.modelo = modelo
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()  # clave -> (expira, respuesta)
+        self._en_curso = {}  # clave -> Future
+        self.contadores = {"aciertos": 0, "unidas": 0, "llamadas_modelo": 0, "errores": 0}
+
+    @staticmethod
+    def clave(cedula, pregunta, huella, contexto=""):
+        """Clave de caché; None si no hay lectura con la que asociar la respuesta.
+
+        `contexto` es la conversación previa que se envía al modelo junto con
+        la pregunta: la respuesta depende de ella, así que forma parte de la clave.
+        """
+        if huella is None:
+            return None
+        huella_contexto = hashlib.sha1(contexto.encode()).hexdigest()[:16] if contexto else ""
+        return (cedula, normalizar_pregunta(pregunta), huella, huella_contexto)
+
+    async def responder(self, clave, user_id, texto, **extra):
+        """Respuesta del modelo a `texto`, reutilizada para la misma `clave`"""
+        if clave is None:
+            return await self._llamar(user_id, texto, **extra)
+
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            if entrada[0] > time.monotonic():
+                self._entradas.move_to_end(clave)
+                self.contadores["aciertos"] += 1
+                return entrada[1]
+            del self._entradas[clave]
+
+        futuro = self._en_curso.get(clave)
+        if futuro is not None:
+            self.contadores["unidas"] += 1
+            try:
+                return await asyncio.shield(futuro)
+            except asyncio.CancelledError:
+                if not futuro.cancelled():
+                    raise
+                # Se canceló la llamada original (no esta): se responde aparte
+                return await self._llamar(user_id, texto, **extra)
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = futuro
+        try:
+            respuesta = await self._llamar(user_id, texto, **extra)
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except Exception as e:
+            futuro.set_exception(e)
+            futuro.exception()  # Evita el aviso si nadie más esperaba
+            raise
+        finally:
+            del self._en_curso[clave]
+
+        futuro.set_result(respuesta)
+        if respuesta:
+            self._entradas[clave] = (time.monotonic() + self.ttl, respuesta)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return respuesta
+
+    async def _llamar(self, user_id, texto, **extra):
+        self.contadores["llamadas_modelo"] += 1
+        try:
+            return await self.modelo(user_id, texto, **extra)
+        except Exception:
+            self.contadores["errores"] += 1
+            raise
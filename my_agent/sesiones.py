@@ -0,0 +1,237 @@
+"""
+Sesiones del bot de Telegram: cédula elegida e historial de conversación.
+
+Las sesiones se guardan en un almacén persistente (SQLite en local, Redis en
+producción; `BOT_SESIONES_BACKEND`) y se mantienen en memoria solo las
+`BOT_SESIONES_MAX_MEMORIA` usadas más recientemente (LRU). Tras un reinicio
+la sesión de un usuario se carga desde el almacén con su primer mensaje.
+Las sesiones sin actividad durante `BOT_SESIONES_TTL` segundos se borran.
+
+El historial se recorta a los últimos `BOT_HISTORIAL_TURNOS` mensajes y a
+`BOT_HISTORIAL_CARACTERES` caracteres, para que el contexto que se envía al
+modelo no crezca con la conversación.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+BOT_SESIONES_BACKEND = os.getenv("BOT_SESIONES_BACKEND", "sqlite")  # sqlite | redis | memoria
+BOT_SESIONES_SQLITE = os.getenv("BOT_SESIONES_SQLITE", str(Path(__file__).resolve().parent / "sesiones.db"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis-db:6379/0")
+BOT_SESIONES_MAX_MEMORIA = int(os.getenv("BOT_SESIONES_MAX_MEMORIA", "1000"))
+BOT_SESIONES_MAX_PERSISTIDAS = int(os.getenv("BOT_SESIONES_MAX_PERSISTIDAS", "100000"))
+BOT_SESIONES_TTL = int(os.getenv("BOT_SESIONES_TTL", str(7 * 24 * 3600)))
+BOT_HISTORIAL_TURNOS = int(os.getenv("BOT_HISTORIAL_TURNOS", "10"))
+BOT_HISTORIAL_CARACTERES = int(os.getenv("BOT_HISTORIAL_CARACTERES", "6000"))
+# Largo máximo de un mensaje dentro del historial
+MAX_CARACTERES_MENSAJE = 1500
+
+PREFIJO_REDIS = "bot:sesion:"
+
+
+def sesion_nueva():
+    return {"cedula": None, "historial": [], "omitidos": 0}
+
+
+def recortar_historial(sesion, max_turnos=BOT_HISTORIAL_TURNOS, max_caracteres=BOT_HISTORIAL_CARACTERES):
+    """Deja los mensajes más recientes que caben en el límite; cuenta los omitidos"""
+    historial = sesion["historial"]
+    conservados = []
+    total = 0
+    for mensaje in reversed(historial[-max_turnos:]):
+        total += len(mensaje["texto"])
+        if total > max_caracteres and conservados:
+            break
+        conservados.append(mensaje)
+    conservados.reverse()
+    sesion["omitidos"] = sesion.get("omitidos", 0) + len(historial) - len(conservados)
+    sesion["historial"] = conservados
+
+
+def agregar_mensaje(sesion, rol, texto):
+    """Agrega un mensaje ('usuario' o 'asistente') y recorta el historial"""
+    if len(texto) > MAX_CARACTERES_MENSAJE:
+        texto = texto[:MAX_CARACTERES_MENSAJE] + "…"
+    sesion["historial"].append({"rol": rol, "texto": texto})
+    recortar_historial(sesion)
+
+
+def transcripcion(sesion, contar_omitidos=True):
+    """Historial en texto para incluir en el mensaje al modelo ('' si está vacío).
+
+    Con `contar_omitidos=False` no se dice cuántos mensajes se omitieron: ese
+    número crece en cada turno y no debe cambiar la clave de caché.
+    """
+    if not sesion["historial"]:
+        return ""
+    lineas = ["Conversación previa con el usuario:"]
+    if sesion.get("omitidos"):
+        cuantos = f"{sesion['omitidos']} " if contar_omitidos else ""
+        lineas.append(f"(se omiten {cuantos}mensajes anteriores)")
+    for mensaje in sesion["historial"]:
+        autor = "Usuario" if mensaje["rol"] == "usuario" else "Pulsito"
+        lineas.append(f"{autor}: {mensaje['texto']}")
+    return "\n".join(lineas) + "\n\n"
+
+
+class AlmacenMemoria:
+    """Sin persistencia (pruebas y desarrollo)"""
+
+    def __init__(self):
+        self._datos = {}
+
+    async def cargar(self, user_id):
+        return self._datos.get(user_id)
+
+    async def guardar(self, user_id, sesion):
+        self._datos[user_id] = sesion
+
+    async def eliminar(self, user_id):
+        self._datos.pop(user_id, None)
+
+
+class AlmacenSQLite:
+    """Sesiones en un archivo SQLite; las consultas corren en un hilo aparte"""
+
+    def __init__(self, ruta=BOT_SESIONES_SQLITE, ttl=BOT_SESIONES_TTL, max_sesiones=BOT_SESIONES_MAX_PERSISTIDAS):
+        self.ttl = ttl
+        self.max_sesiones = max_sesiones
+        self._escrituras = 0
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        with self._lock:
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.execute(
+                "CREATE TABLE IF NOT EXISTS sesiones (user_id TEXT PRIMARY KEY, datos TEXT NOT NULL, actualizado REAL NOT NULL)"
+            )
+            self._conexion.execute("CREATE INDEX IF NOT EXISTS sesiones_actualizado ON sesiones (actualizado)")
+            self._conexion.commit()
+
+    def _cargar(self, user_id):
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT datos FROM sesiones WHERE user_id = ? AND actualizado >= ?",
+                (user_id, time.time() - self.ttl)
+            ).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def _guardar(self, user_id, datos):
+        with self._lock:
+            self._conexion.execute(
+                "INSERT INTO sesiones (user_id, datos, actualizado) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET datos = excluded.datos, actualizado = excluded.actualizado",
+                (user_id, datos, time.time())
+            )
+            self._escrituras += 1
+            if self._escrituras % 1000 == 0:
+                self._purgar()
+            self._conexion.commit()
+
+    def _purgar(self):
+        # Sesiones vencidas y, si hay demasiadas, las de menor actividad reciente
+        self._conexion.execute("DELETE FROM sesiones WHERE actualizado < ?", (time.time() - self.ttl,))
+        self._conexion.execute(
+            "DELETE FROM sesiones WHERE user_id IN "
+            "(SELECT user_id FROM sesiones ORDER BY actualizado DESC LIMIT -1 OFFSET ?)",
+            (self.max_sesiones,)
+        )
+
+    def _eliminar(self, user_id):
+        with self._lock:
+            self._conexion.execute("DELETE FROM sesiones WHERE user_id = ?", (user_id,))
+            self._conexion.commit()
+
+    async def cargar(self, user_id):
+        return await asyncio.to_thread(self._cargar, user_id)
+
+    async def guardar(self, user_id, sesion):
+        await asyncio.to_thread(self._guardar, user_id, json.dumps(sesion, ensure_ascii=False))
+
+    async def eliminar(self, user_id):
+        await asyncio.to_thread(self._eliminar, user_id)
+
+
+class AlmacenRedis:
+    """Una clave por usuario con vencimiento por inactividad"""
+
+    def __init__(self, url=REDIS_URL, ttl=BOT_SESIONES_TTL):
+        import redis.asyncio
+
+        self.redis = redis.asyncio.from_url(url, socket_connect_timeout=2, socket_timeout=2)
+        self.ttl = ttl
+
+    async def cargar(self, user_id):
+        datos = await self.redis.get(PREFIJO_REDIS + user_id)
+        return json.loads(datos) if datos else None
+
+    async def guardar(self, user_id, sesion):
+        await self.redis.set(PREFIJO_REDIS + user_id, json.dumps(sesion, ensure_ascii=False), ex=self.ttl)
+
+    async def eliminar(self, user_id):
+        await self.redis.delete(PREFIJO_REDIS + user_id)
+
+
+class Sesiones:
+    """Caché LRU en memoria delante del almacén persistente (escritura inmediata)"""
+
+    def __init__(self, almacen, max_en_memoria=BOT_SESIONES_MAX_MEMORIA):
+        self.almacen = almacen
+        self.max_en_memoria = max_en_memoria
+        self._cache = OrderedDict()
+        self.contadores = {"aciertos": 0, "cargadas": 0, "nuevas": 0, "desalojadas": 0, "errores": 0}
+
+    async def obtener(self, user_id):
+        """Sesión del usuario; la carga del almacén la primera vez o crea una nueva"""
+        sesion = self._cache.get(user_id)
+        if sesion is not None:
+            self._cache.move_to_end(user_id)
+            self.contadores["aciertos"] += 1
+            return sesion
+
+        try:
+            sesion = await self.almacen.cargar(user_id)
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar la sesión de {user_id}: {e}")
+            self.contadores["errores"] += 1
+            sesion = None
+        if sesion is None:
+            sesion = sesion_nueva()
+            self.contadores["nuevas"] += 1
+        else:
+            self.contadores["cargadas"] += 1
+        self._recordar(user_id, sesion)
+        return sesion
+
+    async def guardar(self, user_id, sesion):
+        self._recordar(user_id, sesion)
+        try:
+            await self.almacen.guardar(user_id, sesion)
+        except Exception as e:
+            # La sesión sigue en memoria; solo se pierde si el bot se reinicia
+            print(f"⚠️ No se pudo guardar la sesión de {user_id}: {e}")
+            self.contadores["errores"] += 1
+
+    def _recordar(self, user_id, sesion):
+        self._cache[user_id] = sesion
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_en_memoria:
+            self._cache.popitem(last=False)
+            self.contadores["desalojadas"] += 1
+
+
+def crear_sesiones():
+    """Sesiones con el almacén configurado en BOT_SESIONES_BACKEND"""
+    if BOT_SESIONES_BACKEND == "redis":
+        almacen = AlmacenRedis()
+    elif BOT_SESIONES_BACKEND == "memoria":
+        almacen = AlmacenMemoria()
+    else:
+        almacen = AlmacenSQLite()
+    print(f"💾 Sesiones del bot en {type(almacen).__name__}")
+    return Sesiones(almacen)
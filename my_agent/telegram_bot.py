@@ -2,13 +2,21 @@ import os
 import sys
 from pathlib import Path
 import re
-import requests
+import time
+import uuid
+import httpx
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import ApplicationBuilder, MessageHandler, CommandHandler, filters, ContextTypes, ConversationHandler
 from my_agent.agent import root_agent
+from my_agent.procesador_updates import ProcesadorPorUsuario
+from my_agent.sesiones import agregar_mensaje, crear_sesiones, transcripcion
+from my_agent.respuestas import (
+    BOTON_HISTORIAL, BOTON_SIGNOS, CacheRespuestas, huella_signos, plantilla_historial, plantilla_signos
+)
+from my_agent.health_data import servicios, tiempos_herramientas
 from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
 from google.genai import types
@@ -17,12 +25,15 @@ from dotenv import load_dotenv
 load_dotenv()
 
 TOKEN = os.getenv("TELEGRAM_TOKEN")
-SERVICE2_URL = "http://127.0.0.1:8002"  # Service2 en puerto 8002
+SERVICE2_URL = os.getenv("SERVICE2_URL", "http://127.0.0.1:8002")  # Service2 en puerto 8002
+# Updates atendidos a la vez (de usuarios distintos; cada usuario va en orden)
+BOT_CONCURRENCIA = int(os.getenv("BOT_CONCURRENCIA", "256"))
 
 # Estados de conversación
 ESPERANDO_CEDULA, CONVERSACION_NORMAL = range(2)
 
-# Crear el runner una sola vez al inicio
+# Crear el runner una sola vez al inicio. Las sesiones de ADK solo viven
+# durante un turno; el historial persistente está en `sesiones`
 session_service = InMemorySessionService()
 runner = Runner(
     agent=root_agent, 
@@ -30,9 +41,80 @@ runner = Runner(
     app_name='telegram_bot'
 )
 
-# Diccionario para mantener sesiones por usuario de Telegram
-user_sessions = {}
-user_cedulas = {}  # Para recordar la última cédula consultada por usuario
+# Cédula elegida e historial de conversación por usuario de Telegram
+sesiones = crear_sesiones()
+
+# Las consultas a Service2 usan el mismo cliente que las herramientas del
+# agente (`servicios`): conexiones reutilizadas, caché corta y el token de
+# servicio del bot. Se abre al iniciar la aplicación y se cierra al detenerla
+
+
+async def iniciar_servicios(application=None):
+    servicios.iniciar()
+
+
+async def cerrar_servicios(application=None):
+    await servicios.cerrar()
+    for nombre, tiempos in tiempos_herramientas().items():
+        print(f"🔧 {nombre}: {tiempos}")
+
+
+async def consultar_analisis(cedula: str, timeout: float = 10):
+    """Último análisis del paciente en Service2 (None si no hay)"""
+    return await servicios.obtener(f"{SERVICE2_URL}/analyze/{cedula}", timeout=timeout)
+
+
+async def consultar_historial(cedula: str, limite: int = 5):
+    """Últimos análisis del paciente en Service2 (None si no hay)"""
+    return await servicios.obtener(f"{SERVICE2_URL}/historial/{cedula}", {"limit": limite})
+
+
+async def responder_agente(user_id: str, message_text: str, cedula: str = None) -> str:
+    """Ejecuta el agente con una sesión de ADK de un solo turno (no acumula eventos).
+
+    La cédula va en el estado de la sesión: las herramientas del agente la
+    usan para consultar solo los datos de ese paciente.
+    """
+    session = await session_service.create_session(
+        app_name='telegram_bot',
+        user_id=user_id,
+        session_id=f'turno_{uuid.uuid4().hex}',
+        state={"cedula": cedula}
+    )
+    message = types.Content(
+        role='user',
+        parts=[types.Part(text=message_text)]
+    )
+
+    response_text = ""
+    inicio = time.perf_counter()
+    tokens_entrada = 0
+    llamadas_herramientas = 0
+    try:
+        async for event in runner.run_async(
+            user_id=user_id,
+            session_id=session.id,
+            new_message=message
+        ):
+            if event.usage_metadata and event.usage_metadata.prompt_token_count:
+                tokens_entrada += event.usage_metadata.prompt_token_count
+            llamadas_herramientas += len(event.get_function_calls())
+            if event.is_final_response():
+                if event.content and event.content.parts:
+                    for part in event.content.parts:
+                        if hasattr(part, 'text') and part.text:
+                            response_text += part.text
+    finally:
+        await session_service.delete_session(
+            app_name='telegram_bot', user_id=user_id, session_id=session.id
+        )
+    print(f"⏱️ Turno de {user_id}: {time.perf_counter() - inicio:.2f} s, "
+          f"{tokens_entrada} tokens de entrada, {llamadas_herramientas} herramientas")
+    return response_text
+
+
+# Respuestas del modelo reutilizadas para la misma pregunta sobre la misma lectura
+respuestas = CacheRespuestas(responder_agente)
 
 
 def extraer_cedula(texto: str) -> str:
@@ -81,26 +163,23 @@ async def recibir_cedula(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Verificar si el paciente existe consultando service2
     try:
-        response = requests.get(f"{SERVICE2_URL}/analyze/{cedula}", timeout=5)
+        data = await consultar_analisis(cedula, timeout=5)
         
-        if response.status_code == 404:
+        if data is None:
             await update.message.reply_text(
                 f"❌ No encontré registros para la cédula {cedula}.\n\n"
                 "Asegúrate de que el paciente esté registrado y tenga signos vitales."
             )
             return ESPERANDO_CEDULA
         
-        if response.status_code != 200:
-            await update.message.reply_text(
-                "⚠️ Hubo un problema al consultar los datos. Intenta de nuevo."
-            )
-            return ESPERANDO_CEDULA
-        
-        data = response.json()
         paciente_nombre = data.get("paciente", {}).get("nombre", "Desconocido")
         
         # Guardar la cédula para este usuario
-        user_cedulas[user_id] = cedula
+        sesion = await sesiones.obtener(user_id)
+        if sesion["cedula"] != cedula:
+            # Otro paciente: la conversación anterior no aplica
+            sesion.update(cedula=cedula, historial=[], omitidos=0)
+        await sesiones.guardar(user_id, sesion)
         
         await update.message.reply_text(
             f"✅ Paciente encontrado: {paciente_nombre}\n"
@@ -110,11 +189,17 @@ async def recibir_cedula(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         return CONVERSACION_NORMAL
         
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         await update.message.reply_text(
             "⏱️ La consulta está tardando mucho. Verifica que los servicios estén activos."
         )
         return ESPERANDO_CEDULA
+    except httpx.HTTPStatusError as e:
+        print(f"⚠️ Service2 respondió {e.response.status_code} para la cédula {cedula}")
+        await update.message.reply_text(
+            "⚠️ Hubo un problema al consultar los datos. Intenta de nuevo."
+        )
+        return ESPERANDO_CEDULA
     except Exception as e:
         print(f"❌ Error: {e}")
         await update.message.reply_text(
@@ -137,14 +222,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
     
     # Verificar si es un botón
-    if user_message == "📊 Ver mis signos vitales":
-        user_message = "¿Cuáles son los últimos signos vitales?"
-    elif user_message == "📋 Ver historial":
-        user_message = "Muéstrame el historial de signos vitales"
-    elif user_message == "👥 Cambiar paciente":
+    boton = user_message if user_message in (BOTON_SIGNOS, BOTON_HISTORIAL) else None
+    if user_message == "👥 Cambiar paciente":
         return await cambiar_paciente(update, context)
     
-    cedula = user_cedulas.get(user_id)
+    sesion = await sesiones.obtener(user_id)
+    cedula = sesion["cedula"]
     
     if not cedula:
         await update.message.reply_text(
@@ -156,82 +239,66 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     print(f"📩 Mensaje de {user_id} para cédula {cedula}: {user_message}")
 
     try:
-        # Obtener los datos más recientes desde Service2
-        response = requests.get(f"{SERVICE2_URL}/analyze/{cedula}", timeout=10)
+        # Último análisis: para los botones y para la clave de la caché de
+        # respuestas; si el modelo lo pide con una herramienta, sale de la caché
+        try:
+            health_data = await consultar_analisis(cedula)
+        except httpx.HTTPStatusError:
+            health_data = {}
         
-        if response.status_code == 404:
+        if health_data is None:
             await update.message.reply_text(
                 f"⚠️ No hay datos disponibles para la cédula {cedula}.\n"
                 "Puede que el paciente no tenga registros recientes."
             )
             return CONVERSACION_NORMAL
-        
-        if response.status_code != 200:
-            contexto = "⚠️ No se pudieron obtener los signos vitales recientes.\n\n"
-        else:
-            health_data = response.json()
-            
-            if "datos" in health_data:
-                datos = health_data["datos"]
-                paciente = health_data.get("paciente", {})
-                alertas = health_data.get("alertas", [])
-                
-                contexto = (
-                    f"📊 **Paciente:** {paciente.get('nombre', 'Desconocido')}\n"
-                    f"📋 **Cédula:** {cedula}\n"
-                    f"🕐 **Última lectura:** {health_data.get('timestamp', 'N/A')}\n\n"
-                    f"**Signos vitales:**\n"
-                    f"❤️ Ritmo cardíaco: {datos.get('ritmo_cardiaco', 'N/A')} bpm\n"
-                    f"🌡️ Temperatura: {datos.get('temperatura', 'N/A')} °C\n"
-                    f"💉 Presión arterial: {datos.get('presion', 'N/A')}\n"
-                    f"🫁 Saturación de oxígeno: {datos.get('oxigeno', 'N/A')} %\n\n"
-                    f"**Alertas:** {', '.join(alertas)}\n\n"
-                )
-            else:
-                contexto = "⚠️ No se encontraron datos estructurados.\n\n"
-
-        # Crear el contenido del mensaje del usuario con contexto clínico
-        message_text = contexto + f"Consulta del usuario: {user_message}"
-
-        # Obtener o crear sesión para este usuario
-        if user_id not in user_sessions:
-            session = await session_service.create_session(
-                app_name='telegram_bot',
-                user_id=user_id,
-                session_id=f'session_{user_id}'
-            )
-            user_sessions[user_id] = session.id
-        
-        session_id = user_sessions[user_id]
 
-        # Crear el contenido del mensaje
-        message = types.Content(
-            role='user',
-            parts=[types.Part(text=message_text)]
-        )
-        
-        # Ejecutar el agente con el runner
-        response_text = ""
-        async for event in runner.run_async(
-            user_id=user_id,
-            session_id=session_id,
-            new_message=message
-        ):
-            if event.is_final_response():
-                if event.content and event.content.parts:
-                    for part in event.content.parts:
-                        if hasattr(part, 'text') and part.text:
-                            response_text += part.text
+        # Botones del menú: respuesta con plantilla, sin llamar al modelo
+        response_text = None
+        if boton == BOTON_SIGNOS and health_data and "datos" in health_data:
+            response_text = plantilla_signos(health_data, cedula)
+        elif boton == BOTON_HISTORIAL:
+            try:
+                historial = await consultar_historial(cedula)
+            except httpx.HTTPStatusError:
+                historial = None
+            if historial is not None:
+                response_text = plantilla_historial(historial, cedula)
+
+        if response_text is not None:
+            await update.message.reply_text(response_text)
+            return CONVERSACION_NORMAL
+
+        if boton == BOTON_SIGNOS:
+            user_message = "¿Cuáles son los últimos signos vitales?"
+        elif boton == BOTON_HISTORIAL:
+            user_message = "Muéstrame el historial de signos vitales"
+
+        # Mensaje con la conversación previa (ya recortada); los datos del
+        # paciente los pide el modelo con sus herramientas
+        previa = transcripcion(sesion)
+        message_text = previa + f"Consulta del usuario: {user_message}"
+
+        # La misma pregunta sobre la misma lectura, con la misma conversación
+        # previa, reutiliza la respuesta (sin el contador de omitidos, que
+        # cambia en cada turno)
+        clave = CacheRespuestas.clave(cedula, user_message, huella_signos(health_data),
+                                      transcripcion(sesion, contar_omitidos=False))
+        response_text = await respuestas.responder(clave, user_id, message_text, cedula=cedula)
         
         if not response_text:
             response_text = "No pude generar una respuesta."
+        else:
+            agregar_mensaje(sesion, "usuario", user_message)
+            agregar_mensaje(sesion, "asistente", response_text)
+            await sesiones.guardar(user_id, sesion)
 
         print(f"🤖 Respuesta: {response_text[:150]}...")
         await update.message.reply_text(response_text)
         
         return CONVERSACION_NORMAL
         
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         await update.message.reply_text(
             "⏱️ La consulta está tardando mucho. Los servicios pueden estar lentos."
         )
@@ -246,6 +313,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return CONVERSACION_NORMAL
 
 
+async def reanudar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Primer mensaje fuera de la conversación (p. ej. tras reiniciar el bot).
+
+    Si el usuario ya tenía una cédula guardada, se retoma la conversación
+    con su historial; si no, el mensaje se toma como la cédula.
+    """
+    sesion = await sesiones.obtener(str(update.effective_user.id))
+    if sesion["cedula"]:
+        return await handle_message(update, context)
+    return await recibir_cedula(update, context)
+
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancela la conversación"""
     await update.message.reply_text(
@@ -259,11 +338,21 @@ if __name__ == "__main__":
         print("❌ Falta el token de Telegram en la variable TELEGRAM_TOKEN")
         exit(1)
 
-    app = ApplicationBuilder().token(TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .concurrent_updates(ProcesadorPorUsuario(BOT_CONCURRENCIA))
+        .post_init(iniciar_servicios)
+        .post_shutdown(cerrar_servicios)
+        .build()
+    )
 
     # Manejador de conversación
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler("start", start)],
+        entry_points=[
+            CommandHandler("start", start),
+            MessageHandler(filters.TEXT & ~filters.COMMAND, reanudar),
+        ],
         states={
             ESPERANDO_CEDULA: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, recibir_cedula)
@@ -1,7 +1,234 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, File, Header, HTTPException, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from pydantic import BaseModel
+from typing import Optional
+import base64
+import hashlib
+import io
+import os
+import time
+import uuid
+import jwt
+from services import data_base_mongo as db_mongo
+from services.contrasenas import IntentosExcedidos, ServicioSaturado
+from services.importar_usuarios import ImportadorUsuarios, formato_de, huella, leer_filas
+from services.indices import aplicar_indices
+from services.tokens import (
+    PREFIJO_REVOCADO, PREFIJO_REVOCADO_USUARIO, TOKEN_ALGORITMO, TOKEN_AUDIENCIA, TOKEN_EMISOR,
+    TokenInvalido, exigir_rol, extraer_bearer, obtener_verificador, usuario_verificado
+)
+
+app = FastAPI(title="Servicio de Autenticación")
+
+# Duración de los tokens de acceso
+TOKEN_MINUTOS = int(os.getenv("TOKEN_MINUTOS", "15"))
+# Un token vigente se puede renovar (/token/renovar) hasta este tiempo después
+# del inicio de sesión; luego hay que volver a iniciar sesión
+SESION_MAX_HORAS = float(os.getenv("SESION_MAX_HORAS", "12"))
+# Clave privada RSA (PEM) con la que se firman los tokens; las claves
+# anteriores (PEM públicos o privados) se siguen publicando en el JWKS para
+# que los tokens firmados antes de una rotación sigan siendo válidos
+CLAVE_PRIVADA_PATH = os.getenv("AUTH_CLAVE_PRIVADA_PATH")
+CLAVES_ANTERIORES = [p for p in os.getenv("AUTH_CLAVES_ANTERIORES_PATH", "").split(",") if p]
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.on_event("startup")
+def preparar_indices():
+    """Índices de las colecciones que escribe este servicio (services/indices.py)"""
+    if db_mongo.db is not None:
+        aplicar_indices(db_mongo.db, ("usuarios", "pacientes", "importaciones_errores"))
+
+
+def _kid(clave_publica):
+    """Identificador de la clave: huella SHA-256 de su forma DER"""
+    der = clave_publica.public_bytes(
+        serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return base64.urlsafe_b64encode(hashlib.sha256(der).digest()[:12]).decode().rstrip("=")
+
+
+def _leer_clave(ruta):
+    with open(ruta, "rb") as f:
+        datos = f.read()
+    if b"PRIVATE KEY" in datos:
+        return serialization.load_pem_private_key(datos, password=None)
+    return serialization.load_pem_public_key(datos)
+
+
+def cargar_claves():
+    """Clave de firma, su kid, el JWKS y las claves públicas vigentes por kid"""
+    if CLAVE_PRIVADA_PATH:
+        privada = _leer_clave(CLAVE_PRIVADA_PATH)
+    else:
+        print("⚠️ AUTH_CLAVE_PRIVADA_PATH no configurada: se genera una clave temporal "
+              "(los tokens dejan de valer al reiniciar y no sirve con varios workers)")
+        privada = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    publicas = [privada.public_key()]
+    for ruta in CLAVES_ANTERIORES:
+        clave = _leer_clave(ruta)
+        publicas.append(clave.public_key() if hasattr(clave, "public_key") else clave)
+
+    por_kid = {_kid(publica): publica for publica in publicas}
+    jwks = {"keys": []}
+    for kid, publica in por_kid.items():
+        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(publica, as_dict=True)
+        jwk.update({"kid": kid, "use": "sig", "alg": TOKEN_ALGORITMO})
+        jwks["keys"].append(jwk)
+    return privada, _kid(privada.public_key()), jwks, por_kid
+
+
+clave_privada, kid_actual, jwks, claves_publicas = cargar_claves()
+# El propio servicio verifica con sus claves en memoria, sin descargar el JWKS
+verificador = obtener_verificador(claves=claves_publicas)
+
+
+class Credenciales(BaseModel):
+    cedula: str
+    password: str
+
+
+def emitir_token(usuario, inicio_sesion=None):
+    """Token de acceso; `inicio_sesion` se conserva al renovar para acotar la sesión"""
+    ahora = int(time.time())
+    claims = {
+        "iss": TOKEN_EMISOR,
+        "aud": TOKEN_AUDIENCIA,
+        "sub": usuario["cedula"],
+        "nombre": usuario["nombre"],
+        "rol": usuario["rol"],
+        "iat": ahora,
+        "exp": ahora + TOKEN_MINUTOS * 60,
+        "jti": uuid.uuid4().hex,
+        "auth_time": inicio_sesion or ahora,
+    }
+    return jwt.encode(claims, clave_privada, algorithm=TOKEN_ALGORITMO, headers={"kid": kid_actual})
 
-app = FastAPI()
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+
+@app.get("/.well-known/jwks.json")
+def obtener_jwks():
+    """Claves públicas para verificar los tokens localmente"""
+    return jwks
+
+
+@app.post("/login")
+def login(credenciales: Credenciales):
+    """Valida las credenciales y emite un token de acceso de corta duración"""
+    try:
+        usuario = db_mongo.autenticar_usuario(credenciales.cedula, credenciales.password)
+    except IntentosExcedidos as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.espera) + 1)})
+    except ServicioSaturado:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, intenta de nuevo", headers={"Retry-After": "2"})
+
+    if not usuario:
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+
+    return {
+        "access_token": emitir_token(usuario),
+        "token_type": "bearer",
+        "expires_in": TOKEN_MINUTOS * 60,
+        "usuario": usuario,
+    }
+
+
+async def _claims_vigentes(authorization):
+    token = extraer_bearer(authorization)
+    if token is None:
+        raise HTTPException(status_code=401, detail="Falta el token de acceso")
+    try:
+        return await verificador.verificar(token)
+    except TokenInvalido as e:
+        raise HTTPException(status_code=401, detail=f"Token inválido: {e}")
+
+
+@app.post("/token/renovar")
+async def renovar_token(authorization: Optional[str] = Header(None)):
+    """Cambia un token aún vigente por uno nuevo (renovación deslizante).
+
+    El nuevo conserva la hora de inicio de sesión: pasadas SESION_MAX_HORAS
+    ya no se renueva. El token anterior se revoca; si Redis no responde
+    sigue valiendo hasta que venza (es de corta duración).
+    """
+    claims = await _claims_vigentes(authorization)
+    inicio_sesion = claims.get("auth_time", claims["iat"])
+    if time.time() - inicio_sesion > SESION_MAX_HORAS * 3600:
+        raise HTTPException(status_code=401, detail="Sesión vencida, inicia sesión de nuevo")
+
+    usuario = {"cedula": claims["sub"], "nombre": claims.get("nombre"), "rol": claims.get("rol")}
+    token = emitir_token(usuario, inicio_sesion)
+    try:
+        await verificador.redis.set(PREFIJO_REVOCADO + claims["jti"], "1",
+                                    ex=max(1, int(claims["exp"] - time.time()) + 60))
+    except Exception as e:
+        print(f"⚠️ No se pudo revocar el token renovado: {e}")
+    return {"access_token": token, "token_type": "bearer", "expires_in": TOKEN_MINUTOS * 60}
+
+
+@app.post("/logout")
+async def logout(todas: bool = False, authorization: Optional[str] = Header(None)):
+    """Revoca el token actual, o todas las sesiones del usuario con `todas=true`"""
+    claims = await _claims_vigentes(authorization)
+
+    ahora = time.time()
+    try:
+        if todas:
+            # Rechaza los tokens emitidos hasta ahora; dura lo que el más largo
+            await verificador.redis.set(PREFIJO_REVOCADO_USUARIO + claims["sub"], str(int(ahora) + 1),
+                                        ex=TOKEN_MINUTOS * 60 + 60)
+        else:
+            await verificador.redis.set(PREFIJO_REVOCADO + claims["jti"], "1",
+                                        ex=max(1, int(claims["exp"] - ahora) + 60))
+    except Exception as e:
+        print(f"⚠️ No se pudo registrar la revocación: {e}")
+        raise HTTPException(status_code=503, detail="No se pudo revocar el token")
+    return {"status": "ok", "revocado": "todas" if todas else claims["jti"]}
+
+
+@app.post("/usuarios/importar")
+def importar_usuarios(archivo: UploadFile = File(...), id_importacion: Optional[str] = None, lote: int = 500,
+                      reiniciar: bool = False, usuario: dict = Depends(usuario_verificado)):
+    """Importa usuarios y pacientes desde un CSV o JSONL.
+
+    Puede crear cuentas de médico, así que exige siempre el token de un
+    médico, aunque AUTH_REQUERIDA esté desactivada.
+
+    Repetir la petición con el mismo archivo (o el mismo `id_importacion`)
+    reanuda una importación interrumpida desde su punto de control.
+    """
+    exigir_rol(usuario, "medico")
+    if db_mongo.db is None:
+        raise HTTPException(status_code=500, detail="Base de datos no disponible")
+    try:
+        formato = formato_de(archivo.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    importador = ImportadorUsuarios(db_mongo.db, id_importacion or huella(archivo.file),
+                                    lote=lote, reiniciar=reiniciar)
+    lineas = io.TextIOWrapper(archivo.file, encoding="utf-8-sig", newline="")
+    try:
+        resumen = importador.importar(leer_filas(lineas, formato))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar codificado en UTF-8")
+    return {**resumen, "errores": importador.errores(limite=1000)}
+
+
+@app.get("/verificador/metricas")
+def metricas_verificador():
+    return verificador.contadores
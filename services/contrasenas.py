@@ -0,0 +1,195 @@
+"""
+Hash y verificación de contraseñas fuera del hilo de la petición.
+
+El hash (scrypt / pbkdf2 de Werkzeug) es costoso a propósito; hacerlo en el
+hilo de Flask deja a todas las demás peticiones sin CPU durante una ráfaga
+de inicios de sesión. Aquí se delega a un pool de procesos de tamaño fijo
+(`HASH_WORKERS`, por defecto la mitad de los núcleos) con una cola acotada:
+si hay más de `HASH_MAX_PENDIENTES` operaciones en curso, la siguiente
+espera como mucho `HASH_ESPERA_COLA` segundos y luego falla con
+`ServicioSaturado` en lugar de encolarse sin límite.
+
+Además se limita la frecuencia de intentos por cédula (cubeta de
+`LOGIN_MAX_INTENTOS` fichas que se recarga en `LOGIN_VENTANA_SEGUNDOS`).
+
+`HASH_METODO` define el costo (p. ej. "scrypt:32768:8:1" o
+"pbkdf2:sha256:600000"); los hashes con otro método se regeneran al
+iniciar sesión (`necesita_rehash`).
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+HASH_MAX_PENDIENTES = int(os.getenv("HASH_MAX_PENDIENTES", str(HASH_WORKERS * 4)))
+HASH_ESPERA_COLA = float(os.getenv("HASH_ESPERA_COLA", "2"))
+LOGIN_MAX_INTENTOS = int(os.getenv("LOGIN_MAX_INTENTOS", "5"))
+LOGIN_VENTANA_SEGUNDOS = float(os.getenv("LOGIN_VENTANA_SEGUNDOS", "60"))
+
+
+def _normalizar_metodo(metodo):
+    """Completa los parámetros por defecto para poder comparar con hashes guardados"""
+    partes = metodo.split(":")
+    if partes[0] == "scrypt":
+        defectos = ["scrypt", "32768", "8", "1"]
+    elif partes[0] == "pbkdf2":
+        defectos = ["pbkdf2", "sha256", str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        raise ValueError(f"Método de hash no soportado: {metodo}")
+    return ":".join(partes + defectos[len(partes):])
+
+
+HASH_METODO = _normalizar_metodo(os.getenv("HASH_METODO", "scrypt:32768:8:1"))
+
+
+class ServicioSaturado(Exception):
+    """Demasiadas operaciones de hash pendientes"""
+
+
+class IntentosExcedidos(Exception):
+    """Demasiados intentos de inicio de sesión para una cédula"""
+
+    def __init__(self, espera):
+        super().__init__(f"Demasiados intentos, reintenta en {espera:.0f}s")
+        self.espera = espera
+
+
+# --- Funciones que corren en los procesos del pool ---
+
+def _generar(password, metodo):
+    return generate_password_hash(password, method=metodo)
+
+
+def _verificar(hash_guardado, password):
+    return check_password_hash(hash_guardado, password)
+
+
+def _generar_varios(passwords, metodo):
+    return [generate_password_hash(password, method=metodo) for password in passwords]
+
+
+# --- Pool de procesos con cola acotada ---
+
+_pool = None
+_pool_lock = threading.Lock()
+_cupos = threading.BoundedSemaphore(HASH_MAX_PENDIENTES)
+# Las importaciones masivas dejan como mucho un trozo en cola por proceso,
+# para que los logins concurrentes no esperen detrás de miles de hashes
+_cupos_lote = threading.BoundedSemaphore(max(1, HASH_WORKERS))
+
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # El pool se crea tarde, con hilos, bucle de eventos y conexiones ya
+            # abiertos: fork copiaría candados tomados y sockets. forkserver
+            # parte de un proceso limpio que solo precarga este módulo (spawn
+            # donde no existe, p. ej. Windows)
+            metodos = multiprocessing.get_all_start_methods()
+            contexto = multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+            if contexto.get_start_method() == "forkserver":
+                contexto.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=contexto)
+        return _pool
+
+
+def _ejecutar(funcion, *args):
+    if HASH_WORKERS <= 0:
+        return funcion(*args)
+    if not _cupos.acquire(timeout=HASH_ESPERA_COLA):
+        raise ServicioSaturado("Demasiadas verificaciones de contraseña en curso")
+    try:
+        return _obtener_pool().submit(funcion, *args).result()
+    finally:
+        _cupos.release()
+
+
+def iniciar():
+    """Arranca los procesos del pool por adelantado (opcional)"""
+    if HASH_WORKERS > 0:
+        _obtener_pool().submit(int).result()
+
+
+def cerrar():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def generar(password):
+    """Hash de la contraseña con HASH_METODO, calculado en el pool"""
+    return _ejecutar(_generar, password, HASH_METODO)
+
+
+def verificar(hash_guardado, password):
+    """True si la contraseña corresponde al hash, verificado en el pool"""
+    return _ejecutar(_verificar, hash_guardado, password)
+
+
+def generar_lote(passwords, trozo=4):
+    """Hashes de varias contraseñas (mismo orden), repartidos en el pool por trozos"""
+    passwords = list(passwords)
+    if HASH_WORKERS <= 0:
+        return _generar_varios(passwords, HASH_METODO)
+    pool = _obtener_pool()
+    futuros = []
+    try:
+        for i in range(0, len(passwords), trozo):
+            _cupos_lote.acquire()
+            futuro = pool.submit(_generar_varios, passwords[i:i + trozo], HASH_METODO)
+            futuro.add_done_callback(lambda _: _cupos_lote.release())
+            futuros.append(futuro)
+        return [h for futuro in futuros for h in futuro.result()]
+    except BaseException:
+        for futuro in futuros:
+            futuro.cancel()
+        raise
+
+
+def necesita_rehash(hash_guardado):
+    """True si el hash se generó con un método o costo distinto de HASH_METODO"""
+    return hash_guardado.split("$", 1)[0] != HASH_METODO
+
+
+# --- Límite de intentos por cédula ---
+
+class LimitadorIntentos:
+    """Cubeta de fichas por cédula: `max_intentos` por `ventana` segundos"""
+
+    def __init__(self, max_intentos=LOGIN_MAX_INTENTOS, ventana=LOGIN_VENTANA_SEGUNDOS, max_claves=100000):
+        self.max_intentos = max_intentos
+        self.tasa = max_intentos / ventana  # fichas por segundo
+        self.max_claves = max_claves
+        self._cubetas = {}  # cedula -> (fichas, última actualización)
+        self._lock = threading.Lock()
+
+    def consumir(self, cedula):
+        """Gasta un intento; lanza IntentosExcedidos si no quedan"""
+        ahora = time.monotonic()
+        with self._lock:
+            fichas, antes = self._cubetas.get(cedula, (self.max_intentos, ahora))
+            fichas = min(self.max_intentos, fichas + (ahora - antes) * self.tasa)
+            if fichas < 1:
+                self._cubetas[cedula] = (fichas, ahora)
+                raise IntentosExcedidos((1 - fichas) / self.tasa)
+            self._cubetas[cedula] = (fichas - 1, ahora)
+            if len(self._cubetas) > self.max_claves:
+                self._purgar(ahora)
+
+    def _purgar(self, ahora):
+        # Las cubetas que ya se recargaron por completo no aportan información
+        llenas = [c for c, (f, t) in self._cubetas.items()
+                  if f + (ahora - t) * self.tasa >= self.max_intentos]
+        for cedula in llenas:
+            del self._cubetas[cedula]
+
+
+limitador_login = LimitadorIntentos()
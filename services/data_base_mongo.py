@@ -1,8 +1,9 @@
 from pymongo import MongoClient
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from services import contrasenas
+from services.contrasenas import ServicioSaturado
 
 # Intentar cargar .env desde la raíz del proyecto (una carpeta arriba de `services`)
 here = os.path.abspath(os.path.dirname(__file__))
@@ -34,13 +35,6 @@ try:
 
     if db is not None:
         print("✅ Conectado a MongoDB correctamente crack")
-        
-        # Crear índices únicos para las colecciones de usuarios
-        try:
-            db.usuarios.create_index('cedula', unique=True)
-            db.pacientes.create_index('cedula', unique=True)
-        except:
-            pass  # Los índices ya existen
     else:
         print("⚠️ No hay conexión activa con MongoDB (db is None)")
 
@@ -49,55 +43,104 @@ except Exception as e:
     db = None
 
 
+# Tamaño máximo de página al listar pacientes (frontend y Service1)
+MAX_PAGINA_PACIENTES = int(os.getenv("MAX_PAGINA_PACIENTES", "1000"))
+
+
 # ============= FUNCIONES PARA GESTIÓN DE USUARIOS =============
 
+def documentos_usuario(cedula, nombre, email, telefono, password_hash, rol='paciente', especialidad=None,
+                       apellido='', fecha_nacimiento='', telegram_user_id=''):
+    """Arma los documentos de `usuarios` y, si es paciente, de `pacientes` (o None)"""
+    usuario = {
+        'cedula': cedula,
+        'nombre': nombre,
+        'email': email,
+        'telefono': telefono,
+        'password': password_hash,
+        'rol': rol,
+        'fecha_registro': datetime.now(),
+        'activo': True
+    }
+    
+    if rol == 'medico' and especialidad:
+        usuario['especialidad'] = especialidad
+    
+    if rol != 'paciente':
+        return usuario, None
+    
+    # Separar nombre completo en nombre y apellido si viene junto
+    partes_nombre = nombre.split(' ', 1)
+    nombre_paciente = partes_nombre[0]
+    apellido_paciente = apellido if apellido else (partes_nombre[1] if len(partes_nombre) > 1 else '')
+    
+    # Fecha como datetime (BSON date), igual que en Service1
+    fecha_actual = datetime.now().replace(microsecond=0)
+    
+    paciente = {
+        'cedula': cedula,
+        'nombre': nombre_paciente,
+        'apellido': apellido_paciente,
+        'fecha_nacimiento': fecha_nacimiento if fecha_nacimiento else '',
+        'telefono': telefono,
+        'email': email,
+        'telegram_user_id': telegram_user_id if telegram_user_id else '',
+        'activo': True,
+        'fecha_registro': fecha_actual,
+        'fecha_actualizacion': fecha_actual
+    }
+    return usuario, paciente
+
+
+_transacciones = {}
+
+
+def transacciones_disponibles(cliente):
+    """True si el servidor admite transacciones (réplica o clúster fragmentado)"""
+    clave = id(cliente)
+    if clave not in _transacciones:
+        try:
+            hello = cliente.admin.command('hello')
+            _transacciones[clave] = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar el tipo de despliegue de MongoDB: {e}")
+            return False
+    return _transacciones[clave]
+
+
 def crear_usuario(cedula, nombre, email, telefono, password, rol='paciente', especialidad=None, apellido='', fecha_nacimiento='', telegram_user_id=''):
-    """Crea un nuevo usuario en la base de datos"""
+    """Crea un nuevo usuario en la base de datos.
+
+    El usuario y su ficha de paciente se escriben en una transacción si el
+    servidor la admite; si no, el usuario se borra cuando falla la ficha.
+    """
     if db is None:
         return False
     
     try:
-        # Crear usuario en la colección de usuarios
-        usuario = {
-            'cedula': cedula,
-            'nombre': nombre,
-            'email': email,
-            'telefono': telefono,
-            'password': generate_password_hash(password),
-            'rol': rol,
-            'fecha_registro': datetime.now(),
-            'activo': True
-        }
-        
-        if rol == 'medico' and especialidad:
-            usuario['especialidad'] = especialidad
-        
-        db.usuarios.insert_one(usuario)
+        usuario, paciente = documentos_usuario(
+            cedula, nombre, email, telefono, contrasenas.generar(password), rol=rol,
+            especialidad=especialidad, apellido=apellido, fecha_nacimiento=fecha_nacimiento,
+            telegram_user_id=telegram_user_id
+        )
         
-        # Si es paciente, agregarlo a la colección de pacientes con la estructura correcta
-        if rol == 'paciente':
-            # Separar nombre completo en nombre y apellido si viene junto
-            partes_nombre = nombre.split(' ', 1)
-            nombre_paciente = partes_nombre[0]
-            apellido_paciente = apellido if apellido else (partes_nombre[1] if len(partes_nombre) > 1 else '')
-            
-            # Formato de fecha como string "YYYY-MM-DD HH:MM:SS"
-            fecha_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            paciente = {
-                'cedula': cedula,
-                'nombre': nombre_paciente,
-                'apellido': apellido_paciente,
-                'fecha_nacimiento': fecha_nacimiento if fecha_nacimiento else '',
-                'telefono': telefono,
-                'email': email,
-                'telegram_user_id': telegram_user_id if telegram_user_id else '',
-                'activo': True,
-                'fecha_registro': fecha_actual,
-                'fecha_actualizacion': fecha_actual
-            }
+        if paciente is None:
+            db.usuarios.insert_one(usuario)
+        elif transacciones_disponibles(client):
+            def escribir(sesion):
+                db.usuarios.insert_one(usuario, session=sesion)
+                db.pacientes.insert_one(paciente, session=sesion)
             
-            db.pacientes.insert_one(paciente)
+            with client.start_session() as sesion:
+                sesion.with_transaction(escribir)
+        else:
+            db.usuarios.insert_one(usuario)
+            try:
+                db.pacientes.insert_one(paciente)
+            except Exception:
+                # No dejar usuarios sin ficha de paciente
+                db.usuarios.delete_one({'_id': usuario['_id']})
+                raise
         
         return True
     except Exception as e:
@@ -106,14 +149,24 @@ def crear_usuario(cedula, nombre, email, telefono, password, rol='paciente', esp
 
 
 def autenticar_usuario(cedula, password):
-    """Autentica un usuario y devuelve sus datos si es válido"""
+    """Autentica un usuario y devuelve sus datos si es válido.
+
+    La verificación corre en el pool de `services.contrasenas`. Lanza
+    IntentosExcedidos si la cédula superó su límite de intentos y
+    ServicioSaturado si el pool de hash está lleno.
+    """
     if db is None:
         return None
-    
+
+    contrasenas.limitador_login.consumir(cedula)
+
     try:
         usuario = db.usuarios.find_one({'cedula': cedula, 'activo': True})
         
-        if usuario and check_password_hash(usuario['password'], password):
+        if usuario and contrasenas.verificar(usuario['password'], password):
+            if contrasenas.necesita_rehash(usuario['password']):
+                _regenerar_hash(usuario, password)
+
             # Eliminar el password del objeto retornado
             usuario_sin_password = {
                 'cedula': usuario['cedula'],
@@ -126,11 +179,27 @@ def autenticar_usuario(cedula, password):
             return usuario_sin_password
         
         return None
+    except ServicioSaturado:
+        raise
     except Exception as e:
         print(f"Error al autenticar usuario: {e}")
         return None
 
 
+def _regenerar_hash(usuario, password):
+    """Actualiza el hash al costo actual (HASH_METODO) tras un login válido"""
+    try:
+        nuevo = contrasenas.generar(password)
+        # Solo si nadie cambió la contraseña mientras tanto
+        db.usuarios.update_one(
+            {'_id': usuario['_id'], 'password': usuario['password']},
+            {'$set': {'password': nuevo}}
+        )
+        print(f"🔐 Hash de contraseña actualizado para {usuario['cedula']}")
+    except Exception as e:
+        print(f"⚠️ No se pudo actualizar el hash de {usuario['cedula']}: {e}")
+
+
 def obtener_usuario(cedula):
     """Obtiene un usuario por cédula (sin password)"""
     if db is None:
@@ -144,17 +213,29 @@ def obtener_usuario(cedula):
         return None
 
 
-def obtener_pacientes():
-    """Obtiene la lista de todos los pacientes"""
+def obtener_pacientes_pagina(despues_de=None, limite=50):
+    """Obtiene una página de pacientes ordenada por cédula (paginación por cursor)
+
+    Devuelve (pacientes, siguiente); `siguiente` es la cédula a pasar como
+    `despues_de` para pedir la próxima página, o None si no hay más.
+    """
     if db is None:
-        return []
+        return [], None
     
+    limite = max(1, min(limite, MAX_PAGINA_PACIENTES))
+    filtro = {'cedula': {'$gt': despues_de}} if despues_de else {}
     try:
-        pacientes = list(db.pacientes.find({}, {'_id': 0, 'cedula': 1, 'nombre': 1}))
-        return pacientes
+        # Se pide uno extra para saber si existe otra página
+        pacientes = list(
+            db.pacientes.find(filtro, {'_id': 0, 'cedula': 1, 'nombre': 1})
+            .sort('cedula', 1)
+            .limit(limite + 1)
+        )
+        siguiente = pacientes[limite - 1]['cedula'] if len(pacientes) > limite else None
+        return pacientes[:limite], siguiente
     except Exception as e:
         print(f"Error al obtener pacientes: {e}")
-        return []
+        return [], None
 
 
 def usuario_existe(cedula):
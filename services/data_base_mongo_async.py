@@ -0,0 +1,34 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+import os
+
+# Reutiliza la carga del .env y la URI del módulo síncrono, que además crea los índices
+from services.data_base_mongo import MONGO_URI, DB_NAME
+
+# Configuración del pool de conexiones compartido
+MONGO_MAX_POOL = int(os.getenv("MONGO_MAX_POOL", "200"))
+MONGO_MIN_POOL = int(os.getenv("MONGO_MIN_POOL", "10"))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))         # Selección de servidor y conexión
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))  # Espera por una conexión libre
+
+try:
+    client_async = AsyncIOMotorClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL,
+        minPoolSize=MONGO_MIN_POOL,
+        serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    )
+    db_async = client_async[DB_NAME] if DB_NAME else client_async.get_default_database()
+except Exception as e:
+    print("❌ Error al crear el cliente asíncrono de MongoDB:", e)
+    client_async = None
+    db_async = None
+
+
+def cerrar_conexion_async():
+    """Cierra el cliente asíncrono de MongoDB"""
+    if client_async:
+        client_async.close()
@@ -0,0 +1,378 @@
+"""
+Bus de eventos entre microservicios: Service1 publica cada lectura nueva y
+Service2 la consume en lotes con un grupo de consumidores.
+
+- `BusRedis`: Redis Streams (XADD / XREADGROUP / XACK / XAUTOCLAIM). Varios
+  procesos de Service2 en el mismo grupo se reparten los mensajes. Si Redis
+  no responde al publicar, los eventos quedan en memoria (hasta
+  `BUS_MAX_REENVIO`) y se reenvían en segundo plano.
+- `BusLocal`: cola asyncio dentro de un mismo proceso (`BUS_BACKEND=local`).
+  Sirve para pruebas, benchmarks o para correr productor y consumidor en un
+  solo proceso sin Redis; no conecta servicios distintos.
+
+Service2 difunde además cada análisis (lectura + alertas) por el canal
+pub/sub `CANAL_ANALISIS`, que escucha el servicio de tiempo real para
+empujarlo a los dashboards. La difusión no se persiste: quien no esté
+escuchando en ese momento no la recibe.
+
+Contrapresión: si el stream acumula más de `BUS_MAX_PENDIENTES` mensajes sin
+confirmar, `saturado()` devuelve True y el productor debe rechazar la
+ingesta (HTTP 503) hasta que el consumidor se ponga al día.
+
+Recorte: el consumidor llama a `recortar()` periódicamente, que borra con
+XTRIM MINID solo los mensajes que todos los grupos ya confirmaron; lo
+pendiente o aún no entregado nunca se pierde. `BUS_MAXLEN` (0 = sin límite)
+es un tope duro opcional por si no hay consumidores: con él, los mensajes
+más viejos se descartan aunque nadie los haya leído, así que se pierde todo
+lo que pase de `BUS_MAXLEN` mensajes sin consumir.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+
+import orjson
+
+from services.database_redis import get_async_redis_client
+from services.utils import dumps_mongo
+
+BUS_BACKEND = os.getenv("BUS_BACKEND", "redis")
+STREAM_LECTURAS = os.getenv("STREAM_LECTURAS", "signos_vitales:nuevas")
+BUS_MAX_PENDIENTES = int(os.getenv("BUS_MAX_PENDIENTES", "50000"))
+# Tope duro opcional del stream; recorta aunque haya mensajes sin consumir (0 = sin tope)
+BUS_MAXLEN = int(os.getenv("BUS_MAXLEN", "0"))
+# Mensajes que se guardan en `<stream>:fallidas` para revisarlos a mano
+BUS_MAX_FALLIDAS = int(os.getenv("BUS_MAX_FALLIDAS", "10000"))
+# Cada cuánto se vuelve a medir la saturación (segundos)
+BUS_INTERVALO_SATURACION = float(os.getenv("BUS_INTERVALO_SATURACION", "1"))
+CANAL_ANALISIS = os.getenv("CANAL_ANALISIS", "signos_vitales:analisis")
+# Eventos que se guardan en memoria para reenviar mientras Redis no responde
+BUS_MAX_REENVIO = int(os.getenv("BUS_MAX_REENVIO", "100000"))
+LOTE_REENVIO = 1000
+ESPERA_REENVIO_MAX = 30
+
+
+class BusLocal:
+    """Bus en proceso sobre una asyncio.Queue acotada (pruebas y benchmarks)"""
+
+    def __init__(self, capacidad=BUS_MAX_PENDIENTES):
+        self.cola = asyncio.Queue(maxsize=capacidad)
+        self.publicados = 0
+        self.descartados = 0
+        self.confirmados = 0
+        self._secuencia = 0
+        self._oyentes = set()  # colas de quienes escuchan los análisis
+
+    async def saturado(self):
+        return self.cola.full()
+
+    async def publicar_lote(self, eventos, reintentar=True):
+        """Publica los eventos; devuelve cuántos se aceptaron"""
+        aceptados = 0
+        for evento in eventos:
+            self._secuencia += 1
+            try:
+                self.cola.put_nowait((str(self._secuencia), evento))
+                aceptados += 1
+            except asyncio.QueueFull:
+                self.descartados += 1
+        self.publicados += aceptados
+        return aceptados
+
+    async def crear_grupo(self, grupo):
+        pass
+
+    async def reclamar(self, grupo, consumidor, cantidad, inactivo_ms):
+        return []
+
+    async def recortar(self):
+        return 0
+
+    async def leer(self, grupo, consumidor, cantidad, bloqueo_ms):
+        """Devuelve hasta `cantidad` mensajes [(id, evento)], esperando el primero"""
+        try:
+            mensajes = [await asyncio.wait_for(self.cola.get(), bloqueo_ms / 1000)]
+        except asyncio.TimeoutError:
+            return []
+        while len(mensajes) < cantidad and not self.cola.empty():
+            mensajes.append(self.cola.get_nowait())
+        return mensajes
+
+    async def confirmar(self, grupo, ids):
+        self.confirmados += len(ids)
+
+    async def apartar_fallida(self, id_mensaje, evento, error):
+        self.descartados += 1
+
+    async def difundir(self, resultados):
+        for resultado in resultados:
+            datos = dumps_mongo(resultado)
+            for oyente in self._oyentes:
+                try:
+                    oyente.put_nowait((resultado, datos))
+                except asyncio.QueueFull:
+                    pass  # un oyente lento pierde difusiones, no frena al resto
+
+    async def escuchar_analisis(self):
+        """Genera (resultado, bytes JSON) por cada análisis difundido"""
+        oyente = asyncio.Queue(maxsize=10000)
+        self._oyentes.add(oyente)
+        try:
+            while True:
+                yield await oyente.get()
+        finally:
+            self._oyentes.discard(oyente)
+
+    async def metricas(self, grupo=None):
+        return {
+            "tipo": "local",
+            "publicados": self.publicados,
+            "descartados": self.descartados,
+            "confirmados": self.confirmados,
+            "pendientes": self.cola.qsize(),
+            "lag": self.cola.qsize(),
+        }
+
+
+class BusRedis:
+    """Bus sobre Redis Streams con grupos de consumidores"""
+
+    def __init__(self, cliente, stream=STREAM_LECTURAS, maxlen=BUS_MAXLEN,
+                 max_pendientes=BUS_MAX_PENDIENTES):
+        self.redis = cliente
+        self.stream = stream
+        self.maxlen = maxlen
+        self.max_pendientes = max_pendientes
+        self.publicados = 0
+        self.descartados = 0
+        self.reenviados = 0
+        self._saturado = False
+        self._medido_en = 0.0
+        self._por_reenviar = deque()
+        self._tarea_reenvio = None
+
+    async def saturado(self):
+        """True si algún grupo acumula más de `max_pendientes` mensajes"""
+        ahora = time.monotonic()
+        if ahora - self._medido_en >= BUS_INTERVALO_SATURACION:
+            self._medido_en = ahora
+            try:
+                grupos = await self.redis.xinfo_groups(self.stream)
+                atraso = max((self._lag(g) for g in grupos), default=0)
+                self._saturado = atraso > self.max_pendientes
+            except Exception:
+                # Sin stream o sin grupos todavía: no hay atraso que medir
+                self._saturado = False
+        return self._saturado
+
+    @staticmethod
+    def _lag(grupo):
+        # `lag` existe desde Redis 7; antes solo se conoce lo entregado sin confirmar
+        lag = grupo.get("lag")
+        return (lag or 0) + grupo.get("pending", 0)
+
+    async def _xadd(self, cargas):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for carga in cargas:
+                pipe.xadd(self.stream, {"datos": carga}, maxlen=self.maxlen or None, approximate=True)
+            await pipe.execute()
+
+    async def publicar_lote(self, eventos, reintentar=True):
+        """Publica los eventos; devuelve cuántos se publicaron ya.
+
+        Si Redis falla y `reintentar` es True, los eventos se guardan para
+        reenviarlos en segundo plano; con False el llamador decide (p. ej.
+        responder 503 para que el cliente reintente).
+        """
+        if not eventos:
+            return 0
+        cargas = [dumps_mongo(evento) for evento in eventos]
+        try:
+            await self._xadd(cargas)
+        except Exception as e:
+            print(f"⚠️ No se pudieron publicar {len(eventos)} eventos: {e}")
+            if reintentar:
+                self._guardar_para_reenvio(cargas)
+            else:
+                self.descartados += len(eventos)
+            return 0
+        self.publicados += len(eventos)
+        return len(eventos)
+
+    def _guardar_para_reenvio(self, cargas):
+        self._por_reenviar.extend(cargas)
+        while len(self._por_reenviar) > BUS_MAX_REENVIO:
+            self._por_reenviar.popleft()
+            self.descartados += 1
+        if self._tarea_reenvio is None or self._tarea_reenvio.done():
+            self._tarea_reenvio = asyncio.get_running_loop().create_task(self._reenviar())
+
+    async def _reenviar(self):
+        """Reenvía los eventos guardados, esperando más entre intentos fallidos"""
+        espera = 1
+        while self._por_reenviar:
+            await asyncio.sleep(espera)
+            lote = [self._por_reenviar[i] for i in range(min(LOTE_REENVIO, len(self._por_reenviar)))]
+            try:
+                await self._xadd(lote)
+            except Exception as e:
+                espera = min(espera * 2, ESPERA_REENVIO_MAX)
+                print(f"⚠️ Reenvío al bus fallido ({len(self._por_reenviar)} pendientes), "
+                      f"reintento en {espera}s: {e}")
+                continue
+            # Los eventos nuevos se agregan al final: los primeros siguen siendo el lote
+            for _ in lote:
+                self._por_reenviar.popleft()
+            self.publicados += len(lote)
+            self.reenviados += len(lote)
+            espera = 0
+        print("✅ Eventos pendientes reenviados al bus")
+
+    async def crear_grupo(self, grupo):
+        try:
+            await self.redis.xgroup_create(self.stream, grupo, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def leer(self, grupo, consumidor, cantidad, bloqueo_ms, pendientes=False):
+        """Lee mensajes nuevos del grupo; con `pendientes` relee los no confirmados"""
+        respuesta = await self.redis.xreadgroup(
+            grupo, consumidor, {self.stream: "0" if pendientes else ">"},
+            count=cantidad, block=None if pendientes else bloqueo_ms
+        )
+        if not respuesta:
+            return []
+        return self._decodificar(respuesta[0][1])
+
+    async def reclamar(self, grupo, consumidor, cantidad, inactivo_ms):
+        """Toma los mensajes entregados hace más de `inactivo_ms` y sin confirmar.
+
+        Recupera lo que quedó pendiente en consumidores caídos (o en este
+        mismo tras un error) con XAUTOCLAIM.
+        """
+        respuesta = await self.redis.xautoclaim(self.stream, grupo, consumidor, inactivo_ms,
+                                                start_id="0-0", count=cantidad)
+        return self._decodificar(respuesta[1])
+
+    async def recortar(self):
+        """Borra los mensajes que ya confirmaron todos los grupos; devuelve cuántos.
+
+        Por grupo, lo más viejo que hay que conservar es su primer mensaje
+        pendiente o, si no tiene pendientes, el último entregado (lo posterior
+        aún no se entregó). Sin grupos no se recorta: el primero que se cree
+        leerá el stream desde el principio.
+        """
+        try:
+            grupos = await self.redis.xinfo_groups(self.stream)
+            if not grupos:
+                return 0
+            conservar = []
+            for g in grupos:
+                desde = g["last-delivered-id"]
+                if g.get("pending"):
+                    resumen = await self.redis.xpending(self.stream, g["name"])
+                    desde = resumen["min"]
+                conservar.append(self._id_a_tupla(desde))
+            minimo = min(conservar)
+            # Exacto: corre cada pocos segundos; con `~` Redis solo borra nodos completos
+            return await self.redis.xtrim(self.stream, minid=f"{minimo[0]}-{minimo[1]}",
+                                          approximate=False)
+        except Exception as e:
+            print(f"⚠️ No se pudo recortar el stream {self.stream}: {e}")
+            return 0
+
+    @staticmethod
+    def _id_a_tupla(id_mensaje):
+        if isinstance(id_mensaje, bytes):
+            id_mensaje = id_mensaje.decode()
+        ms, _, secuencia = id_mensaje.partition("-")
+        return int(ms), int(secuencia or 0)
+
+    @staticmethod
+    def _decodificar(mensajes):
+        # XAUTOCLAIM devuelve campos vacíos para mensajes ya recortados del stream
+        return [
+            (id_mensaje, orjson.loads(campos[b"datos"]))
+            for id_mensaje, campos in mensajes
+            if campos and b"datos" in campos
+        ]
+
+    async def confirmar(self, grupo, ids):
+        if ids:
+            await self.redis.xack(self.stream, grupo, *ids)
+
+    async def apartar_fallida(self, id_mensaje, evento, error):
+        """Copia a `<stream>:fallidas` un mensaje que no se pudo procesar"""
+        try:
+            await self.redis.xadd(f"{self.stream}:fallidas", {
+                "id": id_mensaje, "datos": dumps_mongo(evento), "error": error
+            }, maxlen=BUS_MAX_FALLIDAS, approximate=True)
+        except Exception as e:
+            print(f"⚠️ No se pudo apartar el mensaje fallido {id_mensaje}: {e}")
+
+    async def difundir(self, resultados):
+        """Publica los análisis en el canal pub/sub (una sola serialización)"""
+        if not resultados:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for resultado in resultados:
+                    pipe.publish(CANAL_ANALISIS, dumps_mongo(resultado))
+                await pipe.execute()
+        except Exception as e:
+            print(f"⚠️ No se pudieron difundir {len(resultados)} análisis: {e}")
+
+    async def escuchar_analisis(self):
+        """Genera (resultado, bytes JSON) por cada análisis difundido"""
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(CANAL_ANALISIS)
+        try:
+            while True:
+                mensaje = await pubsub.get_message(timeout=1.0)
+                if mensaje is None:
+                    continue
+                yield orjson.loads(mensaje["data"]), mensaje["data"]
+        finally:
+            await pubsub.unsubscribe(CANAL_ANALISIS)
+            await pubsub.reset()
+
+    async def metricas(self, grupo=None):
+        metricas = {
+            "tipo": "redis",
+            "stream": self.stream,
+            "publicados": self.publicados,
+            "descartados": self.descartados,
+            "reenviados": self.reenviados,
+            "por_reenviar": len(self._por_reenviar),
+            "saturado": self._saturado,
+        }
+        try:
+            metricas["longitud"] = await self.redis.xlen(self.stream)
+            for g in await self.redis.xinfo_groups(self.stream):
+                nombre = g["name"].decode() if isinstance(g["name"], bytes) else g["name"]
+                if grupo is None or nombre == grupo:
+                    metricas.setdefault("grupos", {})[nombre] = {
+                        "pendientes": g.get("pending", 0),
+                        "lag": g.get("lag"),
+                        "consumidores": g.get("consumers", 0),
+                    }
+        except Exception as e:
+            metricas["error"] = str(e)
+        return metricas
+
+
+_bus = None
+
+
+def obtener_bus():
+    """Bus compartido del proceso según BUS_BACKEND (redis | local)"""
+    global _bus
+    if _bus is None:
+        if BUS_BACKEND == "local":
+            print("⚠️ Bus de eventos local: solo conecta productor y consumidor del mismo proceso")
+            _bus = BusLocal()
+        else:
+            _bus = BusRedis(get_async_redis_client(socket_connect_timeout=0.5))
+    return _bus
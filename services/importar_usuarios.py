@@ -0,0 +1,326 @@
+"""
+Importación masiva de usuarios y pacientes desde CSV o JSONL.
+
+Lee el archivo por lotes, calcula los hashes de contraseña en el pool de
+procesos de `services.contrasenas` y escribe cada lote con `insert_many` en
+`usuarios` y `pacientes`. Si MongoDB admite transacciones (réplica o
+clúster), el lote, sus errores y el punto de control se guardan en una sola
+transacción; si no, un paciente cuya ficha no se pudo crear se borra de
+`usuarios` para no dejar registros a medias.
+
+El punto de control (colección `importaciones`) guarda la última fila
+procesada, así que una importación interrumpida se reanuda al repetir el
+comando con el mismo archivo. Las filas rechazadas quedan en
+`importaciones_errores` y se escriben en un reporte JSONL.
+
+Columnas: cedula, nombre, password (obligatorias), apellido, email,
+telefono, rol (paciente | medico), especialidad, fecha_nacimiento,
+telegram_user_id.
+
+Ejecutar desde la raíz del proyecto:
+    python -m services.importar_usuarios pacientes.csv --lote 500
+    HASH_WORKERS=8 python -m services.importar_usuarios pacientes.jsonl --reporte errores.jsonl
+    python -m services.importar_usuarios pacientes.csv --reiniciar   # Ignora el punto de control
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from services import contrasenas
+from services.data_base_mongo import documentos_usuario, transacciones_disponibles
+
+ROLES = ("paciente", "medico")
+CAMPOS_OPCIONALES = ("apellido", "email", "telefono", "especialidad", "fecha_nacimiento", "telegram_user_id")
+MAX_LARGO_CAMPO = 200
+
+
+def formato_de(nombre_archivo):
+    """'csv' o 'jsonl' según la extensión del archivo"""
+    extension = os.path.splitext(nombre_archivo or "")[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError("Formato no soportado: usa un archivo .csv o .jsonl")
+
+
+def huella(archivo):
+    """SHA-256 del contenido de un archivo binario abierto; identifica la importación"""
+    resumen = hashlib.sha256()
+    for bloque in iter(lambda: archivo.read(1 << 20), b""):
+        resumen.update(bloque)
+    archivo.seek(0)
+    return resumen.hexdigest()[:16]
+
+
+def leer_filas(lineas, formato):
+    """Genera (número de fila, dict, error) a partir de las líneas de texto"""
+    if formato == "csv":
+        lector = csv.DictReader(lineas)
+        for fila in lector:
+            yield lector.line_num, fila, None
+        return
+
+    for numero, linea in enumerate(lineas, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError as e:
+            yield numero, None, f"JSON inválido: {e}"
+            continue
+        if isinstance(fila, dict):
+            yield numero, fila, None
+        else:
+            yield numero, None, "Se esperaba un objeto JSON"
+
+
+def validar_fila(fila):
+    """Normaliza una fila; lanza ValueError con el motivo si no es válida"""
+    datos = {}
+    for campo in ("cedula", "nombre", "password") + CAMPOS_OPCIONALES + ("rol",):
+        valor = fila.get(campo)
+        valor = "" if valor is None else str(valor).strip()
+        if len(valor) > MAX_LARGO_CAMPO:
+            raise ValueError(f"El campo {campo} es demasiado largo")
+        datos[campo] = valor
+
+    faltantes = [campo for campo in ("cedula", "nombre", "password") if not datos[campo]]
+    if faltantes:
+        raise ValueError(f"Faltan datos obligatorios: {', '.join(faltantes)}")
+    if any(c.isspace() for c in datos["cedula"]):
+        raise ValueError("La cédula no puede contener espacios")
+    datos["rol"] = datos["rol"].lower() or "paciente"
+    if datos["rol"] not in ROLES:
+        raise ValueError(f"Rol inválido: {datos['rol']}")
+    return datos
+
+
+def _insertar(coleccion, documentos, sesion=None):
+    """insert_many no ordenado; devuelve {índice: motivo} de los que fallaron"""
+    if not documentos:
+        return {}
+    try:
+        coleccion.insert_many(documentos, ordered=False, session=sesion)
+        return {}
+    except BulkWriteError as e:
+        return {
+            error["index"]: "La cédula ya está registrada" if error.get("code") == 11000 else error.get("errmsg", "Error de escritura")
+            for error in e.details.get("writeErrors", [])
+        }
+
+
+class ImportadorUsuarios:
+    """Importa filas por lotes con punto de control en la colección `importaciones`"""
+
+    def __init__(self, db, id_importacion, lote=500, reiniciar=False):
+        self.db = db
+        self.id_importacion = f"usuarios:{id_importacion}"
+        self.lote = max(1, lote)
+        self.control = db["importaciones"]
+        self.transacciones = transacciones_disponibles(db.client)
+
+        if reiniciar:
+            self.control.delete_one({"_id": self.id_importacion})
+            db["importaciones_errores"].delete_many({"importacion": self.id_importacion})
+        self.estado = self.control.find_one({"_id": self.id_importacion}) or {}
+
+    def resumen(self):
+        return {
+            "id_importacion": self.id_importacion,
+            "importados": self.estado.get("importados", 0),
+            "con_errores": self.db["importaciones_errores"].count_documents({"importacion": self.id_importacion}),
+            "ultima_fila": self.estado.get("ultima_fila", 0),
+            "completado": self.estado.get("completado", False),
+            "transacciones": self.transacciones,
+        }
+
+    def errores(self, limite=0):
+        """Filas rechazadas, en orden de aparición"""
+        cursor = self.db["importaciones_errores"].find(
+            {"importacion": self.id_importacion}, {"_id": 0, "importacion": 0}
+        ).sort("fila", 1).limit(limite)
+        return list(cursor)
+
+    def importar(self, filas):
+        """Procesa las filas (de `leer_filas`) y devuelve el resumen"""
+        if self.estado.get("completado"):
+            print(f"ℹ️ La importación {self.id_importacion} ya se completó")
+            return self.resumen()
+
+        desde = self.estado.get("ultima_fila", 0)
+        if desde:
+            print(f"↪ Reanudando {self.id_importacion} después de la fila {desde}")
+
+        pendientes, errores, vistos = [], [], set()
+        for numero, fila, error in filas:
+            if numero <= desde:
+                continue
+            if error is None:
+                try:
+                    datos = validar_fila(fila)
+                except ValueError as e:
+                    error = str(e)
+            if error is None and datos["cedula"] in vistos:
+                error = "Cédula repetida en el archivo"
+            if error is not None:
+                errores.append({"fila": numero, "cedula": (fila or {}).get("cedula"), "error": error})
+            else:
+                vistos.add(datos["cedula"])
+                pendientes.append((numero, datos))
+
+            if len(pendientes) >= self.lote:
+                self._procesar(pendientes, errores, numero)
+                pendientes, errores = [], []
+
+        if pendientes or errores:
+            self._procesar(pendientes, errores, numero)
+
+        self.estado["completado"] = True
+        self.control.update_one(
+            {"_id": self.id_importacion},
+            {"$set": {"completado": True, "actualizado": datetime.now()}},
+            upsert=True
+        )
+        resumen = self.resumen()
+        print(f"✅ {resumen['importados']} usuarios importados, {resumen['con_errores']} filas con errores")
+        return resumen
+
+    def _procesar(self, pendientes, errores, hasta):
+        cedulas = [datos["cedula"] for _, datos in pendientes]
+        existentes = {
+            doc["cedula"] for doc in
+            self.db.usuarios.find({"cedula": {"$in": cedulas}}, {"_id": 0, "cedula": 1})
+        } if cedulas else set()
+
+        nuevos = []
+        for numero, datos in pendientes:
+            if datos["cedula"] in existentes:
+                errores.append({"fila": numero, "cedula": datos["cedula"], "error": "La cédula ya está registrada"})
+            else:
+                nuevos.append((numero, datos))
+
+        # Los hashes se calculan antes de abrir la transacción, para que sea corta
+        hashes = contrasenas.generar_lote([datos["password"] for _, datos in nuevos])
+        documentos = []
+        for (numero, datos), password_hash in zip(nuevos, hashes):
+            usuario, paciente = documentos_usuario(
+                datos["cedula"], datos["nombre"], datos["email"], datos["telefono"], password_hash,
+                rol=datos["rol"], especialidad=datos["especialidad"], apellido=datos["apellido"],
+                fecha_nacimiento=datos["fecha_nacimiento"], telegram_user_id=datos["telegram_user_id"]
+            )
+            documentos.append((numero, usuario, paciente))
+
+        importados = None
+        if self.transacciones:
+            try:
+                with self.db.client.start_session() as sesion:
+                    sesion.with_transaction(
+                        lambda s: self._escribir_en_transaccion(documentos, errores, hasta, s)
+                    )
+                importados = len(documentos)
+            except BulkWriteError:
+                # Alguna cédula se registró mientras tanto: se rehace fila por fila
+                for _, usuario, paciente in documentos:
+                    usuario.pop("_id", None)
+                    if paciente is not None:
+                        paciente.pop("_id", None)
+        if importados is None:
+            importados = self._escribir_sin_transaccion(documentos, errores, hasta)
+
+        self.estado["ultima_fila"] = hasta
+        self.estado["importados"] = self.estado.get("importados", 0) + importados
+        print(f"  ↪ fila {hasta}: {self.estado['importados']} importados, {len(errores)} errores en el lote")
+
+    def _escribir_en_transaccion(self, documentos, errores, hasta, sesion):
+        usuarios = [usuario for _, usuario, _ in documentos]
+        pacientes = [paciente for _, _, paciente in documentos if paciente is not None]
+        for coleccion, docs in ((self.db.usuarios, usuarios), (self.db.pacientes, pacientes)):
+            if docs:
+                coleccion.insert_many(docs, session=sesion)
+        self._guardar_avance(len(documentos), errores, hasta, sesion)
+
+    def _escribir_sin_transaccion(self, documentos, errores, hasta):
+        fallidos = _insertar(self.db.usuarios, [usuario for _, usuario, _ in documentos])
+        for indice, motivo in fallidos.items():
+            numero, usuario, _ = documentos[indice]
+            errores.append({"fila": numero, "cedula": usuario["cedula"], "error": motivo})
+
+        con_ficha = [(numero, usuario, paciente) for i, (numero, usuario, paciente) in enumerate(documentos)
+                     if paciente is not None and i not in fallidos]
+        fallidos_ficha = _insertar(self.db.pacientes, [paciente for _, _, paciente in con_ficha])
+        if fallidos_ficha:
+            # Sin transacción: se deshace el usuario cuya ficha no se pudo crear
+            self.db.usuarios.delete_many({"_id": {"$in": [con_ficha[i][1]["_id"] for i in fallidos_ficha]}})
+            for indice, motivo in fallidos_ficha.items():
+                numero, usuario, _ = con_ficha[indice]
+                errores.append({"fila": numero, "cedula": usuario["cedula"], "error": f"Ficha de paciente: {motivo}"})
+
+        importados = len(documentos) - len(fallidos) - len(fallidos_ficha)
+        self._guardar_avance(importados, errores, hasta)
+        return importados
+
+    def _guardar_avance(self, importados, errores, hasta, sesion=None):
+        if errores:
+            self.db["importaciones_errores"].bulk_write([
+                ReplaceOne(
+                    {"_id": f"{self.id_importacion}:{error['fila']}"},
+                    {"importacion": self.id_importacion, **error},
+                    upsert=True
+                )
+                for error in errores
+            ], ordered=False, session=sesion)
+        self.control.update_one(
+            {"_id": self.id_importacion},
+            {"$set": {"ultima_fila": hasta, "actualizado": datetime.now()}, "$inc": {"importados": importados}},
+            upsert=True, session=sesion
+        )
+
+
+def importar_archivo(db, ruta, lote=500, reiniciar=False, id_importacion=None):
+    """Importa un archivo CSV/JSONL; devuelve (importador, resumen)"""
+    formato = formato_de(ruta)
+    if id_importacion is None:
+        with open(ruta, "rb") as archivo:
+            id_importacion = huella(archivo)
+    importador = ImportadorUsuarios(db, id_importacion, lote=lote, reiniciar=reiniciar)
+    with open(ruta, encoding="utf-8-sig", newline="") as lineas:
+        resumen = importador.importar(leer_filas(lineas, formato))
+    return importador, resumen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archivo", help="Archivo .csv o .jsonl")
+    parser.add_argument("--lote", type=int, default=500, help="Filas por lote")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el punto de control")
+    parser.add_argument("--id", dest="id_importacion", help="Identificador de la importación (por defecto, huella del archivo)")
+    parser.add_argument("--reporte", help="Archivo JSONL con las filas rechazadas (por defecto, <archivo>.errores.jsonl)")
+    args = parser.parse_args()
+
+    from services.data_base_mongo import db
+
+    if db is None:
+        print("❌ No hay conexión con MongoDB")
+        raise SystemExit(1)
+
+    contrasenas.iniciar()
+    try:
+        importador, resumen = importar_archivo(db, args.archivo, lote=args.lote, reiniciar=args.reiniciar,
+                                               id_importacion=args.id_importacion)
+    finally:
+        contrasenas.cerrar()
+
+    if resumen["con_errores"]:
+        ruta_reporte = args.reporte or f"{args.archivo}.errores.jsonl"
+        with open(ruta_reporte, "w", encoding="utf-8") as reporte:
+            for error in importador.errores():
+                reporte.write(json.dumps(error, ensure_ascii=False) + "\n")
+        print(f"📄 Reporte de errores: {ruta_reporte}")
@@ -0,0 +1,133 @@
+"""
+Declaración y verificación de los índices de MongoDB.
+
+Solo depende de pymongo: los servicios importan de aquí los nombres de sus
+colecciones y cada uno aplica los índices de las suyas al arrancar. Ejecutar
+desde la raíz del proyecto para aplicarlos todos y comprobar que las
+consultas frecuentes los usan:
+    python -m services.indices
+"""
+
+import os
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+# Lecturas crudas de Service1 y sus resúmenes por minuto, hora y día
+SIGNOS_COLECCION = os.getenv("SIGNOS_COLECCION", "signos_vitales")
+ROLLUP_COLECCION = "signos_vitales_rollup"
+# Los resúmenes por minuto se borran pasado este tiempo (índice TTL parcial);
+# los de hora y día se conservan
+ROLLUP_MINUTOS_DIAS = float(os.getenv("ROLLUP_MINUTOS_DIAS", "7"))
+# Lecturas del simulador de alta tasa (services/main.py)
+LECTURAS_COLECCION = os.getenv("LECTURAS_COLECCION", "lecturas")
+
+# Índices requeridos por colección: (claves, opciones).
+# Se usan los nombres generados por MongoDB para reconocer los índices ya existentes.
+INDICES = {
+    "usuarios": [
+        ([("cedula", ASCENDING)], {"unique": True}),
+    ],
+    "pacientes": [
+        ([("cedula", ASCENDING)], {"unique": True}),
+    ],
+    SIGNOS_COLECCION: [
+        # find({cedula}).sort(timestamp, -1) y rangos de tiempo por paciente
+        ([("cedula", ASCENDING), ("timestamp", DESCENDING)], {}),
+        # Último signo global: find_one(sort=[(timestamp, -1)])
+        ([("timestamp", DESCENDING)], {}),
+    ],
+    ROLLUP_COLECCION: [
+        # Un documento por (paciente, periodo, inicio); también sirve la consulta
+        # por rango y evita que un reintento cree un segundo resumen
+        ([("cedula", ASCENDING), ("periodo", ASCENDING), ("inicio", DESCENDING)], {"unique": True}),
+        ([("inicio", ASCENDING)], {"expireAfterSeconds": int(ROLLUP_MINUTOS_DIAS * 86400),
+                                   "partialFilterExpression": {"periodo": "minuto"}}),
+    ],
+    LECTURAS_COLECCION: [
+        ([("timestamp", DESCENDING)], {}),
+    ],
+    "importaciones_errores": [
+        # Reporte de filas rechazadas de una importación, en orden
+        ([("importacion", ASCENDING), ("fila", ASCENDING)], {}),
+    ],
+}
+
+# Consultas frecuentes que deben resolverse con un índice: (colección, nombre, filtro, orden)
+CONSULTAS_CRITICAS = [
+    ("pacientes", "paciente por cédula", {"cedula": "0"}, None),
+    ("usuarios", "usuario por cédula", {"cedula": "0"}, None),
+    (SIGNOS_COLECCION, "últimos signos por cédula", {"cedula": "0"}, [("timestamp", DESCENDING)]),
+    (SIGNOS_COLECCION, "último signo global", {}, [("timestamp", DESCENDING)]),
+    (ROLLUP_COLECCION, "resúmenes por paciente", {"cedula": "0", "periodo": "hora"}, [("inicio", DESCENDING)]),
+    (LECTURAS_COLECCION, "últimas lecturas", {}, [("timestamp", DESCENDING)]),
+]
+
+
+def aplicar_indices(db, colecciones=None):
+    """Crea los índices declarados (de `colecciones`, o todos); devuelve los errores"""
+    errores = []
+    for coleccion, indices in INDICES.items():
+        if colecciones is not None and coleccion not in colecciones:
+            continue
+        for claves, opciones in indices:
+            try:
+                db[coleccion].create_index(claves, **opciones)
+            except PyMongoError as e:
+                errores.append(f"{coleccion} {claves}: {e}")
+    for error in errores:
+        print(f"⚠️ No se pudo crear el índice {error}")
+    return errores
+
+
+def _etapas(plan):
+    """Recorre el árbol del plan ganador y devuelve los nombres de sus etapas"""
+    etapas = []
+    pendientes = [plan]
+    while pendientes:
+        nodo = pendientes.pop()
+        etapas.append(nodo.get("stage"))
+        if "inputStage" in nodo:
+            pendientes.append(nodo["inputStage"])
+        pendientes.extend(nodo.get("inputStages", []))
+    return etapas
+
+
+def verificar_consultas(db, colecciones=None):
+    """Comprueba con explain() que las consultas críticas no recorren la colección.
+
+    Devuelve {nombre: bool}; False indica un COLLSCAN o un SORT en memoria.
+    """
+    resultados = {}
+    for coleccion, nombre, filtro, orden in CONSULTAS_CRITICAS:
+        if colecciones is not None and coleccion not in colecciones:
+            continue
+        cursor = db[coleccion].find(filtro).limit(1)
+        if orden:
+            cursor = cursor.sort(orden)
+        try:
+            plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        except PyMongoError as e:
+            print(f"⚠️ No se pudo explicar la consulta '{nombre}': {e}")
+            resultados[nombre] = False
+            continue
+        etapas = _etapas(plan)
+        usa_indice = "COLLSCAN" not in etapas and "SORT" not in etapas
+        resultados[nombre] = usa_indice
+        if not usa_indice:
+            print(f"⚠️ La consulta '{nombre}' en {coleccion} no usa índice: {etapas}")
+    return resultados
+
+
+if __name__ == "__main__":
+    from services.data_base_mongo import db
+
+    if db is None:
+        print("❌ No hay conexión con MongoDB")
+        raise SystemExit(1)
+
+    errores = aplicar_indices(db)
+    resultados = verificar_consultas(db)
+    for nombre, ok in resultados.items():
+        print(f"{'✅' if ok else '❌'} {nombre}")
+    raise SystemExit(1 if errores or not all(resultados.values()) else 0)
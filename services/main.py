@@ -1,26 +1,33 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
-from datetime import datetime
-import random
+from services.simulador_lecturas import (
+    LECTURAS_COLECCION, AlmacenLecturas, SimuladorLecturas, lectura_aleatoria, preparar_coleccion
+)
+from services.utils import MongoJSONResponse
 
 # Cargar variables de entorno
 load_dotenv()
 
-app = FastAPI(title="Microservicio de Monitoreo de Salud")
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+DB_NAME = os.getenv("DB_NAME")
+MONGO_MAX_POOL = int(os.getenv("MONGO_MAX_POOL", "50"))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
+
+# Simulación que arranca con el servicio (0 pacientes = solo a pedido)
+SIMULADOR_PACIENTES = int(os.getenv("SIMULADOR_PACIENTES", "0"))
+SIMULADOR_LECTURAS_SEG = int(os.getenv("SIMULADOR_LECTURAS_SEG", "1000"))
+MAX_DATOS = 1000
 
-# Conexión con MongoDB
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client[os.getenv("DB_NAME")]
-collection = db["lecturas"]
+app = FastAPI(title="Microservicio de Monitoreo de Salud", default_response_class=MongoJSONResponse)
 
-try:
-    client.admin.command('ping')
-    print("✅ Conectado correctamente a MongoDB Atlas")
-except Exception as e:
-    print("❌ Error conectando a MongoDB:", e)
+# La conexión con MongoDB se crea al arrancar el servicio, no al importar.
+# Los endpoints son async: el almacén y el simulador solo se usan desde el bucle de eventos
+client = None
+almacen = AlmacenLecturas(None)
+simulador = SimuladorLecturas(almacen)
 
 
 # CORS para permitir conexión con el frontend
@@ -31,25 +38,65 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 📤 Endpoint de simulación (genera datos aleatorios)
+# 📤 Endpoint de simulación (genera una lectura aleatoria)
 @app.get("/api/simular")
-def simular_datos():
-    lectura = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "datos": {
-            "ritmo_cardiaco": random.randint(55, 110),
-            "temperatura": round(random.uniform(35.5, 38.5), 1)
-        }
-    }
-    # Guardar en MongoDB
-    collection.insert_one(lectura)
-    return {"status": "ok", "inserted": True, "lectura": lectura}
-
-# 📥 Endpoint para obtener los últimos datos
+async def simular_datos():
+    lectura = lectura_aleatoria()
+    # Se guarda en MongoDB con el siguiente lote; `inserted` se mantiene por
+    # compatibilidad con los clientes de la versión que insertaba al momento
+    almacen.agregar(lectura)
+    return MongoJSONResponse({"status": "ok", "inserted": True, "encolada": True, "lectura": lectura})
+
+# 📥 Endpoint para obtener los últimos datos (desde memoria, sin consultar MongoDB)
 @app.get("/api/data")
-def obtener_datos():
-    registros = list(collection.find().sort("_id", -1).limit(20))
-    # Convertir ObjectId a string y limpiar formato
-    for r in registros:
-        r["_id"] = str(r["_id"])
-    return registros
+async def obtener_datos(limit: int = 20):
+    # ObjectId y fechas se convierten a texto al serializar
+    return MongoJSONResponse(almacen.recientes(min(max(limit, 1), MAX_DATOS)))
+
+# 🏃 Simulación a alta tasa en segundo plano
+@app.post("/api/simulacion")
+async def iniciar_simulacion(pacientes: int = 100, lecturas_por_segundo: int = SIMULADOR_LECTURAS_SEG):
+    if pacientes < 1 or lecturas_por_segundo < 1:
+        raise HTTPException(status_code=400, detail="pacientes y lecturas_por_segundo deben ser mayores que 0")
+    simulador.start(pacientes, lecturas_por_segundo)
+    return {"status": "ok", **simulador.metricas()}
+
+@app.delete("/api/simulacion")
+async def detener_simulacion():
+    simulador.detener()
+    return {"status": "ok", **simulador.metricas()}
+
+@app.get("/api/simulacion")
+async def estado_simulacion():
+    """Estado del simulador y de la escritura por lotes"""
+    return {"simulador": simulador.metricas(), "escritura": almacen.metricas()}
+
+
+@app.on_event("startup")
+async def startup_event():
+    global client
+    try:
+        client = AsyncIOMotorClient(MONGO_URI, maxPoolSize=MONGO_MAX_POOL,
+                                    serverSelectionTimeoutMS=MONGO_TIMEOUT_MS, connectTimeoutMS=MONGO_TIMEOUT_MS)
+        db = client[DB_NAME] if DB_NAME else client.get_default_database()
+        await client.admin.command('ping')
+        print("✅ Conectado correctamente a MongoDB")
+        await preparar_coleccion(db)
+        almacen.coleccion = db[LECTURAS_COLECCION]
+        await almacen.cargar_recientes()
+    except Exception as e:
+        # Las lecturas se siguen sirviendo desde memoria y se escriben al reconectar
+        print("❌ Error conectando a MongoDB:", e)
+        if client is not None and DB_NAME:
+            almacen.coleccion = client[DB_NAME][LECTURAS_COLECCION]
+    almacen.start()
+    if SIMULADOR_PACIENTES:
+        simulador.start(SIMULADOR_PACIENTES, SIMULADOR_LECTURAS_SEG)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    simulador.detener()
+    await almacen.detener()
+    if client is not None:
+        client.close()
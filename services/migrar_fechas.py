@@ -0,0 +1,106 @@
+"""
+Migración en línea de fechas guardadas como texto a fechas BSON.
+
+Recorre cada colección por `_id` en lotes, convierte los campos de fecha
+que siguen siendo texto y guarda un punto de control en la colección
+`migraciones` después de cada lote, de modo que puede interrumpirse y
+reanudarse. Cada actualización se condiciona al valor original, así que es
+segura mientras los servicios siguen escribiendo.
+
+Ejecutar desde la raíz del proyecto:
+    python -m services.migrar_fechas --lote 1000 --pausa 0.1
+    python -m services.migrar_fechas --reiniciar   # Ignora los puntos de control
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from services.utils import parse_fecha
+
+# (colección, campo) a convertir
+CAMPOS_FECHA = [
+    ("signos_vitales", "timestamp"),
+    ("lecturas", "timestamp"),
+    ("pacientes", "fecha_registro"),
+    ("pacientes", "fecha_actualizacion"),
+    ("usuarios", "fecha_registro"),
+]
+
+
+def migrar_campo(db, coleccion, campo, lote=1000, pausa=0.0, reiniciar=False):
+    """Convierte `campo` de texto a fecha en `coleccion`; devuelve el resumen"""
+    control = db["migraciones"]
+    id_control = f"fechas:{coleccion}.{campo}"
+    estado = control.find_one({"_id": id_control}) or {}
+    if reiniciar:
+        estado = {}
+    if estado.get("completado"):
+        print(f"ℹ️ {coleccion}.{campo} ya migrado ({estado.get('migrados', 0)} documentos)")
+        return estado
+
+    ultimo_id = estado.get("ultimo_id")
+    migrados = estado.get("migrados", 0)
+    invalidos = estado.get("invalidos", 0)
+
+    while True:
+        filtro = {campo: {"$type": "string"}}
+        if ultimo_id is not None:
+            filtro["_id"] = {"$gt": ultimo_id}
+        documentos = list(
+            db[coleccion].find(filtro, {campo: 1}).sort("_id", 1).limit(lote)
+        )
+        if not documentos:
+            break
+
+        operaciones = []
+        for doc in documentos:
+            try:
+                fecha = parse_fecha(doc[campo])
+            except ValueError:
+                invalidos += 1
+                continue
+            operaciones.append(UpdateOne(
+                {"_id": doc["_id"], campo: doc[campo]},
+                {"$set": {campo: fecha}}
+            ))
+
+        if operaciones:
+            resultado = db[coleccion].bulk_write(operaciones, ordered=False)
+            migrados += resultado.modified_count
+
+        ultimo_id = documentos[-1]["_id"]
+        control.update_one(
+            {"_id": id_control},
+            {"$set": {"ultimo_id": ultimo_id, "migrados": migrados,
+                      "invalidos": invalidos, "actualizado": datetime.now()}},
+            upsert=True
+        )
+        print(f"  ↪ {coleccion}.{campo}: {migrados} migrados, {invalidos} inválidos")
+
+        if pausa:
+            time.sleep(pausa)
+
+    estado = {"migrados": migrados, "invalidos": invalidos, "completado": True}
+    control.update_one({"_id": id_control}, {"$set": estado}, upsert=True)
+    print(f"✅ {coleccion}.{campo}: {migrados} documentos migrados, {invalidos} con formato inválido")
+    return estado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lote", type=int, default=1000, help="Documentos por lote")
+    parser.add_argument("--pausa", type=float, default=0.1, help="Segundos de espera entre lotes")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar los puntos de control")
+    args = parser.parse_args()
+
+    from services.data_base_mongo import db
+
+    if db is None:
+        print("❌ No hay conexión con MongoDB")
+        raise SystemExit(1)
+
+    for coleccion, campo in CAMPOS_FECHA:
+        migrar_campo(db, coleccion, campo, lote=args.lote, pausa=args.pausa, reiniciar=args.reiniciar)
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Campos del paciente que necesitan los endpoints de signos vitales
+PROYECCION_PACIENTE = {"_id": 0, "cedula": 1, "nombre": 1, "apellido": 1}
+
+CACHE_CAPACIDAD = int(os.getenv("CACHE_PACIENTES_CAPACIDAD", "10000"))
+CACHE_TTL_LOCAL = float(os.getenv("CACHE_PACIENTES_TTL_LOCAL", "30"))
+CACHE_TTL_REDIS = int(os.getenv("CACHE_PACIENTES_TTL_REDIS", "300"))
+# Tiempo sin intentar Redis después de un fallo de conexión
+REDIS_ESPERA_REINTENTO = float(os.getenv("CACHE_PACIENTES_REDIS_REINTENTO", "30"))
+
+
+class CachePacientes:
+    """Caché de lectura de pacientes en dos niveles: LRU local → Redis → MongoDB.
+
+    El nivel local es un LRU con TTL por proceso; el TTL corto acota cuánto
+    tiempo otro worker puede servir un paciente ya modificado. Redis es
+    compartido entre workers y se invalida explícitamente al crear o
+    actualizar un paciente. Si Redis no responde se omite durante
+    `REDIS_ESPERA_REINTENTO` segundos y se consulta MongoDB directamente;
+    las invalidaciones de ese intervalo quedan pendientes y se borran de
+    Redis antes de volver a usarlo.
+    Solo se guardan pacientes existentes: una cédula no encontrada siempre
+    vuelve a consultarse en MongoDB.
+
+    Espera una colección de Motor y un cliente de `redis.asyncio`.
+    """
+
+    def __init__(self, coleccion, redis_client=None, capacidad=CACHE_CAPACIDAD,
+                 ttl_local=CACHE_TTL_LOCAL, ttl_redis=CACHE_TTL_REDIS):
+        self.coleccion = coleccion
+        self.redis = redis_client
+        self.capacidad = capacidad
+        self.ttl_local = ttl_local
+        self.ttl_redis = ttl_redis
+        self._local = OrderedDict()  # cedula -> (expira, paciente)
+        self._lock = threading.Lock()
+        self._redis_inactivo_hasta = 0.0
+        self._pendientes = set()  # cédulas invalidadas mientras Redis no respondía
+        self.contadores = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "mongo_hits": 0,
+            "no_encontrados": 0,
+            "errores_redis": 0,
+            "invalidaciones": 0,
+        }
+
+    @staticmethod
+    def _clave(cedula):
+        return f"paciente:{cedula}"
+
+    def _contar(self, contador):
+        with self._lock:
+            self.contadores[contador] += 1
+
+    def _redis_disponible(self):
+        return self.redis is not None and time.monotonic() >= self._redis_inactivo_hasta
+
+    async def _redis_listo(self):
+        """True si se puede usar Redis; antes borra las invalidaciones pendientes"""
+        if not self._redis_disponible():
+            return False
+        with self._lock:
+            pendientes = list(self._pendientes)
+        if not pendientes:
+            return True
+        try:
+            await self.redis.delete(*(self._clave(cedula) for cedula in pendientes))
+        except Exception as e:
+            self._fallo_redis(e)
+            return False
+        with self._lock:
+            self._pendientes.difference_update(pendientes)
+        print(f"🧹 {len(pendientes)} invalidaciones pendientes aplicadas en Redis")
+        return True
+
+    def _fallo_redis(self, e):
+        print(f"⚠️ Redis no disponible para la caché de pacientes: {e}")
+        self._contar("errores_redis")
+        self._redis_inactivo_hasta = time.monotonic() + REDIS_ESPERA_REINTENTO
+
+    def _leer_local(self, cedula):
+        with self._lock:
+            entrada = self._local.get(cedula)
+            if entrada is None:
+                return None
+            expira, paciente = entrada
+            if expira < time.monotonic():
+                del self._local[cedula]
+                return None
+            self._local.move_to_end(cedula)
+            return paciente
+
+    def _guardar_local(self, cedula, paciente):
+        with self._lock:
+            self._local[cedula] = (time.monotonic() + self.ttl_local, paciente)
+            self._local.move_to_end(cedula)
+            while len(self._local) > self.capacidad:
+                self._local.popitem(last=False)
+
+    async def obtener(self, cedula):
+        """Devuelve {cedula, nombre, apellido} del paciente o None si no existe"""
+        paciente = self._leer_local(cedula)
+        if paciente is not None:
+            self._contar("local_hits")
+            return paciente
+
+        if await self._redis_listo():
+            try:
+                valor = await self.redis.get(self._clave(cedula))
+                if valor is not None:
+                    paciente = json.loads(valor)
+                    self._guardar_local(cedula, paciente)
+                    self._contar("redis_hits")
+                    return paciente
+            except Exception as e:
+                self._fallo_redis(e)
+
+        paciente = await self.coleccion.find_one({"cedula": cedula}, PROYECCION_PACIENTE)
+        if paciente is None:
+            self._contar("no_encontrados")
+            return None
+
+        self._contar("mongo_hits")
+        self._guardar_local(cedula, paciente)
+        if await self._redis_listo():
+            try:
+                await self.redis.setex(self._clave(cedula), self.ttl_redis, json.dumps(paciente))
+            except Exception as e:
+                self._fallo_redis(e)
+        return paciente
+
+    async def invalidar(self, cedula):
+        """Elimina el paciente de ambos niveles (tras crearlo o actualizarlo)"""
+        with self._lock:
+            self._local.pop(cedula, None)
+            self.contadores["invalidaciones"] += 1
+        if self.redis is None:
+            return
+        if await self._redis_listo():
+            try:
+                await self.redis.delete(self._clave(cedula))
+                return
+            except Exception as e:
+                self._fallo_redis(e)
+        # Se borrará de Redis cuando vuelva a responder
+        with self._lock:
+            self._pendientes.add(cedula)
+
+    def estadisticas(self):
+        with self._lock:
+            contadores = dict(self.contadores)
+            en_local = len(self._local)
+            pendientes = len(self._pendientes)
+        consultas = contadores["local_hits"] + contadores["redis_hits"] + contadores["mongo_hits"] + contadores["no_encontrados"]
+        aciertos = contadores["local_hits"] + contadores["redis_hits"]
+        return {
+            **contadores,
+            "entradas_locales": en_local,
+            "invalidaciones_pendientes": pendientes,
+            "tasa_aciertos": round(aciertos / consultas, 4) if consultas else 0.0,
+            "redis_activo": self._redis_disponible(),
+        }
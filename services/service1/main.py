@@ -1,12 +1,101 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pymongo.errors import BulkWriteError
+import os
 import random
-from datetime import datetime
-from services.data_base_mongo import db
-from services.utils import serialize_mongo
+import re
+from datetime import datetime, timedelta
+from services.data_base_mongo import MAX_PAGINA_PACIENTES, db
+from services.data_base_mongo_async import db_async
+from services.eventos import obtener_bus
+from services.indices import ROLLUP_COLECCION, aplicar_indices, verificar_consultas
+from services.tokens import exigir_acceso_paciente, exigir_rol, usuario_actual
+from services.utils import FORMATO_FECHA, MongoJSONResponse, dumps_mongo, etag_coincide, parse_fecha
+from services.service1.models_pacientes import LoteSignosVitales
+from services.service1.cache_pacientes import CachePacientes
+from services.database_redis import get_async_redis_client
+from services.service1.versiones import VersionesPaciente
+from services.service1.series_tiempo import (
+    PERIODOS, SIGNOS_COLECCION, actualizar_rollups, consultar_rollups, preparar_coleccion_signos
+)
 from typing import Optional
 
-app = FastAPI(title="Servicio 1 - Generador de Datos de Salud")
+app = FastAPI(title="Servicio 1 - Generador de Datos de Salud", default_response_class=MongoJSONResponse)
+
+# Tamaño máximo de un lote de ingesta (lecturas por petición)
+MAX_LECTURAS_LOTE = int(os.getenv("MAX_LECTURAS_LOTE", "10000"))
+PATRON_PRESION = re.compile(r"^\d{2,3}/\d{2,3}$")
+
+# Listado de pacientes
+LOTE_CURSOR_LISTADO = 500
+PROYECCION_LISTADO = {"_id": 0, "cedula": 1, "nombre": 1, "apellido": 1, "edad": 1, "fecha_registro": 1}
+
+# Colecciones de este servicio, cuyos índices (services/indices.py) crea al arrancar
+COLECCIONES_PROPIAS = ("pacientes", SIGNOS_COLECCION, ROLLUP_COLECCION)
+
+# Caché de pacientes: LRU local → Redis → MongoDB
+redis_async = get_async_redis_client(socket_connect_timeout=0.5, socket_timeout=0.5)
+cache_pacientes = CachePacientes(
+    db_async["pacientes"] if db_async is not None else None,
+    redis_client=redis_async
+)
+
+# Versión por paciente para ETags de /health-data/{cedula}
+versiones = VersionesPaciente(redis_async)
+
+# Bus de eventos: cada lectura guardada se publica para que Service2 la analice
+bus_eventos = obtener_bus()
+
+
+async def verificar_contrapresion():
+    """Rechaza la ingesta mientras el consumidor de eventos va atrasado"""
+    if await bus_eventos.saturado():
+        raise HTTPException(
+            status_code=503,
+            detail="El análisis de lecturas va atrasado, reintenta en unos segundos",
+            headers={"Retry-After": "2"}
+        )
+
+
+async def propagar_lecturas(guardadas):
+    """Actualiza rollups, versiones (ETag) y bus con lecturas ya guardadas.
+
+    Las lecturas ya están en MongoDB, así que un fallo aquí no convierte la
+    respuesta en error (el cliente reintentaría y las duplicaría): se
+    registra y cada paso sigue por su cuenta. Los rollups se pueden
+    reconstruir desde las lecturas, y versiones y bus guardan lo pendiente
+    mientras Redis no responde.
+    """
+    if not guardadas:
+        return
+    cedulas = {lectura["cedula"] for lectura in guardadas}
+    try:
+        await actualizar_rollups(db_async, guardadas)
+    except Exception as e:
+        print(f"⚠️ Error actualizando rollups de {len(guardadas)} lecturas: {e}")
+    try:
+        await versiones.incrementar(cedulas)
+    except Exception as e:
+        print(f"⚠️ Error incrementando la versión de {len(cedulas)} pacientes: {e}")
+    try:
+        await bus_eventos.publicar_lote(guardadas)
+    except Exception as e:
+        print(f"⚠️ Error publicando {len(guardadas)} lecturas en el bus: {e}")
+
+
+@app.on_event("startup")
+def preparar_base():
+    """Crea la colección de serie de tiempo y los índices, y comprueba que se usan.
+
+    El cliente síncrono solo se usa aquí; los endpoints usan `db_async`.
+    """
+    if db is None:
+        return
+    preparar_coleccion_signos(db)
+    if not aplicar_indices(db, COLECCIONES_PROPIAS):
+        verificar_consultas(db, COLECCIONES_PROPIAS)
+
 
 # --- HABILITAR CORS ---
 app.add_middleware(
@@ -20,13 +109,15 @@ app.add_middleware(
 # --- ENDPOINTS DE PACIENTES ---
 
 @app.post("/pacientes")
-def crear_paciente(cedula: str, nombre: str, apellido: str, edad: Optional[int] = None):
-    """Crear o actualizar un paciente"""
-    if db is None:
+async def crear_paciente(cedula: str, nombre: str, apellido: str, edad: Optional[int] = None,
+                         usuario: Optional[dict] = Depends(usuario_actual)):
+    """Crear o actualizar un paciente (un paciente solo puede modificar el suyo)"""
+    exigir_acceso_paciente(usuario, cedula)
+    if db_async is None:
         raise HTTPException(status_code=500, detail="Base de datos no disponible")
     
     # Verificar si ya existe
-    paciente_existente = db["pacientes"].find_one({"cedula": cedula})
+    paciente_existente = await db_async["pacientes"].find_one({"cedula": cedula})
     
     paciente_data = {
         "cedula": cedula,
@@ -37,59 +128,198 @@ def crear_paciente(cedula: str, nombre: str, apellido: str, edad: Optional[int]
     }
     
     if paciente_existente:
-        db["pacientes"].update_one(
+        await db_async["pacientes"].update_one(
             {"cedula": cedula},
             {"$set": paciente_data}
         )
+        await cache_pacientes.invalidar(cedula)
+        await versiones.incrementar([cedula])
         return {"mensaje": "Paciente actualizado", "cedula": cedula}
     else:
-        db["pacientes"].insert_one(paciente_data)
+        await db_async["pacientes"].insert_one(paciente_data)
+        await cache_pacientes.invalidar(cedula)
+        await versiones.incrementar([cedula])
         return {"mensaje": "Paciente creado", "cedula": cedula}
 
 
 @app.get("/pacientes/{cedula}")
-def obtener_paciente(cedula: str):
+async def obtener_paciente(cedula: str, usuario: Optional[dict] = Depends(usuario_actual)):
     """Obtener información de un paciente por cédula"""
-    if db is None:
+    exigir_acceso_paciente(usuario, cedula)
+    if db_async is None:
         raise HTTPException(status_code=500, detail="Base de datos no disponible")
     
-    paciente = db["pacientes"].find_one({"cedula": cedula})
+    paciente = await db_async["pacientes"].find_one({"cedula": cedula})
     if not paciente:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     
-    return serialize_mongo(paciente)
+    return MongoJSONResponse(paciente)
 
 
 @app.get("/pacientes")
-def listar_pacientes():
-    """Listar todos los pacientes"""
-    if db is None:
+async def listar_pacientes(despues_de: Optional[str] = None, limite: int = 100, formato: str = "json",
+                           usuario: Optional[dict] = Depends(usuario_actual)):
+    """Listar pacientes ordenados por cédula, con paginación por cursor.
+
+    - `formato=json`: una página de `limite` pacientes después de la cédula
+      `despues_de`; `siguiente` es el cursor de la próxima página.
+    - `formato=ndjson`: transmite todos los pacientes (desde `despues_de`),
+      uno por línea, a medida que los entrega el cursor de MongoDB.
+    """
+    exigir_rol(usuario, "medico")
+    if db_async is None:
         raise HTTPException(status_code=500, detail="Base de datos no disponible")
-    
-    pacientes = list(db["pacientes"].find())
-    return serialize_mongo(pacientes)
+
+    if formato not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="Formato inválido, usa 'json' o 'ndjson'")
+
+    filtro = {"cedula": {"$gt": despues_de}} if despues_de else {}
+    cursor = db_async["pacientes"].find(filtro, PROYECCION_LISTADO).sort("cedula", 1)
+
+    if formato == "ndjson":
+        async def lineas():
+            async for paciente in cursor.batch_size(LOTE_CURSOR_LISTADO):
+                yield dumps_mongo(paciente) + b"\n"
+        return StreamingResponse(lineas(), media_type="application/x-ndjson")
+
+    limite = max(1, min(limite, MAX_PAGINA_PACIENTES))
+    # Se pide uno extra para saber si existe otra página
+    pacientes = await cursor.limit(limite + 1).to_list(length=limite + 1)
+    siguiente = pacientes[limite - 1]["cedula"] if len(pacientes) > limite else None
+    return MongoJSONResponse({"pacientes": pacientes[:limite], "siguiente": siguiente})
 
 
 # --- ENDPOINTS DE SIGNOS VITALES ---
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "Servicio 1 activo"}
 
 
+@app.get("/cache/pacientes")
+async def estadisticas_cache_pacientes():
+    """Contadores de aciertos y fallos de la caché de pacientes"""
+    return cache_pacientes.estadisticas()
+
+
+@app.get("/eventos/metricas")
+async def metricas_eventos():
+    """Publicaciones, descartes y atraso del bus de eventos"""
+    return await bus_eventos.metricas()
+
+
+@app.post("/health-data/lote")
+async def ingresar_lote_signos_vitales(lote: LoteSignosVitales, usuario: Optional[dict] = Depends(usuario_actual)):
+    """Ingerir un lote de lecturas de varios pacientes en una sola petición.
+
+    Valida todas las cédulas con una única consulta `$in` y guarda las
+    lecturas aceptadas con `insert_many` no ordenado. Devuelve el resultado
+    de cada lectura en el mismo orden en que se recibió. Un paciente solo
+    puede enviar lecturas propias.
+    """
+    for cedula in {lectura.cedula for lectura in lote.lecturas}:
+        exigir_acceso_paciente(usuario, cedula)
+    if db_async is None:
+        raise HTTPException(status_code=500, detail="Base de datos no disponible")
+
+    if len(lote.lecturas) > MAX_LECTURAS_LOTE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote supera el máximo de {MAX_LECTURAS_LOTE} lecturas"
+        )
+
+    await verificar_contrapresion()
+
+    # Una sola consulta para todas las cédulas del lote
+    cedulas = {lectura.cedula for lectura in lote.lecturas}
+    pacientes = {
+        p["cedula"]: f"{p['nombre']} {p['apellido']}"
+        async for p in db_async["pacientes"].find(
+            {"cedula": {"$in": list(cedulas)}},
+            {"_id": 0, "cedula": 1, "nombre": 1, "apellido": 1}
+        )
+    }
+
+    ahora = datetime.now().replace(microsecond=0)
+    resultados = []
+    documentos = []
+    indices_documentos = []  # posición en el lote de cada documento a insertar
+
+    for i, lectura in enumerate(lote.lecturas):
+        motivo = None
+        timestamp = ahora
+        if lectura.cedula not in pacientes:
+            motivo = "Paciente no encontrado"
+        elif not PATRON_PRESION.match(lectura.presion):
+            motivo = "Formato de presión inválido (esperado 'sistolica/diastolica')"
+        elif lectura.timestamp is not None:
+            try:
+                timestamp = datetime.strptime(lectura.timestamp, FORMATO_FECHA)
+            except ValueError:
+                motivo = f"Formato de timestamp inválido (esperado '{FORMATO_FECHA}')"
+
+        if motivo:
+            resultados.append({"indice": i, "cedula": lectura.cedula, "estado": "rechazado", "motivo": motivo})
+            continue
+
+        documentos.append({
+            "cedula": lectura.cedula,
+            "nombre": pacientes[lectura.cedula],
+            "ritmo_cardiaco": lectura.ritmo_cardiaco,
+            "temperatura": lectura.temperatura,
+            "presion": lectura.presion,
+            "oxigeno": lectura.oxigeno,
+            "timestamp": timestamp
+        })
+        indices_documentos.append(i)
+        resultados.append({"indice": i, "cedula": lectura.cedula, "estado": "aceptado"})
+
+    if documentos:
+        fallidos = set()
+        try:
+            await db_async[SIGNOS_COLECCION].insert_many(documentos, ordered=False)
+        except BulkWriteError as e:
+            # Con ordered=False Mongo intenta todas las inserciones y reporta
+            # solo las que fallaron, indexadas según la lista `documentos`
+            for error in e.details.get("writeErrors", []):
+                fallidos.add(error["index"])
+                i = indices_documentos[error["index"]]
+                resultados[i]["estado"] = "rechazado"
+                resultados[i]["motivo"] = error.get("errmsg", "Error al guardar")
+        except Exception as e:
+            print(f"⚠️ Error guardando lote en MongoDB: {e}")
+            raise HTTPException(status_code=500, detail="Error al guardar el lote de signos vitales")
+
+        await propagar_lecturas([d for j, d in enumerate(documentos) if j not in fallidos])
+
+    aceptadas = sum(1 for r in resultados if r["estado"] == "aceptado")
+    print(f"📥 Lote procesado: {aceptadas}/{len(resultados)} lecturas aceptadas")
+
+    return {
+        "status": "ok",
+        "total": len(resultados),
+        "aceptadas": aceptadas,
+        "rechazadas": len(resultados) - aceptadas,
+        "resultados": resultados
+    }
+
+
 @app.post("/health-data/{cedula}")
-def generar_signos_vitales(cedula: str):
+async def generar_signos_vitales(cedula: str, usuario: Optional[dict] = Depends(usuario_actual)):
     """Generar signos vitales para un paciente específico"""
-    if db is None:
+    exigir_acceso_paciente(usuario, cedula)
+    if db_async is None:
         raise HTTPException(status_code=500, detail="Base de datos no disponible")
     
     # Verificar que el paciente existe
-    paciente = db["pacientes"].find_one({"cedula": cedula})
+    paciente = await cache_pacientes.obtener(cedula)
     if not paciente:
         raise HTTPException(
             status_code=404, 
             detail=f"Paciente con cédula {cedula} no encontrado. Debe registrarlo primero."
         )
+
+    await verificar_contrapresion()
     
     # Generar datos aleatorios simulados
     lectura = {
@@ -99,62 +329,139 @@ def generar_signos_vitales(cedula: str):
         "temperatura": round(random.uniform(36, 39), 1),
         "presion": f"{random.randint(100,130)}/{random.randint(70,90)}",
         "oxigeno": random.randint(90, 100),
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "timestamp": datetime.now().replace(microsecond=0)
     }
 
     # Guardar en MongoDB en colección "signos_vitales"
     try:
-        db["signos_vitales"].insert_one(lectura.copy())
-        print(f"📥 Signos vitales guardados para {lectura['nombre']} (Cédula: {cedula})")
+        guardado = await db_async[SIGNOS_COLECCION].insert_one(lectura.copy())
     except Exception as e:
         print(f"⚠️ Error guardando en MongoDB: {e}")
         raise HTTPException(status_code=500, detail="Error al guardar signos vitales")
+    print(f"📥 Signos vitales guardados para {lectura['nombre']} (Cédula: {cedula})")
+
+    # Con su _id: Service2 lo usa para no aplicar dos veces una reentrega
+    await propagar_lecturas([{**lectura, "_id": guardado.inserted_id}])
 
-    return {"status": "ok", "lectura": serialize_mongo(lectura)}
+    return MongoJSONResponse({"status": "ok", "lectura": lectura})
 
 
 @app.get("/health-data/{cedula}")
-def obtener_signos_por_cedula(cedula: str, limit: int = 10):
-    """Obtener los últimos signos vitales de un paciente por cédula"""
-    if db is None:
+async def obtener_signos_por_cedula(cedula: str, limit: int = 10, desde: Optional[str] = None, hasta: Optional[str] = None,
+                                    if_none_match: Optional[str] = Header(None),
+                                    usuario: Optional[dict] = Depends(usuario_actual)):
+    """Obtener los últimos signos vitales de un paciente por cédula.
+
+    `desde` y `hasta` (inclusive) acotan la ventana de tiempo; aceptan
+    "YYYY-MM-DD HH:MM:SS" o "YYYY-MM-DD".
+
+    La respuesta lleva un ETag con la versión del paciente; si el cliente
+    envía el mismo en If-None-Match se responde 304 sin consultar MongoDB.
+    """
+    exigir_acceso_paciente(usuario, cedula)
+    if db_async is None:
         raise HTTPException(status_code=500, detail="Base de datos no disponible")
+
+    # La versión se lee antes que los datos: si llega una lectura entre
+    # ambas consultas, el cuerpo es más nuevo que el ETag y el siguiente
+    # sondeo recibe 200 otra vez (nunca un 304 con datos viejos)
+    version = await versiones.obtener(cedula)
+    etag = f'"{cedula}-{version}"' if version else None
+    if etag_coincide(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache"} if etag else None
+
+    filtro = {"cedula": cedula}
+    rango = {}
+    try:
+        if desde:
+            rango["$gte"] = parse_fecha(desde)
+        if hasta:
+            fin = parse_fecha(hasta)
+            if len(hasta) == 10:  # Solo fecha: incluir el día completo
+                rango["$lt"] = fin + timedelta(days=1)
+            else:
+                rango["$lte"] = fin
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Formato de fecha inválido (esperado '{FORMATO_FECHA}')")
+    if rango:
+        filtro["timestamp"] = rango
     
     # Verificar que el paciente existe
-    paciente = db["pacientes"].find_one({"cedula": cedula})
+    paciente = await cache_pacientes.obtener(cedula)
     if not paciente:
         raise HTTPException(status_code=404, detail=f"Paciente con cédula {cedula} no encontrado")
     
     # Obtener los últimos registros
-    signos = list(
-        db["signos_vitales"]
-        .find({"cedula": cedula})
+    signos = await (
+        db_async[SIGNOS_COLECCION]
+        .find(filtro)
         .sort("timestamp", -1)
         .limit(limit)
+        .to_list(length=limit)
     )
     
     if not signos:
-        return {
+        return MongoJSONResponse({
             "mensaje": f"No hay signos vitales registrados para {paciente['nombre']} {paciente['apellido']}",
             "cedula": cedula
-        }
+        }, headers=cabeceras)
     
-    return {
+    return MongoJSONResponse({
         "paciente": {
             "cedula": cedula,
             "nombre": f"{paciente['nombre']} {paciente['apellido']}"
         },
-        "signos_vitales": serialize_mongo(signos)
-    }
+        "signos_vitales": signos
+    }, headers=cabeceras)
+
+
+@app.get("/health-data/{cedula}/rollup")
+async def obtener_rollup(cedula: str, periodo: str = "hora", desde: Optional[str] = None,
+                   hasta: Optional[str] = None, limit: int = 48,
+                   usuario: Optional[dict] = Depends(usuario_actual)):
+    """Resúmenes min/max/promedio por minuto, hora o día de un paciente.
+
+    Se leen de los resúmenes precalculados al ingerir, sin recorrer las
+    lecturas crudas.
+    """
+    exigir_acceso_paciente(usuario, cedula)
+    if db_async is None:
+        raise HTTPException(status_code=500, detail="Base de datos no disponible")
+
+    if periodo not in PERIODOS:
+        raise HTTPException(status_code=400, detail=f"Periodo inválido, usa uno de: {', '.join(PERIODOS)}")
+
+    try:
+        inicio = parse_fecha(desde) if desde else None
+        fin = parse_fecha(hasta) if hasta else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Formato de fecha inválido (esperado '{FORMATO_FECHA}')")
+
+    paciente = await cache_pacientes.obtener(cedula)
+    if not paciente:
+        raise HTTPException(status_code=404, detail=f"Paciente con cédula {cedula} no encontrado")
+
+    resumenes = await consultar_rollups(db_async, cedula, periodo, inicio, fin, limit)
+    return MongoJSONResponse({
+        "paciente": {
+            "cedula": cedula,
+            "nombre": f"{paciente['nombre']} {paciente['apellido']}"
+        },
+        "periodo": periodo,
+        "resumenes": resumenes
+    })
 
 
 @app.get("/health-data")
-def obtener_ultimo_signo():
+async def obtener_ultimo_signo(usuario: Optional[dict] = Depends(usuario_actual)):
     """Obtener el último signo vital registrado (para compatibilidad)"""
-    if db is None:
+    exigir_rol(usuario, "medico")
+    if db_async is None:
         raise HTTPException(status_code=500, detail="Base de datos no disponible")
     
-    ultimo = db["signos_vitales"].find_one(sort=[("timestamp", -1)])
+    ultimo = await db_async[SIGNOS_COLECCION].find_one(sort=[("timestamp", -1)])
     if not ultimo:
         raise HTTPException(status_code=404, detail="No hay signos vitales registrados")
     
-    return {"status": "ok", "lectura": serialize_mongo(ultimo)}
\ No newline at end of file
+    return MongoJSONResponse({"status": "ok", "lectura": ultimo})
\ No newline at end of file
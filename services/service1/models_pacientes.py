@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class PacienteBase(BaseModel):
@@ -35,4 +35,16 @@ class SignosVitalesRead(SignosVitalesBase):
     nombre_paciente: Optional[str] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class LecturaLote(BaseModel):
+    """Lectura individual dentro de un lote de ingesta"""
+    cedula: str
+    ritmo_cardiaco: int
+    temperatura: float
+    presion: str
+    oxigeno: int
+    timestamp: Optional[str] = None  # "%Y-%m-%d %H:%M:%S"; si falta se usa la hora de llegada
+
+class LoteSignosVitales(BaseModel):
+    lecturas: List[LecturaLote]
@@ -0,0 +1,178 @@
+import hashlib
+import os
+from collections import defaultdict
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
+
+from services.indices import ROLLUP_COLECCION, SIGNOS_COLECCION
+
+# Modo serie de tiempo (opcional) de la colección de lecturas crudas
+SIGNOS_TIMESERIES = os.getenv("SIGNOS_TIMESERIES", "false").lower() == "true"
+SIGNOS_GRANULARIDAD = os.getenv("SIGNOS_GRANULARIDAD", "seconds")  # seconds | minutes | hours
+SIGNOS_EXPIRACION_DIAS = int(os.getenv("SIGNOS_EXPIRACION_DIAS", "0"))  # 0 = sin expiración
+
+CAMPOS_ROLLUP = ("ritmo_cardiaco", "temperatura", "oxigeno")
+# Lotes recientes que recuerda cada resumen para no aplicar dos veces un reintento
+ROLLUP_LOTES_RECORDADOS = 50
+ROLLUP_INTENTOS = 2
+
+# Funciones que truncan una fecha al inicio de cada periodo
+PERIODOS = {
+    "minuto": lambda t: t.replace(second=0, microsecond=0),
+    "hora": lambda t: t.replace(minute=0, second=0, microsecond=0),
+    "dia": lambda t: t.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+def preparar_coleccion_signos(db):
+    """Crea la colección de signos vitales como serie de tiempo si está activado.
+
+    Una colección existente no se convierte: MongoDB no permite cambiar su
+    tipo, así que hay que apuntar SIGNOS_COLECCION a una colección nueva.
+    """
+    if not SIGNOS_TIMESERIES:
+        return
+    opciones = {
+        "timeseries": {
+            "timeField": "timestamp",
+            "metaField": "cedula",
+            "granularity": SIGNOS_GRANULARIDAD,
+        }
+    }
+    if SIGNOS_EXPIRACION_DIAS:
+        opciones["expireAfterSeconds"] = SIGNOS_EXPIRACION_DIAS * 86400
+    try:
+        db.create_collection(SIGNOS_COLECCION, **opciones)
+        db[SIGNOS_COLECCION].create_index([("cedula", ASCENDING), ("timestamp", DESCENDING)])
+        print(f"✅ Colección de serie de tiempo '{SIGNOS_COLECCION}' creada ({SIGNOS_GRANULARIDAD})")
+    except CollectionInvalid:
+        info = db.command("listCollections", filter={"name": SIGNOS_COLECCION})["cursor"]["firstBatch"]
+        if info and info[0].get("type") != "timeseries":
+            print(f"⚠️ '{SIGNOS_COLECCION}' ya existe como colección normal; "
+                  "configura SIGNOS_COLECCION con otro nombre para usar serie de tiempo")
+    except PyMongoError as e:
+        print(f"⚠️ No se pudo crear la colección de serie de tiempo: {e}")
+
+
+def _id_lectura(lectura):
+    """Identifica una lectura: su `_id` o, si no lo tiene, su fecha y valores"""
+    if lectura.get("_id") is not None:
+        return str(lectura["_id"])
+    return f"{lectura['timestamp']}|" + "|".join(str(lectura.get(campo)) for campo in CAMPOS_ROLLUP)
+
+
+def operaciones_rollup(lecturas):
+    """Agrega las lecturas por (cédula, periodo, inicio) y genera los upserts.
+
+    Las lecturas de un mismo lote que caen en el mismo periodo se combinan
+    antes de escribir, así que cada periodo recibe una sola operación. Cada
+    campo lleva su propio conteo (`conteo.<campo>`), porque no todas las
+    lecturas traen todos los signos.
+
+    Cada operación se identifica por las lecturas que agrega (`lote`) y el
+    resumen guarda los últimos lotes aplicados: si la misma operación se
+    reintenta, el filtro ya no coincide, el upsert choca con el índice
+    único y no se suma dos veces.
+    """
+    grupos = defaultdict(lambda: {"n": 0, "ids": [], "min": {}, "max": {},
+                                  "suma": defaultdict(float), "conteo": defaultdict(int)})
+    for lectura in lecturas:
+        for periodo, truncar in PERIODOS.items():
+            grupo = grupos[(lectura["cedula"], periodo, truncar(lectura["timestamp"]))]
+            grupo["n"] += 1
+            grupo["ids"].append(_id_lectura(lectura))
+            for campo in CAMPOS_ROLLUP:
+                valor = lectura.get(campo)
+                if valor is None:
+                    continue
+                grupo["min"][campo] = min(valor, grupo["min"].get(campo, valor))
+                grupo["max"][campo] = max(valor, grupo["max"].get(campo, valor))
+                grupo["suma"][campo] += valor
+                grupo["conteo"][campo] += 1
+
+    operaciones = []
+    for (cedula, periodo, inicio), grupo in grupos.items():
+        lote = hashlib.sha1("\n".join(sorted(grupo["ids"])).encode()).hexdigest()[:16]
+        actualizacion = {
+            "$inc": {
+                "n": grupo["n"],
+                **{f"suma.{c}": v for c, v in grupo["suma"].items()},
+                **{f"conteo.{c}": v for c, v in grupo["conteo"].items()},
+            },
+            "$push": {"lotes": {"$each": [lote], "$slice": -ROLLUP_LOTES_RECORDADOS}},
+        }
+        if grupo["min"]:
+            actualizacion["$min"] = {f"min.{c}": v for c, v in grupo["min"].items()}
+            actualizacion["$max"] = {f"max.{c}": v for c, v in grupo["max"].items()}
+        operaciones.append(UpdateOne(
+            {"cedula": cedula, "periodo": periodo, "inicio": inicio, "lotes": {"$ne": lote}},
+            actualizacion,
+            upsert=True
+        ))
+    return operaciones
+
+
+async def actualizar_rollups(db, lecturas):
+    """Actualiza de forma incremental los resúmenes por minuto, hora y día.
+
+    Las operaciones que fallan se reintentan una vez; las que ya se habían
+    aplicado se reconocen por su lote y no se vuelven a sumar.
+    """
+    if not lecturas:
+        return
+    pendientes = operaciones_rollup(lecturas)
+    error = None
+    for _ in range(ROLLUP_INTENTOS):
+        try:
+            await db[ROLLUP_COLECCION].bulk_write(pendientes, ordered=False)
+            return
+        except BulkWriteError as e:
+            # Clave duplicada: el lote ya estaba aplicado en ese resumen, o
+            # otro worker creó el resumen a la vez (al reintentar se actualiza)
+            errores = e.details["writeErrors"]
+            pendientes = [pendientes[fallo["index"]] for fallo in errores]
+            otros = [fallo for fallo in errores if fallo["code"] != 11000]
+            error = otros[0]["errmsg"] if otros else None
+        except PyMongoError as e:
+            error = e
+    if error:
+        # Los resúmenes se pueden reconstruir; no se rechaza la lectura por ello
+        print(f"⚠️ Error actualizando rollups: {error}")
+
+
+async def consultar_rollups(db, cedula, periodo, desde=None, hasta=None, limit=100):
+    """Devuelve los resúmenes de un paciente, del más reciente al más antiguo"""
+    filtro = {"cedula": cedula, "periodo": periodo}
+    rango = {}
+    if desde:
+        rango["$gte"] = desde
+    if hasta:
+        rango["$lte"] = hasta
+    if rango:
+        filtro["inicio"] = rango
+
+    resumenes = []
+    proyeccion = {"_id": 0, "lotes": 0}
+    async for doc in db[ROLLUP_COLECCION].find(filtro, proyeccion).sort("inicio", -1).limit(limit):
+        n = doc.get("n", 0)
+        conteo = doc.get("conteo", {})
+        resumenes.append({
+            "inicio": doc["inicio"],
+            "lecturas": n,
+            **{
+                # Los resúmenes anteriores al conteo por campo solo tienen `n`
+                campo: _resumen_campo(doc, campo, conteo.get(campo, n if not conteo else 0))
+                for campo in CAMPOS_ROLLUP
+            }
+        })
+    return resumenes
+
+
+def _resumen_campo(doc, campo, conteo):
+    suma = doc.get("suma", {}).get(campo)
+    return {
+        "min": doc.get("min", {}).get(campo),
+        "max": doc.get("max", {}).get(campo),
+        "promedio": round(suma / conteo, 2) if conteo and suma is not None else None,
+    }
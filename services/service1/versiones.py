@@ -0,0 +1,131 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+# Tiempo sin intentar Redis después de un fallo de conexión
+REDIS_ESPERA_REINTENTO = float(os.getenv("VERSIONES_REDIS_REINTENTO", "30"))
+# Primera espera antes de volver a publicar las versiones pendientes (se duplica en cada fallo)
+ESPERA_PENDIENTES = float(os.getenv("VERSIONES_ESPERA_PENDIENTES", "1"))
+
+
+class VersionesPaciente:
+    """Contador de versión por paciente para ETags de las consultas.
+
+    Cada lectura guardada (o cambio del paciente) incrementa la versión; una
+    respuesta con la misma versión que el ETag que trae el cliente no ha
+    cambiado y se contesta 304 sin consultar MongoDB.
+
+    Con Redis el contador es compartido entre workers (`INCR`). La versión
+    incluye una época guardada en Redis: si Redis pierde sus datos se genera
+    otra y los ETags anteriores dejan de coincidir. Mientras Redis no
+    responde `obtener` devuelve None (sin ETag) y las cédulas modificadas
+    quedan pendientes; una tarea de fondo las reintenta (desde
+    `ESPERA_PENDIENTES` segundos, duplicando la espera hasta
+    `REDIS_ESPERA_REINTENTO`) y al publicarlas cambia también la época.
+    Así ningún worker responde 304 a un ETag anterior a la caída. Otro worker
+    que ya vea Redis puede dar ese 304 como mucho hasta el siguiente
+    reintento de este. Sin cliente Redis el contador es local al proceso,
+    con una época aleatoria por arranque.
+
+    Espera un cliente de `redis.asyncio`.
+    """
+
+    def __init__(self, redis_client=None, prefijo="version:signos:"):
+        self.redis = redis_client
+        self.prefijo = prefijo
+        self.clave_epoca = f"{prefijo}epoca"
+        self._epoca_local = uuid.uuid4().hex[:8]
+        self._locales = {}
+        self._pendientes = set()  # cédulas modificadas mientras Redis no respondía
+        self._lock = threading.Lock()
+        self._redis_inactivo_hasta = 0.0
+        self._tarea_pendientes = None
+
+    def _clave(self, cedula):
+        return f"{self.prefijo}{cedula}"
+
+    def _redis_disponible(self):
+        return time.monotonic() >= self._redis_inactivo_hasta
+
+    def _fallo_redis(self, e):
+        print(f"⚠️ Redis no disponible para las versiones de pacientes: {e}")
+        self._redis_inactivo_hasta = time.monotonic() + REDIS_ESPERA_REINTENTO
+
+    async def incrementar(self, cedulas):
+        """Marca como modificados los datos de las cédulas dadas"""
+        cedulas = set(cedulas)
+        if self.redis is None:
+            with self._lock:
+                for cedula in cedulas:
+                    self._locales[cedula] = self._locales.get(cedula, 0) + 1
+            return
+
+        with self._lock:
+            atrasadas = bool(self._pendientes)
+            cedulas |= self._pendientes
+            self._pendientes.clear()
+        if self._redis_disponible():
+            try:
+                await self._publicar(cedulas, nueva_epoca=atrasadas)
+                return
+            except Exception as e:
+                self._fallo_redis(e)
+        with self._lock:
+            self._pendientes |= cedulas
+        if self._tarea_pendientes is None or self._tarea_pendientes.done():
+            self._tarea_pendientes = asyncio.get_running_loop().create_task(self._reintentar_pendientes())
+
+    async def _publicar(self, cedulas, nueva_epoca=False):
+        """Incrementa las versiones; con `nueva_epoca` invalida además todos los ETags"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for cedula in cedulas:
+                pipe.incr(self._clave(cedula))
+            if nueva_epoca:
+                # Otros workers pudieron responder con la versión vieja mientras
+                # estas quedaban pendientes: se cambia la época para todos
+                pipe.set(self.clave_epoca, uuid.uuid4().hex[:8])
+            await pipe.execute()
+
+    async def _reintentar_pendientes(self):
+        """Publica las cédulas pendientes en cuanto Redis vuelve a responder"""
+        espera = ESPERA_PENDIENTES
+        while self._pendientes:
+            await asyncio.sleep(espera)
+            with self._lock:
+                cedulas = set(self._pendientes)
+            try:
+                await self._publicar(cedulas, nueva_epoca=True)
+            except Exception as e:
+                espera = min(espera * 2, REDIS_ESPERA_REINTENTO)
+                print(f"⚠️ Versiones de {len(cedulas)} pacientes sin publicar, reintento en {espera}s: {e}")
+                continue
+            with self._lock:
+                self._pendientes -= cedulas
+            self._redis_inactivo_hasta = 0.0
+            print(f"✅ Versiones pendientes publicadas ({len(cedulas)} pacientes), época renovada")
+
+    async def obtener(self, cedula):
+        """Versión actual como texto, o None si no se puede garantizar"""
+        if self.redis is None:
+            with self._lock:
+                return f"{self._epoca_local}.{self._locales.get(cedula, 0)}"
+
+        if not self._redis_disponible():
+            return None
+        if self._pendientes:
+            await self.incrementar(())
+            if self._pendientes:
+                return None
+        try:
+            epoca, version = await self.redis.mget(self.clave_epoca, self._clave(cedula))
+            if epoca is None:
+                await self.redis.set(self.clave_epoca, uuid.uuid4().hex[:8], nx=True)
+                epoca, version = await self.redis.mget(self.clave_epoca, self._clave(cedula))
+        except Exception as e:
+            self._fallo_redis(e)
+            return None
+        epoca = epoca.decode() if isinstance(epoca, bytes) else epoca
+        version = int(version) if version is not None else 0
+        return f"{epoca}.{version}"
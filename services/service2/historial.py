@@ -0,0 +1,336 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from itertools import islice
+
+# Máximo de registros que se conservan por paciente
+MAX_REGISTROS = 50
+
+# Un segmento se compacta cuando acumula este número de líneas
+UMBRAL_COMPACTACION = MAX_REGISTROS * 2
+
+# Número de candados entre los que se reparten los pacientes
+SHARDS_HISTORIAL = int(os.getenv("HISTORIAL_SHARDS", "64"))
+
+# Pacientes cuyo historial se mantiene cargado en memoria (los menos usados
+# se descartan y se vuelven a leer de su segmento al consultarlos)
+PACIENTES_EN_MEMORIA = int(os.getenv("HISTORIAL_PACIENTES_MEMORIA", "10000"))
+
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+
+_PATRON_CEDULA = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def _validar_cedula(cedula):
+    if not _PATRON_CEDULA.match(cedula):
+        raise ValueError(f"Cédula inválida para el historial: {cedula!r}")
+    return cedula
+
+
+class CandadosPorPaciente:
+    """Candados repartidos por cédula: pacientes distintos no se bloquean
+    entre sí (salvo que caigan en el mismo shard)."""
+
+    def __init__(self, shards=SHARDS_HISTORIAL):
+        self._candados = [threading.Lock() for _ in range(shards)]
+
+    def __call__(self, cedula):
+        return self._candados[hash(cedula) % len(self._candados)]
+
+
+class HistorialSegmentado:
+    """Historial de análisis en segmentos JSONL de solo-adición, uno por paciente.
+
+    Cada análisis se escribe como una línea al final de `<cedula>.jsonl`, así
+    que el costo de escritura no depende de cuántos pacientes existan. Cuando
+    un segmento supera `UMBRAL_COMPACTACION` líneas se reescribe con los
+    últimos `MAX_REGISTROS` en un archivo temporal que reemplaza al original
+    con `os.replace` (atómico). Una línea incompleta al final del segmento,
+    producto de una caída a mitad de escritura, se descarta al cargarlo.
+    Los segmentos se leen de forma perezosa la primera vez que se consultan.
+
+    En memoria cada paciente es un `deque(maxlen=MAX_REGISTROS)` protegido
+    por un candado de su shard, así que el consumidor de eventos y los
+    handlers del threadpool pueden usarlo a la vez. Se mantienen cargados a
+    lo sumo `max_pacientes` (LRU); el resto se relee de disco. El estado vive
+    en un solo proceso: con varios workers o nodos hay que usar
+    `HistorialRedis`.
+
+    Durabilidad: cada línea se escribe con `flush`, así que una caída del
+    proceso no pierde nada. Sin `fsync` (por defecto, `HISTORIAL_FSYNC`) una
+    caída del sistema operativo o un corte de luz puede perder lo que el
+    kernel aún no escribió, normalmente los últimos segundos; es un
+    historial de análisis reconstruible desde las lecturas de Service1. Con
+    `fsync=True` no se pierde nada confirmado, a costa de una espera de
+    disco por análisis.
+
+    `version(cedula)` cambia con cada adición (sirve para ETags); incluye una
+    época aleatoria por arranque para no repetir versiones tras reiniciar.
+    """
+
+    def __init__(self, directorio, fsync=False, shards=SHARDS_HISTORIAL,
+                 max_pacientes=PACIENTES_EN_MEMORIA):
+        self.directorio = directorio
+        self.fsync = fsync
+        self.max_pacientes = max_pacientes
+        self._registros = OrderedDict()  # cedula -> deque con los registros cargados (LRU)
+        self._lineas = {}                # cedula -> líneas actuales en el segmento
+        self._memoria = threading.Lock()  # protege la estructura de los dos dicts
+        self._candado = CandadosPorPaciente(shards)
+        self._versiones = {}  # cedula -> adiciones desde que arrancó el proceso
+        self._epoca = uuid.uuid4().hex[:8]
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def _ruta(self, cedula):
+        return os.path.join(self.directorio, f"{_validar_cedula(cedula)}.jsonl")
+
+    def _cargar(self, cedula):
+        """Lee el segmento del paciente si aún no está en memoria.
+
+        Se llama con el candado del paciente tomado.
+        """
+        if cedula in self._registros:
+            with self._memoria:
+                self._registros.move_to_end(cedula)
+            return self._registros[cedula]
+
+        ruta = self._ruta(cedula)
+        registros = []
+        lineas = 0
+        if os.path.exists(ruta):
+            with open(ruta, "rb") as f:
+                contenido = f.read()
+
+            completo = contenido.rfind(b"\n") + 1
+            if completo < len(contenido):
+                # Cola incompleta de una escritura interrumpida: se trunca
+                # para que la siguiente adición empiece en una línea limpia
+                print(f"⚠️ Segmento {cedula}: descartando escritura incompleta ({len(contenido) - completo} bytes)")
+                with open(ruta, "r+b") as f:
+                    f.truncate(completo)
+
+            for linea in contenido[:completo].splitlines():
+                lineas += 1
+                try:
+                    registros.append(json.loads(linea))
+                except json.JSONDecodeError:
+                    print(f"⚠️ Segmento {cedula}: línea dañada ignorada")
+
+        return self._guardar_en_memoria(cedula, registros, lineas)
+
+    def _guardar_en_memoria(self, cedula, registros, lineas):
+        """Carga el paciente en memoria y descarta los menos usados si sobran.
+
+        Se llama con el candado del paciente tomado. Solo se descartan
+        pacientes cuyo candado está libre: nadie está usando su deque.
+        """
+        cargados = deque(registros, maxlen=MAX_REGISTROS)
+        with self._memoria:
+            self._registros[cedula] = cargados
+            self._lineas[cedula] = lineas
+            exceso = len(self._registros) - self.max_pacientes
+            if exceso > 0:
+                for candidato in list(islice(self._registros, exceso + 16)):
+                    if exceso == 0:
+                        break
+                    candado = self._candado(candidato)
+                    if candidato == cedula or not candado.acquire(blocking=False):
+                        continue
+                    try:
+                        del self._registros[candidato]
+                        del self._lineas[candidato]
+                        exceso -= 1
+                    finally:
+                        candado.release()
+        return cargados
+
+    def _escribir(self, f, datos):
+        f.write(datos)
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def agregar(self, cedula, registro):
+        """Agrega un registro al final del segmento del paciente"""
+        linea = (json.dumps(registro, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._candado(cedula):
+            registros = self._cargar(cedula)
+            with open(self._ruta(cedula), "ab") as f:
+                self._escribir(f, linea)
+            registros.append(registro)  # el deque descarta el más antiguo
+            self._versiones[cedula] = self._versiones.get(cedula, 0) + 1
+
+            self._lineas[cedula] += 1
+            if self._lineas[cedula] > UMBRAL_COMPACTACION:
+                self._compactar(cedula)
+
+    def compactar(self, cedula):
+        """Reescribe el segmento con solo los últimos MAX_REGISTROS registros"""
+        with self._candado(cedula):
+            self._compactar(cedula)
+
+    def _compactar(self, cedula):
+        registros = self._cargar(cedula)
+        ruta = self._ruta(cedula)
+        temporal = ruta + ".tmp"
+
+        with open(temporal, "wb") as f:
+            datos = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in registros)
+            self._escribir(f, datos.encode("utf-8"))
+        os.replace(temporal, ruta)
+
+        self._lineas[cedula] = len(registros)
+
+    def obtener(self, cedula):
+        """Devuelve una copia de los registros del paciente (lista vacía si no tiene)"""
+        if cedula not in self._registros and not os.path.exists(self._ruta(cedula)):
+            return []
+        with self._candado(cedula):
+            return list(self._cargar(cedula))
+
+    def version(self, cedula):
+        with self._candado(cedula):
+            return f"{self._epoca}.{self._versiones.get(cedula, 0)}"
+
+    def cedulas(self):
+        """Cédulas con historial, incluyendo segmentos aún no cargados"""
+        en_disco = {
+            nombre[:-len(".jsonl")]
+            for nombre in os.listdir(self.directorio)
+            if nombre.endswith(".jsonl")
+        }
+        with self._memoria:
+            en_memoria = set(self._registros)
+        return sorted(en_disco | en_memoria)
+
+    def total_registros(self):
+        return sum(len(self.obtener(c)) for c in self.cedulas())
+
+    def importar_legado(self, ruta_json):
+        """Migra el antiguo data_history.json ({cedula: [registros]}) a segmentos"""
+        if not os.path.exists(ruta_json):
+            return 0
+        try:
+            with open(ruta_json, "r") as f:
+                datos = json.load(f)
+        except json.JSONDecodeError:
+            print("⚠️ Archivo JSON heredado vacío o dañado, no se migra.")
+            return 0
+
+        if not isinstance(datos, dict):
+            print("⚠️ Formato de historial heredado no reconocido, no se migra.")
+            return 0
+
+        migrados = 0
+        existentes = set(self.cedulas())
+        for cedula, registros in datos.items():
+            if cedula in existentes:
+                continue
+            with self._candado(cedula):
+                cargados = self._guardar_en_memoria(cedula, registros, 0)
+                self._compactar(cedula)
+                migrados += len(cargados)
+        return migrados
+
+
+class HistorialRedis:
+    """Historial compartido en Redis: un sorted set por paciente.
+
+    El puntaje de cada registro es su timestamp, así que el orden es
+    cronológico aunque varios workers o nodos escriban a la vez, y un mismo
+    registro reentregado no se duplica (mismo miembro). Cada adición recorta
+    el set a los últimos `MAX_REGISTROS` en la misma transacción. Las
+    cédulas con historial se guardan en un set aparte para listarlas sin SCAN.
+    La versión de cada paciente es un contador que se incrementa en esa
+    misma transacción, más una época que cambia si Redis pierde sus datos.
+    """
+
+    def __init__(self, cliente, prefijo="historial:", max_registros=MAX_REGISTROS):
+        self.redis = cliente
+        self.prefijo = prefijo
+        self.max_registros = max_registros
+        self.clave_cedulas = f"{prefijo}cedulas"
+        self.clave_epoca = f"{prefijo}epoca"
+
+    def _clave(self, cedula):
+        return f"{self.prefijo}{_validar_cedula(cedula)}"
+
+    @staticmethod
+    def _puntaje(registro):
+        try:
+            return datetime.strptime(registro["timestamp"], FORMATO_FECHA).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return time.time()
+
+    def agregar(self, cedula, registro):
+        clave = self._clave(cedula)
+        miembro = json.dumps(registro, ensure_ascii=False, sort_keys=True)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zadd(clave, {miembro: self._puntaje(registro)})
+        pipe.zremrangebyrank(clave, 0, -self.max_registros - 1)
+        pipe.sadd(self.clave_cedulas, cedula)
+        pipe.incr(f"{self.prefijo}version:{cedula}")
+        pipe.execute()
+
+    def compactar(self, cedula):
+        pass  # el recorte ocurre en cada adición
+
+    def obtener(self, cedula):
+        return [json.loads(m) for m in self.redis.zrange(self._clave(cedula), 0, -1)]
+
+    def version(self, cedula):
+        clave = f"{self.prefijo}version:{_validar_cedula(cedula)}"
+        epoca, version = self.redis.mget(self.clave_epoca, clave)
+        if epoca is None:
+            self.redis.set(self.clave_epoca, uuid.uuid4().hex[:8], nx=True)
+            epoca, version = self.redis.mget(self.clave_epoca, clave)
+        epoca = epoca.decode() if isinstance(epoca, bytes) else epoca
+        return f"{epoca}.{int(version or 0)}"
+
+    def cedulas(self):
+        return sorted(
+            c.decode() if isinstance(c, bytes) else c
+            for c in self.redis.smembers(self.clave_cedulas)
+        )
+
+    def total_registros(self):
+        pipe = self.redis.pipeline(transaction=False)
+        for cedula in self.cedulas():
+            pipe.zcard(self._clave(cedula))
+        return sum(pipe.execute())
+
+    def importar_legado(self, ruta_json):
+        """Migra el antiguo data_history.json ({cedula: [registros]}) a Redis"""
+        if not os.path.exists(ruta_json):
+            return 0
+        try:
+            with open(ruta_json, "r") as f:
+                datos = json.load(f)
+        except json.JSONDecodeError:
+            print("⚠️ Archivo JSON heredado vacío o dañado, no se migra.")
+            return 0
+
+        if not isinstance(datos, dict):
+            print("⚠️ Formato de historial heredado no reconocido, no se migra.")
+            return 0
+
+        migrados = 0
+        for cedula, registros in datos.items():
+            for registro in list(registros)[-self.max_registros:]:
+                self.agregar(cedula, registro)
+                migrados += 1
+        return migrados
+
+
+def crear_historial(directorio, fsync=False):
+    """Crea el historial según HISTORIAL_BACKEND (archivo | redis)"""
+    if os.getenv("HISTORIAL_BACKEND", "archivo") == "redis":
+        from services.database_redis import get_redis_client
+
+        return HistorialRedis(get_redis_client())
+    return HistorialSegmentado(directorio, fsync=fsync)
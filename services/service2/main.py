@@ -1,59 +1,57 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Response
 import httpx
 import asyncio
+import numpy as np
 import datetime
-import json
 import os
+import threading
+import uuid
+from typing import Optional
+from services.service2.historial import crear_historial
+from itertools import groupby
+from services.eventos import obtener_bus
+from services.service2.modelo_lectura import (
+    ConsumidorBus, ModeloLecturas, clave_lectura, crear_consumidor, normalizar_lectura
+)
+from services.service2.models import LecturaNueva, LoteLecturas
+from services.service2.reglas import MotorReglas
+from services.tokens import exigir_acceso_paciente, exigir_rol, usuario_actual
+from services.utils import FORMATO_FECHA, etag_coincide
 
 app = FastAPI(title="Servicio 2 - Análisis de Datos de Salud")
 
 SERVICE1_URL = os.getenv("NAME1_SERVICE_URL", "http://127.0.0.1:8001")
-DATA_FILE = "data_history.json"
-data_history = {}  # Cambiar a diccionario para organizar por cédula
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_FILE = os.path.join(BASE_DIR, "data_history.json")  # Formato heredado, solo para migrar
+HISTORIAL_DIR = os.getenv("HISTORIAL_DIR", os.path.join(BASE_DIR, "data_history"))
+HISTORIAL_FSYNC = os.getenv("HISTORIAL_FSYNC", "false").lower() == "true"
+# Segundos que se sirve un análisis del modelo en memoria sin que llegue una
+# lectura nueva; pasado ese tiempo se confirma con Service1
+MODELO_VIGENCIA = float(os.getenv("MODELO_VIGENCIA", "300"))
+data_history = None  # HistorialSegmentado o HistorialRedis, se crea en load_data()
 
 
 # --- Cargar historial previo si existe ---
 def load_data():
+    """Prepara el historial (segmentos locales o Redis según HISTORIAL_BACKEND)"""
     global data_history
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r") as f:
-            try:
-                data_history = json.load(f)
-                print(f"✅ Historial cargado ({sum(len(v) for v in data_history.values())} registros).")
-            except json.JSONDecodeError:
-                print("⚠️ Archivo JSON vacío o dañado, iniciando nuevo historial.")
-                data_history = {}
-    else:
-        print("📁 No se encontró historial previo, iniciando nuevo archivo.")
+    data_history = crear_historial(HISTORIAL_DIR, fsync=HISTORIAL_FSYNC)
 
-
-# --- Guardar historial en archivo ---
-def save_data():
-    with open(DATA_FILE, "w") as f:
-        json.dump(data_history, f, indent=4, ensure_ascii=False)
+    if not data_history.cedulas():
+        migrados = data_history.importar_legado(DATA_FILE)
+        if migrados:
+            print(f"✅ Historial heredado migrado a segmentos ({migrados} registros).")
+        else:
+            print("📁 No se encontró historial previo, iniciando nuevo historial.")
+    else:
+        print(f"✅ Historial disponible para {len(data_history.cedulas())} pacientes.")
 
 
 # --- Analizar datos recibidos ---
-def analyze(data):
-    bpm = data.get("ritmo_cardiaco", 0)
-    temp = data.get("temperatura", 0)
-    oxigeno = data.get("oxigeno", 100)
-    alertas = []
-
-    if bpm > 100:
-        alertas.append("⚠️ Ritmo cardíaco alto (posible taquicardia)")
-    elif bpm < 60:
-        alertas.append("⚠️ Ritmo cardíaco bajo (posible bradicardia)")
-    
-    if temp > 38:
-        alertas.append("🌡️ Fiebre detectada")
-    elif temp < 36:
-        alertas.append("❄️ Hipotermia detectada")
-    
-    if oxigeno < 95:
-        alertas.append("🫁 Saturación de oxígeno baja")
-
-    return alertas if alertas else ["✅ Todo en rangos normales"]
+motor_reglas = MotorReglas.desde_archivo()
+# El consumidor del bus y la consulta a Service1 procesan en hilos aparte;
+# de a uno, para que la detección de repetidas y el historial no se crucen
+_lock_procesar = threading.Lock()
 
 
 # --- Endpoints ---
@@ -62,87 +60,253 @@ def root():
     return {"message": "Servicio 2 activo - Análisis por paciente"}
 
 
-@app.get("/analyze/{cedula}")
-def analizar_por_cedula(cedula: str):
-    """Obtener el último análisis de signos vitales de un paciente"""
-    try:
-        # Obtener datos del service1
-        import requests
-        response = requests.get(f"{SERVICE1_URL}/health-data/{cedula}?limit=1")
-        
-        if response.status_code == 404:
-            raise HTTPException(status_code=404, detail=f"No hay datos para la cédula {cedula}")
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail="Error al consultar signos vitales")
-        
-        data = response.json()
-        
-        if "signos_vitales" not in data or not data["signos_vitales"]:
-            raise HTTPException(status_code=404, detail="No hay signos vitales disponibles")
-        
-        ultimo_signo = data["signos_vitales"][0]
-        alertas = analyze(ultimo_signo)
-        
+def procesar_lecturas(documentos):
+    """Analiza un lote de lecturas nuevas y actualiza modelo e historial.
+
+    Las lecturas se agrupan por paciente en orden cronológico y se les
+    antepone la ventana de historial necesaria para las reglas de
+    tendencia; todo el lote se evalúa con una sola pasada del motor. Las
+    lecturas ya presentes en el historial (reentregas del bus) se omiten
+    según su `_id`; las atrasadas o de la misma fecha que la última se
+    aplican igual (el modelo en memoria conserva la más reciente).
+    """
+    with _lock_procesar:
+        return _procesar_lecturas(documentos)
+
+
+def _procesar_lecturas(documentos):
+    lecturas = sorted(
+        (normalizar_lectura(d) for d in documentos),
+        key=lambda l: (l["cedula"], l["timestamp"] or "")
+    )
+    ventana = motor_reglas.ventana_maxima
+    filas = []
+    posiciones = []  # fila de cada lectura nueva dentro de `filas`
+    nuevas = []
+
+    for cedula, grupo in groupby(lecturas, key=lambda l: l["cedula"]):
+        try:
+            historial = data_history.obtener(cedula)
+        except ValueError as e:
+            print(f"⚠️ Lecturas descartadas: {e}")
+            continue
+        vistas = {clave_lectura(r) for r in historial}
+        previas = [r["datos"] for r in historial[-ventana:]] if ventana else []
+        filas.extend({**datos, "cedula": cedula} for datos in previas)
+        for lectura in grupo:
+            if lectura["id_lectura"] in vistas:
+                continue
+            vistas.add(lectura["id_lectura"])
+            posiciones.append(len(filas))
+            filas.append({**lectura["datos"], "cedula": cedula})
+            nuevas.append(lectura)
+
+    if not nuevas:
+        return []
+
+    cedulas = np.array([fila["cedula"] for fila in filas])
+    mascara = motor_reglas.evaluar(motor_reglas.columnas(filas), cedulas)
+    alertas = motor_reglas.alertas(mascara[:, posiciones])
+
+    resultados = []
+    for lectura, alertas_lectura in zip(nuevas, alertas):
         resultado = {
-            "paciente": data["paciente"],
-            "timestamp": ultimo_signo.get("timestamp"),
-            "datos": {
-                "ritmo_cardiaco": ultimo_signo.get("ritmo_cardiaco"),
-                "temperatura": ultimo_signo.get("temperatura"),
-                "presion": ultimo_signo.get("presion"),
-                "oxigeno": ultimo_signo.get("oxigeno")
-            },
-            "alertas": alertas
+            "paciente": {"cedula": lectura["cedula"], "nombre": lectura["nombre"]},
+            "timestamp": lectura["timestamp"],
+            "datos": lectura["datos"],
+            "alertas": alertas_lectura,
+            "id_lectura": lectura["id_lectura"]
         }
-        
-        # Guardar en historial
-        if cedula not in data_history:
-            data_history[cedula] = []
-        
-        data_history[cedula].append(resultado)
-        
-        # Mantener solo últimos 50 registros por paciente
-        if len(data_history[cedula]) > 50:
-            data_history[cedula] = data_history[cedula][-50:]
-        
-        save_data()
-        
+        # Guardar en historial (adición al segmento; mantiene los últimos 50)
+        data_history.agregar(lectura["cedula"], resultado)
+        modelo_lecturas.registrar(resultado)
+        resultados.append(resultado)
+    return resultados
+
+
+# Modelo de lectura: último análisis por paciente, alimentado por el bus de
+# eventos (o el change stream de signos_vitales)
+modelo_lecturas = ModeloLecturas()
+consumidor_lecturas = None
+cliente_service1 = None  # httpx.AsyncClient compartido, se crea al iniciar
+
+
+async def consultar_service1(cedula, authorization=None):
+    """Trae la última lectura desde Service1 cuando el modelo no la tiene o está vencida.
+
+    Reenvía el token del usuario, que Service1 verifica por su cuenta.
+    """
+    cabeceras = {"Authorization": authorization} if authorization else None
+    try:
+        response = await cliente_service1.get(f"/health-data/{cedula}", params={"limit": 1}, headers=cabeceras)
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Sin datos en memoria para la cédula {cedula} y Service1 no responde: {e}"
+        )
+
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail=f"No hay datos para la cédula {cedula}")
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=500, detail="Error al consultar signos vitales")
+
+    data = response.json()
+
+    if "signos_vitales" not in data or not data["signos_vitales"]:
+        raise HTTPException(status_code=404, detail="No hay signos vitales disponibles")
+
+    ultimo_signo = data["signos_vitales"][0]
+    ultimo_signo.setdefault("nombre", data["paciente"]["nombre"])
+    await asyncio.to_thread(procesar_lecturas, [ultimo_signo])
+    # Si la lectura ya se conocía no se vuelve a registrar: queda confirmada
+    modelo_lecturas.renovar(cedula)
+    return modelo_lecturas.obtener(cedula) or historial_reciente(cedula)
+
+
+def historial_reciente(cedula):
+    """Último análisis guardado en el historial del paciente"""
+    historial = data_history.obtener(cedula)
+    if not historial:
+        raise HTTPException(status_code=404, detail=f"No hay datos para la cédula {cedula}")
+    return historial[-1]
+
+
+@app.get("/analyze/{cedula}")
+async def analizar_por_cedula(cedula: str, authorization: Optional[str] = Header(None),
+                              usuario: Optional[dict] = Depends(usuario_actual)):
+    """Obtener el último análisis de signos vitales de un paciente.
+
+    Las alertas se calculan una sola vez al ingerir cada lectura; aquí solo
+    se lee el modelo en memoria. Si el paciente aún no tiene lecturas en él
+    (por ejemplo tras reiniciar) o su análisis lleva más de `MODELO_VIGENCIA`
+    segundos sin actualizarse (la ingesta pudo perder eventos), se consulta
+    a Service1.
+    """
+    exigir_acceso_paciente(usuario, cedula)
+    try:
+        resultado = modelo_lecturas.obtener(cedula, vigencia=MODELO_VIGENCIA)
+        if resultado is None:
+            try:
+                resultado = await consultar_service1(cedula, authorization)
+            except HTTPException as e:
+                # Service1 no responde: mejor el último análisis conocido que un error
+                resultado = modelo_lecturas.obtener(cedula)
+                if e.status_code != 503 or resultado is None:
+                    raise
+
         return resultado
-        
+
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@app.post("/lecturas")
+async def recibir_lectura(lectura: LecturaNueva, usuario: Optional[dict] = Depends(usuario_actual)):
+    """Publicar una lectura en el bus de eventos para que se analice"""
+    exigir_acceso_paciente(usuario, lectura.cedula)
+    evento = lectura.model_dump()
+    evento["_id"] = uuid.uuid4().hex  # Identifica la lectura si el bus la reentrega
+    evento["timestamp"] = evento["timestamp"] or datetime.datetime.now().strftime(FORMATO_FECHA)
+    bus = obtener_bus()
+    if await bus.saturado() or not await bus.publicar_lote([evento], reintentar=False):
+        raise HTTPException(status_code=503, detail="Bus de eventos saturado", headers={"Retry-After": "2"})
+    return {"status": "ok", "id_lectura": evento["_id"]}
+
+
+@app.get("/modelo/estadisticas")
+def estadisticas_modelo():
+    """Estado del modelo de lectura en memoria"""
+    return {
+        "fuente": type(consumidor_lecturas).__name__ if consumidor_lecturas else None,
+        **modelo_lecturas.estadisticas()
+    }
+
+
+@app.get("/eventos/metricas")
+async def metricas_eventos():
+    """Lotes procesados, atraso (lag) y pendientes del consumidor de eventos"""
+    if isinstance(consumidor_lecturas, ConsumidorBus):
+        return await consumidor_lecturas.metricas()
+    return {"fuente": type(consumidor_lecturas).__name__ if consumidor_lecturas else None}
+
+
+@app.post("/analyze/lote")
+def analizar_lote(lote: LoteLecturas, usuario: Optional[dict] = Depends(usuario_actual)):
+    """Analizar un lote de lecturas en una sola pasada vectorizada.
+
+    Las lecturas de un mismo paciente deben venir en orden cronológico
+    para que se evalúen las reglas de tendencia.
+    """
+    exigir_rol(usuario, "medico")
+    if not lote.lecturas:
+        return {"total": 0, "con_alertas": 0, "conteo_alertas": {}, "resultados": []}
+
+    columnas = motor_reglas.columnas(lote.lecturas)
+    cedulas = np.array([lectura.get("cedula", "") for lectura in lote.lecturas])
+    mascara = motor_reglas.evaluar(columnas, cedulas)
+
+    return {
+        "total": len(lote.lecturas),
+        "con_alertas": int(mascara.any(axis=0).sum()),
+        "conteo_alertas": motor_reglas.conteo(mascara),
+        "resultados": [
+            {"indice": i, "cedula": lote.lecturas[i].get("cedula"), "alertas": alertas}
+            for i, alertas in enumerate(motor_reglas.alertas(mascara))
+        ]
+    }
+
+
 @app.get("/historial/{cedula}")
-def obtener_historial(cedula: str, limit: int = 20):
-    """Obtener el historial de análisis de un paciente"""
-    if cedula not in data_history or not data_history[cedula]:
+def obtener_historial(cedula: str, response: Response, limit: int = 20,
+                      if_none_match: Optional[str] = Header(None),
+                      usuario: Optional[dict] = Depends(usuario_actual)):
+    """Obtener el historial de análisis de un paciente.
+
+    Responde 304 si el ETag de If-None-Match coincide con la versión actual
+    del historial del paciente.
+    """
+    exigir_acceso_paciente(usuario, cedula)
+    try:
+        # Versión antes que datos: un ETag nunca describe datos más nuevos que el cuerpo
+        etag = f'"{cedula}-{data_history.version(cedula)}"'
+        if etag_coincide(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        historial = data_history.obtener(cedula)
+    except ValueError:
+        historial = []
+
+    if not historial:
         raise HTTPException(
             status_code=404, 
             detail=f"No hay historial para la cédula {cedula}"
         )
     
-    registros = data_history[cedula][-limit:] if len(data_history[cedula]) > limit else data_history[cedula]
-    
+    registros = historial[-limit:] if len(historial) > limit else historial
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
     return {
         "cedula": cedula,
-        "total_registros": len(data_history[cedula]),
+        "total_registros": len(historial),
         "registros_mostrados": len(registros),
         "historial": registros
     }
 
 
 @app.get("/pacientes")
-def listar_pacientes_con_datos():
+def listar_pacientes_con_datos(usuario: Optional[dict] = Depends(usuario_actual)):
     """Listar todos los pacientes que tienen datos registrados"""
-    if not data_history:
+    exigir_rol(usuario, "medico")
+    cedulas = data_history.cedulas()
+    if not cedulas:
         return {"mensaje": "No hay datos almacenados", "pacientes": []}
     
     resumen = []
-    for cedula, registros in data_history.items():
+    for cedula in cedulas:
+        registros = data_history.obtener(cedula)
         if registros:
             ultimo = registros[-1]
             resumen.append({
@@ -159,5 +323,17 @@ def listar_pacientes_con_datos():
 # --- Al iniciar el servicio ---
 @app.on_event("startup")
 async def startup_event():
+    global consumidor_lecturas, cliente_service1
     load_data()
-    print("✅ Servicio 2 iniciado")
\ No newline at end of file
+    cliente_service1 = httpx.AsyncClient(base_url=SERVICE1_URL, timeout=httpx.Timeout(5, connect=2))
+    consumidor_lecturas = crear_consumidor(procesar_lecturas)
+    consumidor_lecturas.start()
+    print("✅ Servicio 2 iniciado")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if consumidor_lecturas:
+        consumidor_lecturas.detener()
+    if cliente_service1:
+        await cliente_service1.aclose()
\ No newline at end of file
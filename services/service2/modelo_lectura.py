@@ -0,0 +1,288 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+from services.eventos import BusRedis, obtener_bus
+
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+CAMPOS_SIGNOS = ("ritmo_cardiaco", "temperatura", "presion", "oxigeno")
+# Intentos antes de apartar un mensaje que falla aunque todo su lote falle
+BUS_MAX_INTENTOS = int(os.getenv("BUS_MAX_INTENTOS", "5"))
+
+
+def normalizar_lectura(documento):
+    """Convierte un documento de signos_vitales al formato que usa Service2"""
+    timestamp = documento.get("timestamp")
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.strftime(FORMATO_FECHA)
+    lectura = {
+        "cedula": str(documento["cedula"]),
+        "nombre": documento.get("nombre", "Desconocido"),
+        "timestamp": str(timestamp) if timestamp is not None else None,
+        "datos": {campo: documento.get(campo) for campo in CAMPOS_SIGNOS},
+    }
+    lectura["id_lectura"] = str(documento["_id"]) if documento.get("_id") else clave_contenido(lectura)
+    return lectura
+
+
+def clave_contenido(registro):
+    """Identifica una lectura sin `_id` por su fecha y valores"""
+    datos = registro.get("datos", {})
+    return f"{registro.get('timestamp')}|" + "|".join(f"{campo}={datos.get(campo)}" for campo in CAMPOS_SIGNOS)
+
+
+def clave_lectura(registro):
+    """Identificador con el que se detectan lecturas repetidas (reentregas del bus)"""
+    return registro.get("id_lectura") or clave_contenido(registro)
+
+
+class ModeloLecturas:
+    """Modelo de lectura en memoria: último análisis por paciente.
+
+    Lo actualiza la ingesta de lecturas (bus de eventos o change stream),
+    que analiza cada lectura una sola vez; /analyze/{cedula} solo lo lee.
+    Cada entrada recuerda cuándo se actualizó: si la ingesta se detiene o
+    pierde eventos, `obtener` con `vigencia` deja de servirla pasado ese
+    tiempo para que se vuelva a consultar la fuente.
+    """
+
+    def __init__(self):
+        self._tabla = {}  # cedula -> (resultado del análisis de la última lectura, actualizado)
+        self._lock = threading.Lock()
+        self.aplicadas = 0
+        self.descartadas = 0  # lecturas más antiguas que la ya conocida
+        self.vencidas = 0  # consultas a entradas sin actualizar en más de `vigencia`
+
+    def registrar(self, resultado):
+        """Guarda el análisis si es más reciente que el conocido; devuelve si se guardó"""
+        cedula = resultado["paciente"]["cedula"]
+        with self._lock:
+            actual = self._tabla.get(cedula)
+            # Las fechas en FORMATO_FECHA se pueden comparar como texto
+            if actual and resultado["timestamp"] and actual[0]["timestamp"] > resultado["timestamp"]:
+                self.descartadas += 1
+                return False
+            self._tabla[cedula] = (resultado, time.monotonic())
+            self.aplicadas += 1
+            return True
+
+    def renovar(self, cedula):
+        """Marca la entrada como vigente (la fuente confirmó que no hay lecturas más nuevas)"""
+        with self._lock:
+            actual = self._tabla.get(cedula)
+            if actual:
+                self._tabla[cedula] = (actual[0], time.monotonic())
+
+    def obtener(self, cedula, vigencia=None):
+        """Último análisis; None si no hay o si lleva más de `vigencia` segundos sin actualizarse"""
+        with self._lock:
+            entrada = self._tabla.get(cedula)
+            if entrada is None:
+                return None
+            if vigencia is not None and time.monotonic() - entrada[1] > vigencia:
+                self.vencidas += 1
+                return None
+            return entrada[0]
+
+    def cedulas(self):
+        with self._lock:
+            return list(self._tabla)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "pacientes": len(self._tabla),
+                "lecturas_aplicadas": self.aplicadas,
+                "lecturas_descartadas": self.descartadas,
+                "consultas_vencidas": self.vencidas,
+            }
+
+
+class ConsumidorChangeStream(threading.Thread):
+    """Procesa cada inserción en la colección de signos vitales.
+
+    Usa un change stream de MongoDB (requiere réplica, como Atlas) y guarda
+    el resume token para continuar tras una desconexión sin perder
+    lecturas. Las colecciones de serie de tiempo no admiten change streams;
+    en ese caso hay que usar el bus de eventos.
+    """
+
+    def __init__(self, procesar, coleccion, espera_reintento=5):
+        super().__init__(daemon=True, name="consumidor-change-stream")
+        self.procesar = procesar
+        self.coleccion = coleccion
+        self.espera_reintento = espera_reintento
+        self.resume_token = None
+        self._detener = threading.Event()
+
+    def run(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        while not self._detener.is_set():
+            try:
+                with self.coleccion.watch(pipeline, resume_after=self.resume_token, max_await_time_ms=1000) as stream:
+                    print("✅ Escuchando lecturas nuevas (change stream)")
+                    while not self._detener.is_set():
+                        cambio = stream.try_next()
+                        if cambio is None:
+                            continue
+                        self.resume_token = stream.resume_token
+                        try:
+                            self.procesar([cambio["fullDocument"]])
+                        except Exception as e:
+                            print(f"⚠️ Error aplicando lectura del change stream: {e}")
+            except Exception as e:
+                print(f"⚠️ Change stream interrumpido, reintentando en {self.espera_reintento}s: {e}")
+                self._detener.wait(self.espera_reintento)
+
+    def detener(self):
+        self._detener.set()
+
+
+class ConsumidorBus:
+    """Consume el bus de eventos en lotes dentro de un grupo de consumidores.
+
+    Cada lote se procesa de una vez en un hilo aparte (análisis vectorizado
+    e historial, que escribe archivos o llama a Redis), se confirma y los
+    análisis resultantes se difunden al servicio de tiempo real.
+
+    Recuperación: el nombre del consumidor es estable (`BUS_CONSUMIDOR`, por
+    defecto el nombre del host), así al arrancar relee sus propios mensajes
+    sin confirmar. Además, cada `BUS_RECLAMAR_CADA` segundos reclama con
+    XAUTOCLAIM los mensajes de cualquier consumidor que lleven más de
+    `BUS_RECLAMAR_INACTIVO_MS` sin confirmar (consumidores caídos o lotes
+    que fallaron). `procesar` debe tolerar lecturas repetidas.
+
+    Si un lote falla, se reintenta lectura por lectura: las que fallan
+    solas mientras otras del lote sí se procesan se consideran inválidas,
+    se confirman y se copian al stream `<stream>:fallidas` para no
+    bloquear el grupo. Si fallan todas (p. ej. el historial no responde),
+    nada se confirma y el lote se reintenta al reclamarlo, hasta
+    `BUS_MAX_INTENTOS` veces por mensaje.
+
+    Tras cada ronda de reclamos se recorta del stream lo que ya confirmaron
+    todos los grupos.
+    """
+
+    def __init__(self, procesar, bus, grupo="service2", nombre=None,
+                 tam_lote=500, bloqueo_ms=1000, reclamar_cada=None, reclamar_inactivo_ms=None):
+        self.procesar = procesar
+        self.bus = bus
+        self.grupo = grupo
+        self.nombre = nombre or os.getenv("BUS_CONSUMIDOR") or socket.gethostname()
+        self.tam_lote = tam_lote
+        self.bloqueo_ms = bloqueo_ms
+        self.reclamar_cada = reclamar_cada or float(os.getenv("BUS_RECLAMAR_CADA", "15"))
+        self.reclamar_inactivo_ms = reclamar_inactivo_ms or int(os.getenv("BUS_RECLAMAR_INACTIVO_MS", "60000"))
+        self.lotes = 0
+        self.procesadas = 0
+        self.reclamadas = 0
+        self.fallidas = 0
+        self.errores = 0
+        self.ultimo_lote_ms = 0.0
+        self._intentos = {}  # id de mensaje -> intentos fallidos
+        self._tarea = None
+
+    async def _procesar_mensajes(self, mensajes):
+        inicio = time.perf_counter()
+        try:
+            resultados = await asyncio.to_thread(self.procesar, [evento for _, evento in mensajes])
+            confirmar = [id_mensaje for id_mensaje, _ in mensajes]
+        except Exception as e:
+            print(f"⚠️ Error procesando un lote de {len(mensajes)} lecturas, reintentando una a una: {e}")
+            resultados, confirmar = await self._procesar_una_a_una(mensajes)
+
+        await self.bus.confirmar(self.grupo, confirmar)
+        await self.bus.difundir(resultados or [])
+        self.ultimo_lote_ms = (time.perf_counter() - inicio) * 1000
+        self.lotes += 1
+        self.procesadas += len(confirmar)
+
+    async def _procesar_una_a_una(self, mensajes):
+        resultados, confirmar, fallidos = [], [], []
+        for id_mensaje, evento in mensajes:
+            try:
+                resultados.extend(await asyncio.to_thread(self.procesar, [evento]) or [])
+                confirmar.append(id_mensaje)
+            except Exception as e:
+                fallidos.append((id_mensaje, evento, e))
+
+        if len(self._intentos) > 100000:
+            self._intentos.clear()
+        for id_mensaje, evento, e in fallidos:
+            intentos = self._intentos.pop(id_mensaje, 0) + 1
+            if not confirmar and intentos < BUS_MAX_INTENTOS:
+                # Falla todo el lote: quizá es pasajero, se reintenta al reclamarlo
+                self._intentos[id_mensaje] = intentos
+                continue
+            print(f"⚠️ Lectura descartada del bus tras {intentos} intento(s) ({id_mensaje}): {e}")
+            await self.bus.apartar_fallida(id_mensaje, evento, str(e))
+            confirmar.append(id_mensaje)
+            self.fallidas += 1
+        if fallidos and not confirmar:
+            self.errores += 1
+        return resultados, confirmar
+
+    async def _ejecutar(self):
+        await self.bus.crear_grupo(self.grupo)
+        propias = isinstance(self.bus, BusRedis)
+        ultimo_reclamo = 0.0
+        print(f"✅ Consumiendo lecturas del bus (grupo {self.grupo}, consumidor {self.nombre})")
+        while True:
+            try:
+                if propias:
+                    # Mensajes que este consumidor recibió antes de reiniciarse
+                    mensajes = await self.bus.leer(self.grupo, self.nombre, self.tam_lote,
+                                                   self.bloqueo_ms, pendientes=True)
+                    propias = bool(mensajes)
+                elif time.monotonic() - ultimo_reclamo >= self.reclamar_cada:
+                    mensajes = await self.bus.reclamar(self.grupo, self.nombre, self.tam_lote,
+                                                       self.reclamar_inactivo_ms)
+                    self.reclamadas += len(mensajes)
+                    if len(mensajes) < self.tam_lote:
+                        ultimo_reclamo = time.monotonic()
+                        await self.bus.recortar()
+                else:
+                    mensajes = await self.bus.leer(self.grupo, self.nombre, self.tam_lote, self.bloqueo_ms)
+                if mensajes:
+                    await self._procesar_mensajes(mensajes)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errores += 1
+                print(f"⚠️ Error consumiendo el bus de eventos: {e}")
+                await asyncio.sleep(1)
+
+    def start(self):
+        self._tarea = asyncio.get_running_loop().create_task(self._ejecutar())
+
+    def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+
+    async def metricas(self):
+        return {
+            "lotes": self.lotes,
+            "lecturas_procesadas": self.procesadas,
+            "lecturas_reclamadas": self.reclamadas,
+            "lecturas_fallidas": self.fallidas,
+            "errores": self.errores,
+            "ultimo_lote_ms": round(self.ultimo_lote_ms, 2),
+            "bus": await self.bus.metricas(self.grupo),
+        }
+
+
+def crear_consumidor(procesar):
+    """Crea la fuente de lecturas según FUENTE_LECTURAS (bus | changestream)"""
+    fuente = os.getenv("FUENTE_LECTURAS", "bus")
+    if fuente == "changestream":
+        from pymongo import MongoClient
+
+        client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+        db_name = os.getenv("DB_NAME")
+        db = client[db_name] if db_name else client.get_default_database()
+        coleccion = db[os.getenv("SIGNOS_COLECCION", "signos_vitales")]
+        return ConsumidorChangeStream(procesar, coleccion)
+    return ConsumidorBus(procesar, obtener_bus(), tam_lote=int(os.getenv("BUS_TAM_LOTE", "500")))
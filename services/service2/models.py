@@ -1,5 +1,8 @@
-from pydantic import BaseModel
-from typing import Optional
+from datetime import datetime
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
+
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
 
 # Plantilla para modelos Pydantic (útil para validación de datos en endpoints)
 class ExampleModel(BaseModel):
@@ -8,3 +11,26 @@ class ExampleModel(BaseModel):
     # Agrega aquí los campos que necesites para tu microservicio
 
 # Si en el futuro necesitas modelos SQL, puedes usar SQLAlchemy (ver documentación oficial)
+
+
+class LoteLecturas(BaseModel):
+    """Lote de lecturas a analizar; cada una con los campos de signos vitales"""
+    lecturas: List[dict]
+
+
+class LecturaNueva(BaseModel):
+    """Lectura que se publica en el bus con POST /lecturas"""
+    cedula: str = Field(pattern=r"^[A-Za-z0-9_-]+$", max_length=32)
+    nombre: Optional[str] = None
+    ritmo_cardiaco: Optional[int] = None
+    temperatura: Optional[float] = None
+    presion: Optional[str] = Field(None, pattern=r"^\d{2,3}/\d{2,3}$")
+    oxigeno: Optional[int] = None
+    timestamp: Optional[str] = None  # FORMATO_FECHA; si falta se usa la hora de llegada
+
+    @field_validator("timestamp")
+    @classmethod
+    def validar_timestamp(cls, valor):
+        if valor is not None:
+            datetime.strptime(valor, FORMATO_FECHA)
+        return valor
@@ -0,0 +1,148 @@
+import json
+import os
+
+import numpy as np
+
+REGLAS_PATH = os.getenv(
+    "REGLAS_ALERTAS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "reglas_alertas.json")
+)
+
+_OPERADORES = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+}
+
+
+def separar_presion(presiones):
+    """Convierte presiones "120/80" en dos columnas (sistólica, diastólica).
+
+    Los valores ausentes o mal formados quedan como NaN.
+    """
+    n = len(presiones)
+    sistolica = np.full(n, np.nan)
+    diastolica = np.full(n, np.nan)
+    for i, presion in enumerate(presiones):
+        if not isinstance(presion, str):
+            continue
+        alta, _, baja = presion.partition("/")
+        try:
+            # Se convierten ambas antes de asignar para no dejar una a medias
+            sistolica[i], diastolica[i] = float(alta), float(baja)
+        except ValueError:
+            pass
+    return sistolica, diastolica
+
+
+class MotorReglas:
+    """Evalúa reglas de alerta declarativas sobre columnas de NumPy.
+
+    Las reglas se cargan desde un JSON con tres tipos:
+    - `umbral`: compara un campo con un valor (`>`, `>=`, `<`, `<=`).
+    - `rango`: alerta cuando el campo queda fuera de [min, max].
+    - `tendencia`: alerta cuando el campo cambia al menos `delta` respecto a
+      la lectura `ventana` posiciones atrás del mismo paciente (un `delta`
+      negativo detecta descensos).
+
+    Cada regla produce una máscara booleana sobre todo el lote en una sola
+    operación vectorizada; los valores NaN nunca disparan alertas.
+    """
+
+    def __init__(self, config):
+        self.campos = config["campos"]
+        self.mensaje_normal = config.get("mensaje_normal", "✅ Todo en rangos normales")
+        # Cada regla "rango" se expande en dos umbrales para que el orden de
+        # los mensajes sea el mismo que el de la configuración
+        self.reglas = []
+        for regla in config["reglas"]:
+            if regla["tipo"] == "rango":
+                self.reglas.append({"tipo": "umbral", "campo": regla["campo"], "operador": "<",
+                                    "valor": regla["min"], "mensaje": regla["mensaje_bajo"]})
+                self.reglas.append({"tipo": "umbral", "campo": regla["campo"], "operador": ">",
+                                    "valor": regla["max"], "mensaje": regla["mensaje_alto"]})
+            elif regla["tipo"] in ("umbral", "tendencia"):
+                self.reglas.append(regla)
+            else:
+                raise ValueError(f"Tipo de regla desconocido: {regla['tipo']}")
+        self.mensajes = [r["mensaje"] for r in self.reglas]
+        # Lecturas previas necesarias para evaluar todas las tendencias
+        self.ventana_maxima = max(
+            (r["ventana"] for r in self.reglas if r["tipo"] == "tendencia"), default=0
+        )
+
+    @classmethod
+    def desde_archivo(cls, ruta=REGLAS_PATH):
+        with open(ruta, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def columnas(self, lecturas):
+        """Convierte una lista de lecturas (dicts) en columnas de NumPy"""
+        n = len(lecturas)
+        columnas = {}
+        for campo, opciones in self.campos.items():
+            if campo.startswith("presion_"):
+                continue
+            defecto = opciones.get("defecto", np.nan)
+            valores = (lectura.get(campo, defecto) for lectura in lecturas)
+            columnas[campo] = np.fromiter(
+                (np.nan if v is None else v for v in valores), dtype=float, count=n
+            )
+        columnas["presion_sistolica"], columnas["presion_diastolica"] = separar_presion(
+            [lectura.get("presion") for lectura in lecturas]
+        )
+        return columnas
+
+    def evaluar(self, columnas, cedulas=None):
+        """Devuelve una matriz booleana (n_reglas, n_lecturas) de alertas.
+
+        `columnas` es un dict campo -> np.ndarray. Si se pasan `cedulas`, las
+        reglas de tendencia solo comparan lecturas del mismo paciente; las
+        lecturas deben venir en orden cronológico por paciente.
+        """
+        n = len(next(iter(columnas.values())))
+        mascara = np.zeros((len(self.reglas), n), dtype=bool)
+
+        for i, regla in enumerate(self.reglas):
+            valores = columnas[regla["campo"]]
+            if regla["tipo"] == "umbral":
+                with np.errstate(invalid="ignore"):
+                    mascara[i] = _OPERADORES[regla["operador"]](valores, regla["valor"])
+            else:
+                ventana = regla["ventana"]
+                if n <= ventana:
+                    continue
+                cambio = valores[ventana:] - valores[:-ventana]
+                with np.errstate(invalid="ignore"):
+                    if regla["delta"] >= 0:
+                        disparo = cambio >= regla["delta"]
+                    else:
+                        disparo = cambio <= regla["delta"]
+                if cedulas is not None:
+                    disparo &= cedulas[ventana:] == cedulas[:-ventana]
+                mascara[i, ventana:] = disparo
+
+        return mascara
+
+    def alertas(self, mascara):
+        """Traduce la matriz de alertas a una lista de mensajes por lectura"""
+        resultado = [[] for _ in range(mascara.shape[1])]
+        for i, j in zip(*np.nonzero(mascara)):
+            resultado[j].append(self.mensajes[i])
+        return [a if a else [self.mensaje_normal] for a in resultado]
+
+    def analizar_lote(self, lecturas):
+        """Analiza una lista de lecturas y devuelve las alertas de cada una"""
+        if not lecturas:
+            return []
+        cedulas = np.array([lectura.get("cedula", "") for lectura in lecturas])
+        return self.alertas(self.evaluar(self.columnas(lecturas), cedulas))
+
+    def conteo(self, mascara):
+        """Número de lecturas que dispararon cada alerta"""
+        totales = mascara.sum(axis=1)
+        conteo = {}
+        for mensaje, total in zip(self.mensajes, totales):
+            conteo[mensaje] = conteo.get(mensaje, 0) + int(total)
+        return conteo
@@ -0,0 +1,256 @@
+"""
+Lecturas simuladas a alta tasa para el microservicio de monitoreo (services/main.py).
+
+- `AlmacenLecturas` guarda cada lectura en un anillo en memoria con las más
+  recientes (de ahí se sirve /api/data) y en un búfer que se escribe en
+  MongoDB con `insert_many` al juntar `LECTURAS_LOTE` lecturas o cada
+  `LECTURAS_INTERVALO` segundos. Si MongoDB no responde, el búfer se
+  reintenta y, pasado `LECTURAS_BUFFER_MAX`, se descartan las más antiguas.
+- `SimuladorLecturas` genera lecturas de N pacientes virtuales a una tasa
+  fija (lecturas por segundo en total) en una tarea de fondo.
+- `preparar_coleccion` acota el almacenamiento con una colección capped
+  (`LECTURAS_LIMITE=capped`) o un índice TTL (`LECTURAS_LIMITE=ttl`).
+
+Cada lectura lleva su `_id` desde que se genera: si un lote falla a medias y
+se reintenta, las ya insertadas dan error de clave duplicada y se ignoran.
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
+
+from services.indices import LECTURAS_COLECCION
+
+LECTURAS_LOTE = int(os.getenv("LECTURAS_LOTE", "1000"))
+LECTURAS_INTERVALO = float(os.getenv("LECTURAS_INTERVALO", "1"))
+LECTURAS_BUFFER_MAX = int(os.getenv("LECTURAS_BUFFER_MAX", "100000"))
+LECTURAS_ANILLO = int(os.getenv("LECTURAS_ANILLO", "1000"))
+
+# Límite de almacenamiento: colección capped (tamaño fijo) o índice TTL
+LECTURAS_LIMITE = os.getenv("LECTURAS_LIMITE", "capped")  # capped | ttl | ninguno
+LECTURAS_CAPPED_MB = int(os.getenv("LECTURAS_CAPPED_MB", "256"))
+LECTURAS_TTL_HORAS = float(os.getenv("LECTURAS_TTL_HORAS", "24"))
+
+# Cada cuánto genera el simulador (s); en cada paso emite las lecturas que tocan
+PASO_SIMULADOR = 0.05
+# Espera antes de reintentar un lote tras un error de MongoDB (s)
+ESPERA_REINTENTO = 2
+
+
+async def preparar_coleccion(db, nombre=LECTURAS_COLECCION):
+    """Crea la colección con el límite de almacenamiento configurado"""
+    try:
+        if LECTURAS_LIMITE == "capped":
+            try:
+                await db.create_collection(nombre, capped=True, size=LECTURAS_CAPPED_MB * 1024 * 1024)
+                print(f"✅ Colección capped '{nombre}' creada ({LECTURAS_CAPPED_MB} MB)")
+            except CollectionInvalid:
+                opciones = await db[nombre].options()
+                if not opciones.get("capped"):
+                    print(f"⚠️ '{nombre}' ya existe como colección normal; configura LECTURAS_COLECCION "
+                          "con otro nombre o LECTURAS_LIMITE=ttl para acotar su tamaño")
+        elif LECTURAS_LIMITE == "ttl":
+            await db[nombre].create_index("timestamp", expireAfterSeconds=int(LECTURAS_TTL_HORAS * 3600))
+    except PyMongoError as e:
+        print(f"⚠️ No se pudo preparar la colección '{nombre}': {e}")
+
+
+class AlmacenLecturas:
+    """Anillo de lecturas recientes en memoria y escritura a MongoDB por lotes"""
+
+    def __init__(self, coleccion, tamano_lote=LECTURAS_LOTE, intervalo=LECTURAS_INTERVALO,
+                 max_pendientes=LECTURAS_BUFFER_MAX, capacidad_anillo=LECTURAS_ANILLO):
+        self.coleccion = coleccion
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self.anillo = deque(maxlen=capacidad_anillo)
+        self._pendientes = deque()
+        self._lleno = asyncio.Event()
+        self._tarea = None
+        self.contadores = {"recibidas": 0, "insertadas": 0, "descartadas": 0, "rechazadas": 0,
+                           "lotes": 0, "errores": 0}
+        self.ultimo_lote_ms = None
+
+    def agregar(self, lectura):
+        lectura.setdefault("_id", ObjectId())
+        self.anillo.append(lectura)
+        self._pendientes.append(lectura)
+        self.contadores["recibidas"] += 1
+        if len(self._pendientes) > self.max_pendientes:
+            self._pendientes.popleft()
+            self.contadores["descartadas"] += 1
+        if len(self._pendientes) >= self.tamano_lote:
+            self._lleno.set()
+
+    def recientes(self, limite):
+        """Las `limite` lecturas más recientes, de la más nueva a la más antigua"""
+        limite = min(limite, len(self.anillo))
+        return [self.anillo[-i] for i in range(1, limite + 1)]
+
+    async def cargar_recientes(self):
+        """Llena el anillo con las últimas lecturas guardadas (al arrancar)"""
+        if self.coleccion is None:
+            return
+        try:
+            ultimas = await self.coleccion.find().sort("_id", -1).to_list(length=self.anillo.maxlen)
+            self.anillo.extend(reversed(ultimas))
+        except PyMongoError as e:
+            print(f"⚠️ No se pudieron cargar las lecturas recientes: {e}")
+
+    async def vaciar(self):
+        """Escribe los pendientes en lotes; False si MongoDB falló (quedan para reintentar)"""
+        while self._pendientes and self.coleccion is not None:
+            lote = [self._pendientes.popleft() for _ in range(min(self.tamano_lote, len(self._pendientes)))]
+            inicio = time.perf_counter()
+            try:
+                await self.coleccion.insert_many(lote, ordered=False)
+                insertadas = len(lote)
+            except BulkWriteError as e:
+                # Claves duplicadas: ya se habían insertado en un intento anterior.
+                # Otros errores (validación, tamaño) no se arreglan reintentando:
+                # esas lecturas se cuentan como rechazadas y se registran
+                otros = [error for error in e.details["writeErrors"] if error["code"] != 11000]
+                if otros:
+                    self.contadores["rechazadas"] += len(otros)
+                    print(f"⚠️ {len(otros)} lecturas rechazadas por MongoDB "
+                          f"(códigos {sorted({error['code'] for error in otros})}): {otros[0]['errmsg']}")
+                insertadas = e.details["nInserted"]
+            except PyMongoError as e:
+                print(f"⚠️ Error escribiendo {len(lote)} lecturas, se reintentará: {e}")
+                self.contadores["errores"] += 1
+                self._pendientes.extendleft(reversed(lote))
+                while len(self._pendientes) > self.max_pendientes:
+                    self._pendientes.popleft()
+                    self.contadores["descartadas"] += 1
+                return False
+            self.ultimo_lote_ms = (time.perf_counter() - inicio) * 1000
+            self.contadores["insertadas"] += insertadas
+            self.contadores["lotes"] += 1
+        return True
+
+    async def _ejecutar(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._lleno.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._lleno.clear()
+            if not await self.vaciar():
+                await asyncio.sleep(ESPERA_REINTENTO)
+
+    def start(self):
+        self._tarea = asyncio.get_running_loop().create_task(self._ejecutar())
+
+    async def detener(self):
+        """Detiene la escritura periódica y escribe lo que quede pendiente"""
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        await self.vaciar()
+
+    def metricas(self):
+        return {
+            **self.contadores,
+            "pendientes": len(self._pendientes),
+            "en_anillo": len(self.anillo),
+            "ultimo_lote_ms": round(self.ultimo_lote_ms, 1) if self.ultimo_lote_ms is not None else None,
+        }
+
+
+def lectura_aleatoria(cedula=None):
+    """Una lectura independiente (como la de /api/simular)"""
+    lectura = {
+        "timestamp": datetime.now().replace(microsecond=0),
+        "datos": {
+            "ritmo_cardiaco": random.randint(55, 110),
+            "temperatura": round(random.uniform(35.5, 38.5), 1)
+        }
+    }
+    if cedula:
+        lectura["cedula"] = cedula
+    return lectura
+
+
+class SimuladorLecturas:
+    """Genera lecturas de pacientes virtuales a una tasa fija en segundo plano.
+
+    Cada paciente sigue una caminata aleatoria alrededor de valores normales,
+    así sus lecturas son coherentes entre sí. Si el bucle se atrasa más de
+    un segundo, las lecturas atrasadas se omiten (y se cuentan) en lugar de
+    emitirse todas de golpe.
+    """
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+        self.pacientes = 0
+        self.lecturas_por_segundo = 0
+        self.generadas = 0
+        self.omitidas = 0
+        self._estado = []
+        self._tarea = None
+
+    @property
+    def activo(self):
+        return self._tarea is not None and not self._tarea.done()
+
+    def start(self, pacientes, lecturas_por_segundo):
+        self.detener()
+        self.pacientes = pacientes
+        self.lecturas_por_segundo = lecturas_por_segundo
+        self._estado = [[random.uniform(65, 90), random.uniform(36.3, 37.2)] for _ in range(pacientes)]
+        self._tarea = asyncio.get_running_loop().create_task(self._ejecutar())
+        print(f"✅ Simulando {pacientes} pacientes a {lecturas_por_segundo} lecturas/s")
+
+    def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            self._tarea = None
+
+    def _lectura(self, indice, ahora):
+        estado = self._estado[indice]
+        estado[0] = min(max(estado[0] + random.gauss(0, 2), 45), 140)
+        estado[1] = min(max(estado[1] + random.gauss(0, 0.05), 35), 40)
+        return {
+            "cedula": f"SIM{indice:06d}",
+            "timestamp": ahora,
+            "datos": {"ritmo_cardiaco": round(estado[0]), "temperatura": round(estado[1], 1)},
+        }
+
+    async def _ejecutar(self):
+        loop = asyncio.get_running_loop()
+        inicio = loop.time()
+        emitidas = 0
+        siguiente = 0  # Paciente de la próxima lectura (en turno rotativo)
+        while True:
+            debidas = int((loop.time() - inicio) * self.lecturas_por_segundo)
+            atraso = debidas - emitidas - self.lecturas_por_segundo
+            if atraso > 0:
+                self.omitidas += atraso
+                emitidas += atraso
+            ahora = datetime.now()
+            for _ in range(debidas - emitidas):
+                self.almacen.agregar(self._lectura(siguiente, ahora))
+                siguiente = (siguiente + 1) % self.pacientes
+            self.generadas += debidas - emitidas
+            emitidas = debidas
+            await asyncio.sleep(PASO_SIMULADOR)
+
+    def metricas(self):
+        return {
+            "activo": self.activo,
+            "pacientes": self.pacientes,
+            "lecturas_por_segundo": self.lecturas_por_segundo,
+            "generadas": self.generadas,
+            "omitidas": self.omitidas,
+        }
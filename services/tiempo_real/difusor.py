@@ -0,0 +1,155 @@
+import asyncio
+import os
+from collections import defaultdict, deque
+
+from services.utils import dumps_mongo
+
+# Eventos pendientes por conexión antes de fusionarlos
+COLA_MAX = int(os.getenv("TIEMPO_REAL_COLA", "16"))
+MAX_CONEXIONES = int(os.getenv("TIEMPO_REAL_MAX_CONEXIONES", "10000"))
+
+
+def trama_sse(datos, evento="lectura"):
+    """Construye una trama SSE a partir de JSON ya serializado (sin saltos de línea)"""
+    return b"event: " + evento.encode() + b"\ndata: " + datos + b"\n\n"
+
+
+class Suscripcion:
+    """Cola acotada de eventos pendientes de una conexión.
+
+    Si el cliente no lee a tiempo y la cola se llena, los pendientes se
+    fusionan con el evento nuevo en uno solo: el dashboard recibe la lectura
+    más reciente, cuántas se omitieron (`omitidas`) y las alertas que traían
+    (`alertas_omitidas`). Así un cliente lento nunca acumula memoria ni
+    frena la difusión a los demás.
+    """
+
+    def __init__(self, cedula, capacidad=COLA_MAX):
+        self.cedula = cedula
+        self.capacidad = capacidad
+        self.pendientes = deque()  # (evento, trama)
+        self.entregados = 0
+        self.coalescidos = 0
+        self._hay_datos = asyncio.Event()
+
+    def ofrecer(self, evento, trama):
+        """Encola sin esperar nunca (lo llama el difusor para cada conexión)"""
+        if len(self.pendientes) >= self.capacidad:
+            evento, trama = self._fusionar(evento)
+        self.pendientes.append((evento, trama))
+        self._hay_datos.set()
+
+    def _fusionar(self, evento):
+        omitidos = [e for e, _ in self.pendientes]
+        self.pendientes.clear()
+        self.coalescidos += len(omitidos)
+
+        alertas = set(evento.get("alertas", []))
+        alertas_omitidas = []
+        for previo in omitidos:
+            for alerta in previo.get("alertas_omitidas", []) + previo.get("alertas", []):
+                if alerta not in alertas:
+                    alertas.add(alerta)
+                    alertas_omitidas.append(alerta)
+
+        fusionado = {
+            **evento,
+            "omitidas": len(omitidos) + sum(e.get("omitidas", 0) for e in omitidos),
+            "alertas_omitidas": alertas_omitidas,
+        }
+        return fusionado, trama_sse(dumps_mongo(fusionado))
+
+    async def siguiente(self, espera):
+        """Devuelve la próxima trama, o None si pasan `espera` segundos sin eventos"""
+        if not self.pendientes:
+            self._hay_datos.clear()
+            try:
+                await asyncio.wait_for(self._hay_datos.wait(), espera)
+            except asyncio.TimeoutError:
+                return None
+        self.entregados += 1
+        return self.pendientes.popleft()[1]
+
+
+class Difusor:
+    """Reparte los análisis difundidos por el bus entre las conexiones abiertas.
+
+    Una sola tarea escucha el bus; cada evento se serializa una vez como
+    trama SSE y se entrega a todas las conexiones del paciente sin esperar a
+    ninguna (ver `Suscripcion`).
+    """
+
+    def __init__(self, bus, capacidad_cola=COLA_MAX, max_conexiones=MAX_CONEXIONES):
+        self.bus = bus
+        self.capacidad_cola = capacidad_cola
+        self.max_conexiones = max_conexiones
+        self.suscripciones = defaultdict(set)  # cedula -> {Suscripcion}
+        self.conexiones = 0
+        self.recibidos = 0
+        self.rechazadas = 0
+        self._entregados_cerradas = 0
+        self._coalescidos_cerradas = 0
+        self._tarea = None
+
+    def suscribir(self, cedula):
+        """Registra una conexión; devuelve None si el nodo está al límite"""
+        if self.conexiones >= self.max_conexiones:
+            self.rechazadas += 1
+            return None
+        suscripcion = Suscripcion(cedula, self.capacidad_cola)
+        self.suscripciones[cedula].add(suscripcion)
+        self.conexiones += 1
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        conjunto = self.suscripciones.get(suscripcion.cedula)
+        if conjunto is None or suscripcion not in conjunto:
+            return
+        conjunto.discard(suscripcion)
+        if not conjunto:
+            del self.suscripciones[suscripcion.cedula]
+        self.conexiones -= 1
+        self._entregados_cerradas += suscripcion.entregados
+        self._coalescidos_cerradas += suscripcion.coalescidos
+
+    def publicar(self, evento, datos):
+        """Entrega un análisis (dict y su JSON en bytes) a las conexiones del paciente"""
+        self.recibidos += 1
+        cedula = evento.get("paciente", {}).get("cedula")
+        conjunto = self.suscripciones.get(cedula)
+        if not conjunto:
+            return
+        trama = trama_sse(datos)
+        for suscripcion in conjunto:
+            suscripcion.ofrecer(evento, trama)
+
+    async def _ejecutar(self):
+        while True:
+            try:
+                print("✅ Escuchando análisis para difundir en vivo")
+                async for evento, datos in self.bus.escuchar_analisis():
+                    self.publicar(evento, datos)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Escucha de análisis interrumpida, reintentando en 2s: {e}")
+                await asyncio.sleep(2)
+
+    def start(self):
+        self._tarea = asyncio.get_running_loop().create_task(self._ejecutar())
+
+    def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+
+    def metricas(self):
+        activas = [s for conjunto in self.suscripciones.values() for s in conjunto]
+        return {
+            "conexiones": self.conexiones,
+            "pacientes": len(self.suscripciones),
+            "eventos_recibidos": self.recibidos,
+            "eventos_entregados": self._entregados_cerradas + sum(s.entregados for s in activas),
+            "eventos_coalescidos": self._coalescidos_cerradas + sum(s.coalescidos for s in activas),
+            "conexiones_rechazadas": self.rechazadas,
+            "pendientes_max": max((len(s.pendientes) for s in activas), default=0),
+        }
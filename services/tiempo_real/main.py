@@ -0,0 +1,84 @@
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import os
+from services.eventos import obtener_bus
+from services.tokens import AUTH_REQUERIDA, TokenInvalido, exigir_acceso_paciente, obtener_verificador
+from services.tiempo_real.difusor import Difusor
+
+app = FastAPI(title="Servicio de Tiempo Real - Signos Vitales en Vivo")
+
+# Segundos sin eventos tras los que se envía un comentario de latido; mantiene
+# viva la conexión a través de proxies y detecta clientes desconectados
+HEARTBEAT = float(os.getenv("TIEMPO_REAL_HEARTBEAT", "15"))
+# Espera sugerida al navegador antes de reconectar (ms)
+REINTENTO_MS = int(os.getenv("TIEMPO_REAL_REINTENTO_MS", "3000"))
+
+difusor = Difusor(obtener_bus())
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.get("/")
+def root():
+    return {"message": "Servicio de tiempo real activo - Signos vitales en vivo (SSE)"}
+
+
+@app.get("/stream/{cedula}")
+async def transmitir_paciente(cedula: str, token: Optional[str] = None):
+    """Canal Server-Sent Events con cada análisis nuevo del paciente.
+
+    Cada evento `lectura` trae el mismo JSON que /analyze/{cedula} de
+    Service2; si el cliente se atrasa, incluye además `omitidas` y
+    `alertas_omitidas`. EventSource no permite cabeceras, así que el token
+    de acceso llega como parámetro `token`.
+    """
+    if AUTH_REQUERIDA:
+        try:
+            usuario = await obtener_verificador().verificar(token or "")
+        except TokenInvalido as e:
+            raise HTTPException(status_code=401, detail=f"Token inválido: {e}")
+        exigir_acceso_paciente(usuario, cedula)
+
+    suscripcion = difusor.suscribir(cedula)
+    if suscripcion is None:
+        raise HTTPException(status_code=503, detail="Demasiadas conexiones en vivo", headers={"Retry-After": "5"})
+
+    async def tramas():
+        try:
+            yield f"retry: {REINTENTO_MS}\n: conectado\n\n".encode()
+            while True:
+                trama = await suscripcion.siguiente(HEARTBEAT)
+                yield trama if trama is not None else b": ping\n\n"
+        finally:
+            difusor.cancelar(suscripcion)
+
+    return StreamingResponse(
+        tramas(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/metricas")
+def metricas():
+    """Conexiones abiertas, eventos entregados y coalescidos"""
+    return difusor.metricas()
+
+
+@app.on_event("startup")
+async def startup_event():
+    difusor.start()
+    print("✅ Servicio de tiempo real iniciado")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    difusor.detener()
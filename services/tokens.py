@@ -0,0 +1,229 @@
+"""
+Verificación local de tokens de acceso (JWT RS256) emitidos por el servicio
+de autenticación.
+
+Cada servicio verifica la firma con las claves públicas del JWKS del
+servicio de autenticación (descargadas una vez y guardadas en memoria) y
+consulta la lista de revocación en Redis, con una caché local de pocos
+segundos. Ninguna petición autorizada consulta MongoDB.
+
+Por defecto toda petición necesita un token válido. Solo en desarrollo,
+`AUTH_REQUERIDA=false` hace que `usuario_actual` (y el gateway) dejen pasar
+peticiones sin token; `usuario_verificado` lo exige siempre (operaciones
+administrativas).
+
+El gateway importa este mismo módulo, así la verificación es una sola.
+"""
+
+import asyncio
+import json
+import os
+import time
+import urllib.request
+from typing import Optional
+
+import jwt
+from fastapi import Header, HTTPException
+
+AUTH_REQUERIDA = os.getenv("AUTH_REQUERIDA", "true").lower() != "false"
+if not AUTH_REQUERIDA:
+    print("⚠️ AUTH_REQUERIDA=false: se aceptan peticiones sin token (solo para desarrollo)")
+AUTH_JWKS_URL = os.getenv("AUTH_JWKS_URL", "http://auth-service:8001/.well-known/jwks.json")
+TOKEN_EMISOR = os.getenv("TOKEN_EMISOR", "auth-service")
+TOKEN_AUDIENCIA = os.getenv("TOKEN_AUDIENCIA", "taller-microservicios")
+TOKEN_ALGORITMO = "RS256"
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis-db:6379/0")
+
+# Las claves se vuelven a descargar cada este tiempo, o antes si llega un
+# `kid` desconocido (pero no más de una vez cada JWKS_ESPERA_MINIMA)
+JWKS_VIGENCIA = float(os.getenv("AUTH_JWKS_VIGENCIA", "3600"))
+JWKS_ESPERA_MINIMA = float(os.getenv("AUTH_JWKS_ESPERA_MINIMA", "10"))
+# Segundos que se recuerda localmente si un token está revocado o no
+CACHE_REVOCACION = float(os.getenv("AUTH_CACHE_REVOCACION", "5"))
+CACHE_REVOCACION_MAX = 100000
+# Tiempo sin intentar Redis después de un fallo de conexión
+REDIS_ESPERA_REINTENTO = float(os.getenv("AUTH_REDIS_REINTENTO", "30"))
+
+PREFIJO_REVOCADO = "token:revocado:"
+PREFIJO_REVOCADO_USUARIO = "token:revocado_usuario:"
+
+
+class TokenInvalido(Exception):
+    """Token ausente, mal formado, vencido, con firma inválida o revocado"""
+
+
+class VerificadorTokens:
+    """Verifica tokens con claves JWKS en memoria y revocación en Redis.
+
+    La lista de revocación tiene dos claves por token: `token:revocado:{jti}`
+    (cierre de una sesión) y `token:revocado_usuario:{cedula}` con la fecha a
+    partir de la cual se aceptan tokens (cierre de todas las sesiones); ambas
+    se leen en un solo MGET. Si Redis no responde se aceptan los tokens con
+    firma válida hasta que venzan (son de corta duración).
+
+    Espera un cliente de `redis.asyncio` (o None para no revisar revocación).
+    Con `claves` ({kid: clave pública}) no se descarga el JWKS; lo usa el
+    propio servicio de autenticación.
+    """
+
+    def __init__(self, jwks_url=AUTH_JWKS_URL, redis_client=None,
+                 emisor=TOKEN_EMISOR, audiencia=TOKEN_AUDIENCIA, claves=None):
+        self.jwks_url = jwks_url
+        self.redis = redis_client
+        self.emisor = emisor
+        self.audiencia = audiencia
+        self._claves = dict(claves or {})  # kid -> clave pública
+        self._fijas = claves is not None
+        self._claves_en = 0.0
+        self._intento_jwks = 0.0
+        self._lock_jwks = asyncio.Lock()
+        self._revocacion = {}  # jti -> (expira, revocado)
+        self._redis_inactivo_hasta = 0.0
+        self.contadores = {"validos": 0, "invalidos": 0, "revocados": 0, "descargas_jwks": 0, "errores_redis": 0}
+
+    def _descargar_jwks(self):
+        with urllib.request.urlopen(self.jwks_url, timeout=5) as respuesta:
+            datos = json.load(respuesta)
+        return {
+            clave["kid"]: jwt.PyJWK.from_dict(clave, algorithm=TOKEN_ALGORITMO).key
+            for clave in datos.get("keys", [])
+            if clave.get("kid")
+        }
+
+    async def _refrescar_jwks(self):
+        """Descarga el JWKS, como mucho una vez cada JWKS_ESPERA_MINIMA segundos"""
+        async with self._lock_jwks:
+            if self._claves and time.monotonic() - self._intento_jwks < JWKS_ESPERA_MINIMA:
+                return
+            self._intento_jwks = time.monotonic()
+            try:
+                self._claves = await asyncio.to_thread(self._descargar_jwks)
+                self._claves_en = time.monotonic()
+                self.contadores["descargas_jwks"] += 1
+            except Exception as e:
+                print(f"⚠️ No se pudo descargar el JWKS de {self.jwks_url}: {e}")
+
+    async def _clave(self, kid):
+        vigentes = self._fijas or time.monotonic() - self._claves_en < JWKS_VIGENCIA
+        if kid not in self._claves or not vigentes:
+            if not self._fijas:
+                await self._refrescar_jwks()
+            if kid not in self._claves:
+                raise TokenInvalido("Clave de firma desconocida")
+        return self._claves[kid]
+
+    async def _revocado(self, claims):
+        jti = claims.get("jti")
+        ahora = time.monotonic()
+        cacheado = self._revocacion.get(jti)
+        if cacheado and cacheado[0] > ahora:
+            return cacheado[1]
+
+        if self.redis is None or ahora < self._redis_inactivo_hasta:
+            return False
+        try:
+            token_revocado, revocado_desde = await self.redis.mget(
+                PREFIJO_REVOCADO + jti, PREFIJO_REVOCADO_USUARIO + claims["sub"]
+            )
+        except Exception as e:
+            print(f"⚠️ Redis no disponible para la revocación de tokens: {e}")
+            self.contadores["errores_redis"] += 1
+            self._redis_inactivo_hasta = ahora + REDIS_ESPERA_REINTENTO
+            return False
+
+        revocado = token_revocado is not None or (
+            revocado_desde is not None and claims["iat"] < float(revocado_desde)
+        )
+        if len(self._revocacion) >= CACHE_REVOCACION_MAX:
+            self._revocacion.clear()
+        self._revocacion[jti] = (ahora + CACHE_REVOCACION, revocado)
+        return revocado
+
+    async def verificar(self, token):
+        """Devuelve los claims del token o lanza TokenInvalido"""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            claims = jwt.decode(
+                token, await self._clave(kid), algorithms=[TOKEN_ALGORITMO],
+                audience=self.audiencia, issuer=self.emisor, leeway=10,
+                options={"require": ["exp", "iat", "sub", "jti"]}
+            )
+        except jwt.PyJWTError as e:
+            self.contadores["invalidos"] += 1
+            raise TokenInvalido(str(e))
+        except TokenInvalido:
+            self.contadores["invalidos"] += 1
+            raise
+
+        if await self._revocado(claims):
+            self.contadores["revocados"] += 1
+            raise TokenInvalido("Token revocado")
+        self.contadores["validos"] += 1
+        return claims
+
+
+_verificador = None
+
+
+def obtener_verificador(claves=None):
+    """Verificador compartido del proceso (`claves` solo en la primera llamada)"""
+    global _verificador
+    if _verificador is None:
+        import redis.asyncio
+
+        cliente = redis.asyncio.from_url(REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5)
+        _verificador = VerificadorTokens(redis_client=cliente, claves=claves)
+    return _verificador
+
+
+def extraer_bearer(authorization):
+    if not authorization:
+        return None
+    tipo, _, token = authorization.partition(" ")
+    return token.strip() if tipo.lower() == "bearer" and token.strip() else None
+
+
+# --- Dependencias de FastAPI ---
+
+async def usuario_actual(authorization: Optional[str] = Header(None)):
+    """Claims del token de la petición; None si la autenticación no es obligatoria"""
+    if not AUTH_REQUERIDA:
+        return None
+    token = extraer_bearer(authorization)
+    if token is None:
+        raise HTTPException(status_code=401, detail="Falta el token de acceso",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return await obtener_verificador().verificar(token)
+    except TokenInvalido as e:
+        raise HTTPException(status_code=401, detail=f"Token inválido: {e}",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+async def usuario_verificado(authorization: Optional[str] = Header(None)):
+    """Claims de un token válido, también con AUTH_REQUERIDA=false.
+
+    Para operaciones administrativas que nunca deben quedar abiertas.
+    """
+    token = extraer_bearer(authorization)
+    if token is None:
+        raise HTTPException(status_code=401, detail="Falta el token de acceso",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return await obtener_verificador().verificar(token)
+    except TokenInvalido as e:
+        raise HTTPException(status_code=401, detail=f"Token inválido: {e}",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+def exigir_acceso_paciente(usuario, cedula):
+    """Un paciente solo ve sus propios datos; un médico ve los de todos"""
+    if usuario is None:
+        return
+    if usuario.get("rol") != "medico" and usuario.get("sub") != cedula:
+        raise HTTPException(status_code=403, detail="Acceso denegado a los datos de este paciente")
+
+
+def exigir_rol(usuario, rol):
+    if usuario is not None and usuario.get("rol") != rol:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
@@ -1,8 +1,18 @@
-from bson import ObjectId
+from bson import Decimal128, ObjectId
+from datetime import datetime
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+
+# Formato de fecha que exponen las APIs ("2025-11-15 14:30:00")
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+
 
 def serialize_mongo(document):
     """
     Convierte ObjectId y otros tipos no serializables a formatos JSON válidos.
+    Las fechas se devuelven como texto en FORMATO_FECHA.
     """
     if isinstance(document, list):
         return [serialize_mongo(doc) for doc in document]
@@ -10,4 +20,68 @@ def serialize_mongo(document):
         return {k: serialize_mongo(v) for k, v in document.items()}
     if isinstance(document, ObjectId):
         return str(document)
+    if isinstance(document, datetime):
+        return document.strftime(FORMATO_FECHA)
     return document
+
+
+def parse_fecha(valor):
+    """Convierte un texto en FORMATO_FECHA, "YYYY-MM-DD" o ISO 8601 a datetime.
+
+    Lanza ValueError si el texto no tiene un formato reconocido.
+    """
+    for formato in (FORMATO_FECHA, "%Y-%m-%d"):
+        try:
+            return datetime.strptime(valor, formato)
+        except ValueError:
+            pass
+    return datetime.fromisoformat(valor)
+
+
+def etag_coincide(if_none_match, etag):
+    """True si la cabecera If-None-Match incluye el ETag dado (o es "*").
+
+    If-None-Match usa comparación débil: `W/"x"` coincide con `"x"`.
+    """
+    if not if_none_match or not etag:
+        return False
+    candidatos = {e.strip().removeprefix("W/") for e in if_none_match.split(",")}
+    return "*" in candidatos or etag.removeprefix("W/") in candidatos
+
+
+def _bson_default(obj):
+    """Tipos que orjson no sabe serializar por sí mismo"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.strftime(FORMATO_FECHA)
+    if isinstance(obj, Decimal128):
+        return float(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def dumps_mongo(contenido):
+    """Serializa documentos de MongoDB directamente a bytes JSON en una pasada.
+
+    Equivale a `json.dumps(serialize_mongo(contenido))` sin reconstruir los
+    diccionarios: ObjectId → texto, datetime → FORMATO_FECHA, Decimal128 →
+    número.
+    """
+    return orjson.dumps(
+        contenido,
+        default=_bson_default,
+        option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+    )
+
+
+class MongoJSONResponse(JSONResponse):
+    """Respuesta JSON que acepta documentos de MongoDB tal como salen del driver.
+
+    Si el endpoint devuelve esta respuesta directamente, FastAPI no pasa el
+    contenido por `jsonable_encoder` y el documento se recorre una sola vez.
+    """
+
+    def render(self, content):
+        return dumps_mongo(content)
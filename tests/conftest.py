@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Los servicios se importan desde la raíz del repositorio (services.*, my_agent.*)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,241 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+from services.service1 import cache_pacientes
+from services.service1.cache_pacientes import CachePacientes
+
+
+class ColeccionFalsa:
+    """Colección de pacientes en memoria con la interfaz de Motor que usa la caché"""
+
+    def __init__(self, *pacientes):
+        self.documentos = {p["cedula"]: dict(p) for p in pacientes}
+        self.consultas = 0
+
+    async def find_one(self, filtro, proyeccion=None):
+        self.consultas += 1
+        documento = self.documentos.get(filtro["cedula"])
+        if documento is None:
+            return None
+        return {campo: valor for campo, valor in documento.items() if proyeccion.get(campo)}
+
+
+class RedisCaido:
+    """Cliente de Redis cuyo servidor no responde"""
+
+    def __init__(self):
+        self.llamadas = 0
+
+    async def _fallar(self, *args, **kwargs):
+        self.llamadas += 1
+        raise ConnectionError("Redis no responde")
+
+    get = setex = delete = _fallar
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = SimpleNamespace(ahora=1000.0)
+    monkeypatch.setattr(cache_pacientes, "time", SimpleNamespace(monotonic=lambda: reloj.ahora))
+    return reloj
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.aioredis.FakeRedis()
+
+
+def paciente(cedula, nombre="Ana"):
+    return {"cedula": cedula, "nombre": nombre, "apellido": "Pérez", "edad": 40}
+
+
+def test_lectura_pasa_por_los_tres_niveles(reloj, redis):
+    coleccion = ColeccionFalsa(paciente("1"))
+    cache = CachePacientes(coleccion, redis_client=redis, ttl_local=30, ttl_redis=300)
+
+    async def escenario():
+        primero = await cache.obtener("1")
+        segundo = await cache.obtener("1")
+        reloj.ahora += 31  # vence el nivel local, Redis sigue vigente
+        tercero = await cache.obtener("1")
+        return primero, segundo, tercero, await redis.get("paciente:1"), await redis.ttl("paciente:1")
+
+    primero, segundo, tercero, en_redis, ttl = asyncio.run(escenario())
+    assert primero == segundo == tercero == {"cedula": "1", "nombre": "Ana", "apellido": "Pérez"}
+    assert json.loads(en_redis) == primero
+    assert 0 < ttl <= 300
+    assert coleccion.consultas == 1
+    assert (cache.contadores["mongo_hits"], cache.contadores["local_hits"], cache.contadores["redis_hits"]) == (1, 1, 1)
+
+
+def test_lru_descarta_el_menos_usado(reloj):
+    coleccion = ColeccionFalsa(paciente("1"), paciente("2"), paciente("3"))
+    cache = CachePacientes(coleccion, capacidad=2)
+
+    async def escenario():
+        await cache.obtener("1")
+        await cache.obtener("2")
+        await cache.obtener("1")  # "2" queda como el menos usado
+        await cache.obtener("3")
+        consultas = coleccion.consultas
+        await cache.obtener("1")
+        assert coleccion.consultas == consultas
+        await cache.obtener("2")
+        assert coleccion.consultas == consultas + 1
+
+    asyncio.run(escenario())
+    assert cache.estadisticas()["entradas_locales"] == 2
+
+
+def test_no_guarda_pacientes_inexistentes(reloj, redis):
+    coleccion = ColeccionFalsa()
+    cache = CachePacientes(coleccion, redis_client=redis)
+
+    async def escenario():
+        assert await cache.obtener("9") is None
+        assert await cache.obtener("9") is None
+        return await redis.exists("paciente:9")
+
+    assert asyncio.run(escenario()) == 0
+    assert coleccion.consultas == 2
+    assert cache.contadores["no_encontrados"] == 2
+
+
+def test_escritura_invalida_ambos_niveles(reloj, redis):
+    coleccion = ColeccionFalsa(paciente("1", "Ana"))
+    # Dos workers que comparten Redis
+    worker_a = CachePacientes(coleccion, redis_client=redis, ttl_local=30)
+    worker_b = CachePacientes(coleccion, redis_client=redis, ttl_local=30)
+
+    async def escenario():
+        await worker_a.obtener("1")
+        await worker_b.obtener("1")
+
+        # Actualización en el worker A (como POST /pacientes)
+        coleccion.documentos["1"]["nombre"] = "Ana María"
+        await worker_a.invalidar("1")
+        assert await redis.exists("paciente:1") == 0
+        assert (await worker_a.obtener("1"))["nombre"] == "Ana María"
+
+        # El worker B sirve su copia local como mucho hasta que vence el TTL
+        assert (await worker_b.obtener("1"))["nombre"] == "Ana"
+        reloj.ahora += 31
+        assert (await worker_b.obtener("1"))["nombre"] == "Ana María"
+
+    asyncio.run(escenario())
+    assert worker_a.contadores["invalidaciones"] == 1
+    # B leyó de Redis la copia que guardó A, antes y después de la actualización
+    assert worker_b.contadores["redis_hits"] == 2
+    assert coleccion.consultas == 2
+
+
+def test_si_redis_falla_consulta_mongo_y_deja_de_intentar(reloj):
+    coleccion = ColeccionFalsa(paciente("1"), paciente("2"))
+    redis = RedisCaido()
+    cache = CachePacientes(coleccion, redis_client=redis)
+
+    async def escenario():
+        assert (await cache.obtener("1"))["nombre"] == "Ana"
+        assert (await cache.obtener("2"))["nombre"] == "Ana"
+        await cache.invalidar("1")
+
+    asyncio.run(escenario())
+    assert coleccion.consultas == 2
+    # Solo el primer get llega a Redis; después se omite durante la espera
+    assert redis.llamadas == 1
+    assert cache.contadores["errores_redis"] == 1
+    assert not cache.estadisticas()["redis_activo"]
+
+
+def test_redis_se_reintenta_tras_la_espera(reloj, redis):
+    coleccion = ColeccionFalsa(paciente("1"))
+    caido = RedisCaido()
+    cache = CachePacientes(coleccion, redis_client=caido, ttl_local=1)
+
+    async def escenario():
+        await cache.obtener("1")
+        cache.redis = redis  # Redis vuelve
+        reloj.ahora += cache_pacientes.REDIS_ESPERA_REINTENTO + 1
+        await cache.obtener("1")
+        return await redis.exists("paciente:1")
+
+    assert asyncio.run(escenario()) == 1
+    assert coleccion.consultas == 2
+    assert cache.estadisticas()["redis_activo"]
+
+
+class RedisIntermitente:
+    """fakeredis que se puede "caer" y volver a levantar"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.caido = False
+
+    def __getattr__(self, nombre):
+        operacion = getattr(self.redis, nombre)
+
+        async def llamar(*args, **kwargs):
+            if self.caido:
+                raise ConnectionError("Redis no responde")
+            return await operacion(*args, **kwargs)
+
+        return llamar
+
+
+def test_invalidacion_durante_la_espera_se_aplica_al_volver_redis(reloj, redis):
+    coleccion = ColeccionFalsa(paciente("1", "Ana"), paciente("2", "Luis"))
+    intermitente = RedisIntermitente(redis)
+    cache = CachePacientes(coleccion, redis_client=intermitente, ttl_local=1)
+
+    async def escenario():
+        await cache.obtener("1")
+        await cache.obtener("2")
+        assert await redis.exists("paciente:1", "paciente:2") == 2
+
+        # Redis se cae justo cuando se actualiza el paciente 1
+        intermitente.caido = True
+        coleccion.documentos["1"]["nombre"] = "Ana María"
+        await cache.invalidar("1")
+        assert cache.estadisticas()["invalidaciones_pendientes"] == 1
+        # Durante la espera ni siquiera se intenta Redis
+        await cache.invalidar("2")
+        assert cache.estadisticas()["invalidaciones_pendientes"] == 2
+
+        intermitente.caido = False
+        reloj.ahora += cache_pacientes.REDIS_ESPERA_REINTENTO + 1
+        # La primera lectura borra las entradas viejas antes de consultar Redis
+        assert (await cache.obtener("1"))["nombre"] == "Ana María"
+
+    asyncio.run(escenario())
+    assert cache.estadisticas()["invalidaciones_pendientes"] == 0
+    assert cache.contadores["redis_hits"] == 0
+    assert coleccion.consultas == 3
+
+
+def test_invalidaciones_pendientes_se_conservan_si_redis_sigue_caido(reloj, redis):
+    coleccion = ColeccionFalsa(paciente("1"))
+    intermitente = RedisIntermitente(redis)
+    cache = CachePacientes(coleccion, redis_client=intermitente, ttl_local=1)
+
+    async def escenario():
+        await cache.obtener("1")
+        intermitente.caido = True
+        await cache.invalidar("1")
+
+        # Pasada la espera Redis sigue sin responder: la invalidación no se pierde
+        reloj.ahora += cache_pacientes.REDIS_ESPERA_REINTENTO + 1
+        await cache.obtener("1")
+        assert cache.estadisticas()["invalidaciones_pendientes"] == 1
+
+        intermitente.caido = False
+        reloj.ahora += cache_pacientes.REDIS_ESPERA_REINTENTO + 1
+        await cache.invalidar("1")
+        return await redis.exists("paciente:1")
+
+    assert asyncio.run(escenario()) == 0
+    assert cache.estadisticas()["invalidaciones_pendientes"] == 0
+    assert cache.contadores["errores_redis"] == 2
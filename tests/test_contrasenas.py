@@ -0,0 +1,26 @@
+import multiprocessing
+
+import pytest
+
+from services import contrasenas
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(contrasenas, "HASH_WORKERS", 1)
+    monkeypatch.setattr(contrasenas, "HASH_METODO", "pbkdf2:sha256:1000")
+    yield
+    contrasenas.cerrar()
+
+
+def test_pool_no_usa_fork(pool):
+    metodo = contrasenas._obtener_pool()._mp_context.get_start_method()
+    esperado = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    assert metodo == esperado
+
+
+def test_hash_y_verificacion_en_el_pool(pool):
+    hash_guardado = contrasenas.generar("secreta")
+    assert contrasenas.verificar(hash_guardado, "secreta")
+    assert not contrasenas.verificar(hash_guardado, "otra")
+    assert len(contrasenas.generar_lote(["a", "b", "c"], trozo=2)) == 3
@@ -0,0 +1,216 @@
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+import orjson
+import pytest
+
+from services import eventos
+from services.eventos import BusLocal, BusRedis
+from services.service2 import modelo_lectura
+from services.service2.modelo_lectura import ConsumidorBus
+
+_dormir = asyncio.sleep
+
+
+class RedisIntermitente:
+    """Envuelve un FakeRedis cuyas escrituras en pipeline fallan mientras `caido`"""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.caido = True
+        self.intentos = 0
+
+    def pipeline(self, *args, **kwargs):
+        self.intentos += 1
+        if self.caido:
+            raise ConnectionError("Redis no responde")
+        return self.cliente.pipeline(*args, **kwargs)
+
+    def __getattr__(self, nombre):
+        return getattr(self.cliente, nombre)
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.aioredis.FakeRedis()
+
+
+@pytest.fixture
+def sin_esperas(monkeypatch):
+    # El reenvío espera segundos entre intentos; en las pruebas solo cede el turno
+    monkeypatch.setattr(eventos, "asyncio", SimpleNamespace(
+        sleep=lambda segundos: _dormir(0), get_running_loop=asyncio.get_running_loop))
+
+
+def datos(mensajes):
+    return [orjson.loads(campos[b"datos"]) for _, campos in mensajes]
+
+
+def test_reenvia_en_orden_lo_publicado_mientras_redis_no_responde(redis, sin_esperas):
+    cliente = RedisIntermitente(redis)
+    bus = BusRedis(cliente, stream="s")
+
+    async def escenario():
+        assert await bus.publicar_lote([{"n": 1}, {"n": 2}]) == 0
+        assert await bus.publicar_lote([{"n": 3}]) == 0
+        while cliente.intentos < 5:
+            await _dormir(0)
+        cliente.caido = False
+        await bus._tarea_reenvio
+        return await redis.xrange("s")
+
+    assert datos(asyncio.run(escenario())) == [{"n": 1}, {"n": 2}, {"n": 3}]
+    assert bus.publicados == bus.reenviados == 3
+    assert len(bus._por_reenviar) == 0
+
+
+def test_reenvio_acotado_descarta_lo_mas_viejo(redis, sin_esperas, monkeypatch):
+    monkeypatch.setattr(eventos, "BUS_MAX_REENVIO", 2)
+    cliente = RedisIntermitente(redis)
+    bus = BusRedis(cliente, stream="s")
+
+    async def escenario():
+        await bus.publicar_lote([{"n": 1}, {"n": 2}, {"n": 3}])
+        cliente.caido = False
+        await bus._tarea_reenvio
+        return await redis.xrange("s")
+
+    assert datos(asyncio.run(escenario())) == [{"n": 2}, {"n": 3}]
+    assert bus.descartados == 1
+
+
+def test_sin_reintento_el_fallo_se_informa_al_llamador(redis):
+    bus = BusRedis(RedisIntermitente(redis), stream="s")
+
+    assert asyncio.run(bus.publicar_lote([{"n": 1}], reintentar=False)) == 0
+    assert bus.descartados == 1
+    assert bus._tarea_reenvio is None
+
+
+def test_reclama_lo_que_dejo_sin_confirmar_otro_consumidor(redis):
+    bus = BusRedis(redis, stream="s")
+
+    async def escenario():
+        await bus.crear_grupo("g")
+        await bus.publicar_lote([{"n": 1}, {"n": 2}])
+        entregados = await bus.leer("g", "caido", 10, 0)
+        assert await bus.reclamar("g", "vivo", 10, inactivo_ms=60000) == []
+        reclamados = await bus.reclamar("g", "vivo", 10, inactivo_ms=0)
+        await bus.confirmar("g", [id_mensaje for id_mensaje, _ in reclamados])
+        return entregados, reclamados, await redis.xpending("s", "g")
+
+    entregados, reclamados, pendientes = asyncio.run(escenario())
+    assert reclamados == entregados
+    assert [evento for _, evento in reclamados] == [{"n": 1}, {"n": 2}]
+    assert pendientes["pending"] == 0
+
+
+def test_recortar_conserva_lo_pendiente_y_lo_no_entregado(redis):
+    bus = BusRedis(redis, stream="s")
+
+    async def escenario():
+        assert await bus.recortar() == 0  # sin grupos no se toca nada
+        await bus.crear_grupo("rapido")
+        await bus.crear_grupo("lento")
+        await bus.publicar_lote([{"n": n} for n in range(6)])
+
+        rapido = await bus.leer("rapido", "c", 4, 0)
+        await bus.confirmar("rapido", [id_mensaje for id_mensaje, _ in rapido])
+        lento = await bus.leer("lento", "c", 3, 0)
+        await bus.confirmar("lento", [lento[0][0], lento[2][0]])
+
+        # El grupo lento aún debe el segundo mensaje
+        assert await bus.recortar() == 1
+        assert [m[1] for m in await bus.leer("lento", "c", 10, 0, pendientes=True)] == [{"n": 1}]
+
+        await bus.confirmar("lento", [lento[1][0]])
+        # Ya nadie debe nada hasta el tercero; el cuarto lo entregó solo el grupo rápido
+        assert await bus.recortar() == 1
+        return await redis.xrange("s")
+
+    assert datos(asyncio.run(escenario())) == [{"n": 2}, {"n": 3}, {"n": 4}, {"n": 5}]
+
+
+def test_maxlen_cero_no_recorta_al_publicar(redis):
+    bus = BusRedis(redis, stream="s", maxlen=0)
+
+    asyncio.run(bus.publicar_lote([{"n": n} for n in range(50)]))
+
+    assert asyncio.run(redis.xlen("s")) == 50
+
+
+def analizar(eventos_):
+    """Falla con las lecturas marcadas como inválidas, como una lectura corrupta"""
+    if any(evento.get("invalida") for evento in eventos_):
+        raise ValueError("lectura inválida")
+    return [{"analizada": evento["n"]} for evento in eventos_]
+
+
+def test_consumidor_aparta_la_lectura_invalida_y_confirma_el_resto(redis):
+    bus = BusRedis(redis, stream="s")
+    consumidor = ConsumidorBus(analizar, bus, grupo="g", nombre="c")
+
+    async def escenario():
+        await bus.crear_grupo("g")
+        await bus.publicar_lote([{"n": 1}, {"n": 2, "invalida": True}, {"n": 3}])
+        await consumidor._procesar_mensajes(await bus.leer("g", "c", 10, 0))
+        return await redis.xpending("s", "g"), await redis.xrange("s:fallidas")
+
+    pendientes, fallidas = asyncio.run(escenario())
+    assert pendientes["pending"] == 0
+    assert consumidor.procesadas == 3
+    assert consumidor.fallidas == 1
+    assert [orjson.loads(campos[b"datos"])["n"] for _, campos in fallidas] == [2]
+
+
+def test_consumidor_reintenta_el_lote_que_falla_entero(redis, monkeypatch):
+    monkeypatch.setattr(modelo_lectura, "BUS_MAX_INTENTOS", 2)
+    bus = BusRedis(redis, stream="s")
+    consumidor = ConsumidorBus(analizar, bus, grupo="g", nombre="c")
+
+    async def escenario():
+        await bus.crear_grupo("g")
+        await bus.publicar_lote([{"n": 1, "invalida": True}])
+        await consumidor._procesar_mensajes(await bus.leer("g", "c", 10, 0))
+        # Primer intento: no se confirma, queda para reclamarlo
+        primero = (await redis.xpending("s", "g"))["pending"]
+        await consumidor._procesar_mensajes(await bus.reclamar("g", "c", 10, 0))
+        return primero, (await redis.xpending("s", "g"))["pending"], await redis.xlen("s:fallidas")
+
+    primero, despues, fallidas = asyncio.run(escenario())
+    assert (primero, despues, fallidas) == (1, 0, 1)
+    assert consumidor.errores == 1
+
+
+def test_consumidor_relee_sus_pendientes_al_reiniciar(redis):
+    bus = BusRedis(redis, stream="s")
+    procesadas = []
+
+    def procesar(eventos_):
+        procesadas.extend(evento["n"] for evento in eventos_)
+        return []
+
+    async def escenario():
+        await bus.crear_grupo("g")
+        await bus.publicar_lote([{"n": 1}, {"n": 2}])
+        await bus.leer("g", "worker-1", 10, 0)  # entregados antes de caerse
+        await bus.publicar_lote([{"n": 3}])
+
+        consumidor = ConsumidorBus(procesar, bus, grupo="g", nombre="worker-1",
+                                   bloqueo_ms=10, reclamar_cada=3600)
+        consumidor.start()
+        while consumidor.procesadas < 3:
+            await _dormir(0.01)
+        consumidor.detener()
+        return await redis.xpending("s", "g")
+
+    assert asyncio.run(escenario())["pending"] == 0
+    assert procesadas == [1, 2, 3]
+
+
+def test_bus_local_se_elige_por_configuracion(monkeypatch):
+    monkeypatch.setattr(eventos, "BUS_BACKEND", "local")
+    monkeypatch.setattr(eventos, "_bus", None)
+
+    assert isinstance(eventos.obtener_bus(), BusLocal)
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from frontend import app as frontend
+
+
+class Respuesta:
+    def __init__(self, status_code, datos=None):
+        self.status_code = status_code
+        self._datos = datos or {}
+
+    def json(self):
+        return self._datos
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(frontend, "AUTH_SERVICE_URL", "http://auth")
+    frontend.app.db_initialized = True
+    frontend.app.config["TESTING"] = True
+    return frontend.app.test_client()
+
+
+def iniciar_sesion(cliente, vence_en):
+    with cliente.session_transaction() as sesion:
+        sesion["user"] = {"cedula": "1", "nombre": "Ana", "rol": "medico", "especialidad": ""}
+        sesion["token"] = "actual"
+        sesion["token_vence"] = time.time() + vence_en
+
+
+@pytest.fixture(autouse=True)
+def sin_plantillas(monkeypatch):
+    monkeypatch.setattr(frontend, "render_template", lambda *args, **kwargs: "ok")
+
+
+def test_token_lejos_de_vencer_no_se_renueva(cliente, monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(frontend.requests, "post", lambda *a, **k: llamadas.append(a))
+    iniciar_sesion(cliente, vence_en=600)
+    assert cliente.get("/api/token").get_json() == {"token": "actual"}
+    assert llamadas == []
+
+
+def test_token_por_vencer_se_renueva_en_cualquier_peticion(cliente, monkeypatch):
+    llamadas = []
+
+    def post(url, headers=None, **kwargs):
+        llamadas.append((url, headers))
+        return Respuesta(200, {"access_token": "nuevo", "expires_in": 900})
+
+    monkeypatch.setattr(frontend.requests, "post", post)
+    iniciar_sesion(cliente, vence_en=60)
+    assert cliente.get("/medico/dashboard").status_code == 200
+    assert llamadas == [("http://auth/token/renovar", {"Authorization": "Bearer actual"})]
+    assert cliente.get("/api/token").get_json() == {"token": "nuevo"}
+    assert len(llamadas) == 1
+
+
+def test_renovacion_rechazada_cierra_la_sesion(cliente, monkeypatch):
+    monkeypatch.setattr(frontend.requests, "post", lambda *a, **k: Respuesta(401))
+    iniciar_sesion(cliente, vence_en=60)
+    respuesta = cliente.get("/medico/dashboard")
+    assert respuesta.status_code == 302
+    assert respuesta.headers["Location"].endswith("/login")
+
+
+def test_auth_caido_sigue_con_el_token_actual(cliente, monkeypatch):
+    def post(*args, **kwargs):
+        raise frontend.requests.ConnectionError("sin conexión")
+
+    monkeypatch.setattr(frontend.requests, "post", post)
+    iniciar_sesion(cliente, vence_en=60)
+    assert cliente.get("/api/token").get_json() == {"token": "actual"}
+
+
+def test_401_del_servicio_renueva_y_reintenta(cliente, monkeypatch):
+    monkeypatch.setattr(frontend.requests, "post",
+                        lambda *a, **k: Respuesta(200, {"access_token": "nuevo", "expires_in": 900}))
+    usados = []
+
+    def get(url, headers=None, **kwargs):
+        usados.append(headers["Authorization"])
+        return Respuesta(401) if headers["Authorization"] == "Bearer actual" else Respuesta(200, {"historial": []})
+
+    monkeypatch.setattr(frontend.requests, "get", get)
+    iniciar_sesion(cliente, vence_en=600)
+    respuesta = cliente.get("/api/data/1")
+    assert respuesta.status_code == 200
+    assert usados == ["Bearer actual", "Bearer nuevo"]
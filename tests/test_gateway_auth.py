@@ -0,0 +1,33 @@
+import importlib.util
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from services import tokens
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def cargar_gateway():
+    spec = importlib.util.spec_from_file_location("gateway_main", RAIZ / "api-gateway" / "main.py")
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def test_gateway_usa_el_verificador_de_los_servicios():
+    gateway = cargar_gateway()
+
+    assert gateway.obtener_verificador is tokens.obtener_verificador
+    assert gateway.TokenInvalido is tokens.TokenInvalido
+
+
+def test_sin_configurar_la_autenticacion_es_obligatoria():
+    assert tokens.AUTH_REQUERIDA
+    gateway = cargar_gateway()
+
+    with TestClient(gateway.app) as cliente:
+        respuesta = cliente.get("/api/v1/service1/health-data/123")
+
+    assert respuesta.status_code == 401
+    assert respuesta.headers["www-authenticate"] == "Bearer"
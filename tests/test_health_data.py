@@ -0,0 +1,81 @@
+import asyncio
+
+import httpx
+
+from my_agent.health_data import ClienteServicios, historial_lecturas
+
+
+class Contexto:
+    def __init__(self, cedula):
+        self.state = {"cedula": cedula}
+
+
+def servicio_con_login(tokens_validos):
+    """Transporte falso: /login emite tokens numerados; los datos exigen uno válido"""
+    emitidos = []
+
+    def manejar(request):
+        if request.url.path == "/login":
+            emitidos.append(f"t{len(emitidos) + 1}")
+            return httpx.Response(200, json={"access_token": emitidos[-1], "expires_in": 900})
+        if request.headers.get("Authorization") not in {f"Bearer {t}" for t in tokens_validos}:
+            return httpx.Response(401, json={"detail": "Token inválido"})
+        return httpx.Response(200, json={"ok": True, "params": dict(request.url.params)})
+
+    return httpx.MockTransport(manejar), emitidos
+
+
+def cliente(transporte, **kwargs):
+    servicios = ClienteServicios(ttl=0, auth_url="http://auth", cedula="bot", password="secreta", **kwargs)
+    servicios._cliente = httpx.AsyncClient(transport=transporte)
+    return servicios
+
+
+def test_envia_el_token_de_servicio_y_lo_reutiliza():
+    transporte, emitidos = servicio_con_login({"t1"})
+    servicios = cliente(transporte)
+
+    async def escenario():
+        await servicios.obtener("http://service2/analyze/1")
+        return await servicios.obtener("http://service2/analyze/2")
+
+    assert asyncio.run(escenario())["ok"]
+    assert emitidos == ["t1"]
+
+
+def test_renueva_el_token_si_el_servicio_lo_rechaza():
+    transporte, emitidos = servicio_con_login({"t2"})
+    servicios = cliente(transporte)
+
+    assert asyncio.run(servicios.obtener("http://service2/analyze/1"))["ok"]
+    assert emitidos == ["t1", "t2"]
+
+
+def test_sin_credenciales_no_inicia_sesion():
+    peticiones = []
+
+    def manejar(request):
+        peticiones.append(request)
+        return httpx.Response(200, json={})
+
+    servicios = ClienteServicios(ttl=0, auth_url="http://auth")
+    servicios._cliente = httpx.AsyncClient(transport=httpx.MockTransport(manejar))
+    asyncio.run(servicios.obtener("http://service2/analyze/1"))
+    assert [p.url.path for p in peticiones] == ["/analyze/1"]
+    assert "Authorization" not in peticiones[0].headers
+
+
+def test_limite_invalido_devuelve_error(monkeypatch):
+    llamadas = []
+
+    async def obtener(url, params=None):
+        llamadas.append(params)
+        return {"historial": [], "total_registros": 0}
+
+    monkeypatch.setattr("my_agent.health_data.servicios.obtener", obtener)
+    resultado = asyncio.run(historial_lecturas("muchas", Contexto("1")))
+    assert "error" in resultado
+    assert llamadas == []
+
+    asyncio.run(historial_lecturas("50", Contexto("1")))
+    assert llamadas == [{"limit": 20}]
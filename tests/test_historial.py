@@ -0,0 +1,208 @@
+import json
+import threading
+
+import fakeredis
+
+from services.service2 import historial as modulo
+from services.service2.historial import (
+    MAX_REGISTROS, UMBRAL_COMPACTACION, CandadosPorPaciente, HistorialRedis, HistorialSegmentado
+)
+
+
+def registro(i):
+    return {"timestamp": f"2024-01-01 10:00:{i % 60:02d}", "datos": {"ritmo_cardiaco": 60 + i}, "alertas": []}
+
+
+def lineas(ruta):
+    with open(ruta, "rb") as f:
+        return f.read().splitlines()
+
+
+def test_cola_incompleta_se_trunca_al_cargar(tmp_path):
+    ruta = tmp_path / "123.jsonl"
+    completas = "".join(json.dumps(registro(i)) + "\n" for i in range(3))
+    ruta.write_bytes(completas.encode() + b'{"timestamp": "2024-01-01 10:')
+
+    historial = HistorialSegmentado(str(tmp_path))
+    assert [r["datos"]["ritmo_cardiaco"] for r in historial.obtener("123")] == [60, 61, 62]
+    assert ruta.read_bytes() == completas.encode()
+
+    # La siguiente adición empieza en una línea limpia
+    historial.agregar("123", registro(3))
+    assert len(HistorialSegmentado(str(tmp_path)).obtener("123")) == 4
+
+
+def test_linea_danada_en_medio_se_ignora(tmp_path):
+    ruta = tmp_path / "123.jsonl"
+    ruta.write_text(json.dumps(registro(0)) + "\nno es json\n" + json.dumps(registro(1)) + "\n")
+    assert len(HistorialSegmentado(str(tmp_path)).obtener("123")) == 2
+
+
+def test_compacta_a_los_ultimos_registros_con_reemplazo_atomico(tmp_path, monkeypatch):
+    reemplazos = []
+    os_replace = modulo.os.replace
+
+    def replace(origen, destino):
+        reemplazos.append((origen, destino))
+        os_replace(origen, destino)
+
+    monkeypatch.setattr(modulo.os, "replace", replace)
+    historial = HistorialSegmentado(str(tmp_path))
+    for i in range(UMBRAL_COMPACTACION + 1):
+        historial.agregar("123", registro(i))
+
+    ruta = str(tmp_path / "123.jsonl")
+    assert reemplazos == [(ruta + ".tmp", ruta)]
+    guardados = [json.loads(linea) for linea in lineas(ruta)]
+    assert len(guardados) == MAX_REGISTROS
+    assert guardados[-1] == registro(UMBRAL_COMPACTACION)
+    assert not (tmp_path / "123.jsonl.tmp").exists()
+
+    recargado = HistorialSegmentado(str(tmp_path)).obtener("123")
+    assert recargado == historial.obtener("123") == guardados
+
+
+def test_migra_el_json_heredado(tmp_path):
+    legado = tmp_path / "data_history.json"
+    legado.write_text(json.dumps({
+        "1": [registro(i) for i in range(MAX_REGISTROS + 10)],
+        "2": [registro(0)],
+    }))
+    historial = HistorialSegmentado(str(tmp_path / "segmentos"))
+
+    assert historial.importar_legado(str(legado)) == MAX_REGISTROS + 1
+    assert historial.cedulas() == ["1", "2"]
+    recargado = HistorialSegmentado(str(tmp_path / "segmentos"))
+    assert recargado.obtener("1")[0] == registro(10)
+    assert len(recargado.obtener("1")) == MAX_REGISTROS
+
+    # Las cédulas que ya tienen segmento no se vuelven a migrar
+    assert recargado.importar_legado(str(legado)) == 0
+
+
+def test_json_heredado_danado_o_ausente(tmp_path):
+    historial = HistorialSegmentado(str(tmp_path / "segmentos"))
+    assert historial.importar_legado(str(tmp_path / "no_existe.json")) == 0
+    danado = tmp_path / "data_history.json"
+    danado.write_text("{")
+    assert historial.importar_legado(str(danado)) == 0
+    danado.write_text("[]")
+    assert historial.importar_legado(str(danado)) == 0
+
+
+def test_candados_por_paciente_se_reparten_entre_shards():
+    candados = CandadosPorPaciente(shards=8)
+    cedulas = [str(1000 + i) for i in range(200)]
+
+    assert all(candados(c) is candados(c) for c in cedulas)
+    assert len({id(candados(c)) for c in cedulas}) == 8
+
+    # Un paciente ocupado no bloquea a otro de distinto shard
+    a = cedulas[0]
+    b = next(c for c in cedulas if candados(c) is not candados(a))
+    with candados(a):
+        assert candados(b).acquire(blocking=False)
+        candados(b).release()
+
+
+def test_escrituras_concurrentes_de_varios_pacientes(tmp_path):
+    historial = HistorialSegmentado(str(tmp_path), shards=4)
+
+    def escribir(cedula):
+        for i in range(30):
+            historial.agregar(cedula, registro(i))
+
+    hilos = [threading.Thread(target=escribir, args=(str(c),)) for c in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    recargado = HistorialSegmentado(str(tmp_path))
+    assert all(recargado.obtener(str(c)) == [registro(i) for i in range(30)] for c in range(8))
+
+
+def test_cada_paciente_conserva_solo_los_ultimos_registros(tmp_path):
+    historial = HistorialSegmentado(str(tmp_path))
+    for i in range(MAX_REGISTROS + 10):
+        historial.agregar("123", registro(i))
+
+    assert historial.obtener("123") == [registro(i) for i in range(10, MAX_REGISTROS + 10)]
+    # El segmento aún no llega al umbral: en disco sigue todo, al recargar se acota igual
+    assert len(lineas(tmp_path / "123.jsonl")) == MAX_REGISTROS + 10
+    assert len(HistorialSegmentado(str(tmp_path)).obtener("123")) == MAX_REGISTROS
+
+
+def cedulas_en_shards_distintos(historial, n):
+    elegidas = []
+    for cedula in map(str, range(1, 1000)):
+        if all(historial._candado(cedula) is not historial._candado(c) for c in elegidas):
+            elegidas.append(cedula)
+            if len(elegidas) == n:
+                return elegidas
+
+
+def test_pacientes_en_memoria_acotados_sin_perder_datos(tmp_path):
+    historial = HistorialSegmentado(str(tmp_path), max_pacientes=2)
+    a, b, c = cedulas_en_shards_distintos(historial, 3)
+    for i, cedula in enumerate((a, b, c)):
+        historial.agregar(cedula, registro(i))
+    version = historial.version(a)
+
+    assert list(historial._registros) == [b, c]
+    # El descartado se relee de su segmento y conserva su versión
+    assert historial.obtener(a) == [registro(0)]
+    assert historial.version(a) == version
+    assert list(historial._registros) == [c, a]
+    assert historial.cedulas() == sorted([a, b, c])
+
+
+def test_no_descarta_un_paciente_en_uso(tmp_path):
+    historial = HistorialSegmentado(str(tmp_path), max_pacientes=1)
+    a, b, c = cedulas_en_shards_distintos(historial, 3)
+    historial.agregar(a, registro(1))
+
+    with historial._candado(a):
+        # Otro hilo carga un segundo paciente mientras el primero está ocupado
+        hilo = threading.Thread(target=historial.agregar, args=(b, registro(2)))
+        hilo.start()
+        hilo.join(timeout=5)
+        assert set(historial._registros) == {a, b}
+
+    # Ya libres, los dos salen al cargar un tercero
+    historial.agregar(c, registro(3))
+    assert list(historial._registros) == [c]
+
+
+def test_fsync_opcional(tmp_path, monkeypatch):
+    sincronizados = []
+    monkeypatch.setattr(modulo.os, "fsync", sincronizados.append)
+
+    HistorialSegmentado(str(tmp_path / "a")).agregar("1", registro(1))
+    assert sincronizados == []
+    HistorialSegmentado(str(tmp_path / "b"), fsync=True).agregar("1", registro(1))
+    assert len(sincronizados) == 1
+
+
+def test_historial_redis_ordena_recorta_y_no_duplica():
+    historial = HistorialRedis(fakeredis.FakeRedis(), max_registros=3)
+    for i in (4, 1, 3, 2, 5):
+        historial.agregar("123", registro(i))
+    version = historial.version("123")
+    historial.agregar("123", registro(5))  # reentrega del mismo análisis
+
+    assert historial.obtener("123") == [registro(3), registro(4), registro(5)]
+    assert historial.version("123") != version
+    assert historial.cedulas() == ["123"]
+    assert historial.total_registros() == 3
+
+
+def test_historial_redis_compartido_y_migracion(tmp_path):
+    cliente = fakeredis.FakeRedis()
+    legado = tmp_path / "data_history.json"
+    legado.write_text(json.dumps({"1": [registro(i) for i in range(5)], "2": [registro(0)]}))
+
+    assert HistorialRedis(cliente, max_registros=3).importar_legado(str(legado)) == 4
+    otro_worker = HistorialRedis(cliente, max_registros=3)
+    assert otro_worker.cedulas() == ["1", "2"]
+    assert otro_worker.obtener("1") == [registro(2), registro(3), registro(4)]
@@ -0,0 +1,332 @@
+import copy
+import io
+import itertools
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from services import contrasenas, data_base_mongo, importar_usuarios
+from services.importar_usuarios import ImportadorUsuarios, leer_filas
+
+_ids = itertools.count(1)
+
+
+def _coincide(documento, filtro):
+    for campo, valor in filtro.items():
+        if isinstance(valor, dict) and "$in" in valor:
+            if documento.get(campo) not in valor["$in"]:
+                return False
+        elif documento.get(campo) != valor:
+            return False
+    return True
+
+
+class Cursor:
+    def __init__(self, documentos):
+        self.documentos = documentos
+
+    def sort(self, campo, direccion=1):
+        self.documentos = sorted(self.documentos, key=lambda d: d[campo], reverse=direccion == -1)
+        return self
+
+    def limit(self, n):
+        # Como en PyMongo, limit(0) no limita
+        if n:
+            self.documentos = self.documentos[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self.documentos)
+
+
+class Coleccion:
+    """Colección de PyMongo en memoria con índice único opcional en `cedula`"""
+
+    def __init__(self, unica=False):
+        self.documentos = {}
+        self.unica = unica
+        # Cédulas cuya escritura falla con un error de validación
+        self.rechazar = set()
+        # Cédulas que find() no ve (registradas por otro proceso a mitad del lote)
+        self.ocultas = set()
+
+    def insert_many(self, documentos, ordered=True, session=None):
+        errores = []
+        for indice, documento in enumerate(documentos):
+            documento.setdefault("_id", next(_ids))
+            if documento["_id"] in self.documentos or (
+                    self.unica and any(d["cedula"] == documento["cedula"] for d in self.documentos.values())):
+                errores.append({"index": indice, "code": 11000, "errmsg": "E11000 duplicate key"})
+            elif documento.get("cedula") in self.rechazar:
+                errores.append({"index": indice, "code": 121, "errmsg": "Document failed validation"})
+            else:
+                self.documentos[documento["_id"]] = copy.deepcopy(documento)
+                continue
+            if ordered:
+                break
+        if errores:
+            raise BulkWriteError({"writeErrors": errores})
+
+    def find(self, filtro, proyeccion=None):
+        visibles = [copy.deepcopy(d) for d in self.documentos.values()
+                    if _coincide(d, filtro) and d.get("cedula") not in self.ocultas]
+        if proyeccion:
+            incluir = any(v for k, v in proyeccion.items() if k != "_id")
+            visibles = [{k: v for k, v in d.items() if proyeccion.get(k, 1 if k == "_id" else 0)}
+                        if incluir else {k: v for k, v in d.items() if proyeccion.get(k, 1)}
+                        for d in visibles]
+        return Cursor(visibles)
+
+    def find_one(self, filtro):
+        return next(iter(self.find(filtro)), None)
+
+    def count_documents(self, filtro):
+        return len(self.find(filtro).documentos)
+
+    def delete_one(self, filtro):
+        for clave, documento in list(self.documentos.items()):
+            if _coincide(documento, filtro):
+                del self.documentos[clave]
+                return
+
+    def delete_many(self, filtro):
+        for clave, documento in list(self.documentos.items()):
+            if _coincide(documento, filtro):
+                del self.documentos[clave]
+
+    def update_one(self, filtro, cambios, upsert=False, session=None):
+        documento = next((d for d in self.documentos.values() if _coincide(d, filtro)), None)
+        if documento is None:
+            if not upsert:
+                return
+            documento = self.documentos[filtro["_id"]] = dict(filtro)
+        documento.update(cambios.get("$set", {}))
+        for campo, valor in cambios.get("$inc", {}).items():
+            documento[campo] = documento.get(campo, 0) + valor
+
+    def bulk_write(self, operaciones, ordered=True, session=None):
+        for operacion in operaciones:
+            self.documentos[operacion._filter["_id"]] = {**operacion._doc, **operacion._filter}
+
+
+class Sesion:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def with_transaction(self, funcion):
+        # Si la función falla se deshacen todas las escrituras, como en una transacción real
+        copia = {nombre: copy.deepcopy(c.documentos) for nombre, c in self.db.colecciones.items()}
+        try:
+            return funcion(self)
+        except Exception:
+            for nombre, documentos in copia.items():
+                self.db.colecciones[nombre].documentos = documentos
+            raise
+
+
+class Cliente:
+    def __init__(self, db, transacciones):
+        self.db = db
+        self.hello = {"setName": "rs0"} if transacciones else {}
+        self.admin = self
+
+    def command(self, nombre):
+        return self.hello
+
+    def start_session(self):
+        return Sesion(self.db)
+
+
+class BaseDatos:
+    def __init__(self, transacciones=False):
+        self.colecciones = {
+            "usuarios": Coleccion(unica=True),
+            "pacientes": Coleccion(unica=True),
+            "importaciones": Coleccion(),
+            "importaciones_errores": Coleccion(),
+        }
+        self.client = Cliente(self, transacciones)
+
+    def __getitem__(self, nombre):
+        return self.colecciones[nombre]
+
+    def __getattr__(self, nombre):
+        if nombre == "colecciones":
+            raise AttributeError(nombre)
+        return self.colecciones[nombre]
+
+
+@pytest.fixture(autouse=True)
+def hashes_rapidos(monkeypatch):
+    llamadas = []
+
+    def generar_lote(passwords):
+        llamadas.append(len(passwords))
+        return [f"hash:{p}" for p in passwords]
+
+    monkeypatch.setattr(contrasenas, "generar_lote", generar_lote)
+    # Cada BaseDatos nueva consulta otra vez si admite transacciones
+    monkeypatch.setattr(data_base_mongo, "_transacciones", {})
+    return llamadas
+
+
+def csv_usuarios(*filas):
+    return io.StringIO("cedula,nombre,password,rol\n" + "".join(f"{fila}\n" for fila in filas))
+
+
+def filas(*lineas):
+    return leer_filas(csv_usuarios(*lineas), "csv")
+
+
+def cedulas(coleccion):
+    return sorted(d["cedula"] for d in coleccion.documentos.values())
+
+
+def test_importa_usuarios_y_registra_filas_invalidas():
+    db = BaseDatos()
+    importador = ImportadorUsuarios(db, "a", lote=2)
+
+    resumen = importador.importar(filas(
+        "1,Ana Díaz,x,", "2,Luis,x,medico", ",SinCedula,x,", "3,Eva,x,enfermero", "1,Ana,x,",
+        "4,Juan,x,paciente",
+    ))
+
+    assert resumen["importados"] == 3 and resumen["con_errores"] == 3 and resumen["completado"]
+    assert cedulas(db.usuarios) == ["1", "2", "4"]
+    # Los médicos no tienen ficha de paciente
+    assert cedulas(db.pacientes) == ["1", "4"]
+    assert db.usuarios.find_one({"cedula": "1"})["password"] == "hash:x"
+    assert [(e["fila"], e["error"]) for e in importador.errores()] == [
+        (4, "Faltan datos obligatorios: cedula"),
+        (5, "Rol inválido: enfermero"),
+        (6, "Cédula repetida en el archivo"),
+    ]
+
+
+def test_reanuda_desde_el_punto_de_control(hashes_rapidos, monkeypatch):
+    db = BaseDatos()
+    lineas = [f"{c},Paciente {c},x," for c in range(1, 8)]
+
+    def interrumpir(passwords):
+        raise KeyboardInterrupt
+
+    # La importación se corta en el segundo lote: el primero ya quedó guardado
+    generar = contrasenas.generar_lote
+    llamadas = iter([generar, interrumpir])
+    monkeypatch.setattr(contrasenas, "generar_lote", lambda p: next(llamadas)(p))
+    with pytest.raises(KeyboardInterrupt):
+        ImportadorUsuarios(db, "a", lote=3).importar(filas(*lineas))
+    assert cedulas(db.usuarios) == ["1", "2", "3"]
+    assert db.importaciones.find_one({"_id": "usuarios:a"})["ultima_fila"] == 4
+
+    monkeypatch.setattr(contrasenas, "generar_lote", generar)
+    resumen = ImportadorUsuarios(db, "a", lote=3).importar(filas(*lineas))
+
+    assert resumen["importados"] == 7 and resumen["con_errores"] == 0
+    assert resumen["ultima_fila"] == 8
+    assert cedulas(db.usuarios) == [str(c) for c in range(1, 8)]
+    # Solo se hashearon las filas que faltaban
+    assert hashes_rapidos == [3, 3, 1]
+
+
+def test_importacion_completada_no_se_repite(hashes_rapidos):
+    db = BaseDatos()
+    ImportadorUsuarios(db, "a").importar(filas("1,Ana,x,"))
+
+    resumen = ImportadorUsuarios(db, "a").importar(filas("1,Ana,x,", "2,Luis,x,"))
+
+    assert resumen["importados"] == 1 and resumen["completado"]
+    assert cedulas(db.usuarios) == ["1"]
+    assert hashes_rapidos == [1]
+
+
+def test_reiniciar_borra_el_punto_de_control_y_los_errores():
+    db = BaseDatos()
+    ImportadorUsuarios(db, "a").importar(filas("1,Ana,x,", ",SinCedula,x,"))
+    ImportadorUsuarios(db, "otra").importar(filas(",SinCedula,x,"))
+
+    importador = ImportadorUsuarios(db, "a", reiniciar=True)
+    assert importador.resumen()["ultima_fila"] == 0
+    assert importador.resumen()["con_errores"] == 0
+    resumen = importador.importar(filas("1,Ana,x,", "2,Luis,x,"))
+
+    # La fila ya importada ahora es una cédula registrada; la otra importación no se toca
+    assert resumen["importados"] == 1
+    assert [(e["fila"], e["error"]) for e in importador.errores()] == [(2, "La cédula ya está registrada")]
+    assert ImportadorUsuarios(db, "otra").resumen()["con_errores"] == 1
+
+
+def test_lote_en_transaccion():
+    db = BaseDatos(transacciones=True)
+    importador = ImportadorUsuarios(db, "a", lote=10)
+
+    resumen = importador.importar(filas("1,Ana,x,", "2,Luis,x,medico", ",SinCedula,x,"))
+
+    assert resumen["transacciones"] is True
+    assert resumen["importados"] == 2 and resumen["con_errores"] == 1
+    assert cedulas(db.usuarios) == ["1", "2"] and cedulas(db.pacientes) == ["1"]
+
+
+def test_transaccion_fallida_se_rehace_fila_por_fila():
+    db = BaseDatos(transacciones=True)
+    # Otro proceso registra la cédula 2 después de la consulta de existentes
+    db.usuarios.insert_many([{"cedula": "2", "nombre": "Otro"}])
+    db.usuarios.ocultas.add("2")
+    importador = ImportadorUsuarios(db, "a", lote=10)
+
+    resumen = importador.importar(filas("1,Ana,x,", "2,Luis,x,", "3,Eva,x,"))
+
+    assert resumen["importados"] == 2
+    assert cedulas(db.usuarios) == ["1", "2", "3"]
+    assert cedulas(db.pacientes) == ["1", "3"]
+    db.usuarios.ocultas.clear()
+    assert db.usuarios.find_one({"cedula": "2"})["nombre"] == "Otro"
+    assert [(e["fila"], e["error"]) for e in importador.errores()] == [(3, "La cédula ya está registrada")]
+    assert db.importaciones.find_one({"_id": "usuarios:a"})["importados"] == 2
+
+
+def test_sin_transaccion_se_deshace_el_usuario_sin_ficha():
+    db = BaseDatos()
+    db.pacientes.rechazar.add("2")
+    importador = ImportadorUsuarios(db, "a")
+
+    resumen = importador.importar(filas("1,Ana,x,", "2,Luis,x,", "3,Eva,x,medico"))
+
+    assert resumen["importados"] == 2
+    assert cedulas(db.usuarios) == ["1", "3"]
+    assert [(e["fila"], e["error"]) for e in importador.errores()] == [
+        (3, "Ficha de paciente: Document failed validation"),
+    ]
+
+
+def test_limites_de_campos_y_de_errores_devueltos():
+    db = BaseDatos()
+    largo = "x" * (importar_usuarios.MAX_LARGO_CAMPO + 1)
+    importador = ImportadorUsuarios(db, "a")
+
+    resumen = importador.importar(filas(f"1,{largo},x,", "2,Ana,x,", ",A,x,", ",B,x,"))
+
+    assert resumen["importados"] == 1 and resumen["con_errores"] == 3
+    assert [e["fila"] for e in importador.errores(limite=2)] == [2, 4]
+    assert importador.errores(limite=2)[0]["error"] == "El campo nombre es demasiado largo"
+    assert len(importador.errores()) == 3
+
+
+def test_jsonl_con_lineas_invalidas():
+    db = BaseDatos()
+    lineas = io.StringIO('{"cedula": "1", "nombre": "Ana", "password": "x"}\n\n{no es json\n[1, 2]\n')
+    importador = ImportadorUsuarios(db, "a")
+
+    resumen = importador.importar(leer_filas(lineas, "jsonl"))
+
+    assert resumen["importados"] == 1
+    errores = importador.errores()
+    assert [e["fila"] for e in errores] == [3, 4]
+    assert errores[0]["error"].startswith("JSON inválido")
+    assert errores[1]["error"] == "Se esperaba un objeto JSON"
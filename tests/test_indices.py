@@ -0,0 +1,53 @@
+import ast
+import subprocess
+import sys
+from pathlib import Path
+
+from services import indices
+from services.indices import INDICES, ROLLUP_COLECCION, SIGNOS_COLECCION, aplicar_indices
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+class ColeccionFalsa:
+    def __init__(self, nombre, creados):
+        self.nombre = nombre
+        self.creados = creados
+
+    def create_index(self, claves, **opciones):
+        self.creados.append((self.nombre, claves))
+
+
+class BaseFalsa:
+    def __init__(self):
+        self.creados = []
+
+    def __getitem__(self, nombre):
+        return ColeccionFalsa(nombre, self.creados)
+
+
+def test_declaraciones_no_importan_servicios():
+    codigo = ("import sys, services.indices, services.data_base_mongo; "
+              "print(sorted(m for m in sys.modules if m.startswith('services.')))")
+    salida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True,
+                            env={"MONGO_URI": "mongodb://127.0.0.1:1", "PATH": ""})
+    cargados = ast.literal_eval(salida.stdout.strip().splitlines()[-1])
+    assert cargados == ["services.contrasenas", "services.data_base_mongo", "services.indices"]
+
+
+def test_cada_servicio_aplica_solo_sus_colecciones():
+    base = BaseFalsa()
+
+    assert aplicar_indices(base, (SIGNOS_COLECCION, ROLLUP_COLECCION)) == []
+
+    assert {nombre for nombre, _ in base.creados} == {SIGNOS_COLECCION, ROLLUP_COLECCION}
+    assert len(base.creados) == len(INDICES[SIGNOS_COLECCION]) + len(INDICES[ROLLUP_COLECCION])
+
+
+def test_series_tiempo_usa_las_colecciones_declaradas():
+    from services.service1 import series_tiempo
+    from services import simulador_lecturas
+
+    assert series_tiempo.SIGNOS_COLECCION is indices.SIGNOS_COLECCION
+    assert series_tiempo.ROLLUP_COLECCION is indices.ROLLUP_COLECCION
+    assert simulador_lecturas.LECTURAS_COLECCION is indices.LECTURAS_COLECCION
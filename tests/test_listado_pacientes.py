@@ -0,0 +1,114 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services import data_base_mongo
+from services.service1 import main
+from services.tokens import usuario_actual
+
+
+class Cursor:
+    """Cursor de Motor/PyMongo sobre una lista: sort, limit, batch_size e iteración"""
+
+    def __init__(self, documentos):
+        self.documentos = documentos
+
+    def sort(self, campo, direccion=1):
+        self.documentos = sorted(self.documentos, key=lambda d: d[campo], reverse=direccion == -1)
+        return self
+
+    def limit(self, n):
+        self.documentos = self.documentos[:n]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    async def to_list(self, length):
+        return self.documentos[:length]
+
+    def __iter__(self):
+        return iter(self.documentos)
+
+    async def __aiter__(self):
+        for documento in self.documentos:
+            yield documento
+
+
+class ColeccionPacientes:
+    def __init__(self, cedulas):
+        self.documentos = [{"_id": i, "cedula": c, "nombre": f"P{c}", "apellido": "X", "email": "-"}
+                           for i, c in enumerate(cedulas)]
+        self.filtros = []
+
+    def find(self, filtro, proyeccion):
+        self.filtros.append(filtro)
+        minimo = filtro.get("cedula", {}).get("$gt")
+        visibles = [d for d in self.documentos if minimo is None or d["cedula"] > minimo]
+        return Cursor([{k: v for k, v in d.items() if proyeccion.get(k)} for d in visibles])
+
+
+CEDULAS = ["105", "101", "104", "102", "103"]
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    coleccion = ColeccionPacientes(CEDULAS)
+    monkeypatch.setattr(main, "db_async", {"pacientes": coleccion})
+    main.app.dependency_overrides[usuario_actual] = lambda: None
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def recorrer(cliente, limite):
+    paginas, despues_de = [], None
+    while True:
+        params = {"limite": limite, **({"despues_de": despues_de} if despues_de else {})}
+        cuerpo = cliente.get("/pacientes", params=params).json()
+        paginas.append([p["cedula"] for p in cuerpo["pacientes"]])
+        despues_de = cuerpo["siguiente"]
+        if despues_de is None:
+            return paginas
+
+
+def test_paginas_por_cursor_sin_repetir_ni_saltar(cliente):
+    assert recorrer(cliente, 2) == [["101", "102"], ["103", "104"], ["105"]]
+    # Con un múltiplo exacto la última página no anuncia otra vacía
+    assert recorrer(cliente, 5) == [sorted(CEDULAS)]
+
+
+def test_limite_acotado_al_maximo(cliente, monkeypatch):
+    monkeypatch.setattr(main, "MAX_PAGINA_PACIENTES", 3)
+
+    cuerpo = cliente.get("/pacientes", params={"limite": 1000}).json()
+
+    assert len(cuerpo["pacientes"]) == 3
+    assert cuerpo["siguiente"] == "103"
+    assert cliente.get("/pacientes", params={"limite": 0}).json()["pacientes"] == [
+        {"cedula": "101", "nombre": "P101", "apellido": "X"}]
+
+
+def test_ndjson_transmite_todo_desde_el_cursor(cliente):
+    respuesta = cliente.get("/pacientes", params={"formato": "ndjson", "despues_de": "102"})
+
+    assert respuesta.headers["content-type"] == "application/x-ndjson"
+    lineas = [json.loads(linea) for linea in respuesta.text.splitlines()]
+    assert [p["cedula"] for p in lineas] == ["103", "104", "105"]
+    assert all("_id" not in p and "email" not in p for p in lineas)
+
+
+def test_formato_invalido(cliente):
+    assert cliente.get("/pacientes", params={"formato": "csv"}).status_code == 400
+
+
+def test_pagina_del_frontend(monkeypatch):
+    monkeypatch.setattr(data_base_mongo, "db", SimpleNamespace(pacientes=ColeccionPacientes(CEDULAS)))
+    monkeypatch.setattr(data_base_mongo, "MAX_PAGINA_PACIENTES", 2)
+
+    assert data_base_mongo.obtener_pacientes_pagina(limite=50) == (
+        [{"cedula": "101", "nombre": "P101"}, {"cedula": "102", "nombre": "P102"}], "102")
+    pacientes, siguiente = data_base_mongo.obtener_pacientes_pagina(despues_de="104")
+    assert [p["cedula"] for p in pacientes] == ["105"]
+    assert siguiente is None
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services.service2 import modelo_lectura
+from services.service2.modelo_lectura import ModeloLecturas
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = SimpleNamespace(ahora=1000.0)
+    monkeypatch.setattr(modelo_lectura, "time", SimpleNamespace(monotonic=lambda: reloj.ahora))
+    return reloj
+
+
+def analisis(cedula, timestamp):
+    return {"paciente": {"cedula": cedula, "nombre": "Ana"}, "timestamp": timestamp, "datos": {}, "alertas": []}
+
+
+def test_entrada_vencida_no_se_sirve(reloj):
+    modelo = ModeloLecturas()
+    modelo.registrar(analisis("1", "2024-01-01 10:00:00"))
+
+    reloj.ahora += 299
+    assert modelo.obtener("1", vigencia=300)["timestamp"] == "2024-01-01 10:00:00"
+    reloj.ahora += 2
+    assert modelo.obtener("1", vigencia=300) is None
+    assert modelo.obtener("1") is not None  # sin vigencia, como respaldo
+    assert modelo.estadisticas()["consultas_vencidas"] == 1
+
+
+def test_lectura_nueva_o_renovar_la_vuelven_vigente(reloj):
+    modelo = ModeloLecturas()
+    modelo.registrar(analisis("1", "2024-01-01 10:00:00"))
+
+    reloj.ahora += 400
+    modelo.registrar(analisis("1", "2024-01-01 10:05:00"))
+    assert modelo.obtener("1", vigencia=300)["timestamp"] == "2024-01-01 10:05:00"
+
+    reloj.ahora += 400
+    modelo.renovar("1")
+    assert modelo.obtener("1", vigencia=300) is not None
+
+
+def test_lectura_atrasada_no_renueva(reloj):
+    modelo = ModeloLecturas()
+    modelo.registrar(analisis("1", "2024-01-01 10:05:00"))
+
+    reloj.ahora += 400
+    assert not modelo.registrar(analisis("1", "2024-01-01 10:00:00"))
+    assert modelo.obtener("1", vigencia=300) is None
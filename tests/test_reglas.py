@@ -0,0 +1,191 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from services.service2.reglas import MotorReglas, REGLAS_PATH, separar_presion
+
+NORMAL = "✅ Todo en rangos normales"
+
+
+def analisis_escalar(data):
+    """analyze() de services/service2/main.py antes del motor de reglas"""
+    bpm = data.get("ritmo_cardiaco", 0)
+    temp = data.get("temperatura", 0)
+    oxigeno = data.get("oxigeno", 100)
+    alertas = []
+
+    if bpm > 100:
+        alertas.append("⚠️ Ritmo cardíaco alto (posible taquicardia)")
+    elif bpm < 60:
+        alertas.append("⚠️ Ritmo cardíaco bajo (posible bradicardia)")
+
+    if temp > 38:
+        alertas.append("🌡️ Fiebre detectada")
+    elif temp < 36:
+        alertas.append("❄️ Hipotermia detectada")
+
+    if oxigeno < 95:
+        alertas.append("🫁 Saturación de oxígeno baja")
+
+    return alertas if alertas else [NORMAL]
+
+
+def analisis_escalar_completo(data, previas):
+    """Referencia escalar de todas las reglas de reglas_alertas.json.
+
+    `previas` son las lecturas anteriores del mismo paciente (más antigua
+    primero).
+    """
+    alertas = [a for a in analisis_escalar(data) if a != NORMAL]
+
+    try:
+        alta, baja = (float(v) for v in data["presion"].split("/"))
+    except (KeyError, AttributeError, ValueError):
+        alta = baja = None
+    if alta is not None:
+        if alta < 90:
+            alertas.append("💉 Presión sistólica baja (posible hipotensión)")
+        if alta > 140:
+            alertas.append("💉 Presión sistólica alta (posible hipertensión)")
+        if baja < 60:
+            alertas.append("💉 Presión diastólica baja")
+        if baja > 90:
+            alertas.append("💉 Presión diastólica alta")
+
+    if len(previas) >= 3:
+        anterior = previas[-3]
+        if data.get("ritmo_cardiaco", 0) - anterior.get("ritmo_cardiaco", 0) >= 30:
+            alertas.append("📈 Aumento brusco del ritmo cardíaco")
+        if data.get("oxigeno", 100) - anterior.get("oxigeno", 100) <= -4:
+            alertas.append("📉 Descenso sostenido de la saturación de oxígeno")
+
+    return alertas if alertas else [NORMAL]
+
+
+def lectura_aleatoria(rng, cedula):
+    lectura = {"cedula": cedula}
+    # Se incluyen los límites exactos de cada regla
+    if rng.random() < 0.9:
+        lectura["ritmo_cardiaco"] = rng.choice([rng.randint(40, 140), 60, 100])
+    if rng.random() < 0.9:
+        lectura["temperatura"] = rng.choice([round(rng.uniform(34.5, 40.5), 1), 36, 38])
+    if rng.random() < 0.9:
+        lectura["oxigeno"] = rng.choice([rng.randint(85, 100), 95])
+    if rng.random() < 0.8:
+        lectura["presion"] = rng.choice([
+            f"{rng.randint(80, 160)}/{rng.randint(50, 100)}",
+            "90/60", "140/90", "120", "80/", "abc/80", "",
+        ])
+    return lectura
+
+
+@pytest.fixture(scope="module")
+def motor():
+    return MotorReglas.desde_archivo()
+
+
+def test_motor_reproduce_el_analisis_escalar_anterior(motor):
+    # Con solo las reglas originales el motor debe coincidir lectura a lectura
+    with open(REGLAS_PATH, encoding="utf-8") as f:
+        config = json.load(f)
+    config["reglas"] = config["reglas"][:5]
+    originales = MotorReglas(config)
+    rng = random.Random(4)
+    lecturas = [lectura_aleatoria(rng, str(i)) for i in range(2000)]
+
+    assert originales.analizar_lote(lecturas) == [analisis_escalar(l) for l in lecturas]
+
+
+def test_motor_coincide_con_la_referencia_escalar_por_paciente(motor):
+    rng = random.Random(7)
+    cedulas = [str(100000 + i) for i in range(20)]
+    lecturas = [lectura_aleatoria(rng, rng.choice(cedulas)) for _ in range(3000)]
+
+    esperado = []
+    previas = {}
+    for lectura in lecturas:
+        historial = previas.setdefault(lectura["cedula"], [])
+        esperado.append(analisis_escalar_completo(lectura, historial))
+        historial.append(lectura)
+
+    # Las tendencias se evalúan paciente por paciente, como en /analyze/{cedula}
+    por_paciente = {}
+    for indice, lectura in enumerate(lecturas):
+        por_paciente.setdefault(lectura["cedula"], []).append(indice)
+    obtenido = [None] * len(lecturas)
+    for indices in por_paciente.values():
+        for indice, alertas in zip(indices, motor.analizar_lote([lecturas[i] for i in indices])):
+            obtenido[indice] = alertas
+
+    assert obtenido == esperado
+
+
+def test_tendencia_no_mezcla_pacientes_en_el_lote(motor):
+    lecturas = [
+        {"cedula": "1", "ritmo_cardiaco": 70, "temperatura": 37},
+        {"cedula": "2", "ritmo_cardiaco": 70, "temperatura": 37},
+        {"cedula": "2", "ritmo_cardiaco": 70, "temperatura": 37},
+        {"cedula": "2", "ritmo_cardiaco": 100, "temperatura": 37},
+    ]
+
+    assert motor.analizar_lote(lecturas)[-1] == [NORMAL]
+
+    lecturas[0]["cedula"] = "2"
+    assert motor.analizar_lote(lecturas)[-1] == ["📈 Aumento brusco del ritmo cardíaco"]
+
+
+def test_valores_nulos_no_disparan_alertas(motor):
+    lectura = {"cedula": "1", "ritmo_cardiaco": None, "temperatura": None,
+               "oxigeno": None, "presion": None}
+
+    assert motor.analizar_lote([lectura]) == [[NORMAL]]
+
+
+def test_separar_presion_marca_nan_en_valores_mal_formados():
+    sistolica, diastolica = separar_presion(["120/80", "120", "x/80", None, "90/"])
+
+    assert sistolica[0] == 120 and diastolica[0] == 80
+    assert np.isnan(sistolica[1:]).all() and np.isnan(diastolica[1:]).all()
+
+
+def test_conteo_suma_las_lecturas_por_alerta(motor):
+    lecturas = [{"temperatura": 39}, {"temperatura": 39.5}, {"temperatura": 37}]
+    conteo = motor.conteo(motor.evaluar(motor.columnas(lecturas)))
+
+    assert conteo["🌡️ Fiebre detectada"] == 2
+    assert conteo["❄️ Hipotermia detectada"] == 0
+
+
+def test_tipo_de_regla_desconocido():
+    config = {"campos": {"oxigeno": {}},
+              "reglas": [{"tipo": "media", "campo": "oxigeno", "mensaje": "x"}]}
+
+    with pytest.raises(ValueError, match="Tipo de regla desconocido"):
+        MotorReglas(config)
+
+
+@pytest.mark.parametrize("config", [
+    {"reglas": []},
+    {"campos": {}},
+    {"campos": {}, "reglas": [{"campo": "oxigeno", "mensaje": "x"}]},
+    {"campos": {}, "reglas": [{"tipo": "rango", "campo": "oxigeno", "min": 90,
+                               "mensaje_bajo": "bajo", "mensaje_alto": "alto"}]},
+    {"campos": {}, "reglas": [{"tipo": "umbral", "campo": "oxigeno", "operador": "<",
+                               "valor": 95}]},
+])
+def test_configuracion_incompleta(config):
+    with pytest.raises(KeyError):
+        MotorReglas(config)
+
+
+def test_archivo_de_reglas_invalido(tmp_path):
+    ruta = tmp_path / "reglas.json"
+    ruta.write_text("{\"campos\": {", encoding="utf-8")
+
+    with pytest.raises(json.JSONDecodeError):
+        MotorReglas.desde_archivo(str(ruta))
+
+    with pytest.raises(FileNotFoundError):
+        MotorReglas.desde_archivo(str(tmp_path / "no_existe.json"))
@@ -0,0 +1,47 @@
+import time
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+
+from services.authentication import main as auth
+
+USUARIO = {"cedula": "1", "nombre": "Ana", "rol": "medico"}
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(auth.verificador, "redis", fakeredis.aioredis.FakeRedis())
+    monkeypatch.setattr(auth.verificador, "_revocacion", {})
+    return TestClient(auth.app)
+
+
+def renovar(cliente, token):
+    return cliente.post("/token/renovar", headers={"Authorization": f"Bearer {token}"})
+
+
+def test_renovar_emite_un_token_nuevo_y_revoca_el_anterior(cliente):
+    anterior = auth.emitir_token(USUARIO)
+    respuesta = renovar(cliente, anterior)
+    assert respuesta.status_code == 200
+    nuevo = respuesta.json()["access_token"]
+
+    claims = auth.jwt.decode(nuevo, options={"verify_signature": False})
+    assert (claims["sub"], claims["rol"]) == ("1", "medico")
+
+    auth.verificador._revocacion.clear()  # sin la caché local de revocación
+    assert renovar(cliente, anterior).status_code == 401
+    assert renovar(cliente, nuevo).status_code == 200
+
+
+def test_renovar_conserva_el_inicio_de_sesion_y_lo_acota(cliente):
+    inicio = int(time.time()) - 3600
+    nuevo = renovar(cliente, auth.emitir_token(USUARIO, inicio)).json()["access_token"]
+    assert auth.jwt.decode(nuevo, options={"verify_signature": False})["auth_time"] == inicio
+
+    vencida = auth.emitir_token(USUARIO, int(time.time() - auth.SESION_MAX_HORAS * 3600 - 1))
+    assert renovar(cliente, vencida).status_code == 401
+
+
+def test_renovar_sin_token(cliente):
+    assert cliente.post("/token/renovar").status_code == 401
@@ -0,0 +1,197 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from my_agent import respuestas
+from my_agent.respuestas import CacheRespuestas
+
+
+class ModeloFalso:
+    """Modelo que cuenta sus llamadas y puede retenerse hasta que se libere"""
+
+    def __init__(self, respuesta="ok", error=None):
+        self.respuesta = respuesta
+        self.error = error
+        self.llamadas = 0
+        self.liberar = None
+
+    async def __call__(self, user_id, texto, **extra):
+        self.llamadas += 1
+        if self.liberar is not None:
+            await self.liberar.wait()
+        if self.error:
+            raise self.error
+        return f"{self.respuesta}: {texto}"
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    # Solo el reloj de la caché; el bucle de eventos sigue con el real
+    monkeypatch.setattr(respuestas, "time", SimpleNamespace(monotonic=reloj))
+    return reloj
+
+
+def test_clave_incluye_contexto_y_normaliza_pregunta():
+    base = CacheRespuestas.clave("1", "¿Cómo está mi temperatura?", "h1")
+    assert base == CacheRespuestas.clave("1", "como esta mi  temperatura", "h1")
+    assert base != CacheRespuestas.clave("1", "¿Cómo está mi temperatura?", "h2")
+    con_contexto = CacheRespuestas.clave("1", "¿y ayer?", "h1", "Usuario: ¿mi ritmo?\n")
+    assert con_contexto != CacheRespuestas.clave("1", "¿y ayer?", "h1", "Usuario: ¿mi temperatura?\n")
+    assert con_contexto != CacheRespuestas.clave("1", "¿y ayer?", "h1")
+    assert CacheRespuestas.clave("1", "hola", None) is None
+
+
+def test_reutiliza_respuesta_dentro_del_ttl(reloj):
+    modelo = ModeloFalso()
+    cache = CacheRespuestas(modelo, ttl=60)
+    clave = CacheRespuestas.clave("1", "hola", "h1")
+
+    async def escenario():
+        primera = await cache.responder(clave, "u1", "hola")
+        reloj.ahora += 59
+        segunda = await cache.responder(clave, "u2", "hola")
+        return primera, segunda
+
+    primera, segunda = asyncio.run(escenario())
+    assert primera == segunda
+    assert modelo.llamadas == 1
+    assert cache.contadores["aciertos"] == 1
+
+
+def test_vuelve_a_llamar_al_vencer_el_ttl(reloj):
+    modelo = ModeloFalso()
+    cache = CacheRespuestas(modelo, ttl=60)
+    clave = CacheRespuestas.clave("1", "hola", "h1")
+
+    async def escenario():
+        await cache.responder(clave, "u1", "hola")
+        reloj.ahora += 61
+        await cache.responder(clave, "u1", "hola")
+
+    asyncio.run(escenario())
+    assert modelo.llamadas == 2
+    assert cache.contadores["aciertos"] == 0
+
+
+def test_descarta_la_entrada_menos_usada(reloj):
+    modelo = ModeloFalso()
+    cache = CacheRespuestas(modelo, ttl=60, max_entradas=2)
+    a, b, c = (CacheRespuestas.clave("1", pregunta, "h1") for pregunta in ("a", "b", "c"))
+
+    async def escenario():
+        await cache.responder(a, "u", "a")
+        await cache.responder(b, "u", "b")
+        await cache.responder(a, "u", "a")  # "b" queda como la menos usada
+        await cache.responder(c, "u", "c")
+        await cache.responder(a, "u", "a")
+        await cache.responder(b, "u", "b")
+
+    asyncio.run(escenario())
+    assert modelo.llamadas == 4
+
+
+def test_sin_clave_no_guarda(reloj):
+    modelo = ModeloFalso()
+    cache = CacheRespuestas(modelo)
+
+    async def escenario():
+        await cache.responder(None, "u", "hola")
+        await cache.responder(None, "u", "hola")
+
+    asyncio.run(escenario())
+    assert modelo.llamadas == 2
+
+
+def test_une_preguntas_identicas_en_curso():
+    modelo = ModeloFalso()
+    cache = CacheRespuestas(modelo)
+    clave = CacheRespuestas.clave("1", "hola", "h1")
+
+    async def escenario():
+        modelo.liberar = asyncio.Event()
+        tareas = [asyncio.create_task(cache.responder(clave, f"u{i}", "hola")) for i in range(5)]
+        await asyncio.sleep(0)
+        modelo.liberar.set()
+        return await asyncio.gather(*tareas)
+
+    resultados = asyncio.run(escenario())
+    assert len(set(resultados)) == 1
+    assert modelo.llamadas == 1
+    assert cache.contadores["unidas"] == 4
+
+
+def test_si_se_cancela_la_original_los_demas_llaman_aparte():
+    modelo = ModeloFalso()
+    cache = CacheRespuestas(modelo)
+    clave = CacheRespuestas.clave("1", "hola", "h1")
+
+    async def escenario():
+        modelo.liberar = asyncio.Event()
+        original = asyncio.create_task(cache.responder(clave, "u1", "hola"))
+        await asyncio.sleep(0)
+        unida = asyncio.create_task(cache.responder(clave, "u2", "hola"))
+        await asyncio.sleep(0)
+        original.cancel()
+        await asyncio.sleep(0)
+        modelo.liberar.set()
+        with pytest.raises(asyncio.CancelledError):
+            await original
+        return await unida
+
+    assert asyncio.run(escenario()) == "ok: hola"
+    assert modelo.llamadas == 2
+    assert cache.contadores["unidas"] == 1
+
+
+def test_cancelar_una_unida_no_cancela_la_original():
+    modelo = ModeloFalso()
+    cache = CacheRespuestas(modelo)
+    clave = CacheRespuestas.clave("1", "hola", "h1")
+
+    async def escenario():
+        modelo.liberar = asyncio.Event()
+        original = asyncio.create_task(cache.responder(clave, "u1", "hola"))
+        await asyncio.sleep(0)
+        unida = asyncio.create_task(cache.responder(clave, "u2", "hola"))
+        await asyncio.sleep(0)
+        unida.cancel()
+        await asyncio.sleep(0)
+        modelo.liberar.set()
+        with pytest.raises(asyncio.CancelledError):
+            await unida
+        return await original
+
+    assert asyncio.run(escenario()) == "ok: hola"
+    assert modelo.llamadas == 1
+
+
+def test_los_errores_se_propagan_y_no_se_guardan():
+    modelo = ModeloFalso(error=RuntimeError("sin cuota"))
+    cache = CacheRespuestas(modelo)
+    clave = CacheRespuestas.clave("1", "hola", "h1")
+
+    async def escenario():
+        modelo.liberar = asyncio.Event()
+        tareas = [asyncio.create_task(cache.responder(clave, f"u{i}", "hola")) for i in range(3)]
+        await asyncio.sleep(0)
+        modelo.liberar.set()
+        resultados = await asyncio.gather(*tareas, return_exceptions=True)
+        modelo.error = None
+        modelo.liberar = None
+        return resultados, await cache.responder(clave, "u", "hola")
+
+    resultados, despues = asyncio.run(escenario())
+    assert all(isinstance(r, RuntimeError) for r in resultados)
+    assert despues == "ok: hola"
+    assert modelo.llamadas == 2
+    assert cache.contadores["errores"] == 1
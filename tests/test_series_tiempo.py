@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from services.service1.series_tiempo import (
+    ROLLUP_COLECCION, actualizar_rollups, consultar_rollups, operaciones_rollup
+)
+
+
+def lectura(segundo, _id=None, **signos):
+    return {"_id": _id, "cedula": "1", "timestamp": datetime(2024, 1, 1, 10, 0, segundo), **signos}
+
+
+def por_periodo(operaciones):
+    return {op._filter["periodo"]: op for op in operaciones}
+
+
+def test_conteo_por_campo():
+    operaciones = operaciones_rollup([
+        lectura(1, "a", ritmo_cardiaco=80, temperatura=36.5),
+        lectura(2, "b", ritmo_cardiaco=90),
+    ])
+    minuto = por_periodo(operaciones)["minuto"]._doc
+    assert minuto["$inc"]["n"] == 2
+    assert minuto["$inc"]["conteo.ritmo_cardiaco"] == 2
+    assert minuto["$inc"]["conteo.temperatura"] == 1
+    assert "conteo.oxigeno" not in minuto["$inc"]
+
+
+def test_lote_estable_y_filtro_excluye_lotes_aplicados():
+    lecturas = [lectura(1, "a", ritmo_cardiaco=80), lectura(2, "b", ritmo_cardiaco=90)]
+    primero = por_periodo(operaciones_rollup(lecturas))["hora"]
+    repetido = por_periodo(operaciones_rollup(list(reversed(lecturas))))["hora"]
+    otro = por_periodo(operaciones_rollup([lectura(3, "c", ritmo_cardiaco=70)]))["hora"]
+
+    lote = primero._doc["$push"]["lotes"]["$each"][0]
+    assert primero._filter["lotes"] == {"$ne": lote}
+    assert repetido._doc["$push"]["lotes"]["$each"] == [lote]
+    assert otro._doc["$push"]["lotes"]["$each"] != [lote]
+
+
+class ColeccionRollups:
+    """Aplica las operaciones como MongoDB: filtro, upsert e índice único por resumen"""
+
+    def __init__(self, fallos=()):
+        self.documentos = {}
+        self.fallos = list(fallos)  # excepciones a lanzar en las primeras llamadas
+
+    async def bulk_write(self, operaciones, ordered=True):
+        if self.fallos:
+            raise self.fallos.pop(0)
+        errores = []
+        for indice, op in enumerate(operaciones):
+            filtro = op._filter
+            clave = (filtro["cedula"], filtro["periodo"], filtro["inicio"])
+            lote = filtro["lotes"]["$ne"]
+            doc = self.documentos.get(clave)
+            if doc is not None and lote in doc["lotes"]:
+                errores.append({"index": indice, "code": 11000, "errmsg": "duplicate key"})
+                continue
+            if doc is None:
+                doc = self.documentos[clave] = {"inicio": filtro["inicio"], "n": 0, "suma": {}, "conteo": {},
+                                                "min": {}, "max": {}, "lotes": []}
+            for campo, valor in op._doc["$inc"].items():
+                grupo, _, nombre = campo.partition(".")
+                if nombre:
+                    doc[grupo][nombre] = doc[grupo].get(nombre, 0) + valor
+                else:
+                    doc[grupo] += valor
+            for campo, valor in op._doc.get("$min", {}).items():
+                nombre = campo.split(".")[1]
+                doc["min"][nombre] = min(valor, doc["min"].get(nombre, valor))
+            for campo, valor in op._doc.get("$max", {}).items():
+                nombre = campo.split(".")[1]
+                doc["max"][nombre] = max(valor, doc["max"].get(nombre, valor))
+            doc["lotes"].extend(op._doc["$push"]["lotes"]["$each"])
+        if errores:
+            raise BulkWriteError({"writeErrors": errores, "nInserted": 0})
+
+    def find(self, filtro, proyeccion):
+        docs = [{k: v for k, v in d.items() if k != "lotes"}
+                for (cedula, periodo, _), d in self.documentos.items()
+                if cedula == filtro["cedula"] and periodo == filtro["periodo"]]
+        return Cursor(docs)
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, n):
+        return self
+
+    def __aiter__(self):
+        async def iterar():
+            for doc in self.docs:
+                yield doc
+        return iterar()
+
+
+def test_reintento_no_suma_dos_veces_y_promedia_por_campo():
+    coleccion = ColeccionRollups()
+    db = {ROLLUP_COLECCION: coleccion}
+    lecturas = [
+        lectura(1, "a", ritmo_cardiaco=80, temperatura=36.0),
+        lectura(2, "b", ritmo_cardiaco=90),
+    ]
+
+    async def escenario():
+        await actualizar_rollups(db, lecturas)
+        await actualizar_rollups(db, lecturas)  # el mismo lote otra vez
+        return await consultar_rollups(db, "1", "minuto")
+
+    [resumen] = asyncio.run(escenario())
+    assert resumen["lecturas"] == 2
+    assert resumen["ritmo_cardiaco"]["promedio"] == 85
+    assert resumen["temperatura"]["promedio"] == 36.0
+    assert resumen["oxigeno"]["promedio"] is None
+
+
+def test_error_transitorio_se_reintenta():
+    coleccion = ColeccionRollups(fallos=[AutoReconnect("conexión perdida")])
+    db = {ROLLUP_COLECCION: coleccion}
+
+    asyncio.run(actualizar_rollups(db, [lectura(1, "a", ritmo_cardiaco=80)]))
+    assert {d["n"] for d in coleccion.documentos.values()} == {1}
+    assert len(coleccion.documentos) == 3  # minuto, hora y día
+
+
+def test_resumen_antiguo_sin_conteo_usa_n():
+    coleccion = ColeccionRollups()
+    coleccion.documentos[("1", "hora", datetime(2024, 1, 1, 10))] = {
+        "inicio": datetime(2024, 1, 1, 10), "n": 4, "suma": {"ritmo_cardiaco": 320.0},
+        "min": {"ritmo_cardiaco": 70}, "max": {"ritmo_cardiaco": 90}, "lotes": [],
+    }
+    [resumen] = asyncio.run(consultar_rollups({ROLLUP_COLECCION: coleccion}, "1", "hora"))
+    assert resumen["ritmo_cardiaco"]["promedio"] == 80
@@ -0,0 +1,180 @@
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from pymongo.errors import BulkWriteError
+
+from services.eventos import BusLocal
+from services.service1 import main
+from services.service1.series_tiempo import ROLLUP_COLECCION, SIGNOS_COLECCION
+from services.service1.versiones import VersionesPaciente
+from services.tokens import usuario_actual
+
+
+class ColeccionPacientes:
+    def __init__(self, *pacientes):
+        self.pacientes = pacientes
+        self.consultas = []
+
+    def find(self, filtro, proyeccion=None):
+        self.consultas.append(filtro)
+        cedulas = set(filtro["cedula"]["$in"])
+
+        async def cursor():
+            for paciente in self.pacientes:
+                if paciente["cedula"] in cedulas:
+                    yield dict(paciente)
+        return cursor()
+
+
+class ColeccionSignos:
+    """Inserta como MongoDB: asigna _id y, sin orden, reporta solo las que fallan"""
+
+    def __init__(self, rechazar=lambda documento: False, error=None):
+        self.rechazar = rechazar
+        self.error = error
+        self.guardados = []
+        self.ordenado = None
+
+    async def insert_many(self, documentos, ordered=True):
+        if self.error:
+            raise self.error
+        self.ordenado = ordered
+        errores = []
+        for indice, documento in enumerate(documentos):
+            documento["_id"] = ObjectId()
+            if self.rechazar(documento):
+                errores.append({"index": indice, "code": 11000, "errmsg": "E11000 duplicate key"})
+            else:
+                self.guardados.append(documento)
+        if errores:
+            raise BulkWriteError({"writeErrors": errores, "nInserted": len(documentos) - len(errores)})
+
+    async def insert_one(self, documento):
+        if self.error:
+            raise self.error
+        documento["_id"] = ObjectId()
+        self.guardados.append(documento)
+        return SimpleNamespace(inserted_id=documento["_id"])
+
+
+class ColeccionRollups:
+    def __init__(self, error=None):
+        self.error = error
+        self.lecturas = 0
+
+    async def bulk_write(self, operaciones, ordered=True):
+        if self.error:
+            raise self.error
+        self.lecturas += len(operaciones)
+
+
+class VersionesRotas:
+    async def incrementar(self, cedulas):
+        raise RuntimeError("contador no disponible")
+
+
+class CacheFalsa:
+    def __init__(self, pacientes):
+        self.pacientes = {p["cedula"]: p for p in pacientes}
+
+    async def obtener(self, cedula):
+        return self.pacientes.get(cedula)
+
+
+PACIENTES = (
+    {"cedula": "1", "nombre": "Ana", "apellido": "Pérez"},
+    {"cedula": "2", "nombre": "Luis", "apellido": "Gómez"},
+)
+
+
+@pytest.fixture
+def servicio(monkeypatch):
+    base = {
+        "pacientes": ColeccionPacientes(*PACIENTES),
+        SIGNOS_COLECCION: ColeccionSignos(),
+        ROLLUP_COLECCION: ColeccionRollups(),
+    }
+    bus = BusLocal()
+    monkeypatch.setattr(main, "db_async", base)
+    monkeypatch.setattr(main, "bus_eventos", bus)
+    monkeypatch.setattr(main, "versiones", VersionesPaciente())
+    monkeypatch.setattr(main, "cache_pacientes", CacheFalsa(PACIENTES))
+    main.app.dependency_overrides[usuario_actual] = lambda: None
+    yield SimpleNamespace(cliente=TestClient(main.app), base=base, bus=bus)
+    main.app.dependency_overrides.clear()
+
+
+def lectura(cedula, **cambios):
+    return {"cedula": cedula, "ritmo_cardiaco": 80, "temperatura": 36.5, "presion": "120/80",
+            "oxigeno": 97, **cambios}
+
+
+def test_lote_valida_cedulas_con_una_sola_consulta(servicio):
+    respuesta = servicio.cliente.post("/health-data/lote", json={"lecturas": [
+        lectura("1"), lectura("9"), lectura("2", presion="alta"), lectura("2"), lectura("1"),
+    ]})
+
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.json()
+    consultas = servicio.base["pacientes"].consultas
+    assert len(consultas) == 1
+    assert sorted(consultas[0]["cedula"]["$in"]) == ["1", "2", "9"]
+    assert [r["estado"] for r in cuerpo["resultados"]] == [
+        "aceptado", "rechazado", "rechazado", "aceptado", "aceptado"]
+    assert cuerpo["resultados"][1]["motivo"] == "Paciente no encontrado"
+    assert (cuerpo["aceptadas"], cuerpo["rechazadas"]) == (3, 2)
+    assert servicio.base[SIGNOS_COLECCION].ordenado is False
+    assert servicio.bus.publicados == 3
+
+
+def test_lote_informa_las_lecturas_que_mongo_rechaza(servicio):
+    servicio.base[SIGNOS_COLECCION].rechazar = lambda documento: documento["oxigeno"] == 50
+
+    respuesta = servicio.cliente.post("/health-data/lote", json={"lecturas": [
+        lectura("1"), lectura("9"), lectura("2", oxigeno=50), lectura("2"),
+    ]})
+
+    cuerpo = respuesta.json()
+    assert respuesta.status_code == 200
+    assert [r["estado"] for r in cuerpo["resultados"]] == ["aceptado", "rechazado", "rechazado", "aceptado"]
+    assert cuerpo["resultados"][2]["motivo"] == "E11000 duplicate key"
+    assert cuerpo["aceptadas"] == 2
+    # Solo lo guardado llega al bus
+    assert servicio.bus.publicados == 2
+    publicados = [servicio.bus.cola.get_nowait()[1] for _ in range(2)]
+    assert [p["oxigeno"] for p in publicados] == [97, 97]
+
+
+def test_lote_responde_500_si_mongo_no_responde(servicio):
+    servicio.base[SIGNOS_COLECCION].error = ConnectionError("sin conexión")
+
+    respuesta = servicio.cliente.post("/health-data/lote", json={"lecturas": [lectura("1")]})
+
+    assert respuesta.status_code == 500
+    assert servicio.bus.publicados == 0
+
+
+def test_fallos_tras_guardar_no_convierten_la_lectura_en_error(servicio, monkeypatch):
+    servicio.base[ROLLUP_COLECCION].error = RuntimeError("rollups caídos")
+    monkeypatch.setattr(main, "versiones", VersionesRotas())
+
+    individual = servicio.cliente.post("/health-data/1")
+    lote = servicio.cliente.post("/health-data/lote", json={"lecturas": [lectura("2")]})
+
+    assert individual.status_code == 200
+    assert lote.json()["aceptadas"] == 1
+    assert len(servicio.base[SIGNOS_COLECCION].guardados) == 2
+    # El bus se alimenta aunque fallen los pasos anteriores
+    assert servicio.bus.publicados == 2
+
+
+def test_solo_el_fallo_al_insertar_devuelve_500(servicio):
+    servicio.base[SIGNOS_COLECCION].error = ConnectionError("sin conexión")
+
+    respuesta = servicio.cliente.post("/health-data/1")
+
+    assert respuesta.status_code == 500
+    assert servicio.base[ROLLUP_COLECCION].lecturas == 0
+    assert servicio.bus.publicados == 0
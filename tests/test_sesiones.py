@@ -0,0 +1,160 @@
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+from my_agent import sesiones
+from my_agent.respuestas import CacheRespuestas
+from my_agent.sesiones import (
+    AlmacenMemoria, AlmacenRedis, AlmacenSQLite, Sesiones, agregar_mensaje, sesion_nueva, transcripcion,
+)
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = SimpleNamespace(ahora=1_700_000_000.0)
+    monkeypatch.setattr(sesiones, "time", SimpleNamespace(time=lambda: reloj.ahora))
+    return reloj
+
+
+class AlmacenCaido:
+    async def cargar(self, user_id):
+        raise ConnectionError("almacén no disponible")
+
+    guardar = eliminar = cargar
+
+
+def conversar(sesion, turnos):
+    for i in range(turnos):
+        agregar_mensaje(sesion, "usuario", f"pregunta {i}")
+        agregar_mensaje(sesion, "asistente", f"respuesta {i}")
+
+
+def test_historial_se_recorta_por_turnos_y_caracteres():
+    sesion = sesion_nueva()
+    conversar(sesion, 8)
+
+    assert len(sesion["historial"]) == sesiones.BOT_HISTORIAL_TURNOS
+    assert sesion["omitidos"] == 16 - sesiones.BOT_HISTORIAL_TURNOS
+    assert sesion["historial"][-1] == {"rol": "asistente", "texto": "respuesta 7"}
+
+    # Un mensaje largo se corta y desplaza a los anteriores aunque quepan por turnos
+    agregar_mensaje(sesion, "asistente", "x" * 5000)
+    sesiones.recortar_historial(sesion, max_caracteres=sesiones.MAX_CARACTERES_MENSAJE + 10)
+    assert len(sesion["historial"]) == 1
+    assert len(sesion["historial"][0]["texto"]) == sesiones.MAX_CARACTERES_MENSAJE + 1
+    assert sesion["omitidos"] == 16
+
+
+def test_clave_de_cache_no_cambia_con_el_contador_de_omitidos():
+    # Dos conversaciones que terminan igual pero omitieron distinta cantidad
+    corta, larga = sesion_nueva(), sesion_nueva()
+    conversar(corta, 6)
+    conversar(larga, 9)
+    for sesion in (corta, larga):
+        sesion["historial"] = [dict(m) for m in larga["historial"]]
+
+    assert transcripcion(corta) != transcripcion(larga)
+    assert "(se omiten 8 mensajes anteriores)" in transcripcion(larga)
+    assert transcripcion(corta, contar_omitidos=False) == transcripcion(larga, contar_omitidos=False)
+    assert (CacheRespuestas.clave("1", "¿y hoy?", "h", transcripcion(corta, contar_omitidos=False))
+            == CacheRespuestas.clave("1", "¿y hoy?", "h", transcripcion(larga, contar_omitidos=False)))
+
+    # Sin mensajes omitidos la transcripción no los menciona
+    nueva = sesion_nueva()
+    conversar(nueva, 1)
+    assert "se omiten" not in transcripcion(nueva, contar_omitidos=False)
+
+
+def test_sqlite_guarda_y_recupera_tras_reiniciar(tmp_path, reloj):
+    ruta = str(tmp_path / "sesiones.db")
+
+    async def escenario():
+        almacen = AlmacenSQLite(ruta)
+        sesion = {"cedula": "123", "historial": [{"rol": "usuario", "texto": "¿cómo está?"}], "omitidos": 2}
+        await almacen.guardar("u1", sesion)
+        await almacen.guardar("u1", {**sesion, "cedula": "456"})
+
+        # Otro proceso (o el bot reiniciado) abre el mismo archivo
+        reabierto = AlmacenSQLite(ruta)
+        cargada = await reabierto.cargar("u1")
+        await reabierto.eliminar("u1")
+        return cargada, await reabierto.cargar("u1"), await almacen.cargar("nadie")
+
+    cargada, eliminada, inexistente = asyncio.run(escenario())
+    assert cargada["cedula"] == "456" and cargada["historial"][0]["texto"] == "¿cómo está?"
+    assert eliminada is None and inexistente is None
+
+
+def test_sqlite_ignora_y_purga_sesiones_vencidas(tmp_path, reloj):
+    almacen = AlmacenSQLite(str(tmp_path / "sesiones.db"), ttl=60, max_sesiones=2)
+
+    async def escenario():
+        await almacen.guardar("viejo", sesion_nueva())
+        reloj.ahora += 61
+        assert await almacen.cargar("viejo") is None
+
+        for user_id in ("a", "b", "c"):
+            reloj.ahora += 1
+            await almacen.guardar(user_id, sesion_nueva())
+        # La purga corre cada 1000 escrituras
+        almacen._escrituras = 999
+        reloj.ahora += 1
+        await almacen.guardar("d", sesion_nueva())
+
+    asyncio.run(escenario())
+    filas = almacen._conexion.execute("SELECT user_id FROM sesiones ORDER BY user_id").fetchall()
+    # Se borra la vencida y, pasado el máximo, las de menor actividad reciente
+    assert [f[0] for f in filas] == ["c", "d"]
+
+
+def test_redis_guarda_con_vencimiento():
+    almacen = AlmacenRedis(ttl=60)
+    almacen.redis = fakeredis.aioredis.FakeRedis()
+
+    async def escenario():
+        await almacen.guardar("u1", {"cedula": "123", "historial": [], "omitidos": 0})
+        ttl = await almacen.redis.ttl(sesiones.PREFIJO_REDIS + "u1")
+        cargada = await almacen.cargar("u1")
+        await almacen.eliminar("u1")
+        return ttl, cargada, await almacen.cargar("u1")
+
+    ttl, cargada, eliminada = asyncio.run(escenario())
+    assert 0 < ttl <= 60
+    assert cargada["cedula"] == "123"
+    assert eliminada is None
+
+
+def test_lru_desaloja_y_recarga_desde_el_almacen():
+    almacen = AlmacenMemoria()
+    cache = Sesiones(almacen, max_en_memoria=2)
+
+    async def escenario():
+        for user_id in ("a", "b"):
+            sesion = await cache.obtener(user_id)
+            sesion["cedula"] = user_id.upper()
+            await cache.guardar(user_id, sesion)
+        await cache.obtener("a")  # "a" pasa a ser la más reciente
+        await cache.obtener("c")  # desaloja "b"
+        assert list(cache._cache) == ["a", "c"]
+        return await cache.obtener("b")
+
+    recargada = asyncio.run(escenario())
+    assert recargada["cedula"] == "B"
+    assert cache.contadores == {"aciertos": 1, "cargadas": 1, "nuevas": 3, "desalojadas": 2, "errores": 0}
+
+
+def test_almacen_caido_no_interrumpe_la_conversacion():
+    cache = Sesiones(AlmacenCaido())
+
+    async def escenario():
+        sesion = await cache.obtener("u1")
+        sesion["cedula"] = "123"
+        await cache.guardar("u1", sesion)
+        return await cache.obtener("u1")
+
+    # La sesión sigue en memoria aunque no se pueda persistir
+    assert asyncio.run(escenario())["cedula"] == "123"
+    assert cache.contadores["errores"] == 2
+    assert cache.contadores["nuevas"] == 1 and cache.contadores["aciertos"] == 1
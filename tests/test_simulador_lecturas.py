@@ -0,0 +1,159 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from pymongo.errors import AutoReconnect, BulkWriteError, CollectionInvalid
+
+from services import simulador_lecturas
+from services.simulador_lecturas import AlmacenLecturas, preparar_coleccion
+
+
+class ColeccionLecturas:
+    """insert_many de Motor: falla con los errores programados y si no guarda"""
+
+    def __init__(self, *fallos):
+        self.fallos = list(fallos)
+        self.documentos = {}
+        self.llamadas = 0
+
+    async def insert_many(self, documentos, ordered=True):
+        self.llamadas += 1
+        if self.fallos:
+            fallo = self.fallos.pop(0)
+            if isinstance(fallo, Exception):
+                raise fallo
+            errores = []
+            for indice, documento in enumerate(documentos):
+                codigo = fallo(documento)
+                if codigo is None:
+                    self.documentos[documento["_id"]] = documento
+                else:
+                    errores.append({"index": indice, "code": codigo, "errmsg": f"error {codigo}"})
+            raise BulkWriteError({"writeErrors": errores, "nInserted": len(documentos) - len(errores)})
+        for documento in documentos:
+            self.documentos[documento["_id"]] = documento
+
+
+def lecturas(n):
+    return [{"cedula": str(i), "datos": {"ritmo_cardiaco": 70}} for i in range(n)]
+
+
+def test_escribe_por_lotes_y_avisa_al_llenar_uno():
+    almacen = AlmacenLecturas(ColeccionLecturas(), tamano_lote=3)
+    for lectura in lecturas(2):
+        almacen.agregar(lectura)
+    assert not almacen._lleno.is_set()
+    for lectura in lecturas(5):
+        almacen.agregar(lectura)
+    assert almacen._lleno.is_set()
+
+    assert asyncio.run(almacen.vaciar())
+    metricas = almacen.metricas()
+    assert (metricas["insertadas"], metricas["lotes"], metricas["pendientes"]) == (7, 3, 0)
+
+
+def test_si_mongo_falla_el_lote_vuelve_al_frente_en_orden():
+    coleccion = ColeccionLecturas(AutoReconnect("sin conexión"))
+    almacen = AlmacenLecturas(coleccion, tamano_lote=10)
+    for lectura in lecturas(4):
+        almacen.agregar(lectura)
+
+    assert not asyncio.run(almacen.vaciar())
+    assert [l["cedula"] for l in almacen._pendientes] == ["0", "1", "2", "3"]
+    assert almacen.contadores["errores"] == 1
+
+    assert asyncio.run(almacen.vaciar())
+    assert len(coleccion.documentos) == 4
+
+
+def test_bufer_acotado_descarta_lo_mas_viejo():
+    almacen = AlmacenLecturas(None, max_pendientes=3)
+    for lectura in lecturas(5):
+        almacen.agregar(lectura)
+
+    assert [l["cedula"] for l in almacen._pendientes] == ["2", "3", "4"]
+    assert almacen.contadores["descartadas"] == 2
+    # El anillo de recientes no depende del búfer de escritura
+    assert [l["cedula"] for l in almacen.recientes(10)] == ["4", "3", "2", "1", "0"]
+
+
+def test_duplicadas_se_ignoran_y_otros_errores_se_cuentan():
+    # Reintento de un lote a medio escribir: "0" ya estaba y "1" no pasa la validación
+    coleccion = ColeccionLecturas(
+        lambda d: {"0": 11000, "1": 121}.get(d["cedula"])
+    )
+    almacen = AlmacenLecturas(coleccion, tamano_lote=10)
+    for lectura in lecturas(4):
+        almacen.agregar(lectura)
+
+    assert asyncio.run(almacen.vaciar())
+    metricas = almacen.metricas()
+    assert metricas["insertadas"] == 2
+    assert metricas["rechazadas"] == 1
+    assert metricas["pendientes"] == 0
+
+
+class BaseFalsa:
+    def __init__(self, opciones_existentes=None):
+        self.existentes = opciones_existentes
+        self.creadas = []
+        self.indices = []
+
+    async def create_collection(self, nombre, **opciones):
+        if self.existentes is not None:
+            raise CollectionInvalid(f"collection {nombre} already exists")
+        self.creadas.append((nombre, opciones))
+
+    def __getitem__(self, nombre):
+        base = self
+
+        class Coleccion:
+            async def options(self):
+                return base.existentes
+
+            async def create_index(self, campo, **opciones):
+                base.indices.append((nombre, campo, opciones))
+        return Coleccion()
+
+
+def test_coleccion_capped(monkeypatch):
+    monkeypatch.setattr(simulador_lecturas, "LECTURAS_LIMITE", "capped")
+    monkeypatch.setattr(simulador_lecturas, "LECTURAS_CAPPED_MB", 8)
+    base = BaseFalsa()
+
+    asyncio.run(preparar_coleccion(base, "lecturas"))
+
+    assert base.creadas == [("lecturas", {"capped": True, "size": 8 * 1024 * 1024})]
+
+
+def test_coleccion_existente_sin_capped_avisa(monkeypatch, capsys):
+    monkeypatch.setattr(simulador_lecturas, "LECTURAS_LIMITE", "capped")
+    base = BaseFalsa(opciones_existentes={})
+
+    asyncio.run(preparar_coleccion(base, "lecturas"))
+
+    assert "ya existe como colección normal" in capsys.readouterr().out
+    assert base.creadas == []
+
+
+def test_indice_ttl(monkeypatch):
+    monkeypatch.setattr(simulador_lecturas, "LECTURAS_LIMITE", "ttl")
+    monkeypatch.setattr(simulador_lecturas, "LECTURAS_TTL_HORAS", 2)
+    base = BaseFalsa()
+
+    asyncio.run(preparar_coleccion(base, "lecturas"))
+
+    assert base.creadas == []
+    assert base.indices == [("lecturas", "timestamp", {"expireAfterSeconds": 7200})]
+
+
+def test_simular_mantiene_la_respuesta_anterior(monkeypatch):
+    from services import main
+
+    almacen = AlmacenLecturas(None)
+    monkeypatch.setattr(main, "almacen", almacen)
+
+    cuerpo = TestClient(main.app).get("/api/simular").json()
+
+    assert cuerpo["status"] == "ok"
+    assert cuerpo["inserted"] is True
+    assert len(almacen._pendientes) == 1
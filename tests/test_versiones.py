@@ -0,0 +1,157 @@
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+
+from services.service1 import main, versiones
+from services.service1.series_tiempo import SIGNOS_COLECCION
+from services.service1.versiones import VersionesPaciente
+from services.tokens import usuario_actual
+
+_dormir = asyncio.sleep
+
+
+class RedisIntermitente:
+    """FakeRedis compartido que deja de responder a un worker mientras `caido`"""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.caido = False
+
+    def __getattr__(self, nombre):
+        if self.caido:
+            raise ConnectionError("Redis no responde")
+        return getattr(self.cliente, nombre)
+
+
+@pytest.fixture
+def sin_esperas(monkeypatch):
+    monkeypatch.setattr(versiones, "asyncio", SimpleNamespace(
+        sleep=lambda segundos: _dormir(0), get_running_loop=asyncio.get_running_loop))
+
+
+def test_version_cambia_con_cada_incremento():
+    redis = fakeredis.aioredis.FakeRedis()
+    worker_a, worker_b = VersionesPaciente(redis), VersionesPaciente(redis)
+
+    async def escenario():
+        antes = await worker_a.obtener("1")
+        await worker_b.incrementar(["1"])
+        return antes, await worker_a.obtener("1"), await worker_a.obtener("2")
+
+    antes, despues, otro = asyncio.run(escenario())
+    assert antes != despues
+    assert antes.split(".")[0] == despues.split(".")[0] == otro.split(".")[0]
+
+
+def test_escritura_durante_la_caida_invalida_los_etags_de_todos(sin_esperas):
+    redis = fakeredis.aioredis.FakeRedis()
+    conexion_a = RedisIntermitente(redis)
+    worker_a, worker_b = VersionesPaciente(conexion_a), VersionesPaciente(redis)
+
+    async def escenario():
+        etag_cliente = await worker_b.obtener("1")
+        conexion_a.caido = True
+        await worker_a.incrementar(["1"])  # lectura guardada mientras A no ve Redis
+        assert worker_a._pendientes == {"1"}
+        assert await worker_a.obtener("1") is None  # A no da ETag mientras tanto
+
+        conexion_a.caido = False
+        await worker_a._tarea_pendientes
+        return etag_cliente, await worker_b.obtener("1"), await worker_a.obtener("1")
+
+    etag_cliente, version_b, version_a = asyncio.run(escenario())
+    assert version_b != etag_cliente
+    assert version_b.split(".")[0] != etag_cliente.split(".")[0]  # época nueva
+    assert version_a == version_b
+    assert worker_a._pendientes == set()
+
+
+def test_reintento_sigue_mientras_redis_no_vuelva(sin_esperas, monkeypatch):
+    monkeypatch.setattr(versiones, "REDIS_ESPERA_REINTENTO", 4)
+    redis = fakeredis.aioredis.FakeRedis()
+    conexion = RedisIntermitente(redis)
+    worker = VersionesPaciente(conexion)
+
+    async def escenario():
+        conexion.caido = True
+        await worker.incrementar(["1", "2"])
+        for _ in range(5):
+            await _dormir(0)
+        assert worker._pendientes == {"1", "2"}
+        conexion.caido = False
+        await worker._tarea_pendientes
+        return await redis.mget("version:signos:1", "version:signos:2")
+
+    assert asyncio.run(escenario()) == [b"1", b"1"]
+
+
+class ColeccionSignos:
+    def __init__(self):
+        self.consultas = 0
+
+    def find(self, filtro):
+        self.consultas += 1
+        cursor = SimpleNamespace()
+        cursor.sort = lambda *args: cursor
+        cursor.limit = lambda n: cursor
+
+        async def to_list(length):
+            return [{"cedula": filtro["cedula"], "ritmo_cardiaco": 80}]
+        cursor.to_list = to_list
+        return cursor
+
+
+class CacheFalsa:
+    async def obtener(self, cedula):
+        return {"cedula": cedula, "nombre": "Ana", "apellido": "Pérez"}
+
+
+@pytest.fixture
+def servicio(monkeypatch):
+    coleccion = ColeccionSignos()
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(main, "db_async", {SIGNOS_COLECCION: coleccion})
+    monkeypatch.setattr(main, "cache_pacientes", CacheFalsa())
+    monkeypatch.setattr(main, "versiones", VersionesPaciente(redis))
+    main.app.dependency_overrides[usuario_actual] = lambda: None
+    yield SimpleNamespace(cliente=TestClient(main.app), coleccion=coleccion)
+    main.app.dependency_overrides.clear()
+
+
+def test_if_none_match_responde_304_sin_consultar_mongo(servicio):
+    primera = servicio.cliente.get("/health-data/1")
+    etag = primera.headers["etag"]
+
+    repetida = servicio.cliente.get("/health-data/1", headers={"If-None-Match": etag})
+    debil = servicio.cliente.get("/health-data/1", headers={"If-None-Match": f"W/{etag}"})
+
+    assert primera.status_code == 200
+    assert (repetida.status_code, debil.status_code) == (304, 304)
+    assert repetida.headers["etag"] == etag
+    assert repetida.content == b""
+    assert servicio.coleccion.consultas == 1
+
+
+def test_lectura_nueva_cambia_el_etag(servicio):
+    etag = servicio.cliente.get("/health-data/1").headers["etag"]
+    asyncio.run(main.versiones.incrementar(["1"]))
+
+    respuesta = servicio.cliente.get("/health-data/1", headers={"If-None-Match": etag})
+
+    assert respuesta.status_code == 200
+    assert respuesta.headers["etag"] != etag
+    assert servicio.coleccion.consultas == 2
+
+
+def test_sin_redis_no_hay_etag_ni_304(servicio, monkeypatch):
+    conexion = RedisIntermitente(fakeredis.aioredis.FakeRedis())
+    conexion.caido = True
+    monkeypatch.setattr(main, "versiones", VersionesPaciente(conexion))
+
+    respuesta = servicio.cliente.get("/health-data/1", headers={"If-None-Match": "*"})
+
+    assert respuesta.status_code == 200
+    assert "etag" not in respuesta.headers